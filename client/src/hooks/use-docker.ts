@@ -31,7 +31,7 @@ interface DockerContainer {
   image: string;
   status: string;
   created_at: string;
-  updated_at: string;
+  updated_at: string | null;
 }
 
 interface DockerfileCreate {
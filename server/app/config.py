@@ -16,6 +16,10 @@ os.makedirs(VIRTUAL_DISK_FOLDER, exist_ok=True)
 VM_DATA_FOLDER = os.path.join(DATA_DIR, "vms")
 os.makedirs(VM_DATA_FOLDER, exist_ok=True)
 
+# Host port leases of VMs and containers
+PORT_DATA_FOLDER = os.path.join(DATA_DIR, "ports")
+os.makedirs(PORT_DATA_FOLDER, exist_ok=True)
+
 # ISO path for VM installation
 ISO_PATH = os.path.join(DATA_DIR, "iso", "alpine-standard.iso")
 os.makedirs(os.path.dirname(ISO_PATH), exist_ok=True)
@@ -24,6 +28,73 @@ os.makedirs(os.path.dirname(ISO_PATH), exist_ok=True)
 DOCKER_DATA_FOLDER = os.path.join(DATA_DIR, "docker")
 os.makedirs(DOCKER_DATA_FOLDER, exist_ok=True)
 
+# Metadata storage backend: "sqlite" (default), "journal" (metadata.json snapshot
+# plus append-only metadata.journal) or "json" (legacy whole-file rewrites).
+# Only the json backend keeps an in-process copy of the data (MetadataCache);
+# sqlite reads go to the database on every call, relying on SQLite's page cache
+METADATA_BACKEND = os.environ.get("METADATA_BACKEND", "sqlite")
+# Journal entries after which the journal backend compacts into a new snapshot
+METADATA_JOURNAL_COMPACT_THRESHOLD = int(
+    os.environ.get("METADATA_JOURNAL_COMPACT_THRESHOLD", "1000")
+)
+
+# Docker daemon endpoint. The Engine API is used over a unix socket; with any
+# other endpoint (or no reachable daemon socket) the docker CLI is used
+DOCKER_HOST = os.environ.get("DOCKER_HOST", "unix:///var/run/docker.sock")
+# Idle keep-alive connections kept open to the Docker daemon
+DOCKER_API_POOL_SIZE = int(os.environ.get("DOCKER_API_POOL_SIZE", "8"))
+
+# Timeouts (seconds) for host commands run by the API. Image builds and pulls
+# may legitimately take much longer than everything else
+COMMAND_TIMEOUT = float(os.environ.get("COMMAND_TIMEOUT", "120"))
+LONG_COMMAND_TIMEOUT = float(os.environ.get("LONG_COMMAND_TIMEOUT", "3600"))
+
+# Concurrency limits per class of heavy host operation (see app.utils.scheduler).
+# Operations beyond the limit queue by priority
+SCHEDULER_LIMITS = {
+    "build": int(os.environ.get("SCHEDULER_BUILD_LIMIT", "2")),
+    "pull": int(os.environ.get("SCHEDULER_PULL_LIMIT", "3")),
+    "disk_io": int(os.environ.get("SCHEDULER_DISK_IO_LIMIT", "2")),
+    "vm_boot": int(os.environ.get("SCHEDULER_VM_BOOT_LIMIT", "2")),
+    # Every other docker CLI call (ps, inspect, start, stop, ...)
+    "docker": int(os.environ.get("SCHEDULER_DOCKER_LIMIT", "8")),
+}
+# How long a starting VM counts against the vm_boot limit
+VM_BOOT_SLOT_SECONDS = float(os.environ.get("VM_BOOT_SLOT_SECONDS", "10"))
+# Builds a batch runs at once unless the request asks for fewer; the build
+# limit above still caps how many docker build processes run
+BATCH_BUILD_CONCURRENCY = int(os.environ.get("BATCH_BUILD_CONCURRENCY", "4"))
+# Containers a bulk start/stop/restart/delete acts on at once unless the
+# request asks for fewer
+BULK_CONTAINER_CONCURRENCY = int(os.environ.get("BULK_CONTAINER_CONCURRENCY", "8"))
+
+# Docker Hub image search: results per query, and how long and how many
+# queries are cached
+SEARCH_LIMIT = int(os.environ.get("SEARCH_LIMIT", "25"))
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", "300"))
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", "256"))
+
+# How long a started container may take to become ready (healthy, accepting
+# connections on its published ports, or just running) and the longest wait
+# between readiness checks
+CONTAINER_READY_TIMEOUT = float(os.environ.get("CONTAINER_READY_TIMEOUT", "30"))
+CONTAINER_READY_MAX_INTERVAL = float(
+    os.environ.get("CONTAINER_READY_MAX_INTERVAL", "1")
+)
+# Resource usage samples kept per running container (Docker reports about
+# one a second)
+CONTAINER_STATS_HISTORY = int(os.environ.get("CONTAINER_STATS_HISTORY", "300"))
+# Container logs: largest piece of output held in memory and sent at once,
+# and how much of a failed container's log goes into the error message
+LOG_CHUNK_BYTES = int(os.environ.get("LOG_CHUNK_BYTES", "65536"))
+LOG_EXCERPT_CHARS = int(os.environ.get("LOG_EXCERPT_CHARS", "8192"))
+
+# Host ports handed out automatically ("first-last"): SSH forwards of VMs,
+# and container ports published without a host port. Ports given explicitly
+# may be anywhere but are still checked against every lease
+VM_PORT_RANGE = os.environ.get("VM_PORT_RANGE", "2222-2999")
+CONTAINER_PORT_RANGE = os.environ.get("CONTAINER_PORT_RANGE", "30000-32767")
+
 # Logging configuration
 LOG_LEVEL = logging.INFO
 LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
@@ -0,0 +1,125 @@
+"""
+Shared service instances
+
+Services are built once when the application starts (see ``lifespan``) and
+handed to every request through the ``get_*_service`` dependencies, so the
+request path never repeats dependency checks or metadata restoration.
+"""
+
+import logging
+import threading
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Request
+
+from app.services.disk_service import DiskService
+from app.services.vm_service import VMService
+from app.services.docker_service import DockerService
+from app.utils.host_capabilities import get_host_capabilities
+from app.utils.process_watcher import get_process_watcher
+from app.utils.scheduler import get_scheduler
+
+logger = logging.getLogger(__name__)
+
+_init_lock = threading.Lock()
+
+
+def init_services(app: FastAPI) -> None:
+    """
+    Build the service singletons and store them on ``app.state``
+
+    A service whose host dependency is missing (e.g. QEMU or Docker not
+    installed) is left unset and its error recorded, so the rest of the API
+    keeps working.
+
+    Args:
+        app: FastAPI application
+    """
+    with _init_lock:
+        if getattr(app.state, "services_ready", False):
+            return
+
+        # Probe host binaries, KVM and Docker once; services read the result
+        app.state.host_capabilities = get_host_capabilities()
+        app.state.host_capabilities.refresh()
+
+        errors = {}
+        disk_service = vm_service = docker_service = None
+
+        try:
+            disk_service = DiskService()
+        except RuntimeError as e:
+            errors["disk_service"] = str(e)
+
+        if disk_service is not None:
+            try:
+                vm_service = VMService(disk_service)
+            except RuntimeError as e:
+                errors["vm_service"] = str(e)
+        else:
+            errors["vm_service"] = errors["disk_service"]
+
+        try:
+            docker_service = DockerService()
+        except RuntimeError as e:
+            errors["docker_service"] = str(e)
+
+        for name, error in errors.items():
+            logger.warning(f"{name} unavailable: {error}")
+
+        app.state.disk_service = disk_service
+        app.state.vm_service = vm_service
+        app.state.docker_service = docker_service
+        app.state.service_errors = errors
+        app.state.services_ready = True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Build the services and start the VM process watcher, Docker mirror and
+    container stats sampler
+    """
+    init_services(app)
+    watcher = get_process_watcher()
+    await watcher.start()
+    if app.state.docker_service is not None:
+        await app.state.docker_service.start_state_mirror()
+        await app.state.docker_service.start_stats_sampler()
+    try:
+        yield
+    finally:
+        await watcher.stop()
+        if app.state.docker_service is not None:
+            await app.state.docker_service.close()
+        # Timers don't outlive the loop; free slots still held by them
+        get_scheduler().flush_delayed_releases()
+
+
+def _get_service(request: Request, name: str):
+    """Return a service singleton or fail the request with 503"""
+    app = request.app
+    if not getattr(app.state, "services_ready", False):
+        # Lifespan didn't run (e.g. TestClient used without a context manager)
+        init_services(app)
+
+    service = getattr(app.state, name)
+    if service is None:
+        raise HTTPException(status_code=503, detail=app.state.service_errors[name])
+    return service
+
+
+def get_disk_service(request: Request) -> DiskService:
+    return _get_service(request, "disk_service")
+
+
+async def get_vm_service(request: Request) -> VMService:
+    service = _get_service(request, "vm_service")
+    # No-op once the lifespan started it; otherwise VM exits (including those
+    # of VMs restored at init) would never be noticed
+    await get_process_watcher().start()
+    return service
+
+
+def get_docker_service(request: Request) -> DockerService:
+    return _get_service(request, "docker_service")
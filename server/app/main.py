@@ -12,7 +12,8 @@ sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 from config import LOG_LEVEL, LOG_FORMAT
 
 # Import routers
-from routers import disk_router, vm_router, docker_router
+from routers import disk_router, vm_router, docker_router, system_router
+from app.dependencies import lifespan
 
 # Configure logging
 logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
@@ -23,6 +24,7 @@ app = FastAPI(
     title="Cloud Management System",
     description="API for managing virtual machines, disks, and Docker containers",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Setup CORS with specific allowed origins
@@ -39,6 +41,7 @@ app.add_middleware(
 app.include_router(disk_router, prefix="/api")
 app.include_router(vm_router, prefix="/api")
 app.include_router(docker_router, prefix="/api")
+app.include_router(system_router, prefix="/api")
 
 
 @app.get("/")
@@ -53,6 +56,7 @@ def read_root():
             "disks": "/api/disks",
             "vms": "/api/vms",
             "docker": "/api/docker",
+            "system": "/api/system",
         },
     }
 
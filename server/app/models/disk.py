@@ -16,6 +16,11 @@ class EditDiskRequest(BaseModel):
     size: Optional[str] = None
 
 
+class ConvertDiskRequest(BaseModel):
+    format: str  # Target format
+    name: Optional[str] = None  # Defaults to "<source name>-<format>"
+
+
 class DiskResponse(BaseResponse):
     name: str
     size: str
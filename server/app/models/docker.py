@@ -1,6 +1,9 @@
 from datetime import datetime
+from enum import Enum
 from typing import Optional, Dict, List
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from app.models.base import JobStatus
 
 
 class Dockerfile(BaseModel):
@@ -17,6 +20,21 @@ class DockerImage(BaseModel):
     dockerfile_id: Optional[str]
     created_at: datetime
     updated_at: datetime
+    size: Optional[int] = None  # bytes
+    shared_size: Optional[int] = None  # bytes shared with other images
+    containers: Optional[int] = None  # containers using the image
+
+
+class ContainerResources(BaseModel):
+    cpus: Optional[float] = None  # CPUs' worth of time, e.g. 1.5
+    cpu_shares: Optional[int] = None  # relative CPU weight (Docker's default 1024)
+    cpuset_cpus: Optional[str] = None  # CPUs it may run on, e.g. "0-2,4"
+    memory: Optional[int] = None  # bytes
+    memory_swap: Optional[int] = None  # bytes of memory plus swap, -1 unlimited
+    pids_limit: Optional[int] = None  # -1 unlimited
+    blkio_weight: Optional[int] = None  # relative block I/O weight, 10-1000
+    device_read_bps: Optional[Dict[str, int]] = None  # device path -> bytes/s
+    device_write_bps: Optional[Dict[str, int]] = None
 
 
 class DockerContainer(BaseModel):
@@ -25,7 +43,25 @@ class DockerContainer(BaseModel):
     image: str
     status: str
     created_at: datetime
-    updated_at: datetime
+    # Last start or stop; None where the listing doesn't include it
+    updated_at: Optional[datetime] = None
+    # Limits in effect, where the listing includes them
+    resources: Optional[ContainerResources] = None
+
+
+class ContainerStats(BaseModel):
+    id: str
+    name: str
+    time: datetime
+    cpu_percent: Optional[float] = None  # 100 = one busy core
+    memory_bytes: Optional[float] = None  # excluding page cache
+    memory_limit: Optional[float] = None
+    memory_percent: Optional[float] = None
+    net_rx_bytes: Optional[float] = None  # totals since the container started
+    net_tx_bytes: Optional[float] = None
+    block_read_bytes: Optional[float] = None
+    block_write_bytes: Optional[float] = None
+    pids: Optional[float] = None
 
 
 class DockerfileCreate(BaseModel):
@@ -48,6 +84,86 @@ class TemplateInfo(BaseModel):
 class ImageBuild(BaseModel):
     dockerfile_id: str
     tag: str
+    build_args: Optional[Dict[str, str]] = None
+
+
+class BuildStep(BaseModel):
+    step: int
+    total: int
+    instruction: str
+    stage: Optional[str] = None  # BuildKit stage in multi-stage builds
+    elapsed: float  # seconds from the start of the build
+    duration: Optional[float] = None  # seconds, once the step has finished
+
+
+class BuildJob(BaseModel):
+    id: str
+    dockerfile_id: str
+    tag: str
+    status: JobStatus
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    progress: Optional[BuildStep] = None  # current (or last) step
+    steps: List[BuildStep] = []
+    image: Optional[DockerImage] = None  # once succeeded
+    error: Optional[str] = None
+
+
+class BatchBuild(BaseModel):
+    builds: List[ImageBuild]
+    concurrency: Optional[int] = None  # defaults to BATCH_BUILD_CONCURRENCY
+
+
+class BatchBuildResult(BaseModel):
+    index: int  # position in the request
+    dockerfile_id: str
+    tag: str
+    status: JobStatus
+    image: Optional[DockerImage] = None
+    error: Optional[str] = None
+    duration: Optional[float] = None  # seconds
+
+
+class BatchBuildSummary(BaseModel):
+    total: int
+    succeeded: int
+    failed: int
+    duration: float  # seconds, wall clock
+    results: List[BatchBuildResult]
+
+
+class ContainerAction(str, Enum):
+    START = "start"
+    STOP = "stop"
+    RESTART = "restart"
+    DELETE = "delete"
+
+
+class BulkContainerAction(BaseModel):
+    # Containers by ID or name, and/or by docker label filters such as
+    # "app=web" or "app" (every filter must match)
+    ids: List[str] = []
+    labels: List[str] = []
+    concurrency: Optional[int] = None  # defaults to BULK_CONTAINER_CONCURRENCY
+    # Seconds to wait for a stop before killing
+    timeout: Optional[int] = Field(None, ge=0, le=3600)
+
+
+class BulkContainerResult(BaseModel):
+    id: str
+    status: JobStatus
+    error: Optional[str] = None
+    duration: Optional[float] = None  # seconds
+
+
+class BulkContainerSummary(BaseModel):
+    action: ContainerAction
+    total: int
+    succeeded: int
+    failed: int
+    duration: float  # seconds, wall clock
+    results: List[BulkContainerResult]
 
 
 class ContainerRun(BaseModel):
@@ -55,3 +171,40 @@ class ContainerRun(BaseModel):
     name: Optional[str] = None
     ports: Optional[Dict[str, str]] = None
     environment: Optional[Dict[str, str]] = None
+    resources: Optional[ContainerResources] = None
+    # Container ports to publish on host ports picked by the port allocator
+    auto_ports: Optional[List[str]] = None
+
+
+class StackMember(BaseModel):
+    name: str  # also its hostname on the stack's network
+    image_id: str
+    ports: Optional[Dict[str, str]] = None
+    environment: Optional[Dict[str, str]] = None  # overrides the stack's
+    resources: Optional[ContainerResources] = None
+    auto_ports: Optional[List[str]] = None
+    # Members that must be ready before this one starts
+    depends_on: List[str] = []
+
+
+class StackCreate(BaseModel):
+    name: str
+    environment: Dict[str, str] = {}  # given to every member
+    members: List[StackMember]
+
+
+class StackMemberResult(BaseModel):
+    name: str
+    # Outcome of the last deploy or teardown; None when just looked up
+    status: Optional[JobStatus] = None
+    container: Optional[DockerContainer] = None
+    error: Optional[str] = None
+    duration: Optional[float] = None  # seconds
+
+
+class Stack(BaseModel):
+    name: str
+    network: str
+    created_at: datetime
+    duration: Optional[float] = None  # seconds, wall clock of a deploy/teardown
+    members: List[StackMemberResult]
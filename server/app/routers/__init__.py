@@ -1,3 +1,4 @@
 from .disk_router import router as disk_router
 from .vm_router import router as vm_router
 from .docker_router import router as docker_router
+from .system_router import router as system_router
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from typing import List
 
 from app.models.disk import (
@@ -6,8 +6,12 @@ from app.models.disk import (
     DiskResponse,
     DiskListResponse,
     EditDiskRequest,
+    ConvertDiskRequest,
 )
 from app.services.disk_service import DiskService
+from app.dependencies import get_disk_service
+from app.utils.disconnect import cancel_on_disconnect
+from app.utils.sse import event_stream_response
 
 router = APIRouter(
     prefix="/disks",
@@ -16,20 +20,17 @@ router = APIRouter(
 )
 
 
-# Dependency
-def get_disk_service():
-    return DiskService()
-
-
 @router.post("/", response_model=DiskResponse, status_code=201)
-def create_disk(
-    request: CreateDiskRequest, service: DiskService = Depends(get_disk_service)
+async def create_disk(
+    request: CreateDiskRequest,
+    http_request: Request,
+    service: DiskService = Depends(get_disk_service),
 ):
     """
     Create a new virtual disk with specified parameters.
     """
     try:
-        return service.create_disk(request)
+        return await cancel_on_disconnect(http_request, service.create_disk(request))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -69,7 +70,7 @@ def delete_disk(disk_id: str, service: DiskService = Depends(get_disk_service)):
 
 
 @router.patch("/{disk_id}", response_model=DiskResponse)
-def edit_disk(
+async def edit_disk(
     disk_id: str,
     request: EditDiskRequest,
     service: DiskService = Depends(get_disk_service),
@@ -77,4 +78,23 @@ def edit_disk(
     """
     Edit a virtual disk.
     """
-    return service.edit_disk(disk_id, request)
+    return await service.edit_disk(disk_id, request)
+
+
+@router.post("/{disk_id}/convert")
+def convert_disk(
+    disk_id: str,
+    request: ConvertDiskRequest,
+    service: DiskService = Depends(get_disk_service),
+):
+    """
+    Convert a disk to another format as a new disk, streaming progress as
+    Server-Sent Events ("progress", then "done" with the new disk or "error").
+    """
+    if not service.get_disk(disk_id):
+        raise HTTPException(status_code=404, detail="Disk not found")
+    try:
+        service.validate_format(request.format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return event_stream_response(service.convert_disk_events(disk_id, request))
@@ -1,6 +1,5 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Dict, Optional
-from datetime import datetime
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from typing import Any, List, Dict, Optional
 
 from app.models.docker import (
     Dockerfile,
@@ -10,9 +9,22 @@ from app.models.docker import (
     DockerfileTemplateCreate,
     TemplateInfo,
     ImageBuild,
+    BatchBuild,
+    BatchBuildSummary,
+    BuildJob,
+    BulkContainerAction,
+    BulkContainerSummary,
+    ContainerAction,
+    ContainerResources,
     ContainerRun,
+    ContainerStats,
+    Stack,
+    StackCreate,
 )
 from app.services.docker_service import DockerService
+from app.dependencies import get_docker_service
+from app.utils.disconnect import cancel_on_disconnect
+from app.utils.sse import event_stream_response
 
 router = APIRouter(
     prefix="/docker",
@@ -21,11 +33,6 @@ router = APIRouter(
 )
 
 
-# Dependency
-def get_docker_service():
-    return DockerService()
-
-
 @router.post("/dockerfiles", response_model=Dockerfile, status_code=201)
 def create_dockerfile(
     dockerfile: DockerfileCreate, service: DockerService = Depends(get_docker_service)
@@ -45,38 +52,175 @@ def create_dockerfile(
 
 
 @router.post("/images/build", response_model=DockerImage, status_code=201)
-def build_image(
+async def build_image(
+    build: ImageBuild,
+    request: Request,
+    service: DockerService = Depends(get_docker_service),
+):
+    """
+    Build a Docker image from a Dockerfile. The build is cancelled if the
+    client disconnects.
+    """
+    try:
+        return await cancel_on_disconnect(
+            request,
+            service.build_image(build.dockerfile_id, build.tag, build.build_args),
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/images/build/stream")
+def build_image_stream(
     build: ImageBuild, service: DockerService = Depends(get_docker_service)
 ):
     """
-    Build a Docker image from a Dockerfile.
+    Build a Docker image, streaming the build output as Server-Sent Events
+    ("log" lines, then "done" with the image or "error"). Disconnecting
+    cancels the build.
+    """
+    if not service.get_dockerfile(build.dockerfile_id):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Dockerfile with ID {build.dockerfile_id} not found",
+        )
+    return event_stream_response(
+        service.build_image_events(build.dockerfile_id, build.tag, build.build_args)
+    )
+
+
+@router.post("/images/build/batch", response_model=BatchBuildSummary)
+async def build_batch(
+    batch: BatchBuild,
+    request: Request,
+    service: DockerService = Depends(get_docker_service),
+):
+    """
+    Build many Docker images in parallel and report the outcome of each. A
+    failed build doesn't stop the others. The batch is cancelled if the
+    client disconnects.
+    """
+    try:
+        return await cancel_on_disconnect(
+            request, service.build_batch(batch.builds, batch.concurrency)
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/images/build/batch/stream")
+def build_batch_stream(
+    batch: BatchBuild, service: DockerService = Depends(get_docker_service)
+):
+    """
+    Build many Docker images in parallel, streaming Server-Sent Events:
+    "build" when each build starts and finishes, "step" progress, then
+    "done" with the summary. Disconnecting cancels the batch.
+    """
+    if not batch.builds:
+        raise HTTPException(status_code=400, detail="No builds given")
+    for build in batch.builds:
+        if not service.get_dockerfile(build.dockerfile_id):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Dockerfile with ID {build.dockerfile_id} not found",
+            )
+    return event_stream_response(
+        service.build_batch_events(batch.builds, batch.concurrency)
+    )
+
+
+@router.post("/images/build/jobs", response_model=BuildJob, status_code=202)
+async def submit_build(
+    build: ImageBuild, service: DockerService = Depends(get_docker_service)
+):
+    """
+    Start a Docker image build in the background and return its job right
+    away. Follow it at /images/build/jobs/{job_id}/events.
+    """
+    try:
+        return service.submit_build(build.dockerfile_id, build.tag, build.build_args)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/images/build/cache", response_model=Dict[str, int])
+def build_cache_metrics(service: DockerService = Depends(get_docker_service)):
+    """
+    Report build cache hits and misses, builds started and requests coalesced
+    into a running identical build.
+    """
+    return service.build_cache_metrics()
+
+
+@router.get("/images/build/jobs", response_model=List[BuildJob])
+def list_build_jobs(service: DockerService = Depends(get_docker_service)):
+    """
+    List recent build jobs, newest first.
+    """
+    return service.list_build_jobs()
+
+
+@router.get("/images/build/jobs/{job_id}", response_model=BuildJob)
+def get_build_job(job_id: str, service: DockerService = Depends(get_docker_service)):
+    """
+    Get the status and step progress of a build job.
+    """
+    job = service.get_build_job(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=404, detail=f"Build job with ID {job_id} not found"
+        )
+    return job
+
+
+@router.get("/images/build/jobs/{job_id}/events")
+def build_job_events(job_id: str, service: DockerService = Depends(get_docker_service)):
+    """
+    Stream a build job's output as Server-Sent Events: the output so far,
+    then live "log" lines and "step" progress until "done" with the image,
+    "error" or "cancelled". Disconnecting does not cancel the build.
+    """
+    try:
+        events = service.build_job_events(job_id)
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return event_stream_response(events)
+
+
+@router.post("/images/build/jobs/{job_id}/cancel", response_model=BuildJob)
+async def cancel_build_job(
+    job_id: str, service: DockerService = Depends(get_docker_service)
+):
+    """
+    Cancel a running build job.
     """
     try:
-        return service.build_image(build.dockerfile_id, build.tag)
+        return await service.cancel_build_job(job_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/images", response_model=List[DockerImage])
-def list_images(service: DockerService = Depends(get_docker_service)):
+async def list_images(service: DockerService = Depends(get_docker_service)):
     """
     List all Docker images.
     """
     try:
-        return service.list_images()
+        return await service.list_images()
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/containers", response_model=List[DockerContainer])
-def list_containers(
+async def list_containers(
     all_containers: bool = False, service: DockerService = Depends(get_docker_service)
 ):
     """
     List all Docker containers.
     """
     try:
-        return service.list_containers(all_containers)
+        return await service.list_containers(all_containers)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -95,59 +239,208 @@ def delete_dockerfile(
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.get("/containers/readiness", response_model=Dict[str, Any])
+def readiness_metrics(service: DockerService = Depends(get_docker_service)):
+    """
+    Report how long started containers took to become ready, and how.
+    """
+    return service.readiness_metrics()
+
+
+@router.get("/containers/stats", response_model=List[ContainerStats])
+async def container_stats(service: DockerService = Depends(get_docker_service)):
+    """
+    Latest CPU, memory, network and block I/O figures of every running
+    container.
+    """
+    try:
+        return await service.container_stats()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/containers/stats/events")
+def container_stats_events(
+    container_id: Optional[str] = None,
+    service: DockerService = Depends(get_docker_service),
+):
+    """
+    Stream resource usage samples of running containers (or of one) as
+    Server-Sent "stats" events, about one per container per second.
+    """
+    return event_stream_response(service.container_stats_events(container_id))
+
+
+@router.get("/containers/stats/metrics", response_model=Dict[str, Any])
+def container_stats_metrics(service: DockerService = Depends(get_docker_service)):
+    """
+    Report containers sampled, samples recorded and dropped, and the memory
+    held by sample history.
+    """
+    return service.container_stats_metrics()
+
+
+@router.get("/containers/{container_id}/stats", response_model=List[ContainerStats])
+async def container_stats_history(
+    container_id: str,
+    since: Optional[float] = None,
+    service: DockerService = Depends(get_docker_service),
+):
+    """
+    Recent resource usage samples of a running container, oldest first,
+    optionally only those after `since` (seconds since the epoch).
+    """
+    try:
+        samples = await service.container_stats_history(container_id, since)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if samples is None:
+        raise HTTPException(
+            status_code=404, detail=f"No stats for container {container_id}"
+        )
+    return samples
+
+
+@router.get("/containers/{container_id}/logs")
+def container_logs(
+    container_id: str,
+    tail: Optional[int] = None,
+    since: Optional[str] = None,
+    follow: bool = False,
+    limit_bytes: Optional[int] = None,
+    service: DockerService = Depends(get_docker_service),
+):
+    """
+    Stream a container's output as Server-Sent "log" events, then "end".
+    `tail` limits it to the last lines, `since` to output after a time
+    (epoch seconds, RFC 3339 or a duration such as "10m"), `limit_bytes` to
+    that much output; `follow` keeps streaming until the container stops or
+    the client disconnects.
+    """
+    if tail is not None and tail < 0:
+        raise HTTPException(status_code=400, detail="tail must not be negative")
+    if since:
+        try:
+            service.validate_log_since(since)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return event_stream_response(
+        service.container_log_events(container_id, tail, since, follow, limit_bytes)
+    )
+
+
+# Before the per-container routes: "bulk" isn't a container ID
+@router.post("/containers/bulk/{action}", response_model=BulkContainerSummary)
+async def bulk_container_action(
+    action: ContainerAction,
+    bulk: BulkContainerAction,
+    service: DockerService = Depends(get_docker_service),
+):
+    """
+    Start, stop, restart or delete many containers, given by ID and/or label
+    filters, in parallel and report the outcome for each. A failure doesn't
+    stop the others.
+    """
+    try:
+        return await service.bulk_container_action(
+            action, bulk.ids, bulk.labels, bulk.concurrency, bulk.timeout
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.delete("/containers/{container_id}", status_code=204)
-def delete_container(
+async def delete_container(
     container_id: str, service: DockerService = Depends(get_docker_service)
 ):
     """
     Delete a Docker container.
     """
     try:
-        service.delete_container(container_id)
+        await service.delete_container(container_id)
         return None
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post("/containers/{container_id}/start", status_code=204)
-def start_container(
+async def start_container(
     container_id: str, service: DockerService = Depends(get_docker_service)
 ):
     """
     Start a Docker container.
     """
     try:
-        service.start_container(container_id)
+        await service.start_container(container_id)
         return None
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post("/containers/{container_id}/stop", status_code=204)
-def stop_container(
+async def stop_container(
     container_id: str, service: DockerService = Depends(get_docker_service)
 ):
     """
     Stop a running Docker container.
     """
     try:
-        service.stop_container(container_id)
+        await service.stop_container(container_id)
         return None
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.get("/containers/{container_id}/resources", response_model=ContainerResources)
+async def get_container_resources(
+    container_id: str, service: DockerService = Depends(get_docker_service)
+):
+    """
+    Get the CPU, memory, process and block I/O limits of a container.
+    """
+    try:
+        return await service.get_container_resources(container_id)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.patch("/containers/{container_id}/resources", response_model=ContainerResources)
+async def update_container_resources(
+    container_id: str,
+    resources: ContainerResources,
+    service: DockerService = Depends(get_docker_service),
+):
+    """
+    Change the limits of a container without restarting it. Only the limits
+    given are changed.
+    """
+    try:
+        return await service.update_container_resources(container_id, resources)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.get("/search")
-def search_image(query: str, service: DockerService = Depends(get_docker_service)):
+async def search_image(
+    query: str, request: Request, service: DockerService = Depends(get_docker_service)
+):
     """
     Search for Docker images on Docker Hub.
     """
     try:
-        return service.search_image(query)
+        return await cancel_on_disconnect(request, service.search_image(query))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.get("/search/cache", response_model=Dict[str, int])
+def search_cache_metrics(service: DockerService = Depends(get_docker_service)):
+    """
+    Report image search cache hits, misses and evictions.
+    """
+    return service.search_cache_metrics()
+
+
 @router.get("/dockerfiles", response_model=List[Dockerfile])
 def list_dockerfiles(service: DockerService = Depends(get_docker_service)):
     """
@@ -160,47 +453,127 @@ def list_dockerfiles(service: DockerService = Depends(get_docker_service)):
 
 
 @router.post("/images/pull", response_model=DockerImage, status_code=201)
-def pull_image(
+async def pull_image(
+    request: Request,
     image_name: str,
     tag: str = "latest",
     service: DockerService = Depends(get_docker_service),
 ):
     """
-    Pull a Docker image from Docker Hub.
+    Pull a Docker image from Docker Hub. The pull is cancelled if the client
+    disconnects.
     """
     try:
-        return service.pull_image(image_name, tag)
+        return await cancel_on_disconnect(request, service.pull_image(image_name, tag))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post("/images/pull/stream")
+def pull_image_stream(
+    image_name: str,
+    tag: str = "latest",
+    service: DockerService = Depends(get_docker_service),
+):
+    """
+    Pull a Docker image, streaming the pull output as Server-Sent Events
+    ("log" lines and per-layer "progress", then "done" with the image or
+    "error"). Concurrent pulls of the same image share one pull, which is
+    cancelled once every client has disconnected.
+    """
+    return event_stream_response(service.pull_image_events(image_name, tag))
+
+
 @router.delete("/images/{image_id}", status_code=204)
-def delete_image(image_id: str, service: DockerService = Depends(get_docker_service)):
+async def delete_image(
+    image_id: str, service: DockerService = Depends(get_docker_service)
+):
     """
     Delete a Docker image.
     """
     try:
-        service.delete_image(image_id)
+        await service.delete_image(image_id)
         return None
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post("/containers/run", response_model=DockerContainer, status_code=201)
-def run_container(
+async def run_container(
     container: ContainerRun, service: DockerService = Depends(get_docker_service)
 ):
     """
     Run a Docker container with specified configuration.
     """
     try:
-        return service.run_container(
-            container.image_id, container.name, container.ports, container.environment
+        return await service.run_container(
+            container.image_id,
+            container.name,
+            container.ports,
+            container.environment,
+            container.resources,
+            container.auto_ports,
         )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post("/stacks", response_model=Stack, status_code=201)
+async def deploy_stack(
+    stack: StackCreate, service: DockerService = Depends(get_docker_service)
+):
+    """
+    Deploy a stack: containers on a private network, each started once the
+    members it depends on are ready, independent members in parallel.
+    Reports the outcome for each member.
+    """
+    try:
+        return await service.deploy_stack(stack)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/stacks", response_model=List[Stack])
+async def list_stacks(service: DockerService = Depends(get_docker_service)):
+    """
+    List stacks and the state of their containers.
+    """
+    try:
+        return await service.list_stacks()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/stacks/{name}", response_model=Stack)
+async def get_stack(name: str, service: DockerService = Depends(get_docker_service)):
+    """
+    Get a stack and the state of its containers.
+    """
+    try:
+        stack = await service.get_stack(name)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not stack:
+        raise HTTPException(status_code=404, detail=f"Stack {name} not found")
+    return stack
+
+
+@router.delete("/stacks/{name}", response_model=Stack)
+async def delete_stack(
+    name: str,
+    timeout: Optional[int] = Query(None, ge=0, le=3600),
+    service: DockerService = Depends(get_docker_service),
+):
+    """
+    Tear a stack down: dependents are removed before what they depend on,
+    then the network. Reports the outcome for each member.
+    """
+    try:
+        return await service.delete_stack(name, timeout)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.get("/templates", response_model=Dict[str, TemplateInfo])
 def get_templates(service: DockerService = Depends(get_docker_service)):
     """
@@ -249,20 +622,13 @@ def get_dockerfile(
     Get details of a specific Dockerfile.
     """
     try:
-        metadata = service._load_metadata()
-        dockerfile_info = metadata.get("dockerfiles", {}).get(dockerfile_id)
+        dockerfile = service.get_dockerfile(dockerfile_id)
 
-        if not dockerfile_info:
+        if not dockerfile:
             raise HTTPException(
                 status_code=404, detail=f"Dockerfile with ID {dockerfile_id} not found"
             )
 
-        return Dockerfile(
-            id=dockerfile_id,
-            name=dockerfile_info["name"],
-            path=dockerfile_info["path"],
-            created_at=datetime.fromisoformat(dockerfile_info["created_at"]),
-            updated_at=datetime.fromisoformat(dockerfile_info["updated_at"]),
-        )
+        return dockerfile
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,63 @@
+import os
+from fastapi import APIRouter
+from typing import Dict
+
+from app.utils.metadata_store import RESOURCE_FOLDERS, open_metadata_store
+from app.utils.host_capabilities import get_host_capabilities
+from app.utils.port_allocator import get_port_allocator
+from app.utils.scheduler import get_scheduler
+
+router = APIRouter(
+    prefix="/system",
+    tags=["system"],
+    responses={404: {"description": "Not found"}},
+)
+
+
+@router.get("/metadata", response_model=Dict[str, Dict])
+def metadata_stats():
+    """
+    Report metadata store statistics (backend, journal size, replay time, ...)
+    for every resource type.
+    """
+    return {
+        os.path.basename(folder): open_metadata_store(folder, flat_collection).stats()
+        for folder, flat_collection in RESOURCE_FOLDERS
+    }
+
+
+@router.get("/capabilities", response_model=Dict)
+def host_capabilities():
+    """
+    Report what the host can run: QEMU/Docker binaries and versions, /dev/kvm
+    access, accelerators, machine types, qemu-img formats and the Docker
+    server version, as recorded by the last probe.
+    """
+    return get_host_capabilities().snapshot()
+
+
+@router.post("/capabilities/refresh", response_model=Dict)
+def refresh_host_capabilities():
+    """
+    Re-probe the host (e.g. after installing or upgrading QEMU or Docker)
+    """
+    return get_host_capabilities().refresh()
+
+
+@router.get("/scheduler", response_model=Dict[str, Dict])
+def scheduler_metrics():
+    """
+    Report the operation scheduler's per-class limits, running and queued
+    operations (by priority) and queue wait times.
+    """
+    return get_scheduler().metrics()
+
+
+@router.get("/ports", response_model=Dict)
+def port_leases():
+    """
+    Report the host port pools (VM SSH forwards, container ports published
+    without a host port) and every port leased to a VM or container.
+    """
+    allocator = get_port_allocator()
+    return dict(allocator.metrics(), leases=allocator.leases())
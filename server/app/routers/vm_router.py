@@ -3,7 +3,7 @@ from typing import List
 
 from app.models.vm import CreateVMRequest, VMResponse, VMListResponse
 from app.services.vm_service import VMService
-from app.services.disk_service import DiskService
+from app.dependencies import get_vm_service
 
 router = APIRouter(
     prefix="/vms",
@@ -12,15 +12,6 @@ router = APIRouter(
 )
 
 
-# Dependencies
-def get_disk_service():
-    return DiskService()
-
-
-def get_vm_service(disk_service: DiskService = Depends(get_disk_service)):
-    return VMService(disk_service)
-
-
 @router.post("/", response_model=VMResponse, status_code=201)
 def create_vm(request: CreateVMRequest, service: VMService = Depends(get_vm_service)):
     """
@@ -55,34 +46,34 @@ def get_vm(vm_id: str, service: VMService = Depends(get_vm_service)):
 
 
 @router.post("/{vm_id}/start", response_model=VMResponse)
-def start_vm(vm_id: str, service: VMService = Depends(get_vm_service)):
+async def start_vm(vm_id: str, service: VMService = Depends(get_vm_service)):
     """
     Start a virtual machine.
     """
     try:
-        return service.start_vm(vm_id)
+        return await service.start_vm(vm_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post("/{vm_id}/stop", response_model=VMResponse)
-def stop_vm(vm_id: str, service: VMService = Depends(get_vm_service)):
+async def stop_vm(vm_id: str, service: VMService = Depends(get_vm_service)):
     """
     Stop a virtual machine.
     """
     try:
-        return service.stop_vm(vm_id)
+        return await service.stop_vm(vm_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.delete("/{vm_id}", status_code=204)
-def delete_vm(vm_id: str, service: VMService = Depends(get_vm_service)):
+async def delete_vm(vm_id: str, service: VMService = Depends(get_vm_service)):
     """
     Delete a virtual machine.
     """
     try:
-        success = service.delete_vm(vm_id)
+        success = await service.delete_vm(vm_id)
         if not success:
             raise HTTPException(status_code=404, detail="VM not found")
         return None
@@ -1,49 +1,67 @@
 import os
+import re
 import json
+import asyncio
 import logging
-from typing import List, Optional, Dict
+from typing import Any, AsyncIterator, List, Optional, Dict, Tuple
 from datetime import datetime
 from uuid import uuid4
 
-from app.config import VIRTUAL_DISK_FOLDER, VM_DATA_FOLDER
-from app.models.disk import DiskResponse, CreateDiskRequest, EditDiskRequest
-from app.utils.subprocess_utils import run_command, check_command_exists
+from app.config import VIRTUAL_DISK_FOLDER, VM_DATA_FOLDER, LONG_COMMAND_TIMEOUT
+from app.models.disk import (
+    DiskResponse,
+    CreateDiskRequest,
+    EditDiskRequest,
+    ConvertDiskRequest,
+)
+from app.utils.subprocess_utils import run_command_async, stream_command
+from app.utils.host_capabilities import get_host_capabilities
+from app.utils.scheduler import Priority
+from app.utils.metadata_store import open_metadata_store
 
 logger = logging.getLogger(__name__)
 
+# qemu-img -p progress output, e.g. "    (42.50/100%)"
+_PROGRESS = re.compile(r"\((\d+(?:\.\d+)?)/100%\)")
+
 
 class DiskService:
     def __init__(self):
         """Initialize the disk service and ensure QEMU is available"""
-        if not check_command_exists("qemu-img"):
+        self.capabilities = get_host_capabilities()
+        if not self.capabilities.has_binary("qemu-img"):
             raise RuntimeError("qemu-img command not found - please install QEMU")
 
-        # Create disk metadata file if it doesn't exist
-        self.metadata_file = os.path.join(VIRTUAL_DISK_FOLDER, "metadata.json")
-        if not os.path.exists(self.metadata_file):
-            with open(self.metadata_file, "w") as f:
-                json.dump({}, f)
-
-    def _load_metadata(self) -> Dict:
-        """Load disk metadata from JSON file"""
-        try:
-            with open(self.metadata_file, "r") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            return {}
-
-    def _save_metadata(self, metadata: Dict) -> None:
-        """Save disk metadata to JSON file"""
-        with open(self.metadata_file, "w") as f:
-            json.dump(metadata, f, default=str)
+        # Shared metadata store (SQLite by default, see METADATA_BACKEND)
+        self._store = open_metadata_store(VIRTUAL_DISK_FOLDER, flat_collection="disks")
 
-    def _get_disk_size_info(self, path: str) -> Dict:
+    async def _get_disk_size_info(self, path: str) -> Dict:
         """Get detailed disk size information using qemu-img info"""
         command = ["qemu-img", "info", "--output=json", path]
-        stdout, _, _ = run_command(command)
+        stdout, _, _ = await run_command_async(
+            command, op_class="disk_io", priority=Priority.INTERACTIVE
+        )
         return json.loads(stdout)
 
-    def create_disk(self, request: CreateDiskRequest) -> DiskResponse:
+    def validate_format(self, disk_format: str) -> None:
+        """
+        Check that a disk format can be created on this host
+
+        Args:
+            disk_format: Image format, e.g. "qcow2"
+
+        Raises:
+            ValueError: If the format is unsupported
+        """
+        if disk_format not in ["qcow2", "raw", "vdi", "vmdk", "vhdx"]:
+            raise ValueError(f"Unsupported disk format: {disk_format}")
+        supported_formats = self.capabilities.qemu_img_formats
+        if supported_formats and disk_format not in supported_formats:
+            raise ValueError(
+                f"Disk format {disk_format} is not supported by this qemu-img build"
+            )
+
+    async def create_disk(self, request: CreateDiskRequest) -> DiskResponse:
         """
         Create a new virtual disk
 
@@ -54,8 +72,7 @@ class DiskService:
             DiskResponse object with the created disk details
         """
         # Validate format
-        if request.format not in ["qcow2", "raw", "vdi", "vmdk", "vhdx"]:
-            raise ValueError(f"Unsupported disk format: {request.format}")
+        self.validate_format(request.format)
 
         # Create unique filename
         disk_id = str(uuid4())
@@ -80,7 +97,13 @@ class DiskService:
         else:
             command.extend(["-f", request.format, path, request.size])
 
-        run_command(command)
+        try:
+            await run_command_async(command, op_class="disk_io")
+        except BaseException:
+            # Don't leave a partial image behind if qemu-img failed or was cancelled
+            if os.path.exists(path):
+                os.remove(path)
+            raise
 
         # Create and save metadata
         disk_info = {
@@ -95,9 +118,8 @@ class DiskService:
             "updated_at": datetime.now().isoformat(),
         }
 
-        metadata = self._load_metadata()
-        metadata[disk_id] = disk_info
-        self._save_metadata(metadata)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._store.put, "disks", disk_id, disk_info)
 
         return DiskResponse(
             id=disk_id,
@@ -111,6 +133,79 @@ class DiskService:
             updated_at=datetime.fromisoformat(disk_info["updated_at"]),
         )
 
+    async def convert_disk_events(
+        self, disk_id: str, request: ConvertDiskRequest
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Convert a disk into a new disk of another format, reporting progress
+
+        The source disk is left untouched.
+
+        Args:
+            disk_id: ID of the disk to convert
+            request: ConvertDiskRequest with the target format and optional name
+
+        Yields:
+            ("progress", {"percent"}) as qemu-img advances, then
+            ("done", DiskResponse) for the new disk
+        """
+        source = self._store.get("disks", disk_id)
+        if source is None or not os.path.exists(source["path"]):
+            raise ValueError(f"Disk with ID {disk_id} not found")
+        self.validate_format(request.format)
+
+        name = request.name or f"{source['name']}-{request.format}"
+        new_id = str(uuid4())
+        filename = f"{name.replace(' ', '_')}_{new_id}.{request.format}"
+        path = os.path.join(VIRTUAL_DISK_FOLDER, filename)
+
+        command = [
+            "qemu-img",
+            "convert",
+            "-p",
+            "-f",
+            source["format"],
+            "-O",
+            request.format,
+            source["path"],
+            path,
+        ]
+        try:
+            last_percent = None
+            # Conversions are background work; creations and reads go first
+            async for _, line in stream_command(
+                command,
+                timeout=LONG_COMMAND_TIMEOUT,
+                op_class="disk_io",
+                priority=Priority.BULK,
+            ):
+                match = _PROGRESS.search(line)
+                if match and float(match.group(1)) != last_percent:
+                    last_percent = float(match.group(1))
+                    yield "progress", {"percent": last_percent}
+        except BaseException:
+            # Don't leave a partial image behind if the conversion failed or
+            # the client went away
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+
+        disk_info = {
+            "id": new_id,
+            "name": name,
+            "size": source["size"],
+            "format": request.format,
+            "path": path,
+            "in_use": False,
+            "dynamic": source.get("dynamic", True),
+            "created_at": datetime.now().isoformat(),
+            "updated_at": datetime.now().isoformat(),
+        }
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._store.put, "disks", new_id, disk_info)
+
+        yield "done", self.get_disk(new_id)
+
     def list_disks(self) -> List[DiskResponse]:
         """
         List all available virtual disks
@@ -118,7 +213,7 @@ class DiskService:
         Returns:
             List of DiskResponse objects
         """
-        metadata = self._load_metadata()
+        metadata = self._store.all("disks")
         return [
             DiskResponse(
                 id=disk_id,
@@ -145,11 +240,10 @@ class DiskService:
         Returns:
             DiskResponse object or None if not found
         """
-        metadata = self._load_metadata()
-        if disk_id not in metadata:
+        info = self._store.get("disks", disk_id)
+        if info is None:
             return None
 
-        info = metadata[disk_id]
         if not os.path.exists(info["path"]):
             return None
 
@@ -175,26 +269,33 @@ class DiskService:
         Returns:
             Boolean indicating success
         """
-        metadata = self._load_metadata()
-        if disk_id not in metadata:
-            return False
+        # Hold the metadata lock so the in-use check can't race another worker
+        with self._store.locked():
+            disk_info = self._store.get("disks", disk_id)
+            if disk_info is None:
+                return False
 
-        disk_info = metadata[disk_id]
+            # Check if disk is in use
+            if disk_info.get("in_use", False):
+                raise ValueError("Cannot delete disk that is in use by a VM")
 
-        # Check if disk is in use
-        if disk_info.get("in_use", False):
-            raise ValueError("Cannot delete disk that is in use by a VM")
+            # Delete the file if it exists
+            if os.path.exists(disk_info["path"]):
+                os.remove(disk_info["path"])
 
-        # Delete the file if it exists
-        if os.path.exists(disk_info["path"]):
-            os.remove(disk_info["path"])
-
-        # Remove from metadata
-        del metadata[disk_id]
-        self._save_metadata(metadata)
+            # Remove from metadata
+            self._store.delete("disks", disk_id)
 
         return True
 
+    def locked(self):
+        """
+        Hold the disk metadata lock across several calls
+
+        Callers that also take the VM metadata lock must take this one first.
+        """
+        return self._store.locked()
+
     def mark_disk_in_use(self, disk_id: str, in_use: bool = True) -> bool:
         """
         Mark a disk as in use or not in use
@@ -206,17 +307,14 @@ class DiskService:
         Returns:
             Boolean indicating success
         """
-        metadata = self._load_metadata()
-        if disk_id not in metadata:
-            return False
-
-        metadata[disk_id]["in_use"] = in_use
-        metadata[disk_id]["updated_at"] = datetime.now().isoformat()
-        self._save_metadata(metadata)
-
-        return True
+        updated = self._store.update(
+            "disks",
+            disk_id,
+            {"in_use": in_use, "updated_at": datetime.now().isoformat()},
+        )
+        return updated is not None
 
-    def edit_disk(
+    async def edit_disk(
         self, disk_id: str, request: EditDiskRequest
     ) -> Optional[DiskResponse]:
         """
@@ -229,50 +327,27 @@ class DiskService:
         Returns:
             Updated DiskResponse object or None if disk not found
         """
-        metadata = self._load_metadata()
-        if disk_id not in metadata:
+        # The metadata lock belongs to the thread holding it, so the locked
+        # steps run in a worker thread rather than on the event loop. The
+        # resize itself runs unlocked in a disk_io slot, with the disk claimed
+        # as in use so it can't be attached or deleted meanwhile.
+        loop = asyncio.get_running_loop()
+        started = await loop.run_in_executor(
+            None, self._begin_disk_edit, disk_id, request
+        )
+        if started is None:
             return None
-
-        disk_info = metadata[disk_id]
-
-        # Check if disk is in use
-        if disk_info.get("in_use", False):
-            raise ValueError("Cannot edit disk that is in use by a VM")
-
-        # Update name if provided
-        if request.name is not None:
-            old_path = disk_info["path"]
-            new_filename = (
-                f"{request.name.replace(' ', '_')}_{disk_id}.{disk_info['format']}"
+        disk_info, resize_command = started
+
+        if resize_command is not None:
+            try:
+                await run_command_async(resize_command, op_class="disk_io")
+            except BaseException:
+                await loop.run_in_executor(None, self._finish_disk_edit, disk_id, None)
+                raise
+            disk_info = await loop.run_in_executor(
+                None, self._finish_disk_edit, disk_id, request.size
             )
-            new_path = os.path.join(VIRTUAL_DISK_FOLDER, new_filename)
-
-            # Rename the file
-            if os.path.exists(old_path):
-                os.rename(old_path, new_path)
-                disk_info["path"] = new_path
-                disk_info["name"] = request.name
-
-        # Resize disk if new size provided
-        if request.size is not None:
-            current_size = disk_info["size"]
-            command = ["qemu-img", "resize", "-f", disk_info["format"]]
-
-            # Check if the new size is less than the current size
-            if request.size < current_size:
-                logger.warning(
-                    "Shrinking disk image - this will delete all data beyond the shrunken image's end"
-                )
-                command.append("--shrink")
-
-            command.extend([disk_info["path"], request.size])
-            run_command(command)
-            disk_info["size"] = request.size
-
-        # Update metadata
-        disk_info["updated_at"] = datetime.now().isoformat()
-        metadata[disk_id] = disk_info
-        self._save_metadata(metadata)
 
         return DiskResponse(
             id=disk_id,
@@ -285,3 +360,72 @@ class DiskService:
             created_at=datetime.fromisoformat(disk_info["created_at"]),
             updated_at=datetime.fromisoformat(disk_info["updated_at"]),
         )
+
+    def _begin_disk_edit(
+        self, disk_id: str, request: EditDiskRequest
+    ) -> Optional[Tuple[Dict, Optional[List[str]]]]:
+        """
+        Rename a disk and, if it's being resized, claim it, under the metadata lock
+
+        Returns:
+            (disk record, qemu-img resize command or None), or None if the
+            disk doesn't exist
+        """
+        with self._store.locked():
+            disk_info = self._store.get("disks", disk_id)
+            if disk_info is None:
+                return None
+
+            # Check if disk is in use
+            if disk_info.get("in_use", False):
+                raise ValueError("Cannot edit disk that is in use by a VM")
+
+            # Update name if provided
+            if request.name is not None:
+                old_path = disk_info["path"]
+                new_filename = (
+                    f"{request.name.replace(' ', '_')}_{disk_id}.{disk_info['format']}"
+                )
+                new_path = os.path.join(VIRTUAL_DISK_FOLDER, new_filename)
+
+                # Rename the file
+                if os.path.exists(old_path):
+                    os.rename(old_path, new_path)
+                    disk_info["path"] = new_path
+                    disk_info["name"] = request.name
+
+            # Build the resize command if new size provided
+            command = None
+            if request.size is not None:
+                current_size = disk_info["size"]
+                command = ["qemu-img", "resize", "-f", disk_info["format"]]
+
+                # Check if the new size is less than the current size
+                if request.size < current_size:
+                    logger.warning(
+                        "Shrinking disk image - this will delete all data beyond the shrunken image's end"
+                    )
+                    command.append("--shrink")
+
+                command.extend([disk_info["path"], request.size])
+                # Held until _finish_disk_edit
+                disk_info["in_use"] = True
+
+            # Update metadata
+            disk_info["updated_at"] = datetime.now().isoformat()
+            self._store.put("disks", disk_id, disk_info)
+
+        return disk_info, command
+
+    def _finish_disk_edit(self, disk_id: str, size: Optional[str]) -> Optional[Dict]:
+        """
+        Release the claim taken for a resize and record the new size
+
+        Args:
+            disk_id: ID of the disk
+            size: New size, or None if the resize failed
+        """
+        changes = {"in_use": False, "updated_at": datetime.now().isoformat()}
+        if size is not None:
+            changes["size"] = size
+        return self._store.update("disks", disk_id, changes)
@@ -1,48 +1,511 @@
 import os
+import re
 import json
+import time
+import codecs
+import hashlib
+import shutil
+import asyncio
 import logging
 import subprocess
-from typing import List, Optional, Dict, Any
-from datetime import datetime
+from collections import Counter
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    List,
+    Optional,
+    Dict,
+    Any,
+    Tuple,
+    Union,
+)
+from datetime import datetime, timezone
+from urllib.parse import quote
 from uuid import uuid4
 
-from app.config import DOCKER_DATA_FOLDER
-from app.models.docker import DockerImage, DockerContainer, Dockerfile
-from app.utils.subprocess_utils import run_command, check_command_exists
+from app.config import (
+    BATCH_BUILD_CONCURRENCY,
+    BULK_CONTAINER_CONCURRENCY,
+    CONTAINER_READY_MAX_INTERVAL,
+    CONTAINER_READY_TIMEOUT,
+    CONTAINER_STATS_HISTORY,
+    COMMAND_TIMEOUT,
+    DOCKER_DATA_FOLDER,
+    LOG_CHUNK_BYTES,
+    LOG_EXCERPT_CHARS,
+    LONG_COMMAND_TIMEOUT,
+    SEARCH_CACHE_SIZE,
+    SEARCH_CACHE_TTL,
+    SEARCH_LIMIT,
+)
+from app.models.base import JobStatus
+from app.models.docker import (
+    BatchBuildResult,
+    BatchBuildSummary,
+    BulkContainerResult,
+    BulkContainerSummary,
+    ContainerAction,
+    ContainerResources,
+    ContainerStats,
+    BuildJob,
+    BuildStep,
+    DockerImage,
+    DockerContainer,
+    Dockerfile,
+    ImageBuild,
+    Stack,
+    StackCreate,
+    StackMemberResult,
+)
+from app.utils.subprocess_utils import (
+    CommandError,
+    run_command_async,
+    stream_command,
+)
+from app.utils.docker_api import DockerAPI, DockerAPIError
+from app.utils.container_stats import ContainerStatsSampler
+from app.utils.dependency_graph import (
+    DependencyFailedError,
+    run_in_dependency_order,
+    topological_order,
+)
+from app.utils.docker_mirror import (
+    DockerStateMirror,
+    container_status,
+    parse_docker_time,
+)
+from app.utils.host_capabilities import get_host_capabilities
+from app.utils.jobs import Job, JobManager
+from app.utils.readiness import LatencyStats, poll_until, probe_tcp
+from app.utils.search_cache import SearchCache, normalize_query
+from app.utils.singleflight import SingleFlight
+from app.utils.scheduler import Priority
+from app.utils.metadata_store import open_metadata_store
+from app.utils.port_allocator import PortConflictError, get_port_allocator
 from app.templates.dockerfile_templates import DOCKERFILE_TEMPLATES
 
 logger = logging.getLogger(__name__)
 
+# Decimal units, as printed by the docker CLI
+SIZE_UNITS = {"B": 1, "kB": 10**3, "MB": 10**6, "GB": 10**9, "TB": 10**12}
+
+# Build output lines that start a step: "Step 2/5 : RUN make" from the
+# legacy builder, "#6 [2/5] RUN make" or "#9 [builder 2/5] ..." from BuildKit
+BUILD_STEP_PATTERNS = (
+    re.compile(r"^Step (?P<step>\d+)/(?P<total>\d+) : (?P<instruction>.+)$"),
+    re.compile(
+        r"^#\d+ \[(?:(?P<stage>\S+) )?(?P<step>\d+)/(?P<total>\d+)\] "
+        r"(?P<instruction>.+)$"
+    ),
+)
+
+# Per-layer statuses reported while pulling, and those that end a layer
+LAYER_STATUSES = (
+    "Pulling fs layer",
+    "Waiting",
+    "Downloading",
+    "Verifying Checksum",
+    "Download complete",
+    "Extracting",
+    "Pull complete",
+    "Already exists",
+)
+LAYER_DONE_STATUSES = ("Pull complete", "Already exists")
+# Build output events held for each requester of a build; one that falls
+# further behind misses output instead of holding it all in memory
+BUILD_OUTPUT_BUFFER = 1000
+
+
+def _short_id(docker_id: str) -> str:
+    """12-character ID as printed by the docker CLI"""
+    return docker_id.split(":")[-1][:12]
+
+
+def _display_tag(repo_tag: str) -> str:
+    """repository:tag, or just the repository when the image is untagged"""
+    repository, _, tag = repo_tag.rpartition(":")
+    return repo_tag if tag != "<none>" else repository
+
+
+def _build_step(line: str) -> Optional[Dict[str, Any]]:
+    """Step a build output line starts, if any"""
+    for pattern in BUILD_STEP_PATTERNS:
+        match = pattern.match(line)
+        if match:
+            groups = match.groupdict()
+            return {
+                "step": int(groups["step"]),
+                "total": int(groups["total"]),
+                "instruction": groups["instruction"].strip(),
+                "stage": groups.get("stage"),
+            }
+    return None
+
+
+def _build_key(dockerfile: bytes, build_args: Optional[Dict[str, str]]) -> str:
+    """Build cache key: hash of everything that goes into a build"""
+    digest = hashlib.sha256(dockerfile)
+    digest.update(json.dumps(build_args or {}, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def _full_tag(tag: str) -> str:
+    """Tag as Docker records it, e.g. "app" -> "app:latest" """
+    return tag if ":" in tag.rsplit("/", 1)[-1] else f"{tag}:latest"
+
+
+async def _forward(output: asyncio.Queue, task: asyncio.Future) -> AsyncIterator[Any]:
+    """Yield what a background task puts on output until the task finishes"""
+    while True:
+        item = asyncio.ensure_future(output.get())
+        try:
+            await asyncio.wait([item, task], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not item.done():
+                item.cancel()
+        if not item.done() or item.cancelled():
+            break
+        yield item.result()
+    while not output.empty():
+        yield output.get_nowait()
+
+
+def _parse_cli_time(value: Optional[str]) -> Optional[datetime]:
+    """Parse a docker CLI time such as "2024-05-01 10:00:00 +0000 UTC" """
+    try:
+        return datetime.strptime(" ".join(value.split()[:3]), "%Y-%m-%d %H:%M:%S %z")
+    except (AttributeError, ValueError):
+        return None
+
+
+def _parse_cli_size(value: Optional[str]) -> Optional[int]:
+    """Parse a docker CLI size such as "187MB" into bytes"""
+    match = re.fullmatch(r"([\d.]+)\s*([kMGT]?B)", value or "")
+    if not match:
+        return None
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def _parse_since(value: str) -> float:
+    """
+    Parse a log "since" time: seconds since the epoch, an RFC 3339
+    timestamp, or a duration before now such as "90s", "10m" or "2h"
+    """
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhd])", value)
+    if match:
+        unit = {"s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+        return time.time() - float(match.group(1)) * unit
+    try:
+        parsed = parse_docker_time(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError(f"Invalid since value: {value}")
+    return parsed.timestamp()
+
+
+# Docker refuses memory limits below this
+MIN_CONTAINER_MEMORY = 6 * 1024 * 1024
+
+# ContainerResources field -> (HostConfig key, docker run/update flag)
+RESOURCE_OPTIONS = {
+    "cpu_shares": ("CpuShares", "--cpu-shares"),
+    "cpuset_cpus": ("CpusetCpus", "--cpuset-cpus"),
+    "memory": ("Memory", "--memory"),
+    "memory_swap": ("MemorySwap", "--memory-swap"),
+    "pids_limit": ("PidsLimit", "--pids-limit"),
+    "blkio_weight": ("BlkioWeight", "--blkio-weight"),
+}
+DEVICE_RATE_OPTIONS = {
+    "device_read_bps": ("BlkioDeviceReadBps", "--device-read-bps"),
+    "device_write_bps": ("BlkioDeviceWriteBps", "--device-write-bps"),
+}
+
+
+def _parse_cpuset(spec: str) -> List[int]:
+    """CPU numbers of a cpuset such as "0-2,4" """
+    cpus = []
+    for part in spec.split(","):
+        first, _, last = part.strip().partition("-")
+        if not first.isdigit() or (last and not last.isdigit()):
+            raise ValueError(f"Invalid cpuset: {spec}")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def _validate_resources(resources: ContainerResources, host: Dict[str, int]) -> None:
+    """
+    Check resource limits against each other and the Docker host's capacity
+
+    Args:
+        resources: Requested limits
+        host: The host's "cpus" and "memory" (bytes)
+
+    Raises:
+        ValueError: If a limit can't be applied
+    """
+    if resources.cpus is not None and not 0 < resources.cpus <= host["cpus"]:
+        raise ValueError(f"cpus must be more than 0 and at most {host['cpus']}")
+    if resources.cpu_shares is not None and resources.cpu_shares < 2:
+        raise ValueError("cpu_shares must be at least 2")
+    if resources.cpuset_cpus:
+        missing = [
+            cpu for cpu in _parse_cpuset(resources.cpuset_cpus) if cpu >= host["cpus"]
+        ]
+        if missing:
+            raise ValueError(
+                f"cpuset_cpus names CPUs the host doesn't have: {missing} "
+                f"(it has 0-{host['cpus'] - 1})"
+            )
+    if resources.memory is not None and not (
+        MIN_CONTAINER_MEMORY <= resources.memory <= host["memory"]
+    ):
+        raise ValueError(
+            f"memory must be between {MIN_CONTAINER_MEMORY} and {host['memory']} "
+            "bytes"
+        )
+    if resources.memory_swap is not None and resources.memory_swap != -1:
+        if resources.memory is None or resources.memory_swap < resources.memory:
+            raise ValueError(
+                "memory_swap (memory plus swap) needs memory and must be at least it"
+            )
+    if resources.pids_limit is not None and (
+        resources.pids_limit == 0 or resources.pids_limit < -1
+    ):
+        raise ValueError("pids_limit must be positive, or -1 for no limit")
+    if resources.blkio_weight is not None and not 10 <= resources.blkio_weight <= 1000:
+        raise ValueError("blkio_weight must be between 10 and 1000")
+    for field in DEVICE_RATE_OPTIONS:
+        for path, rate in (getattr(resources, field) or {}).items():
+            if not path.startswith("/dev/") or rate <= 0:
+                raise ValueError(f"{field} needs /dev paths and positive rates")
+
+
+def _host_config_resources(resources: ContainerResources) -> Dict[str, Any]:
+    """HostConfig (or container update) entries for the limits that are set"""
+    config: Dict[str, Any] = {}
+    if resources.cpus is not None:
+        config["NanoCpus"] = int(resources.cpus * 1e9)
+    for field, (key, _) in RESOURCE_OPTIONS.items():
+        value = getattr(resources, field)
+        if value is not None:
+            config[key] = value
+    for field, (key, _) in DEVICE_RATE_OPTIONS.items():
+        rates = getattr(resources, field)
+        if rates is not None:
+            config[key] = [{"Path": path, "Rate": rate} for path, rate in rates.items()]
+    return config
+
+
+def _resource_flags(resources: ContainerResources) -> List[str]:
+    """docker run/update flags for the limits that are set"""
+    flags = []
+    if resources.cpus is not None:
+        flags.extend(["--cpus", str(resources.cpus)])
+    for field, (_, flag) in RESOURCE_OPTIONS.items():
+        value = getattr(resources, field)
+        if value is not None:
+            flags.extend([flag, str(value)])
+    for field, (_, flag) in DEVICE_RATE_OPTIONS.items():
+        for path, rate in (getattr(resources, field) or {}).items():
+            flags.extend([flag, f"{path}:{rate}"])
+    return flags
+
+
+def _container_resources(host_config: Dict[str, Any]) -> ContainerResources:
+    """Limits recorded in a container's HostConfig (0 and empty mean unset)"""
+    values: Dict[str, Any] = {}
+    if host_config.get("NanoCpus"):
+        values["cpus"] = host_config["NanoCpus"] / 1e9
+    for field, (key, _) in RESOURCE_OPTIONS.items():
+        if host_config.get(key):
+            values[field] = host_config[key]
+    for field, (key, _) in DEVICE_RATE_OPTIONS.items():
+        if host_config.get(key):
+            values[field] = {rate["Path"]: rate["Rate"] for rate in host_config[key]}
+    return ContainerResources(**values)
+
+
+# Label put on a stack's containers and network, set to the stack's name
+STACK_LABEL = "stack"
+# Names docker accepts for containers and networks
+DOCKER_NAME = re.compile(r"^[a-zA-Z0-9][a-zA-Z0-9_.-]*$")
+
+
+def _stack_graph(stack: StackCreate) -> Dict[str, List[str]]:
+    """
+    Dependencies of each member of a stack, checked
+
+    Raises:
+        ValueError: On invalid or duplicate names, unknown dependencies or
+                    a dependency cycle
+    """
+    graph: Dict[str, List[str]] = {}
+    for name in [stack.name] + [member.name for member in stack.members]:
+        if not DOCKER_NAME.match(name):
+            raise ValueError(f"Invalid name: {name}")
+    for member in stack.members:
+        if member.name in graph:
+            raise ValueError(f"Duplicate stack member: {member.name}")
+        graph[member.name] = list(member.depends_on)
+    if not graph:
+        raise ValueError("A stack needs at least one member")
+    topological_order(graph)
+    return graph
+
+
+def _host_port(binding: str) -> int:
+    """Host port of a port mapping key ("8080" or "127.0.0.1:8080")"""
+    port = str(binding).rpartition(":")[2]
+    if not port.isdigit():
+        raise ValueError(f"Invalid host port: {binding}")
+    return int(port)
+
+
+def _port_key(container_port: str) -> str:
+    """Container port as Docker keys it, e.g. "80" -> "80/tcp" """
+    return container_port if "/" in container_port else f"{container_port}/tcp"
+
+
+def _port_bindings(info: Dict[str, Any]) -> Dict[str, List[int]]:
+    """Host ports a container publishes, by container port ("80/tcp")"""
+    bindings = (info.get("HostConfig") or {}).get("PortBindings") or {}
+    return {
+        container_port: sorted(
+            int(binding["HostPort"])
+            for binding in host_bindings or []
+            if binding.get("HostPort")
+        )
+        for container_port, host_bindings in bindings.items()
+    }
+
+
+def _same_ports(
+    published: Dict[str, List[int]], ports: Dict[str, str], auto_ports: List[str]
+) -> bool:
+    """Whether a container publishes exactly the ports run_container asks for"""
+    wanted: Dict[str, List[Optional[int]]] = {}
+    for host_port, container_port in ports.items():
+        wanted.setdefault(_port_key(container_port), []).append(_host_port(host_port))
+    for container_port in auto_ports:
+        wanted.setdefault(_port_key(container_port), []).append(None)
+    if set(wanted) != set(published):
+        return False
+    for container_port, host_ports in wanted.items():
+        fixed = [port for port in host_ports if port is not None]
+        actual = published[container_port]
+        if len(host_ports) != len(actual) or not set(fixed) <= set(actual):
+            return False
+    return True
+
+
+def _stack_model(
+    record: Dict[str, Any], containers: Dict[str, DockerContainer]
+) -> Stack:
+    """Stack from its record and its containers by name"""
+    name = record["name"]
+    return Stack(
+        name=name,
+        network=record["network"],
+        created_at=record["created_at"],
+        members=[
+            StackMemberResult(
+                name=member["name"],
+                container=containers.get(f"{name}_{member['name']}"),
+            )
+            for member in record["definition"]["members"]
+        ],
+    )
+
+
+def _container_model(info: Dict[str, Any]) -> DockerContainer:
+    """DockerContainer from a container's inspect document"""
+    created_at = parse_docker_time(info["Created"])
+    # Last start or stop, whichever is later
+    changes = [
+        parse_docker_time(info["State"].get("StartedAt")),
+        parse_docker_time(info["State"].get("FinishedAt")),
+        created_at,
+    ]
+    return DockerContainer(
+        id=_short_id(info["Id"]),
+        name=info["Name"].lstrip("/"),
+        image=info["Config"]["Image"],
+        status=container_status(info["State"]),
+        created_at=created_at,
+        updated_at=max(change for change in changes if change),
+        resources=(
+            _container_resources(info["HostConfig"]) if "HostConfig" in info else None
+        ),
+    )
+
+
+def _published_ports(info: Dict[str, Any]) -> List[Tuple[str, int]]:
+    """Host addresses and ports a container's TCP ports are published on"""
+    published = []
+    ports = (info.get("NetworkSettings") or {}).get("Ports") or {}
+    for container_port, bindings in ports.items():
+        if not container_port.endswith("/tcp"):
+            continue
+        for binding in bindings or []:
+            host = binding.get("HostIp") or "0.0.0.0"
+            # Bound to all interfaces: reachable on loopback
+            host = {"0.0.0.0": "127.0.0.1", "::": "::1"}.get(host, host)
+            published.append((host, int(binding["HostPort"])))
+    return published
+
 
 class DockerService:
     def __init__(self):
         """Initialize the Docker service and ensure Docker is available"""
-        if not check_command_exists("docker"):
+        capabilities = get_host_capabilities()
+        if not capabilities.has_binary("docker"):
             raise RuntimeError("docker command not found - please install Docker")
 
-        # Create Docker metadata file if it doesn't exist
-        self.metadata_file = os.path.join(DOCKER_DATA_FOLDER, "metadata.json")
-        if not os.path.exists(self.metadata_file):
-            with open(self.metadata_file, "w") as f:
-                json.dump({}, f)
+        # Talk to the daemon over its socket when it answers; otherwise (and
+        # for image builds) fall back to the docker CLI
+        socket_path = capabilities.docker_socket
+        self._api = DockerAPI(socket_path) if socket_path else None
+        # Event-driven copy of containers and images that listings read from
+        # (see start_state_mirror)
+        self._mirror = DockerStateMirror(self._api) if self._api else None
+        # Builds submitted to run in the background
+        self._build_jobs = JobManager("build")
+        # Build cache (see build_image_events)
+        self._build_flight = SingleFlight()
+        self._build_listeners: Dict[str, List[Callable[[Tuple[str, Any]], None]]] = {}
+        self._build_cache = {"hits": 0, "misses": 0}
+        # Pulls in progress, shared by everyone pulling the same image:tag
+        self._pull_flight = SingleFlight()
+        self._pull_listeners: Dict[str, List[Callable[[Tuple[str, Any]], None]]] = {}
+        self._pull_layers: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # Docker Hub search results
+        self._search_cache = SearchCache(
+            SEARCH_CACHE_TTL, SEARCH_CACHE_SIZE, SEARCH_LIMIT
+        )
+        self._search_flight = SingleFlight()
+        # How long started containers took to become ready, and how
+        self._readiness = LatencyStats()
+        # Docker host capacity that resource limits are checked against
+        self._host_info: Optional[Dict[str, int]] = None
+        # Host ports published by containers, shared with VMs
+        self._ports = get_port_allocator()
+        # CPU, memory, network and block I/O of running containers
+        self._stats = ContainerStatsSampler(self._api, CONTAINER_STATS_HISTORY)
+
+        # Shared metadata store (SQLite by default, see METADATA_BACKEND)
+        self._store = open_metadata_store(DOCKER_DATA_FOLDER)
 
         # Create Dockerfiles directory if it doesn't exist
         self.dockerfiles_dir = os.path.join(DOCKER_DATA_FOLDER, "dockerfiles")
         os.makedirs(self.dockerfiles_dir, exist_ok=True)
 
-    def _load_metadata(self) -> Dict:
-        """Load Docker metadata from JSON file"""
-        try:
-            with open(self.metadata_file, "r") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            return {}
-
-    def _save_metadata(self, metadata: Dict) -> None:
-        """Save Docker metadata to JSON file"""
-        with open(self.metadata_file, "w") as f:
-            json.dump(metadata, f, default=str)
-
     def create_dockerfile(
         self, name: str, content: str, custom_path: Optional[str] = None
     ) -> Dockerfile:
@@ -83,11 +546,7 @@ class DockerService:
             "updated_at": datetime.now().isoformat(),
         }
 
-        metadata = self._load_metadata()
-        if "dockerfiles" not in metadata:
-            metadata["dockerfiles"] = {}
-        metadata["dockerfiles"][dockerfile_id] = dockerfile_info
-        self._save_metadata(metadata)
+        self._store.put("dockerfiles", dockerfile_id, dockerfile_info)
 
         return Dockerfile(
             id=dockerfile_id,
@@ -97,115 +556,498 @@ class DockerService:
             updated_at=datetime.fromisoformat(dockerfile_info["updated_at"]),
         )
 
-    def build_image(self, dockerfile_id: str, tag: str) -> DockerImage:
+    async def build_image(
+        self, dockerfile_id: str, tag: str, build_args: Optional[Dict[str, str]] = None
+    ) -> DockerImage:
         """
         Build a Docker image from a Dockerfile
 
         Args:
             dockerfile_id: ID of the Dockerfile to use
             tag: Tag for the Docker image
+            build_args: Optional build-time variables (--build-arg)
 
         Returns:
             DockerImage object with the built image details
         """
-        metadata = self._load_metadata()
-        if (
-            "dockerfiles" not in metadata
-            or dockerfile_id not in metadata["dockerfiles"]
+        async for event, data in self.build_image_events(
+            dockerfile_id, tag, build_args
         ):
+            if event == "done":
+                return data
+        raise RuntimeError("Failed to build Docker image")
+
+    async def build_image_events(
+        self,
+        dockerfile_id: str,
+        tag: str,
+        build_args: Optional[Dict[str, str]] = None,
+        priority: Priority = Priority.NORMAL,
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Build a Docker image, yielding the build output as it happens
+
+        Builds are keyed by the Dockerfile content and build args. If an
+        image with the same key still exists it is reused (and tagged) without
+        building; an identical build already in progress is joined instead of
+        started again, and everyone waiting for it receives its output from
+        the moment they joined.
+
+        Args:
+            dockerfile_id: ID of the Dockerfile to use
+            tag: Tag for the Docker image
+            build_args: Optional build-time variables (--build-arg)
+            priority: Scheduler queue priority of the build
+
+        Yields:
+            ("log", {"stream", "line"}) for each output line,
+            ("step", {"step", "total", "instruction", "stage"}) when a
+            Dockerfile step starts, then ("done", DockerImage) once the image
+            is built
+        """
+        dockerfile_info = self._store.get("dockerfiles", dockerfile_id)
+        if dockerfile_info is None:
             raise ValueError(f"Dockerfile with ID {dockerfile_id} not found")
 
-        dockerfile_info = metadata["dockerfiles"][dockerfile_id]
-        dockerfile_path = dockerfile_info["path"]
+        with open(dockerfile_info["path"], "rb") as f:
+            build_key = _build_key(f.read(), build_args)
+
+        image_id = await self._cached_build(build_key)
+        if image_id is not None:
+            self._build_cache["hits"] += 1
+            yield "log", {
+                "stream": "stdout",
+                "line": f"Using cached image {image_id} built from identical input",
+            }
+        else:
+            self._build_cache["misses"] += 1
+            if self._build_flight.in_flight(build_key):
+                yield "log", {
+                    "stream": "stdout",
+                    "line": "Waiting for an identical build in progress",
+                }
+
+            # The build runs in its own task (shared with identical requests)
+            # and passes its output to each of them through a queue
+            output: asyncio.Queue = asyncio.Queue(BUILD_OUTPUT_BUFFER)
+
+            def listener(event: Tuple[str, Any]) -> None:
+                if not output.full():
+                    output.put_nowait(event)
+
+            listeners = self._build_listeners.setdefault(build_key, [])
+            listeners.append(listener)
+            try:
+                build = asyncio.ensure_future(
+                    self._build_flight.do(
+                        build_key,
+                        lambda: self._build(
+                            dockerfile_info["path"],
+                            tag,
+                            build_args,
+                            build_key,
+                            priority,
+                        ),
+                    )
+                )
+                try:
+                    async for event in _forward(output, build):
+                        yield event
+                    image_id = build.result()
+                finally:
+                    # Stops the build unless an identical request still waits
+                    # for it
+                    if not build.done():
+                        build.cancel()
+                        await asyncio.wait([build])
+            finally:
+                listeners.remove(listener)
+                if not listeners:
+                    del self._build_listeners[build_key]
+
+        yield "done", await self._record_build(image_id, tag, dockerfile_id)
+
+    async def _build(
+        self,
+        dockerfile_path: str,
+        tag: str,
+        build_args: Optional[Dict[str, str]],
+        build_key: str,
+        priority: Priority,
+    ) -> str:
+        """
+        Run docker build and add the image to the build cache, sending its
+        output to everyone waiting for it
+
+        Args:
+            dockerfile_path: Path of the Dockerfile
+            tag: Tag for the Docker image
+            build_args: Optional build-time variables
+            build_key: Build cache key
+            priority: Scheduler queue priority
+
+        Returns:
+            Short ID of the built image
+        """
+
+        def emit(event: Tuple[str, Any]) -> None:
+            for listener in self._build_listeners.get(build_key, []):
+                listener(event)
 
-        # Create a temporary build context directory
+        # Create a temporary build context directory; identical builds are
+        # coalesced, so the key makes it unique
         build_context_dir = os.path.join(
-            os.path.dirname(dockerfile_path), f"build_context_{dockerfile_id}"
+            os.path.dirname(dockerfile_path), f"build_context_{build_key[:12]}"
         )
         os.makedirs(build_context_dir, exist_ok=True)
 
         try:
             # Copy Dockerfile to build context with standard name
-            with open(dockerfile_path, "r") as src, open(
-                os.path.join(build_context_dir, "Dockerfile"), "w"
-            ) as dst:
-                dst.write(src.read())
+            shutil.copyfile(
+                dockerfile_path, os.path.join(build_context_dir, "Dockerfile")
+            )
 
-            # Build the Docker image from the build context
-            command = ["docker", "build", "-t", tag, build_context_dir]
+            # Build the Docker image from the build context. Plain progress
+            # makes BuildKit print one line per step instead of redrawing.
+            command = ["docker", "build", "-t", tag]
+            for name, value in sorted((build_args or {}).items()):
+                command.extend(["--build-arg", f"{name}={value}"])
+            command.append(build_context_dir)
+            current_step = None
+            try:
+                async for stream, line in stream_command(
+                    command,
+                    timeout=LONG_COMMAND_TIMEOUT,
+                    env={"BUILDKIT_PROGRESS": "plain"},
+                    op_class="build",
+                    priority=priority,
+                ):
+                    emit(("log", {"stream": stream, "line": line}))
+                    step = _build_step(line)
+                    # BuildKit repeats a step's header when it prints more
+                    # of its output
+                    if step is not None and step != current_step:
+                        current_step = step
+                        emit(("step", step))
+            except CommandError as e:
+                raise RuntimeError(f"Failed to build Docker image: {e.stderr or e}")
+        finally:
+            # Clean up build context directory
+            shutil.rmtree(build_context_dir, ignore_errors=True)
 
-            stdout, stderr, return_code = run_command(command)
+        image_id = await self._image_id(tag)
+        await self._sync_images()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None,
+            self._store.put,
+            "builds",
+            build_key,
+            {
+                "key": build_key,
+                "image_id": image_id,
+                "created_at": datetime.now().isoformat(),
+            },
+        )
+        return image_id
+
+    async def _cached_build(self, build_key: str) -> Optional[str]:
+        """Short ID of the image built from identical input, if it still exists"""
+        record = self._store.get("builds", build_key)
+        if record is None:
+            return None
+        if await self._image_tags_of(record["image_id"]) is None:
+            # Deleted outside this API
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._store.delete, "builds", build_key)
+            return None
+        return record["image_id"]
+
+    async def _record_build(
+        self, image_id: str, tag: str, dockerfile_id: str
+    ) -> DockerImage:
+        """Make sure tag names the built image and save its metadata"""
+        tags = await self._image_tags_of(image_id) or []
+        if _full_tag(tag) not in tags:
+            # Built (or cached) under another tag
+            await self._tag_image(image_id, tag)
 
-            if return_code != 0:
-                raise RuntimeError(f"Failed to build Docker image: {stderr}")
+        image_info = {
+            "id": image_id,
+            "tag": tag,
+            "dockerfile_id": dockerfile_id,
+            "created_at": datetime.now().isoformat(),
+            "updated_at": datetime.now().isoformat(),
+        }
 
-            # Get image ID from docker images
-            image_id_command = ["docker", "images", "-q", tag]
-            image_id, _, _ = run_command(image_id_command)
-            image_id = image_id.strip()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None, self._store.put, "images", image_id, image_info
+        )
 
-            # Create and save metadata
-            image_info = {
-                "id": image_id,
-                "tag": tag,
-                "dockerfile_id": dockerfile_id,
-                "created_at": datetime.now().isoformat(),
-                "updated_at": datetime.now().isoformat(),
-            }
+        return DockerImage(
+            id=image_id,
+            tag=tag,
+            dockerfile_id=dockerfile_id,
+            created_at=datetime.fromisoformat(image_info["created_at"]),
+            updated_at=datetime.fromisoformat(image_info["updated_at"]),
+        )
 
-            if "images" not in metadata:
-                metadata["images"] = {}
-            metadata["images"][image_id] = image_info
-            self._save_metadata(metadata)
+    def build_cache_metrics(self) -> Dict[str, Any]:
+        """
+        Report build cache effectiveness
 
-            return DockerImage(
-                id=image_id,
-                tag=tag,
-                dockerfile_id=dockerfile_id,
-                created_at=datetime.fromisoformat(image_info["created_at"]),
-                updated_at=datetime.fromisoformat(image_info["updated_at"]),
-            )
+        Returns:
+            Cache "hits" (no build run), "misses" (built, or joined an
+            identical build), builds "started", requests "coalesced" into a
+            running build, builds "in_flight" and cached "entries"
+        """
+        return {
+            **self._build_cache,
+            **self._build_flight.metrics(),
+            "entries": len(self._store.all("builds")),
+        }
+
+    async def build_batch(
+        self, builds: List[ImageBuild], concurrency: Optional[int] = None
+    ) -> BatchBuildSummary:
+        """
+        Build many Docker images in parallel
+
+        Args:
+            builds: Images to build
+            concurrency: Maximum number of builds run at once (at most
+                         BATCH_BUILD_CONCURRENCY)
+
+        Returns:
+            BatchBuildSummary with the outcome of every build
+        """
+        async for event, data in self.build_batch_events(builds, concurrency):
+            if event == "done":
+                return data
+        raise RuntimeError("Batch build did not finish")
+
+    async def build_batch_events(
+        self, builds: List[ImageBuild], concurrency: Optional[int] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Build many Docker images in parallel, yielding their progress
 
+        Builds wait at bulk priority, so single builds requested meanwhile
+        go first. A failed build doesn't stop the others, and identical
+        builds in the batch run once (see build_image_events).
+
+        Args:
+            builds: Images to build
+            concurrency: Maximum number of builds run at once (at most
+                         BATCH_BUILD_CONCURRENCY)
+
+        Yields:
+            ("build", BatchBuildResult) when a build starts and when it
+            finishes, ("step", {"index", "step", "total", "instruction",
+            "stage"}) as builds progress, then ("done", BatchBuildSummary)
+        """
+        if not builds:
+            raise ValueError("No builds given")
+        for build in builds:
+            if self._store.get("dockerfiles", build.dockerfile_id) is None:
+                raise ValueError(f"Dockerfile with ID {build.dockerfile_id} not found")
+
+        limit = asyncio.Semaphore(
+            max(1, min(concurrency or BATCH_BUILD_CONCURRENCY, BATCH_BUILD_CONCURRENCY))
+        )
+        results = [
+            BatchBuildResult(
+                index=index,
+                dockerfile_id=build.dockerfile_id,
+                tag=build.tag,
+                status=JobStatus.QUEUED,
+            )
+            for index, build in enumerate(builds)
+        ]
+        output: asyncio.Queue = asyncio.Queue()
+        batch_started = time.monotonic()
+
+        async def run(result: BatchBuildResult, build: ImageBuild) -> None:
+            async with limit:
+                result.status = JobStatus.RUNNING
+                output.put_nowait(("build", result.model_copy()))
+                started = time.monotonic()
+                try:
+                    async for event, data in self.build_image_events(
+                        build.dockerfile_id,
+                        build.tag,
+                        build.build_args,
+                        priority=Priority.BULK,
+                    ):
+                        if event == "step":
+                            output.put_nowait(("step", {"index": result.index, **data}))
+                        elif event == "done":
+                            result.image = data
+                    result.status = JobStatus.SUCCEEDED
+                except Exception as e:
+                    logger.warning(f"Batch build of {build.tag} failed: {e}")
+                    result.status = JobStatus.FAILED
+                    result.error = str(e)
+                result.duration = round(time.monotonic() - started, 3)
+                output.put_nowait(("build", result.model_copy()))
+
+        batch = asyncio.ensure_future(
+            asyncio.gather(
+                *(run(result, build) for result, build in zip(results, builds))
+            )
+        )
+        try:
+            async for event in _forward(output, batch):
+                yield event
+            batch.result()
         finally:
-            # Clean up build context directory
-            import shutil
+            if not batch.done():
+                batch.cancel()
+                await asyncio.wait([batch])
+
+        succeeded = sum(result.status == JobStatus.SUCCEEDED for result in results)
+        yield "done", BatchBuildSummary(
+            total=len(results),
+            succeeded=succeeded,
+            failed=len(results) - succeeded,
+            duration=round(time.monotonic() - batch_started, 3),
+            results=results,
+        )
 
-            shutil.rmtree(build_context_dir, ignore_errors=True)
+    def submit_build(
+        self, dockerfile_id: str, tag: str, build_args: Optional[Dict[str, str]] = None
+    ) -> BuildJob:
+        """
+        Start building a Docker image in the background
 
-    def list_images(self) -> List[DockerImage]:
+        Args:
+            dockerfile_id: ID of the Dockerfile to use
+            tag: Tag for the Docker image
+            build_args: Optional build-time variables (--build-arg)
+
+        Returns:
+            BuildJob object describing the queued build
+        """
+        if self._store.get("dockerfiles", dockerfile_id) is None:
+            raise ValueError(f"Dockerfile with ID {dockerfile_id} not found")
+
+        job = self._build_jobs.submit(
+            self.build_image_events(dockerfile_id, tag, build_args),
+            {"dockerfile_id": dockerfile_id, "tag": tag},
+        )
+        return self._build_job_model(job)
+
+    def list_build_jobs(self) -> List[BuildJob]:
+        """
+        List recent build jobs
+
+        Returns:
+            List of BuildJob objects, newest first
+        """
+        return [self._build_job_model(job) for job in self._build_jobs.list()]
+
+    def get_build_job(self, job_id: str) -> Optional[BuildJob]:
+        """
+        Get a build job
+
+        Args:
+            job_id: ID of the build job
+
+        Returns:
+            BuildJob object if found, None otherwise
+        """
+        job = self._build_jobs.get(job_id)
+        return self._build_job_model(job) if job else None
+
+    async def cancel_build_job(self, job_id: str) -> BuildJob:
+        """
+        Cancel a build job, stopping its docker build
+
+        Args:
+            job_id: ID of the build job
+
+        Returns:
+            BuildJob object in its final state
+        """
+        job = self._get_build_job(job_id)
+        if not await job.cancel():
+            raise ValueError(f"Build job {job_id} has already finished")
+        return self._build_job_model(job)
+
+    def build_job_events(self, job_id: str) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Follow a build job's output
+
+        Args:
+            job_id: ID of the build job
+
+        Returns:
+            Async iterator of the job's events so far, then live ones until
+            the final "done", "error" or "cancelled"
+        """
+        return self._get_build_job(job_id).subscribe()
+
+    def _get_build_job(self, job_id: str) -> Job:
+        job = self._build_jobs.get(job_id)
+        if job is None:
+            raise ValueError(f"Build job with ID {job_id} not found")
+        return job
+
+    @staticmethod
+    def _build_job_model(job: Job) -> BuildJob:
+        return BuildJob(
+            id=job.id,
+            dockerfile_id=job.params["dockerfile_id"],
+            tag=job.params["tag"],
+            status=job.status,
+            created_at=job.created_at,
+            started_at=job.started_at,
+            finished_at=job.finished_at,
+            progress=job.progress,
+            steps=[BuildStep(**step) for step in job.steps],
+            image=job.result,
+            error=job.error,
+        )
+
+    async def list_images(self) -> List[DockerImage]:
         """
         List all Docker images
 
         Returns:
             List of DockerImage objects
         """
-        command = ["docker", "images", "--format", "{{.ID}}\t{{.Repository}}\t{{.Tag}}"]
-        stdout, _, _ = run_command(command)
-
-        metadata = self._load_metadata()
+        image_metadata = self._store.all("images")
         images = []
-        for line in stdout.strip().split("\n"):
-            if not line:
-                continue
-            image_id, repository, tag = line.split("\t")
-            full_tag = f"{repository}:{tag}" if tag != "<none>" else repository
-
-            # Check if the image is created locally by looking for its ID in metadata
-            dockerfile_id = metadata["images"].get(image_id, {}).get("dockerfile_id")
-
-            images.append(
-                DockerImage(
-                    id=image_id,
-                    tag=full_tag,
-                    dockerfile_id=dockerfile_id,  # Use the dockerfile_id from metadata if available
-                    created_at=datetime.now(),  # Docker doesn't provide this easily
-                    updated_at=datetime.now(),
-                )
+        for summary in await self._image_summaries():
+            # Images built or pulled through this API have a metadata record
+            info = image_metadata.get(summary["id"], {})
+            created_at = summary["created"] or datetime.fromisoformat(
+                info.get("created_at") or datetime.now().isoformat()
+            )
+            updated_at = (
+                datetime.fromisoformat(info["updated_at"]) if info else created_at
             )
 
+            for full_tag in summary["tags"]:
+                images.append(
+                    DockerImage(
+                        id=summary["id"],
+                        tag=full_tag,
+                        dockerfile_id=info.get("dockerfile_id"),
+                        created_at=created_at,
+                        updated_at=updated_at,
+                        size=summary["size"],
+                        shared_size=summary["shared_size"],
+                        containers=summary["containers"],
+                    )
+                )
+
         return images
 
-    def list_containers(self, all_containers: bool = False) -> List[DockerContainer]:
+    async def list_containers(
+        self, all_containers: bool = False
+    ) -> List[DockerContainer]:
         """
         List all Docker containers
 
@@ -215,31 +1057,7 @@ class DockerService:
         Returns:
             List of DockerContainer objects
         """
-        command = ["docker", "ps"]
-        if all_containers:
-            command.append("-a")
-        command.extend(["--format", "{{.ID}}\t{{.Image}}\t{{.Status}}\t{{.Names}}"])
-
-        stdout, _, _ = run_command(command)
-
-        containers = []
-        for line in stdout.strip().split("\n"):
-            if not line:
-                continue
-            container_id, image, status, name = line.split("\t")
-
-            containers.append(
-                DockerContainer(
-                    id=container_id,
-                    name=name,
-                    image=image,
-                    status=status,
-                    created_at=datetime.now(),  # Docker doesn't provide this easily
-                    updated_at=datetime.now(),
-                )
-            )
-
-        return containers
+        return await self._containers(all_containers, priority=Priority.INTERACTIVE)
 
     def list_dockerfiles(self) -> List[Dockerfile]:
         """
@@ -248,53 +1066,99 @@ class DockerService:
         Returns:
             List of Dockerfile objects
         """
-        metadata = self._load_metadata()
         dockerfiles = []
 
-        if "dockerfiles" in metadata:
-            for dockerfile_id, info in metadata["dockerfiles"].items():
-                dockerfiles.append(
-                    Dockerfile(
-                        id=dockerfile_id,
-                        name=info["name"],
-                        path=info["path"],
-                        created_at=datetime.fromisoformat(info["created_at"]),
-                        updated_at=datetime.fromisoformat(info["updated_at"]),
-                    )
+        for dockerfile_id, info in self._store.all("dockerfiles").items():
+            dockerfiles.append(
+                Dockerfile(
+                    id=dockerfile_id,
+                    name=info["name"],
+                    path=info["path"],
+                    created_at=datetime.fromisoformat(info["created_at"]),
+                    updated_at=datetime.fromisoformat(info["updated_at"]),
                 )
+            )
 
         return dockerfiles
 
-    def delete_container(self, container_id: str) -> bool:
+    def get_dockerfile(self, dockerfile_id: str) -> Optional[Dockerfile]:
+        """
+        Get details of a specific Dockerfile
+
+        Args:
+            dockerfile_id: ID of the Dockerfile to retrieve
+
+        Returns:
+            Dockerfile object or None if not found
+        """
+        info = self._store.get("dockerfiles", dockerfile_id)
+        if info is None:
+            return None
+
+        return Dockerfile(
+            id=dockerfile_id,
+            name=info["name"],
+            path=info["path"],
+            created_at=datetime.fromisoformat(info["created_at"]),
+            updated_at=datetime.fromisoformat(info["updated_at"]),
+        )
+
+    async def delete_container(
+        self,
+        container_id: str,
+        timeout: Optional[int] = None,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> bool:
         """
         Delete a Docker container
 
         Args:
             container_id: ID of the container to delete
+            timeout: Seconds to wait for a graceful stop before killing it
+                     (Docker's default if None)
+            priority: Scheduler queue priority
 
         Returns:
             Boolean indicating success
         """
+        # Its name identifies its host port leases
+        try:
+            name = (await self._inspect_container(container_id))["Name"].lstrip("/")
+        except RuntimeError:
+            name = None
+
         # First try to stop the container if it's running
         try:
-            command = ["docker", "stop", container_id]
-            run_command(command)
-        except:
+            await self._container_action("stop", container_id, priority, timeout)
+        except RuntimeError:
             pass  # Ignore errors from stop command
 
         # Then remove the container
-        command = ["docker", "rm", "-f", container_id]
-        _, stderr, return_code = run_command(command)
-
-        if return_code != 0:
-            raise RuntimeError(f"Failed to delete container: {stderr}")
+        try:
+            if self._api is not None:
+                await self._api.request(
+                    "DELETE",
+                    f"/containers/{quote(container_id)}",
+                    params={"force": 1},
+                    op_class="docker",
+                    priority=priority,
+                )
+            else:
+                command = ["docker", "rm", "-f", container_id]
+                await run_command_async(command, op_class="docker", priority=priority)
+        except RuntimeError as e:
+            raise RuntimeError(f"Failed to delete container: {e}")
+        loop = asyncio.get_running_loop()
+        if name is not None:
+            await loop.run_in_executor(None, self._ports.release, f"container:{name}")
+        if self._mirror is not None:
+            self._mirror.remove_container(container_id)
 
         # Try to clean up metadata if it exists
         try:
-            metadata = self._load_metadata()
-            if "containers" in metadata and container_id in metadata["containers"]:
-                del metadata["containers"][container_id]
-                self._save_metadata(metadata)
+            await loop.run_in_executor(
+                None, self._store.delete, "containers", container_id
+            )
         except Exception:
             pass  # Ignore metadata errors - container deletion was successful
 
@@ -310,118 +1174,347 @@ class DockerService:
         Returns:
             Boolean indicating success
         """
-        metadata = self._load_metadata()
-
-        if (
-            "dockerfiles" not in metadata
-            or dockerfile_id not in metadata["dockerfiles"]
-        ):
-            raise ValueError(f"Dockerfile with ID {dockerfile_id} not found")
-
-        # Get the actual file path from metadata
-        dockerfile_info = metadata["dockerfiles"][dockerfile_id]
-        dockerfile_path = dockerfile_info["path"]
-
-        try:
-            # Delete the file
-            os.remove(dockerfile_path)
-
-            # Remove the entry from metadata
-            del metadata["dockerfiles"][dockerfile_id]
-            self._save_metadata(metadata)
-
-            return True
-        except FileNotFoundError:
-            # If file is already gone, just clean up metadata
-            del metadata["dockerfiles"][dockerfile_id]
-            self._save_metadata(metadata)
-            return True
-        except Exception as e:
-            raise RuntimeError(f"Failed to delete Dockerfile: {str(e)}")
-
-    def start_container(self, container_id: str) -> bool:
+        # Keep the file removal and metadata delete atomic across workers
+        with self._store.locked():
+            dockerfile_info = self._store.get("dockerfiles", dockerfile_id)
+            if dockerfile_info is None:
+                raise ValueError(f"Dockerfile with ID {dockerfile_id} not found")
+
+            # Get the actual file path from metadata
+            dockerfile_path = dockerfile_info["path"]
+
+            try:
+                # Delete the file
+                os.remove(dockerfile_path)
+
+                # Remove the entry from metadata
+                self._store.delete("dockerfiles", dockerfile_id)
+
+                return True
+            except FileNotFoundError:
+                # If file is already gone, just clean up metadata
+                self._store.delete("dockerfiles", dockerfile_id)
+                return True
+            except Exception as e:
+                raise RuntimeError(f"Failed to delete Dockerfile: {str(e)}")
+
+    async def start_container(
+        self, container_id: str, priority: Priority = Priority.NORMAL
+    ) -> bool:
         """
         Start a Docker container and update metadata
         """
-        command = ["docker", "start", container_id]
-        _, stderr, return_code = run_command(command)
-
-        if return_code != 0:
-            raise RuntimeError(f"Failed to start container: {stderr}")
+        try:
+            await self._container_action("start", container_id, priority)
+        except RuntimeError as e:
+            raise RuntimeError(f"Failed to start container: {e}")
+        await self._sync_container(container_id)
 
         # Update metadata to reflect the container's running status
-        metadata = self._load_metadata()
-        if "containers" in metadata and container_id in metadata["containers"]:
-            metadata["containers"][container_id]["status"] = "running"
-            metadata["containers"][container_id]["updated_at"] = datetime.now()
-            self._save_metadata(metadata)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None,
+            self._store.update,
+            "containers",
+            container_id,
+            {"status": "running", "updated_at": datetime.now().isoformat()},
+        )
 
         return True
 
-    def stop_container(self, container_id: str) -> bool:
+    async def stop_container(
+        self,
+        container_id: str,
+        timeout: Optional[int] = None,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> bool:
         """
         Stop a Docker container
 
         Args:
             container_id: ID of the container to stop
+            timeout: Seconds to wait for a graceful stop before killing it
+                     (Docker's default if None)
+            priority: Scheduler queue priority
 
         Returns:
             Boolean indicating success
         """
-        command = ["docker", "stop", container_id]
-        _, stderr, return_code = run_command(command)
+        try:
+            await self._container_action("stop", container_id, priority, timeout)
+        except RuntimeError as e:
+            raise RuntimeError(f"Failed to stop container: {e}")
+        await self._sync_container(container_id)
+
+        return True
+
+    async def restart_container(
+        self,
+        container_id: str,
+        timeout: Optional[int] = None,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> bool:
+        """
+        Restart a Docker container
+
+        Args:
+            container_id: ID of the container to restart
+            timeout: Seconds to wait for a graceful stop before killing it
+                     (Docker's default if None)
+            priority: Scheduler queue priority
 
-        if return_code != 0:
-            raise RuntimeError(f"Failed to stop container: {stderr}")
+        Returns:
+            Boolean indicating success
+        """
+        try:
+            await self._container_action("restart", container_id, priority, timeout)
+        except RuntimeError as e:
+            raise RuntimeError(f"Failed to restart container: {e}")
+        await self._sync_container(container_id)
 
         return True
 
-    def search_image(self, query: str) -> List[Dict[str, str]]:
+    async def get_container_resources(self, container_id: str) -> ContainerResources:
+        """
+        Resource limits in effect for a container
+
+        Args:
+            container_id: Container ID or name
+
+        Returns:
+            ContainerResources with the limits that are set
+        """
+        info = await self._inspect_container(container_id)
+        return _container_resources(info.get("HostConfig") or {})
+
+    async def update_container_resources(
+        self, container_id: str, resources: ContainerResources
+    ) -> ContainerResources:
+        """
+        Change the resource limits of a container, running or not
+
+        Only the limits given are changed. Device read/write rates can only
+        be set when a container is created.
+
+        Args:
+            container_id: Container ID or name
+            resources: New limits
+
+        Returns:
+            The limits now in effect
+        """
+        if resources.device_read_bps or resources.device_write_bps:
+            raise ValueError("Device read/write rates can't be changed after creation")
+        _validate_resources(resources, await self._host_resources())
+        if self._api is not None:
+            await self._api.request(
+                "POST",
+                f"/containers/{quote(container_id)}/update",
+                body=_host_config_resources(resources),
+                op_class="docker",
+                priority=Priority.INTERACTIVE,
+            )
+        else:
+            command = ["docker", "update", *_resource_flags(resources), container_id]
+            await run_command_async(
+                command, op_class="docker", priority=Priority.INTERACTIVE
+            )
+        await self._sync_container(container_id)
+        return await self.get_container_resources(container_id)
+
+    async def _host_resources(self) -> Dict[str, int]:
+        """The Docker host's CPU count and memory in bytes (read once)"""
+        if self._host_info is None:
+            if self._api is not None:
+                info = await self._api.request("GET", "/info", op_class="docker")
+            else:
+                command = ["docker", "info", "--format", "{{json .}}"]
+                stdout, _, _ = await run_command_async(command, op_class="docker")
+                info = json.loads(stdout)
+            self._host_info = {"cpus": info["NCPU"], "memory": info["MemTotal"]}
+        return self._host_info
+
+    async def bulk_container_action(
+        self,
+        action: ContainerAction,
+        ids: Optional[List[str]] = None,
+        labels: Optional[List[str]] = None,
+        concurrency: Optional[int] = None,
+        timeout: Optional[int] = None,
+    ) -> BulkContainerSummary:
+        """
+        Start, stop, restart or delete many containers in parallel
+
+        Containers are acted on at bulk priority, so single operations
+        requested meanwhile go first. A failure doesn't stop the others.
+
+        Args:
+            action: What to do with each container
+            ids: Container IDs or names
+            labels: docker label filters ("key" or "key=value") selecting
+                    containers as well; all of them must match
+            concurrency: Maximum number of containers acted on at once (at
+                         most BULK_CONTAINER_CONCURRENCY)
+            timeout: Seconds a stop waits before killing (Docker's default
+                     if None)
+
+        Returns:
+            BulkContainerSummary with the outcome for each container
+        """
+        if not ids and not labels:
+            raise ValueError("No containers given")
+        targets = list(ids or [])
+        if labels:
+            matching = await self._containers(
+                True, {"label": list(labels)}, Priority.BULK
+            )
+            targets.extend(container.id for container in matching)
+        # Each container once, in the order given
+        targets = list(dict.fromkeys(targets))
+
+        operations = {
+            ContainerAction.START: lambda container_id: self.start_container(
+                container_id, Priority.BULK
+            ),
+            ContainerAction.STOP: lambda container_id: self.stop_container(
+                container_id, timeout, Priority.BULK
+            ),
+            ContainerAction.RESTART: lambda container_id: self.restart_container(
+                container_id, timeout, Priority.BULK
+            ),
+            ContainerAction.DELETE: lambda container_id: self.delete_container(
+                container_id, timeout, Priority.BULK
+            ),
+        }
+        operation = operations[action]
+        limit = asyncio.Semaphore(
+            max(
+                1,
+                min(
+                    concurrency or BULK_CONTAINER_CONCURRENCY,
+                    BULK_CONTAINER_CONCURRENCY,
+                ),
+            )
+        )
+        started = time.monotonic()
+
+        async def run(container_id: str) -> BulkContainerResult:
+            async with limit:
+                result = BulkContainerResult(id=container_id, status=JobStatus.RUNNING)
+                operation_started = time.monotonic()
+                try:
+                    await operation(container_id)
+                    result.status = JobStatus.SUCCEEDED
+                except Exception as e:
+                    logger.warning(f"Bulk {action.value} of {container_id} failed: {e}")
+                    result.status = JobStatus.FAILED
+                    result.error = str(e)
+                result.duration = round(time.monotonic() - operation_started, 3)
+                return result
+
+        results = await asyncio.gather(*(run(target) for target in targets))
+        succeeded = sum(result.status == JobStatus.SUCCEEDED for result in results)
+        return BulkContainerSummary(
+            action=action,
+            total=len(results),
+            succeeded=succeeded,
+            failed=len(results) - succeeded,
+            duration=round(time.monotonic() - started, 3),
+            results=results,
+        )
+
+    async def search_image(self, query: str) -> List[Dict[str, Any]]:
         """
         Search for Docker images on Docker Hub
 
+        Results are cached per query for SEARCH_CACHE_TTL seconds, and a
+        query that extends a cached one may be answered from its results.
+
         Args:
             query: Search query
 
         Returns:
             List of image information dictionaries
         """
-        command = ["docker", "search", query]
-        stdout, _, _ = run_command(command)
+        results = self._search_cache.get(query)
+        if results is not None:
+            return results
 
-        results = []
-        for line in stdout.strip().split("\n")[1:]:  # Skip header line
-            if not line:
-                continue
-            parts = line.split()
-            if len(parts) >= 5:
-                # The format is: NAME DESCRIPTION STARS OFFICIAL AUTOMATED
-                name = parts[0]
-                # Find the last three fields (stars, official, automated)
-                stars = parts[-3]
-                official = parts[-2]
-                automated = parts[-1]
-                # Everything in between is the description
-                description = " ".join(parts[1:-3])
+        # Identical queries (e.g. from several open search dialogs) that
+        # arrive while one is running share it
+        query = normalize_query(query)
+        return list(await self._search_flight.do(query, lambda: self._search(query)))
+
+    def search_cache_metrics(self) -> Dict[str, int]:
+        """
+        Report image search cache effectiveness
+
+        Returns:
+            Cached query "entries", lookups answered exactly ("hits") or from
+            a shorter cached query ("prefix_hits"), "misses", "evictions",
+            and searches "started", "coalesced" and "in_flight"
+        """
+        return {**self._search_cache.metrics(), **self._search_flight.metrics()}
+
+    async def _search(self, query: str) -> List[Dict[str, Any]]:
+        """Search Docker Hub and cache the results"""
+        if self._api is not None:
+            found = await self._api.request(
+                "GET",
+                "/images/search",
+                params={"term": query, "limit": SEARCH_LIMIT},
+                op_class="docker",
+                priority=Priority.INTERACTIVE,
+            )
+            results = [
+                {
+                    "name": image["name"],
+                    "description": image.get("description", ""),
+                    "stars": image.get("star_count", 0),
+                    "official": bool(image.get("is_official")),
+                    "automated": bool(image.get("is_automated")),
+                }
+                for image in found or []
+            ]
+        else:
+            command = [
+                "docker",
+                "search",
+                "--no-trunc",
+                "--limit",
+                str(SEARCH_LIMIT),
+                "--format",
+                "{{json .}}",
+                query,
+            ]
+            stdout, _, _ = await run_command_async(
+                command, op_class="docker", priority=Priority.INTERACTIVE
+            )
 
+            results = []
+            for line in stdout.splitlines():
+                if not line.strip():
+                    continue
+                row = json.loads(line)
                 try:
-                    stars_int = int(stars)
+                    stars = int(row.get("StarCount") or 0)
                 except ValueError:
-                    stars_int = 0
-
+                    stars = 0
                 results.append(
                     {
-                        "name": name,
-                        "description": description,
-                        "stars": stars_int,
-                        "official": official == "[OK]",
-                        "automated": automated == "[OK]",
+                        "name": row["Name"],
+                        "description": row.get("Description", ""),
+                        "stars": stars,
+                        # "[OK]" or "", "true" or "false" in older clients
+                        "official": row.get("IsOfficial") in ("[OK]", "true"),
+                        "automated": row.get("IsAutomated") in ("[OK]", "true"),
                     }
                 )
 
+        self._search_cache.put(query, results)
         return results
 
-    def pull_image(self, image_name: str, tag: str = "latest") -> DockerImage:
+    async def pull_image(self, image_name: str, tag: str = "latest") -> DockerImage:
         """
         Pull a Docker image from Docker Hub
 
@@ -432,23 +1525,147 @@ class DockerService:
         Returns:
             DockerImage object with the pulled image details
         """
+        async for event, data in self.pull_image_events(image_name, tag):
+            if event == "done":
+                return data
+        raise RuntimeError("Failed to pull image")
+
+    async def pull_image_events(
+        self, image_name: str, tag: str = "latest"
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Pull a Docker image, yielding the pull output as it happens
+
+        Concurrent pulls of the same image:tag share one pull; everyone
+        pulling it receives its output from the moment they joined.
+
+        Args:
+            image_name: Name of the image to pull
+            tag: Tag of the image to pull
+
+        Yields:
+            ("log", {"stream", "line"}) for each output line,
+            ("progress", {"layer", "status", "current", "total",
+            "layers_done", "layers"}) when a layer's download or extraction
+            progresses (byte counts are None from the CLI), then
+            ("done", DockerImage) once the image is pulled
+        """
         full_tag = f"{image_name}:{tag}"
-        command = ["docker", "pull", full_tag]
-        stdout, stderr, return_code = run_command(command)
+        output: asyncio.Queue = asyncio.Queue()
+        listeners = self._pull_listeners.setdefault(full_tag, [])
+        listeners.append(output.put_nowait)
+        try:
+            if self._pull_flight.in_flight(full_tag):
+                yield "log", {
+                    "stream": "stdout",
+                    "line": f"Joining the pull of {full_tag} in progress",
+                }
+                # Where the pull is up to
+                for layer in list(self._pull_layers.get(full_tag, {}).values()):
+                    yield "progress", dict(layer)
+
+            pull = asyncio.ensure_future(
+                self._pull_flight.do(
+                    full_tag, lambda: self._pull(image_name, tag, full_tag)
+                )
+            )
+            try:
+                async for event in _forward(output, pull):
+                    yield event
+                image = pull.result()
+            finally:
+                # Stops the pull unless someone else still waits for it
+                if not pull.done():
+                    pull.cancel()
+                    await asyncio.wait([pull])
+        finally:
+            listeners.remove(output.put_nowait)
+            if not listeners:
+                del self._pull_listeners[full_tag]
 
-        if return_code != 0:
-            raise RuntimeError(f"Failed to pull image: {stderr}")
+        yield "done", image
 
-        # Get image ID
-        command = ["docker", "images", full_tag, "--format", "{{.ID}}"]
-        stdout, _, _ = run_command(command)
-        image_id = stdout.strip()
+    async def _pull(self, image_name: str, tag: str, full_tag: str) -> DockerImage:
+        """
+        Pull an image, sending its output to everyone pulling it
 
-        # Create and save metadata
-        metadata = self._load_metadata()
-        if "images" not in metadata:
-            metadata["images"] = {}
+        Args:
+            image_name: Name of the image to pull
+            tag: Tag of the image to pull
+            full_tag: image_name:tag
+
+        Returns:
+            DockerImage object with the pulled image details
+        """
+
+        def emit(event: str, data: Dict[str, Any]) -> None:
+            for listener in self._pull_listeners.get(full_tag, []):
+                listener((event, data))
+
+        layers = self._pull_layers[full_tag] = {}
+
+        def update_layer(layer_id: str, status: str, detail: Dict) -> None:
+            if status not in LAYER_STATUSES:
+                return
+            layers[layer_id] = {
+                "layer": layer_id,
+                "status": status,
+                "current": detail.get("current"),
+                "total": detail.get("total"),
+            }
+            done = sum(
+                layer["status"] in LAYER_DONE_STATUSES for layer in layers.values()
+            )
+            for layer in layers.values():
+                layer.update(layers_done=done, layers=len(layers))
+            emit("progress", dict(layers[layer_id]))
+
+        try:
+            if self._api is not None:
+                progress = self._api.stream_json(
+                    "POST",
+                    "/images/create",
+                    params={"fromImage": image_name, "tag": tag},
+                    op_class="pull",
+                )
+                try:
+                    async for message in progress:
+                        if "error" in message:
+                            raise RuntimeError(
+                                f"Failed to pull image: {message['error']}"
+                            )
+                        # Same shape as the CLI's output, e.g. "abc123: Downloading"
+                        line = message.get("status", "")
+                        if message.get("id"):
+                            line = f"{message['id']}: {line}"
+                        if message.get("progress"):
+                            line = f"{line} {message['progress']}"
+                        emit("log", {"stream": "stdout", "line": line})
+                        if message.get("id"):
+                            update_layer(
+                                message["id"],
+                                message.get("status", ""),
+                                message.get("progressDetail") or {},
+                            )
+                finally:
+                    await progress.aclose()
+            else:
+                command = ["docker", "pull", full_tag]
+                try:
+                    async for stream, line in stream_command(
+                        command, timeout=LONG_COMMAND_TIMEOUT, op_class="pull"
+                    ):
+                        emit("log", {"stream": stream, "line": line})
+                        layer_id, _, status = line.partition(": ")
+                        update_layer(layer_id, status.strip(), {})
+                except CommandError as e:
+                    raise RuntimeError(f"Failed to pull image: {e.stderr or e}")
+        finally:
+            del self._pull_layers[full_tag]
 
+        image_id = await self._pulled_image_id(full_tag)
+
+        # Create and save metadata
         image_info = {
             "id": image_id,
             "tag": full_tag,
@@ -457,8 +1674,10 @@ class DockerService:
             "updated_at": datetime.now().isoformat(),
         }
 
-        metadata["images"][image_id] = image_info
-        self._save_metadata(metadata)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None, self._store.put, "images", image_id, image_info
+        )
 
         return DockerImage(
             id=image_id,
@@ -468,89 +1687,130 @@ class DockerService:
             updated_at=datetime.fromisoformat(image_info["updated_at"]),
         )
 
-    def delete_image(self, image_id: str) -> bool:
+    async def _pulled_image_id(self, full_tag: str) -> str:
+        """Short ID of a just-pulled image"""
+        await self._sync_images()
+        if self._mirror_ready():
+            # The refreshed image list already has it
+            for image in self._mirror.images():
+                if full_tag in (image.get("RepoTags") or []):
+                    return _short_id(image["Id"])
+        return await self._image_id(full_tag)
+
+    async def delete_image(self, image_id: str) -> bool:
         """
         Delete a Docker image and remove its metadata
         """
         # Delete the image from the system
-        command = ["docker", "rmi", "-f", image_id]
-        _, stderr, return_code = run_command(command)
-
-        if return_code != 0:
-            raise RuntimeError(f"Failed to delete image: {stderr}")
+        try:
+            if self._api is not None:
+                await self._api.request(
+                    "DELETE",
+                    f"/images/{quote(image_id)}",
+                    params={"force": 1},
+                    op_class="docker",
+                )
+            else:
+                command = ["docker", "rmi", "-f", image_id]
+                await run_command_async(command, op_class="docker")
+        except RuntimeError as e:
+            raise RuntimeError(f"Failed to delete image: {e}")
+        await self._sync_images()
 
         # Remove the image from metadata
-        metadata = self._load_metadata()
-        if "images" in metadata and image_id in metadata["images"]:
-            del metadata["images"][image_id]
-            self._save_metadata(metadata)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._forget_image, image_id)
 
         return True
 
-    def run_container(
+    def _forget_image(self, image_id: str) -> None:
+        """Drop an image's metadata and the build cache entries naming it"""
+        with self._store.locked():
+            self._store.delete("images", image_id)
+            for record in self._store.find("builds", image_id=image_id):
+                self._store.delete("builds", record["key"])
+
+    async def run_container(
         self,
         image_id: str,
         name: Optional[str] = None,
         ports: Optional[Dict[str, str]] = None,
         environment: Optional[Dict[str, str]] = None,
+        resources: Optional[ContainerResources] = None,
+        auto_ports: Optional[List[str]] = None,
+        network: Optional[str] = None,
+        aliases: Optional[List[str]] = None,
+        labels: Optional[Dict[str, str]] = None,
     ) -> DockerContainer:
         """
         Run a Docker container. If a stopped container exists for the same image and name,
-        it will be restarted instead of creating a new one.
+        it will be restarted instead of creating a new one. Its published
+        ports must then match ports and auto_ports, if given, and are leased
+        again before it starts.
+        Returns once the container is ready (see _wait_until_ready).
 
         Args:
             image_id: ID of the image to run
             name: Optional name for the container
             ports: Optional port mappings (host_port:container_port)
             environment: Optional environment variables
+            resources: Optional CPU, memory, process and block I/O limits,
+                       also applied to an existing container that is reused
+            auto_ports: Optional container ports to publish on free host
+                        ports from CONTAINER_PORT_RANGE
+            network: Optional network to attach a new container to
+            aliases: Optional host names of the container on that network
+            labels: Optional labels of a new container
 
         Returns:
             DockerContainer object with the running container details
         """
+        if resources is not None:
+            _validate_resources(resources, await self._host_resources())
+
         # Generate a name if none provided
         if not name:
             name = f"container_{image_id[:12]}"  # Simplified name for better reuse
 
         # Check if container with this name already exists
-        existing_container_cmd = [
-            "docker",
-            "ps",
-            "-a",
-            "--filter",
-            f"name=^{name}$",
-            "--format",
-            "{{.ID}}",
-        ]
-        existing_id, _, _ = run_command(existing_container_cmd)
+        existing = await self._containers(True, {"name": f"^{name}$"})
 
-        if existing_id.strip():
+        if existing:
             # Container exists, start it if it's stopped
-            container_id = existing_id.strip()
-            status_cmd = [
-                "docker",
-                "inspect",
-                "--format={{.State.Running}}",
-                container_id,
-            ]
-            is_running, _, _ = run_command(status_cmd)
-
-            if is_running.strip() == "false":
-                start_cmd = ["docker", "start", container_id]
-                _, stderr, return_code = run_command(start_cmd)
-                if return_code != 0:
-                    raise RuntimeError(f"Failed to start existing container: {stderr}")
+            container_id = existing[0].id
+            info = await self._inspect_container(container_id)
+            published = _port_bindings(info)
+            if (ports or auto_ports) and not _same_ports(
+                published, ports or {}, auto_ports or []
+            ):
+                raise ValueError(
+                    f"Container {name} already exists with different published ports"
+                )
+            if resources is not None:
+                await self.update_container_resources(container_id, resources)
+            if not info["State"]["Running"]:
+                # Its leases may have been reclaimed while it was stopped
+                await self._lease_ports(
+                    f"container:{name}",
+                    {
+                        str(host_port): container_port
+                        for container_port, host_ports in published.items()
+                        for host_port in host_ports
+                    },
+                    [],
+                )
+                try:
+                    await self._container_action("start", container_id)
+                except RuntimeError as e:
+                    raise RuntimeError(f"Failed to start existing container: {e}")
         else:
             # No existing container, create new one
-            command = ["docker", "run", "-d", "--restart=unless-stopped"]
-            command.extend(["--name", name])
-
             # Add default environment variables based on image
             if not environment:
                 environment = {}
 
             # Check if it's a known image type and add appropriate settings
-            image_info_cmd = ["docker", "inspect", "--format={{.Config.Cmd}}", image_id]
-            image_info, _, _ = run_command(image_info_cmd)
+            image_info = await self._image_command(image_id)
 
             if "python" in image_info.lower():
                 # For Python/Flask apps
@@ -566,72 +1826,947 @@ class DockerService:
                 if "POSTGRES_USER" not in environment:
                     environment["POSTGRES_USER"] = "postgres"
 
-            # Add environment variables
-            for key, value in environment.items():
-                command.extend(["-e", f"{key}={value}"])
+            # Lease the host ports first so a conflict fails before launch
+            owner = f"container:{name}"
+            ports = await self._lease_ports(owner, ports or {}, auto_ports or [])
+            try:
+                container_id = await self._create_container(
+                    image_id,
+                    name,
+                    ports,
+                    environment,
+                    resources,
+                    network,
+                    aliases,
+                    labels,
+                )
+            except RuntimeError as e:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, self._ports.release, owner)
+                raise RuntimeError(f"Failed to run container: {e}")
+
+        info = await self._wait_until_ready(container_id)
+        await self._sync_container(container_id)
+        return _container_model(info)
+
+    async def _lease_ports(
+        self, owner: str, ports: Dict[str, str], auto_ports: List[str]
+    ) -> Dict[str, str]:
+        """
+        Lease the host ports a new container publishes
+
+        Args:
+            owner: Lease owner ("container:<name>")
+            ports: Port mappings asked for (host_port:container_port)
+            auto_ports: Container ports to publish on allocated host ports
 
-            # Add port mappings
+        Returns:
+            All port mappings, including the allocated ones
+
+        Raises:
+            PortConflictError: If a host port is taken
+        """
+        # The allocator holds the metadata file lock and probes ports with
+        # bind(), so it runs in a worker thread rather than on the event loop
+        loop = asyncio.get_running_loop()
+        host_ports = [_host_port(binding) for binding in ports]
+        try:
+            await loop.run_in_executor(None, self._ports.reserve, owner, host_ports)
+        except PortConflictError as e:
+            if e.owner is None or not e.owner.startswith("container:"):
+                raise
+            # The holder may have been removed outside this API; drop the
+            # leases of containers that are gone and try again
+            live = {f"container:{c.name}" for c in await self._containers(True)}
+            if e.owner in live:
+                raise
+            await loop.run_in_executor(
+                None, self._ports.release_missing, "container:", live
+            )
+            await loop.run_in_executor(None, self._ports.reserve, owner, host_ports)
+
+        mappings = dict(ports)
+        if auto_ports:
+            try:
+                allocated = await loop.run_in_executor(
+                    None, self._ports.allocate, owner, "container", len(auto_ports)
+                )
+            except RuntimeError:
+                await loop.run_in_executor(None, self._ports.release, owner)
+                raise
+            for host_port, container_port in zip(allocated, auto_ports):
+                mappings[str(host_port)] = container_port
+        return mappings
+
+    async def _wait_until_ready(self, container_id: str) -> Dict[str, Any]:
+        """
+        Wait for a started container to become ready
+
+        A container with a healthcheck is ready once healthy; otherwise one
+        with published ports once they all accept connections, and any other
+        once it is running. Checks back off exponentially up to
+        CONTAINER_READY_MAX_INTERVAL. A container still not ready after
+        CONTAINER_READY_TIMEOUT is returned as it is, with a warning.
+
+        Args:
+            container_id: ID of the started container
+
+        Returns:
+            The container's latest inspect document
+
+        Raises:
+            RuntimeError: If the container exited or became unhealthy
+        """
+        started = time.monotonic()
+        latest: Dict[str, Any] = {}
+
+        async def check() -> Optional[str]:
+            info = latest["info"] = await self._inspect_container(container_id)
+            state = info["State"]
+            # A crashed container with a restart policy is "restarting"
+            if not state.get("Running") or state.get("Restarting"):
+                return "exited"
+            health = (state.get("Health") or {}).get("Status")
+            if health in ("healthy", "unhealthy"):
+                return "healthcheck" if health == "healthy" else "unhealthy"
+            if health:
+                return None  # Still "starting"
+            ports = _published_ports(info)
             if ports:
-                for host_port, container_port in ports.items():
-                    command.extend(["-p", f"{host_port}:{container_port}"])
+                probes = await asyncio.gather(
+                    *(probe_tcp(host, port) for host, port in ports)
+                )
+                return "tcp" if all(probes) else None
+            return "running"
 
-            command.append(image_id)
+        try:
+            outcome = await poll_until(
+                check,
+                CONTAINER_READY_TIMEOUT,
+                max_interval=CONTAINER_READY_MAX_INTERVAL,
+            )
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            logger.warning(
+                f"Container {container_id[:12]} not ready after "
+                f"{CONTAINER_READY_TIMEOUT:g}s"
+            )
+        self._readiness.record(outcome, time.monotonic() - started)
 
-            stdout, stderr, return_code = run_command(command)
+        if outcome in ("exited", "unhealthy"):
+            # Only the tail: the full log of a crash-looping app can be huge
+            logs = await self._container_logs(container_id, tail=50)
+            problem = "stopped" if outcome == "exited" else "became unhealthy"
+            raise RuntimeError(f"Container {problem} after starting. Logs:\n{logs}")
+        return latest["info"]
 
-            if return_code != 0:
-                raise RuntimeError(f"Failed to run container: {stderr}")
+    def readiness_metrics(self) -> Dict[str, Any]:
+        """
+        Report how long started containers took to become ready
 
-            container_id = stdout.strip()
+        Returns:
+            Number of starts, counts per outcome ("healthcheck", "tcp",
+            "running", "exited", "unhealthy", "timeout") and latency
+            percentiles in seconds
+        """
+        return self._readiness.metrics()
 
-            # Wait briefly for container to start
-            import time
+    # Docker primitives: the Engine API when the daemon socket answers,
+    # otherwise the docker CLI
 
-            time.sleep(2)
+    async def _image_summaries(self) -> List[Dict[str, Any]]:
+        """
+        Describe every local image from one bulk listing
 
-        # Get container details
-        command = [
-            "docker",
-            "ps",
-            "--filter",
-            f"id={container_id}",
-            "--format",
-            "{{.ID}}\t{{.Image}}\t{{.Status}}\t{{.Names}}",
-        ]
-        stdout, _, _ = run_command(command)
+        Returns:
+            Dicts with the short "id", display "tags", "created" datetime,
+            "size" and "shared_size" in bytes and the number of
+            "containers" using the image (None where Docker doesn't report it)
+        """
+        if self._api is not None:
+            if self._mirror_ready():
+                images = self._mirror.images()
+                containers = self._mirror.containers(all_containers=True)
+                usage = Counter(info["Image"] for info in containers)
+            else:
+                images, containers = await asyncio.gather(
+                    self._api.request(
+                        "GET",
+                        "/images/json",
+                        params={"shared-size": 1},
+                        op_class="docker",
+                        priority=Priority.INTERACTIVE,
+                    ),
+                    self._api.request(
+                        "GET",
+                        "/containers/json",
+                        params={"all": 1},
+                        op_class="docker",
+                        priority=Priority.INTERACTIVE,
+                    ),
+                )
+                usage = Counter(container["ImageID"] for container in containers)
+
+            return [
+                {
+                    "id": _short_id(image["Id"]),
+                    "tags": [
+                        _display_tag(repo_tag)
+                        for repo_tag in image.get("RepoTags") or ["<none>:<none>"]
+                    ],
+                    "created": datetime.fromtimestamp(image["Created"], timezone.utc),
+                    "size": image.get("Size"),
+                    # -1 means the daemon didn't compute it
+                    "shared_size": (
+                        image["SharedSize"]
+                        if image.get("SharedSize", -1) >= 0
+                        else None
+                    ),
+                    "containers": usage.get(image["Id"], 0),
+                }
+                for image in images
+            ]
 
-        if not stdout:
-            # If container not found in running containers, check all containers
-            command = [
-                "docker",
-                "ps",
-                "-a",
-                "--filter",
-                f"id={container_id}",
-                "--format",
-                "{{.ID}}\t{{.Image}}\t{{.Status}}\t{{.Names}}",
+        command = ["docker", "images", "--format", "{{json .}}"]
+        stdout, _, _ = await run_command_async(
+            command, op_class="docker", priority=Priority.INTERACTIVE
+        )
+        # The CLI prints one row per tag; group them by image
+        summaries: Dict[str, Dict[str, Any]] = {}
+        for line in stdout.splitlines():
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            summary = summaries.setdefault(
+                row["ID"],
+                {
+                    "id": row["ID"],
+                    "tags": [],
+                    "created": _parse_cli_time(row.get("CreatedAt")),
+                    "size": _parse_cli_size(row.get("Size")),
+                    "shared_size": _parse_cli_size(row.get("SharedSize")),
+                    "containers": (
+                        int(row["Containers"])
+                        if str(row.get("Containers", "")).isdigit()
+                        else None
+                    ),
+                },
+            )
+            summary["tags"].append(_display_tag(f"{row['Repository']}:{row['Tag']}"))
+        return list(summaries.values())
+
+    async def _containers(
+        self,
+        all_containers: bool,
+        filters: Optional[Dict[str, Union[str, List[str]]]] = None,
+        priority: Priority = Priority.NORMAL,
+    ) -> List[DockerContainer]:
+        """
+        List containers as docker ps does
+
+        Args:
+            all_containers: Whether to include stopped containers
+            filters: docker ps filters, e.g. {"name": "^web$"}; a list of
+                     values must all match, e.g. {"label": ["app", "tier=db"]}
+            priority: Scheduler queue priority
+
+        Returns:
+            List of DockerContainer objects
+        """
+        filters = {
+            key: value if isinstance(value, list) else [value]
+            for key, value in (filters or {}).items()
+        }
+        if not filters and self._mirror_ready():
+            return [
+                _container_model(info)
+                for info in self._mirror.containers(all_containers)
             ]
-            stdout, _, _ = run_command(command)
-            if not stdout:
-                raise RuntimeError("Failed to get container details")
 
-        container_id, image, status, name = stdout.strip().split("\t")
+        if self._api is not None:
+            summaries = await self._api.request(
+                "GET",
+                "/containers/json",
+                params={
+                    "all": 1 if all_containers else 0,
+                    "filters": filters,
+                },
+                op_class="docker",
+                priority=priority,
+            )
+            containers = []
+            for summary in summaries:
+                # Summaries carry no start/stop times; the mirror's inspect
+                # documents do
+                info = None
+                if self._mirror_ready():
+                    info = self._mirror.container(summary["Id"])
+                if info is not None:
+                    containers.append(_container_model(info))
+                    continue
+                containers.append(
+                    DockerContainer(
+                        id=_short_id(summary["Id"]),
+                        name=summary["Names"][0].lstrip("/"),
+                        image=summary["Image"],
+                        status=summary["Status"],
+                        created_at=datetime.fromtimestamp(
+                            summary["Created"], timezone.utc
+                        ),
+                    )
+                )
+            return containers
+
+        command = ["docker", "ps"]
+        if all_containers:
+            command.append("-a")
+        for key, values in filters.items():
+            for value in values:
+                command.extend(["--filter", f"{key}={value}"])
+        command.extend(["--format", "{{json .}}"])
+        stdout, _, _ = await run_command_async(
+            command, op_class="docker", priority=priority
+        )
+        containers = []
+        for line in stdout.splitlines():
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            created_at = _parse_cli_time(row.get("CreatedAt")) or datetime.now(
+                timezone.utc
+            )
+            containers.append(
+                DockerContainer(
+                    id=row["ID"],
+                    name=row["Names"],
+                    image=row["Image"],
+                    status=row["Status"],
+                    created_at=created_at,
+                )
+            )
+        return containers
+
+    async def _inspect_container(self, container_id: str) -> Dict[str, Any]:
+        """A container's inspect document"""
+        if self._api is not None:
+            return await self._api.request(
+                "GET", f"/containers/{quote(container_id)}/json", op_class="docker"
+            )
 
-        # If container stopped immediately, check logs for error
-        if "Exited" in status:
-            logs_cmd = ["docker", "logs", container_id]
-            logs, _, _ = run_command(logs_cmd)
-            raise RuntimeError(f"Container stopped after starting. Logs:\n{logs}")
+        command = ["docker", "inspect", "--format={{json .}}", container_id]
+        stdout, _, _ = await run_command_async(command, op_class="docker")
+        return json.loads(stdout)
 
-        return DockerContainer(
-            id=container_id,
-            name=name,
-            image=image,
-            status=status,
-            created_at=datetime.now(),
-            updated_at=datetime.now(),
+    async def _container_action(
+        self,
+        action: str,
+        container_id: str,
+        priority: Priority = Priority.NORMAL,
+        timeout: Optional[int] = None,
+    ) -> None:
+        """
+        Start, stop or restart a container
+
+        Args:
+            action: "start", "stop" or "restart"
+            container_id: Container ID or name
+            priority: Scheduler queue priority
+            timeout: Seconds a stop waits before killing (Docker's default
+                     if None)
+        """
+        # A stop may legitimately take the whole grace period before the
+        # daemon answers
+        command_timeout = COMMAND_TIMEOUT
+        if timeout is not None and action != "start":
+            command_timeout += timeout
+
+        if self._api is not None:
+            # 304 (already started/stopped) isn't an error
+            await self._api.request(
+                "POST",
+                f"/containers/{quote(container_id)}/{action}",
+                params={"t": timeout} if timeout is not None else None,
+                timeout=command_timeout,
+                op_class="docker",
+                priority=priority,
+            )
+            return
+
+        command = ["docker", action]
+        if timeout is not None and action != "start":
+            command.extend(["-t", str(timeout)])
+        command.append(container_id)
+        await run_command_async(
+            command, timeout=command_timeout, op_class="docker", priority=priority
+        )
+
+    async def _image_id(self, reference: str) -> str:
+        """Short ID of a local image given its tag"""
+        if self._api is not None:
+            info = await self._api.request(
+                "GET", f"/images/{quote(reference)}/json", op_class="docker"
+            )
+            return _short_id(info["Id"])
+
+        command = ["docker", "images", "-q", reference]
+        stdout, _, _ = await run_command_async(command, op_class="docker")
+        return stdout.strip()
+
+    async def _image_tags_of(self, image_id: str) -> Optional[List[str]]:
+        """An image's repository:tag names, or None if it doesn't exist"""
+        if self._mirror_ready():
+            for image in self._mirror.images():
+                if _short_id(image["Id"]) == image_id:
+                    return image.get("RepoTags") or []
+            return None
+
+        if self._api is not None:
+            try:
+                info = await self._api.request(
+                    "GET", f"/images/{quote(image_id)}/json", op_class="docker"
+                )
+            except DockerAPIError as e:
+                if e.status == 404:
+                    return None
+                raise
+            return info.get("RepoTags") or []
+
+        command = ["docker", "image", "inspect", "--format", "{{json .RepoTags}}"]
+        try:
+            stdout, _, _ = await run_command_async(
+                command + [image_id], op_class="docker"
+            )
+        except CommandError:
+            return None
+        return json.loads(stdout) or []
+
+    async def _tag_image(self, image_id: str, tag: str) -> None:
+        """Point tag at a local image"""
+        if self._api is not None:
+            repository, _, name = _full_tag(tag).rpartition(":")
+            await self._api.request(
+                "POST",
+                f"/images/{quote(image_id)}/tag",
+                params={"repo": repository, "tag": name},
+                op_class="docker",
+            )
+        else:
+            await run_command_async(["docker", "tag", image_id, tag], op_class="docker")
+        await self._sync_images()
+
+    async def _image_command(self, image_id: str) -> str:
+        """An image's default command, e.g. "[python app.py]" """
+        if self._api is not None:
+            info = await self._api.request(
+                "GET", f"/images/{quote(image_id)}/json", op_class="docker"
+            )
+            return f"[{' '.join(info['Config'].get('Cmd') or [])}]"
+
+        command = ["docker", "inspect", "--format={{.Config.Cmd}}", image_id]
+        stdout, _, _ = await run_command_async(command, op_class="docker")
+        return stdout
+
+    async def _create_container(
+        self,
+        image_id: str,
+        name: str,
+        ports: Dict[str, str],
+        environment: Dict[str, str],
+        resources: Optional[ContainerResources] = None,
+        network: Optional[str] = None,
+        aliases: Optional[List[str]] = None,
+        labels: Optional[Dict[str, str]] = None,
+    ) -> str:
+        """
+        Create and start a detached container that restarts unless stopped
+
+        Args:
+            image_id: ID of the image to run
+            name: Container name
+            ports: Port mappings (host_port:container_port)
+            environment: Environment variables
+            resources: Resource limits
+            network: Network to attach it to instead of the default bridge
+            aliases: Its host names on that network
+            labels: Container labels
+
+        Returns:
+            The container's ID
+        """
+        if self._api is not None:
+            port_bindings: Dict[str, List[Dict[str, str]]] = {}
+            for host_port, container_port in ports.items():
+                if "/" not in container_port:
+                    container_port = f"{container_port}/tcp"
+                port_bindings.setdefault(container_port, []).append(
+                    {"HostPort": str(host_port)}
+                )
+            body: Dict[str, Any] = {
+                "Image": image_id,
+                "Env": [f"{key}={value}" for key, value in environment.items()],
+                "Labels": labels or {},
+                "ExposedPorts": {port: {} for port in port_bindings},
+                "HostConfig": {
+                    "RestartPolicy": {"Name": "unless-stopped"},
+                    "PortBindings": port_bindings,
+                    **_host_config_resources(resources or ContainerResources()),
+                },
+            }
+            if network:
+                body["HostConfig"]["NetworkMode"] = network
+                body["NetworkingConfig"] = {
+                    "EndpointsConfig": {network: {"Aliases": aliases or []}}
+                }
+            created = await self._api.request(
+                "POST",
+                "/containers/create",
+                params={"name": name},
+                body=body,
+                op_class="docker",
+            )
+            await self._container_action("start", created["Id"])
+            return created["Id"]
+
+        command = ["docker", "run", "-d", "--restart=unless-stopped"]
+        command.extend(["--name", name])
+        command.extend(_resource_flags(resources or ContainerResources()))
+        for key, value in (labels or {}).items():
+            command.extend(["--label", f"{key}={value}"])
+        if network:
+            command.extend(["--network", network])
+            for alias in aliases or []:
+                command.extend(["--network-alias", alias])
+
+        # Add environment variables
+        for key, value in environment.items():
+            command.extend(["-e", f"{key}={value}"])
+
+        # Add port mappings
+        for host_port, container_port in ports.items():
+            command.extend(["-p", f"{host_port}:{container_port}"])
+
+        command.append(image_id)
+
+        stdout, _, _ = await run_command_async(command, op_class="docker")
+        return stdout.strip()
+
+    async def _container_logs(self, container_id: str, tail: int) -> str:
+        """The end of a container's output, at most LOG_EXCERPT_CHARS long"""
+        excerpt = ""
+        async for event, data in self.container_log_events(container_id, tail=tail):
+            if event == "log":
+                excerpt = (excerpt + data["text"])[-LOG_EXCERPT_CHARS:]
+        return excerpt
+
+    def validate_log_since(self, since: str) -> None:
+        """
+        Check that a container_log_events "since" value can be parsed
+
+        Args:
+            since: Seconds since the epoch, an RFC 3339 timestamp or a
+                   duration such as "10m"
+
+        Raises:
+            ValueError: If the value is none of these
+        """
+        _parse_since(since)
+
+    async def container_log_events(
+        self,
+        container_id: str,
+        tail: Optional[int] = None,
+        since: Optional[str] = None,
+        follow: bool = False,
+        limit_bytes: Optional[int] = None,
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Stream a container's output as it is read
+
+        At most LOG_CHUNK_BYTES of output are held at a time, however long
+        the log or its lines. Closing the iterator (e.g. when the client
+        disconnects) closes the daemon connection or kills docker logs.
+
+        Args:
+            container_id: Container ID or name
+            tail: Only the last lines (all of them if None)
+            since: Only output after this time: seconds since the epoch, an
+                   RFC 3339 timestamp or a duration such as "10m"
+            follow: Keep streaming new output until the container stops
+            limit_bytes: Stop after this many bytes of output
+
+        Yields:
+            ("log", {"stream": "stdout" or "stderr", "text"}) as output
+            arrives, then ("end", {"bytes", "truncated"})
+        """
+        since_time = _parse_since(since) if since else None
+        # A followed log may stream for hours: don't hold a scheduler slot
+        op_class = None if follow else "docker"
+        sent = 0
+        truncated = False
+        decoders = {
+            name: codecs.getincrementaldecoder("utf-8")(errors="replace")
+            for name in ("stdout", "stderr")
+        }
+
+        if self._api is not None:
+            source = self._api.stream_logs(
+                container_id, tail, since_time, follow, op_class=op_class
+            )
+        else:
+            command = ["docker", "logs"]
+            if tail is not None:
+                command.extend(["--tail", str(tail)])
+            if since_time is not None:
+                command.extend(["--since", f"{since_time:.3f}"])
+            if follow:
+                command.append("--follow")
+            command.append(container_id)
+            source = stream_command(
+                command,
+                timeout=None if follow else COMMAND_TIMEOUT,
+                max_line_bytes=LOG_CHUNK_BYTES,
+                buffer_lines=16,
+                op_class=op_class,
+                keep_line_ends=True,
+            )
+
+        try:
+            async for stream, data in source:
+                if self._api is not None:
+                    stream = "stderr" if stream == 2 else "stdout"
+                else:
+                    data = data.encode()
+                if limit_bytes is not None and sent + len(data) > limit_bytes:
+                    data = data[: limit_bytes - sent]
+                    truncated = True
+                for start in range(0, len(data), LOG_CHUNK_BYTES):
+                    piece = data[start : start + LOG_CHUNK_BYTES]
+                    text = decoders[stream].decode(piece)
+                    if text:
+                        yield "log", {"stream": stream, "text": text}
+                sent += len(data)
+                if truncated:
+                    break
+        finally:
+            await source.aclose()
+        if not truncated:
+            # A stream that ended mid-character gets a replacement character
+            # rather than losing the bytes
+            for stream, decoder in decoders.items():
+                text = decoder.decode(b"", final=True)
+                if text:
+                    yield "log", {"stream": stream, "text": text}
+        yield "end", {"bytes": sent, "truncated": truncated}
+
+    def _mirror_ready(self) -> bool:
+        return self._mirror is not None and self._mirror.ready
+
+    async def _sync_container(self, container_id: str) -> None:
+        """Update the mirror right after changing a container"""
+        if self._mirror_ready():
+            await self._mirror.refresh_container(container_id)
+
+    async def _sync_images(self) -> None:
+        """Update the mirror right after changing the images"""
+        if self._mirror_ready():
+            await self._mirror.refresh_images()
+
+    async def deploy_stack(self, stack: StackCreate) -> Stack:
+        """
+        Start a stack of containers on a network of its own
+
+        Each member starts as soon as the members it depends on are ready
+        (see _wait_until_ready), so members that don't depend on each other
+        start in parallel. Members whose dependency failed aren't started.
+        Members reach each other by member name; their containers are named
+        "<stack>_<member>" and labelled stack=<stack>. Deploying a stack
+        again starts whichever of its containers are stopped or missing.
+
+        Args:
+            stack: Members, their dependencies and the shared environment
+
+        Returns:
+            Stack with the outcome for each member
+        """
+        graph = _stack_graph(stack)
+        previous = self._store.get("stacks", stack.name)
+        record = {
+            "name": stack.name,
+            "network": f"{stack.name}_net",
+            "created_at": (
+                previous["created_at"] if previous else datetime.now().isoformat()
+            ),
+            "definition": stack.model_dump(),
+        }
+        await self._create_network(record["network"], stack.name)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._store.put, "stacks", stack.name, record)
+        members = {member.name: member for member in stack.members}
+
+        async def start(name: str) -> DockerContainer:
+            member = members[name]
+            return await self.run_container(
+                member.image_id,
+                f"{stack.name}_{name}",
+                member.ports,
+                {**stack.environment, **(member.environment or {})},
+                member.resources,
+                member.auto_ports,
+                network=record["network"],
+                aliases=[name],
+                labels={STACK_LABEL: stack.name},
+            )
+
+        return await self._run_stack(record, graph, start)
+
+    async def delete_stack(self, name: str, timeout: Optional[int] = None) -> Stack:
+        """
+        Remove a stack's containers in reverse dependency order, then its network
+
+        A member is removed once every member depending on it is gone. If a
+        removal fails, the members it depends on are kept, and so are the
+        network and the stack itself, so deleting again picks up from there.
+
+        Args:
+            name: Stack name
+            timeout: Seconds each stop waits before killing (Docker's
+                     default if None)
+
+        Returns:
+            Stack with the outcome for each member
+        """
+        record = self._store.get("stacks", name)
+        if record is None:
+            raise ValueError(f"Stack {name} not found")
+        graph = _stack_graph(StackCreate(**record["definition"]))
+        existing = {
+            container.name
+            for container in await self._containers(
+                True, {"label": f"{STACK_LABEL}={name}"}
+            )
+        }
+
+        async def remove(member: str) -> None:
+            if f"{name}_{member}" in existing:
+                await self.delete_container(f"{name}_{member}", timeout)
+
+        stack = await self._run_stack(record, graph, remove, reverse=True)
+        if all(member.status == JobStatus.SUCCEEDED for member in stack.members):
+            await self._remove_network(record["network"])
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._store.delete, "stacks", name)
+        return stack
+
+    async def get_stack(self, name: str) -> Optional[Stack]:
+        """
+        Get a stack and the current state of its containers
+
+        Args:
+            name: Stack name
+
+        Returns:
+            Stack, or None if not found
+        """
+        record = self._store.get("stacks", name)
+        if record is None:
+            return None
+        containers = await self._containers(True, {"label": f"{STACK_LABEL}={name}"})
+        return _stack_model(
+            record, {container.name: container for container in containers}
         )
 
+    async def list_stacks(self) -> List[Stack]:
+        """
+        List stacks and the current state of their containers
+
+        Returns:
+            List of Stack objects
+        """
+        records = self._store.all("stacks")
+        if not records:
+            return []
+        # One listing of every stack's containers; member containers are
+        # named "<stack>_<member>"
+        containers = await self._containers(True, {"label": STACK_LABEL})
+        by_name = {container.name: container for container in containers}
+        return [_stack_model(record, by_name) for record in records.values()]
+
+    async def _run_stack(
+        self,
+        record: Dict[str, Any],
+        graph: Dict[str, List[str]],
+        action: Callable[[str], Awaitable[Any]],
+        reverse: bool = False,
+    ) -> Stack:
+        """Run an action on each stack member in dependency order and report"""
+        durations: Dict[str, float] = {}
+
+        async def timed(name: str) -> Any:
+            started = time.monotonic()
+            try:
+                return await action(name)
+            finally:
+                durations[name] = round(time.monotonic() - started, 3)
+
+        started = time.monotonic()
+        outcomes = await run_in_dependency_order(graph, timed, reverse)
+        members = []
+        for name in graph:
+            outcome = outcomes[name]
+            result = StackMemberResult(name=name, duration=durations.get(name))
+            if isinstance(outcome, DependencyFailedError):
+                result.status = JobStatus.CANCELLED
+                result.error = str(outcome)
+            elif isinstance(outcome, BaseException):
+                logger.warning(
+                    f"Stack {record['name']} member {name} failed: {outcome}"
+                )
+                result.status = JobStatus.FAILED
+                result.error = str(outcome)
+            else:
+                result.status = JobStatus.SUCCEEDED
+                result.container = outcome
+            members.append(result)
+        return Stack(
+            name=record["name"],
+            network=record["network"],
+            created_at=record["created_at"],
+            duration=round(time.monotonic() - started, 3),
+            members=members,
+        )
+
+    async def _create_network(self, network: str, stack: str) -> None:
+        """Create a stack's bridge network unless it exists"""
+        labels = {STACK_LABEL: stack}
+        if self._api is not None:
+            try:
+                await self._api.request(
+                    "POST",
+                    "/networks/create",
+                    body={"Name": network, "Labels": labels, "CheckDuplicate": True},
+                    op_class="docker",
+                )
+            except DockerAPIError as e:
+                if e.status != 409:
+                    raise
+            return
+
+        command = ["docker", "network", "create", "--label", f"{STACK_LABEL}={stack}"]
+        try:
+            await run_command_async(command + [network], op_class="docker")
+        except CommandError as e:
+            if "already exists" not in e.stderr:
+                raise
+
+    async def _remove_network(self, network: str) -> None:
+        """Remove a stack's network if it still exists"""
+        if self._api is not None:
+            try:
+                await self._api.request(
+                    "DELETE", f"/networks/{quote(network)}", op_class="docker"
+                )
+            except DockerAPIError as e:
+                if e.status != 404:
+                    raise
+            return
+
+        command = ["docker", "network", "rm", network]
+        try:
+            await run_command_async(command, op_class="docker")
+        except CommandError as e:
+            if "not found" not in e.stderr:
+                raise
+
+    async def start_state_mirror(self) -> None:
+        """
+        Start mirroring containers and images from the daemon's events
+
+        Listings are then served from memory. Without the Engine API (CLI
+        fallback) this does nothing and listings query Docker every time.
+        """
+        if self._mirror is not None:
+            await self._mirror.start()
+
+    async def start_stats_sampler(self) -> None:
+        """Start sampling the resource usage of running containers"""
+        await self._stats.start()
+
+    async def container_stats(self) -> List[ContainerStats]:
+        """
+        Latest resource usage of every running container
+
+        Returns:
+            One ContainerStats per container, as last sampled
+        """
+        await self._stats.start()
+        return [ContainerStats(**sample) for sample in self._stats.latest()]
+
+    async def container_stats_history(
+        self, container_id: str, since: Optional[float] = None
+    ) -> Optional[List[ContainerStats]]:
+        """
+        Recent resource usage of one container
+
+        Args:
+            container_id: Container ID, ID prefix or name
+            since: Only samples taken after this time (seconds since epoch)
+
+        Returns:
+            Samples oldest first (at most CONTAINER_STATS_HISTORY), or None
+            if the container isn't running
+        """
+        await self._stats.start()
+        samples = self._stats.history(container_id, since)
+        if samples is None:
+            return None
+        return [ContainerStats(**sample) for sample in samples]
+
+    async def container_stats_events(
+        self, container_id: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, ContainerStats]]:
+        """
+        Follow resource usage samples as they are taken
+
+        Args:
+            container_id: Only this container (ID, ID prefix or name)
+
+        Yields:
+            ("stats", ContainerStats) for each sample
+        """
+        await self._stats.start()
+        samples = self._stats.subscribe()
+        try:
+            async for sample in samples:
+                if container_id is None or (
+                    sample["id"].startswith(container_id[:12])
+                    or sample["name"] == container_id
+                ):
+                    yield "stats", ContainerStats(**sample)
+        finally:
+            await samples.aclose()
+
+    def container_stats_metrics(self) -> Dict[str, Any]:
+        """
+        Report the stats sampler's state
+
+        Returns:
+            Containers sampled, samples recorded and dropped for slow live
+            subscribers, and the memory the sample buffers hold
+        """
+        return self._stats.metrics()
+
+    async def close(self) -> None:
+        """
+        Cancel running builds, stop the state mirror and stats sampler and
+        close daemon connections
+        """
+        await self._build_jobs.close()
+        await self._stats.stop()
+        if self._mirror is not None:
+            await self._mirror.stop()
+        if self._api is not None:
+            await self._api.close()
+
     def get_available_templates(self) -> Dict[str, Dict[str, str]]:
         """
         Get all available Dockerfile templates
@@ -686,8 +2821,7 @@ class DockerService:
         Returns:
             String with the content of the Dockerfile
         """
-        metadata = self._load_metadata()
-        dockerfile_info = metadata.get("dockerfiles", {}).get(dockerfile_id)
+        dockerfile_info = self._store.get("dockerfiles", dockerfile_id)
 
         if not dockerfile_info:
             raise ValueError(f"Dockerfile with ID {dockerfile_id} not found")
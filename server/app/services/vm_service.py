@@ -1,22 +1,25 @@
 import os
-import json
+import asyncio
 import logging
 import signal
 import platform
 import psutil
-import time
-from typing import List, Optional, Dict, Any
+from typing import List, Optional
 from datetime import datetime
 from uuid import uuid4
 
-from app.config import VM_DATA_FOLDER, ISO_PATH
+from app.config import VM_DATA_FOLDER, ISO_PATH, VM_BOOT_SLOT_SECONDS
 from app.models.vm import VMResponse, VMStatus
 from app.services.disk_service import DiskService
 from app.utils.subprocess_utils import (
-    run_command,
+    run_command_async,
     run_command_background,
-    check_command_exists,
 )
+from app.utils.host_capabilities import get_host_capabilities
+from app.utils.process_watcher import get_process_watcher
+from app.utils.scheduler import get_scheduler
+from app.utils.metadata_store import open_metadata_store
+from app.utils.port_allocator import get_port_allocator
 import subprocess
 
 logger = logging.getLogger(__name__)
@@ -32,60 +35,110 @@ class VMService:
         """
         self.disk_service = disk_service
 
-        # Check if QEMU is installed
-        if not check_command_exists("qemu-system-x86_64"):
+        # Check if QEMU is installed (probed once at startup)
+        self.capabilities = get_host_capabilities()
+        if not self.capabilities.has_binary("qemu-system-x86_64"):
             raise RuntimeError(
                 "qemu-system-x86_64 command not found - please install QEMU"
             )
 
-        # Create VM metadata file if it doesn't exist
-        self.metadata_file = os.path.join(VM_DATA_FOLDER, "metadata.json")
-        if not os.path.exists(self.metadata_file):
-            with open(self.metadata_file, "w") as f:
-                json.dump({}, f)
+        # Shared metadata store (SQLite by default, see METADATA_BACKEND)
+        self._store = open_metadata_store(VM_DATA_FOLDER, flat_collection="vms")
 
-        # Track running VMs
+        # Host ports for SSH forwarding, shared with containers
+        self._ports = get_port_allocator()
+
+        # Track running VMs; the watcher flips their status when QEMU exits
         self.running_vms = {}
+        self._watcher = get_process_watcher()
+        self._stopping = set()
 
         # Restore VM processes from metadata
         self._restore_running_vms()
 
-    def _load_metadata(self) -> Dict:
-        """Load VM metadata from JSON file"""
-        try:
-            with open(self.metadata_file, "r") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            return {}
-
-    def _save_metadata(self, metadata: Dict) -> None:
-        """Save VM metadata to JSON file"""
-        with open(self.metadata_file, "w") as f:
-            json.dump(metadata, f, default=str)
-
     def _restore_running_vms(self) -> None:
         """Restore running VM processes from metadata"""
-        metadata = self._load_metadata()
-
-        for vm_id, info in metadata.items():
-            # Skip VMs that aren't marked as running
-            if info.get("status") != VMStatus.RUNNING:
-                continue
-
+        for info in self._store.find("vms", status=VMStatus.RUNNING):
+            vm_id = info["id"]
             pid = info.get("pid")
             if pid and self._check_process_running(pid):
                 self.running_vms[vm_id] = pid
+                self._watch(vm_id, pid)
             else:
                 # Update status if VM isn't actually running
-                metadata[vm_id]["status"] = VMStatus.STOPPED
-                metadata[vm_id]["pid"] = None
+                self._store.update(
+                    "vms", vm_id, {"status": VMStatus.STOPPED, "pid": None}
+                )
+                self._ports.release(f"vm:{vm_id}")
+
+    def _watch(
+        self, vm_id: str, pid: int, process: Optional[subprocess.Popen] = None
+    ) -> None:
+        """Have the process watcher report when a VM's QEMU process exits"""
+        self._watcher.watch(
+            pid,
+            lambda pid, return_code: self._on_vm_exit(vm_id, pid, return_code),
+            process,
+        )
 
-        self._save_metadata(metadata)
+    def _on_vm_exit(self, vm_id: str, pid: int, return_code: Optional[int]) -> None:
+        """
+        Record that a VM's QEMU process exited
+
+        Args:
+            vm_id: ID of the VM
+            pid: PID of the exited QEMU process
+            return_code: Exit status, or None if it couldn't be collected
+        """
+        if self.running_vms.get(vm_id) == pid:
+            self.running_vms.pop(vm_id, None)
+        requested = vm_id in self._stopping
+        self._stopping.discard(vm_id)
+
+        # The watcher calls this on the event loop; the metadata lock may be
+        # held by another worker, so the update runs in a worker thread
+        def record() -> None:
+            try:
+                self._record_vm_exit(vm_id, pid, return_code, requested)
+            except Exception:
+                logger.exception(f"Failed to record the exit of VM {vm_id}")
+
+        asyncio.get_running_loop().run_in_executor(None, record)
+
+    def _record_vm_exit(
+        self, vm_id: str, pid: int, return_code: Optional[int], requested: bool
+    ) -> None:
+        """Mark an exited VM stopped (or failed) while holding the metadata lock"""
+        with self._store.locked():
+            info = self._store.get("vms", vm_id)
+            # Skip VMs that were deleted, stopped or restarted meanwhile
+            if info is None or info.get("pid") != pid:
+                return
+            crashed = not requested and return_code not in (0, None)
+            self._store.update(
+                "vms",
+                vm_id,
+                {
+                    "status": VMStatus.ERROR if crashed else VMStatus.STOPPED,
+                    "pid": None,
+                    "ip_address": None,
+                    "updated_at": datetime.now().isoformat(),
+                },
+            )
+            self._ports.release(f"vm:{vm_id}")
+
+        if crashed:
+            logger.warning(f"VM {vm_id} (pid {pid}) exited with status {return_code}")
+        else:
+            logger.info(f"VM {vm_id} (pid {pid}) exited")
 
     def _check_process_running(self, pid: int) -> bool:
         """Check if a process with the given PID is running"""
         try:
             process = psutil.Process(pid)
+            # An exited child that hasn't been reaped yet is not running
+            if process.status() == psutil.STATUS_ZOMBIE:
+                return False
             if "qemu" in process.name().lower():
                 return True
         except (psutil.NoSuchProcess, psutil.AccessDenied):
@@ -107,11 +160,6 @@ class VMService:
         Returns:
             VMResponse object with the created VM details
         """
-        # Validate disk exists
-        disk = self.disk_service.get_disk(disk_id)
-        if not disk:
-            raise ValueError(f"Disk with ID {disk_id} not found")
-
         # Create VM ID and metadata
         vm_id = str(uuid4())
 
@@ -128,13 +176,23 @@ class VMService:
             "updated_at": datetime.now().isoformat(),
         }
 
-        # Save metadata
-        metadata = self._load_metadata()
-        metadata[vm_id] = vm_info
-        self._save_metadata(metadata)
+        # The disk can't be deleted or claimed by another VM until it's
+        # marked in use; disk lock first, then the VM lock
+        with self.disk_service.locked(), self._store.locked():
+            # Validate disk exists
+            disk = self.disk_service.get_disk(disk_id)
+            if not disk:
+                raise ValueError(f"Disk with ID {disk_id} not found")
+            if disk.in_use:
+                raise ValueError(f"Disk with ID {disk_id} is already in use")
 
-        # Mark disk as in use
-        self.disk_service.mark_disk_in_use(disk_id, True)
+            # Save metadata
+            self._store.put("vms", vm_id, vm_info)
+
+            # Mark disk as in use
+            if not self.disk_service.mark_disk_in_use(disk_id, True):
+                self._store.delete("vms", vm_id)
+                raise ValueError(f"Disk with ID {disk_id} not found")
 
         return VMResponse(
             id=vm_id,
@@ -155,7 +213,7 @@ class VMService:
         Returns:
             List of VMResponse objects
         """
-        metadata = self._load_metadata()
+        metadata = self._store.all("vms")
         return [
             VMResponse(
                 id=vm_id,
@@ -181,11 +239,10 @@ class VMService:
         Returns:
             VMResponse object or None if not found
         """
-        metadata = self._load_metadata()
-        if vm_id not in metadata:
+        info = self._store.get("vms", vm_id)
+        if info is None:
             return None
 
-        info = metadata[vm_id]
         return VMResponse(
             id=vm_id,
             name=info["name"],
@@ -198,7 +255,7 @@ class VMService:
             updated_at=datetime.fromisoformat(info["updated_at"]),
         )
 
-    def start_vm(self, vm_id: str) -> VMResponse:
+    async def start_vm(self, vm_id: str) -> VMResponse:
         """
         Start a virtual machine
 
@@ -208,16 +265,16 @@ class VMService:
         Returns:
             Updated VMResponse object
         """
-        metadata = self._load_metadata()
-        if vm_id not in metadata:
+        vm_info = self._store.get("vms", vm_id)
+        if vm_info is None:
             raise ValueError(f"VM with ID {vm_id} not found")
 
-        vm_info = metadata[vm_id]
-
-        # Check if VM is already running
+        # Check if VM is already running. Watched processes are known to be
+        # alive; anything else (e.g. left over from a crashed worker) is probed
         if vm_info["status"] == VMStatus.RUNNING:
-            if vm_id in self.running_vms and self._check_process_running(
-                self.running_vms[vm_id]
+            pid = vm_info.get("pid")
+            if pid and (
+                self._watcher.is_watching(pid) or self._check_process_running(pid)
             ):
                 return self.get_vm(vm_id)
             # Fall through if VM is marked as running but process doesn't exist
@@ -227,6 +284,16 @@ class VMService:
         if not disk:
             raise ValueError(f"Disk with ID {vm_info['disk_id']} not found")
 
+        # Lease a host port to forward to the guest's SSH port (the same one
+        # again if the VM still holds a lease)
+        # The allocator holds the metadata file lock and probes ports with
+        # bind(), so it runs in a worker thread rather than on the event loop
+        loop = asyncio.get_running_loop()
+        leased = await loop.run_in_executor(
+            None, self._ports.allocate, f"vm:{vm_id}", "vm"
+        )
+        ssh_port = leased[0]
+
         # Build QEMU command
         command = [
             "qemu-system-x86_64",
@@ -242,48 +309,93 @@ class VMService:
             "-net",
             "nic,model=virtio",
             "-net",
-            "user,hostfwd=tcp::2222-:22",  # Forward host port 2222 to guest port 22
+            f"user,hostfwd=tcp::{ssh_port}-:22",  # Leased host port to guest port 22
         ]
 
         # Add ISO if it exists
         if os.path.exists(ISO_PATH):
             command.extend(["-cdrom", ISO_PATH])
 
-        # Add KVM acceleration if on Linux and available
-        if platform.system() == "Linux" and check_command_exists("kvm"):
-            command.append("-enable-kvm")
+        # Use the hardware accelerator found by the startup probe (KVM when
+        # /dev/kvm is usable); plain TCG emulation needs no flag
+        accelerator = self.capabilities.preferred_accelerator
+        if accelerator != "tcg":
+            command.extend(["-accel", accelerator])
+
+        # Wait for a vm_boot slot; the slot stays taken for the first
+        # VM_BOOT_SLOT_SECONDS of the boot, when QEMU is busiest
+        scheduler = get_scheduler()
+        await scheduler.acquire("vm_boot")
+        try:
+            # Another request may have started the VM while we were queued
+            vm_info = self._store.get("vms", vm_id)
+            if vm_info is None:
+                raise ValueError(f"VM with ID {vm_id} not found")
+            if vm_info["status"] == VMStatus.RUNNING and self._watcher.is_watching(
+                vm_info.get("pid")
+            ):
+                scheduler.release("vm_boot")
+                return self.get_vm(vm_id)
+
+            await self._launch(vm_id, command, disk.path, ssh_port)
+        except BaseException:
+            scheduler.release("vm_boot")
+            if vm_id not in self.running_vms:
+                await loop.run_in_executor(None, self._ports.release, f"vm:{vm_id}")
+            raise
+        scheduler.release_later("vm_boot", VM_BOOT_SLOT_SECONDS)
+
+        return self.get_vm(vm_id)
 
-        # Start the VM
+    async def _launch(
+        self, vm_id: str, command: List[str], disk_path: str, ssh_port: int
+    ) -> None:
+        """
+        Start QEMU for a VM and record it as running
+
+        Args:
+            vm_id: ID of the VM
+            command: QEMU command line
+            disk_path: Path of the VM's disk, used to find QEMU on Windows
+            ssh_port: Host port forwarded to the guest's SSH port
+        """
         process = run_command_background(command)
 
         if process:
-            # Wait briefly for QEMU to start
-            time.sleep(1)
-
-            # Find the QEMU process ID
-            qemu_pid = self._find_qemu_pid(vm_id, disk.path)
-            print(qemu_pid)
+            if platform.system() == "Windows":
+                # QEMU runs under a shell there; wait for it and look it up
+                await asyncio.sleep(1)
+                qemu_pid = self._find_qemu_pid(vm_id, disk_path)
+            else:
+                # QEMU is our direct child
+                qemu_pid = process.pid
 
             if qemu_pid:
-                # Update metadata with the QEMU PID, not the subprocess PID
-                vm_info["status"] = VMStatus.RUNNING
-                vm_info["pid"] = qemu_pid
-                vm_info["updated_at"] = datetime.now().isoformat()
-                self._save_metadata(metadata)
+                # Update metadata with the QEMU PID, not the subprocess PID.
+                # IP address is localhost since we're using port forwarding.
+                await asyncio.get_running_loop().run_in_executor(
+                    None,
+                    self._store.update,
+                    "vms",
+                    vm_id,
+                    {
+                        "status": VMStatus.RUNNING,
+                        "pid": qemu_pid,
+                        "ip_address": f"127.0.0.1:{ssh_port}",
+                        "updated_at": datetime.now().isoformat(),
+                    },
+                )
 
                 # Track the running VM with the QEMU PID
                 self.running_vms[vm_id] = qemu_pid
-
-                # Set IP address to localhost since we're using port forwarding
-                vm_info["ip_address"] = "127.0.0.1:2222"
-                self._save_metadata(metadata)
+                self._watch(
+                    vm_id, qemu_pid, process if process.pid == qemu_pid else None
+                )
             else:
                 raise RuntimeError("Failed to find QEMU process")
         else:
             raise RuntimeError("Failed to start VM")
 
-        return self.get_vm(vm_id)
-
     def _find_qemu_pid(self, vm_id: str, disk_path: str) -> int:
         """
         Find the PID of the QEMU process for a specific VM.
@@ -344,7 +456,7 @@ class VMService:
 
         return None
 
-    def stop_vm(self, vm_id: str) -> VMResponse:
+    async def stop_vm(self, vm_id: str) -> VMResponse:
         """
         Stop a virtual machine
 
@@ -354,46 +466,61 @@ class VMService:
         Returns:
             Updated VMResponse object
         """
-        metadata = self._load_metadata()
-        if vm_id not in metadata:
+        vm_info = self._store.get("vms", vm_id)
+        if vm_info is None:
             raise ValueError(f"VM with ID {vm_id} not found")
 
-        vm_info = metadata[vm_id]
-
         # Check if VM is already stopped
         if vm_info["status"] == VMStatus.STOPPED:
             return self.get_vm(vm_id)
 
-        # Try to terminate the process
+        # Try to terminate the process. Another worker may have launched it,
+        # so go by the recorded PID rather than this worker's running_vms
         pid = vm_info["pid"]
-        if pid and vm_id in self.running_vms:
+        if pid and (self._watcher.is_watching(pid) or self._check_process_running(pid)):
+            self._stopping.add(vm_id)
             try:
                 if platform.system() == "Windows":
-                    run_command(["taskkill", "/F", "/PID", str(pid)])
+                    await run_command_async(["taskkill", "/F", "/PID", str(pid)])
                 else:
                     os.kill(pid, signal.SIGTERM)
-                    # Give it some time to terminate gracefully
-                    time.sleep(2)
-                    # If still running, force kill
-                    if self._check_process_running(pid):
+                    # Give it up to 2 seconds to terminate gracefully; the
+                    # process watcher reaps it as soon as it exits
+                    for _ in range(20):
+                        await asyncio.sleep(0.1)
+                        if not self._check_process_running(pid):
+                            break
+                    else:
+                        # Still running, force kill
                         os.kill(pid, signal.SIGKILL)
             except (ProcessLookupError, OSError):
                 # Process already gone
                 pass
 
-            # Remove from tracking
-            self.running_vms.pop(vm_id, None)
+            self._stopping.discard(vm_id)
+
+        # Remove from tracking
+        self.running_vms.pop(vm_id, None)
 
         # Update metadata
-        vm_info["status"] = VMStatus.STOPPED
-        vm_info["pid"] = None
-        vm_info["ip_address"] = None
-        vm_info["updated_at"] = datetime.now().isoformat()
-        self._save_metadata(metadata)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None,
+            self._store.update,
+            "vms",
+            vm_id,
+            {
+                "status": VMStatus.STOPPED,
+                "pid": None,
+                "ip_address": None,
+                "updated_at": datetime.now().isoformat(),
+            },
+        )
+        await loop.run_in_executor(None, self._ports.release, f"vm:{vm_id}")
 
         return self.get_vm(vm_id)
 
-    def delete_vm(self, vm_id: str) -> bool:
+    async def delete_vm(self, vm_id: str) -> bool:
         """
         Delete a virtual machine
 
@@ -403,23 +530,32 @@ class VMService:
         Returns:
             Boolean indicating success
         """
-        metadata = self._load_metadata()
-        if vm_id not in metadata:
+        vm_info = self._store.get("vms", vm_id)
+        if vm_info is None:
             return False
 
-        vm_info = metadata[vm_id]
-
         # Stop VM if running
         if vm_info["status"] == VMStatus.RUNNING:
-            self.stop_vm(vm_id)
+            await self.stop_vm(vm_id)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._delete_vm_locked, vm_id)
 
-        # Release disk
-        disk_id = vm_info["disk_id"]
-        self.disk_service.mark_disk_in_use(disk_id, False)
+    def _delete_vm_locked(self, vm_id: str) -> bool:
+        """Delete a VM's record, disk claim and port lease under the metadata locks"""
+        with self.disk_service.locked(), self._store.locked():
+            # Another worker may have deleted it while we were stopping it
+            vm_info = self._store.get("vms", vm_id)
+            if vm_info is None:
+                return False
 
-        # Remove from metadata
-        del metadata[vm_id]
-        self._save_metadata(metadata)
+            # Release disk
+            disk_id = vm_info["disk_id"]
+            self.disk_service.mark_disk_in_use(disk_id, False)
+
+            # Remove from metadata
+            self._store.delete("vms", vm_id)
+            self._ports.release(f"vm:{vm_id}")
 
         return True
 
@@ -439,37 +575,41 @@ class VMService:
         Returns:
             Updated VMResponse object
         """
-        metadata = self._load_metadata()
-        if vm_id not in metadata:
-            raise ValueError(f"VM with ID {vm_id} not found")
-
-        vm_info = metadata[vm_id]
-
-        # Validate new disk exists
-        new_disk = self.disk_service.get_disk(disk_id)
-        if not new_disk:
-            raise ValueError(f"Disk with ID {disk_id} not found")
-
-        # If disk is changing, handle disk transitions
-        if vm_info["disk_id"] != disk_id:
-            # Release old disk
-            self.disk_service.mark_disk_in_use(vm_info["disk_id"], False)
-            # Mark new disk as in use
-            self.disk_service.mark_disk_in_use(disk_id, True)
-
-        # Update VM info
-        vm_info.update(
-            {
-                "name": name,
-                "cpu_cores": cpu_cores,
-                "memory_size": memory_size,
-                "disk_id": disk_id,
-                "updated_at": datetime.now().isoformat(),
-            }
-        )
-
-        # Save metadata
-        self._save_metadata(metadata)
+        # Disk transitions and the VM update must not interleave with other
+        # workers; disk lock first, then the VM lock
+        with self.disk_service.locked(), self._store.locked():
+            vm_info = self._store.get("vms", vm_id)
+            if vm_info is None:
+                raise ValueError(f"VM with ID {vm_id} not found")
+
+            # Validate new disk exists
+            new_disk = self.disk_service.get_disk(disk_id)
+            if not new_disk:
+                raise ValueError(f"Disk with ID {disk_id} not found")
+
+            # If disk is changing, handle disk transitions
+            if vm_info["disk_id"] != disk_id:
+                if new_disk.in_use:
+                    raise ValueError(f"Disk with ID {disk_id} is already in use")
+                # Mark new disk as in use
+                if not self.disk_service.mark_disk_in_use(disk_id, True):
+                    raise ValueError(f"Disk with ID {disk_id} not found")
+                # Release old disk
+                self.disk_service.mark_disk_in_use(vm_info["disk_id"], False)
+
+            # Update VM info (only the edited fields, so a concurrent status
+            # change isn't overwritten)
+            vm_info = self._store.update(
+                "vms",
+                vm_id,
+                {
+                    "name": name,
+                    "cpu_cores": cpu_cores,
+                    "memory_size": memory_size,
+                    "disk_id": disk_id,
+                    "updated_at": datetime.now().isoformat(),
+                },
+            )
 
         return VMResponse(
             id=vm_id,
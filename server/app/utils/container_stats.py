@@ -0,0 +1,401 @@
+import re
+import time
+import json
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from app.utils.docker_api import DockerAPI
+from app.utils.ring_buffer import RingBuffer
+from app.utils.subprocess_utils import stream_command
+
+logger = logging.getLogger(__name__)
+
+STATS_FIELDS = (
+    "cpu_percent",
+    "memory_bytes",
+    "memory_limit",
+    "memory_percent",
+    "net_rx_bytes",
+    "net_tx_bytes",
+    "block_read_bytes",
+    "block_write_bytes",
+    "pids",
+)
+
+# Units docker stats prints sizes in (decimal for I/O, binary for memory)
+_CLI_UNITS = {
+    "B": 1,
+    "kB": 1000,
+    "KB": 1000,
+    "MB": 1000**2,
+    "GB": 1000**3,
+    "TB": 1000**4,
+    "KiB": 1024,
+    "MiB": 1024**2,
+    "GiB": 1024**3,
+    "TiB": 1024**4,
+}
+
+
+def api_stats_sample(doc: Dict[str, Any]) -> Optional[Dict[str, float]]:
+    """
+    Sample from one document of the Engine API stats stream
+
+    CPU use is the share of host CPU time used since the previous document,
+    scaled by the number of CPUs (200% = two busy cores), as docker stats
+    shows it. Memory excludes the page cache, also like docker stats.
+
+    Args:
+        doc: /containers/{id}/stats document
+
+    Returns:
+        Value per STATS_FIELDS name, or None for the first document of a
+        stream (which has no previous CPU reading to compare with)
+    """
+    cpu, precpu = doc.get("cpu_stats") or {}, doc.get("precpu_stats") or {}
+    if not precpu.get("system_cpu_usage"):
+        return None
+    cpu_delta = cpu["cpu_usage"]["total_usage"] - precpu["cpu_usage"]["total_usage"]
+    system_delta = cpu.get("system_cpu_usage", 0) - precpu["system_cpu_usage"]
+    cpus = cpu.get("online_cpus") or len(cpu["cpu_usage"].get("percpu_usage") or [1])
+    cpu_percent = (
+        cpu_delta / system_delta * cpus * 100
+        if system_delta > 0 and cpu_delta >= 0
+        else 0.0
+    )
+
+    memory = doc.get("memory_stats") or {}
+    memory_bytes = memory_limit = memory_percent = None
+    if "usage" in memory:
+        details = memory.get("stats") or {}
+        # cgroup v2, then v1
+        cache = details.get("inactive_file", details.get("total_inactive_file", 0))
+        memory_bytes = max(memory["usage"] - cache, 0)
+        memory_limit = memory.get("limit")
+        if memory_limit:
+            memory_percent = memory_bytes / memory_limit * 100
+
+    networks = (doc.get("networks") or {}).values()
+    block = (doc.get("blkio_stats") or {}).get("io_service_bytes_recursive") or []
+    return {
+        "cpu_percent": cpu_percent,
+        "memory_bytes": memory_bytes,
+        "memory_limit": memory_limit,
+        "memory_percent": memory_percent,
+        "net_rx_bytes": sum(network.get("rx_bytes", 0) for network in networks),
+        "net_tx_bytes": sum(network.get("tx_bytes", 0) for network in networks),
+        "block_read_bytes": sum(
+            entry["value"] for entry in block if entry["op"].lower() == "read"
+        ),
+        "block_write_bytes": sum(
+            entry["value"] for entry in block if entry["op"].lower() == "write"
+        ),
+        "pids": (doc.get("pids_stats") or {}).get("current"),
+    }
+
+
+def _cli_size(value: str) -> Optional[float]:
+    match = re.fullmatch(r"([\d.]+)\s*([kKMGT]?i?B)", value.strip())
+    if not match or match.group(2) not in _CLI_UNITS:
+        return None
+    return float(match.group(1)) * _CLI_UNITS[match.group(2)]
+
+
+def _cli_pair(value: Optional[str]) -> Tuple[Optional[float], Optional[float]]:
+    """Parse "1.2kB / 3MB" into two byte counts"""
+    first, _, second = (value or "").partition("/")
+    return _cli_size(first), _cli_size(second)
+
+
+def _cli_percent(value: Optional[str]) -> Optional[float]:
+    try:
+        return float((value or "").rstrip("%"))
+    except ValueError:
+        return None
+
+
+def cli_stats_sample(row: Dict[str, str]) -> Dict[str, Optional[float]]:
+    """
+    Sample from one row of docker stats --format '{{json .}}'
+
+    Args:
+        row: Decoded row
+
+    Returns:
+        Value per STATS_FIELDS name (None where the CLI shows "--")
+    """
+    memory_bytes, memory_limit = _cli_pair(row.get("MemUsage"))
+    rx, tx = _cli_pair(row.get("NetIO"))
+    read, write = _cli_pair(row.get("BlockIO"))
+    pids = row.get("PIDs", "")
+    return {
+        "cpu_percent": _cli_percent(row.get("CPUPerc")),
+        "memory_bytes": memory_bytes,
+        "memory_limit": memory_limit,
+        "memory_percent": _cli_percent(row.get("MemPerc")),
+        "net_rx_bytes": rx,
+        "net_tx_bytes": tx,
+        "block_read_bytes": read,
+        "block_write_bytes": write,
+        "pids": float(pids) if pids.isdigit() else None,
+    }
+
+
+class _Series:
+    """Recent samples of one container"""
+
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.samples = RingBuffer(STATS_FIELDS, capacity)
+        self.updated = time.monotonic()
+
+
+class ContainerStatsSampler:
+    """
+    Resource usage of every running container, sampled continuously
+
+    With the Engine API, each running container's stats stream is followed
+    (the daemon sends a document about once a second) and the running set
+    is re-listed every ``refresh`` seconds to pick up new containers.
+    Without it, one ``docker stats`` process streams every container.
+
+    Each container's samples go into a fixed-size ring buffer, and a
+    container that stops reporting is forgotten after ``stale_after``
+    seconds, so memory stays bounded by running containers times capacity.
+    """
+
+    def __init__(
+        self,
+        api: Optional[DockerAPI],
+        capacity: int,
+        refresh: float = 2.0,
+        stale_after: float = 10.0,
+        subscriber_buffer: int = 1000,
+    ):
+        """
+        Args:
+            api: Engine API client, or None to use the docker CLI
+            capacity: Samples kept per container
+            refresh: Seconds between checks for new containers (API only)
+            stale_after: Seconds without samples after which a container's
+                         history is dropped
+            subscriber_buffer: Samples held for a slow live subscriber
+                               before its oldest are dropped
+        """
+        self._api = api
+        self.capacity = capacity
+        self.refresh = refresh
+        self.stale_after = stale_after
+        self.subscriber_buffer = subscriber_buffer
+        self._series: Dict[str, _Series] = {}  # Full container ID -> samples
+        self._subscribers: List[asyncio.Queue] = []
+        self._task: Optional[asyncio.Task] = None
+        self._last_prune = time.monotonic()
+        self.samples_recorded = 0
+        self.samples_dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        """Start sampling in the background"""
+        if self._task is None:
+            run = self._run_api if self._api is not None else self._run_cli
+            self._task = asyncio.ensure_future(run())
+
+    async def stop(self) -> None:
+        """Stop sampling; recorded history is kept until pruned"""
+        if self._task is not None:
+            # Before Python 3.12, wait_for() can swallow a cancellation that
+            # races with the request it wraps; cancel until the task ends
+            while not self._task.done():
+                self._task.cancel()
+                await asyncio.wait([self._task], timeout=0.1)
+            self._task = None
+
+    async def _run_api(self) -> None:
+        streams: Dict[str, asyncio.Task] = {}
+        try:
+            while True:
+                try:
+                    running = await self._api.request(
+                        "GET", "/containers/json", params={"all": 0}
+                    )
+                except Exception as e:
+                    logger.warning(f"Listing containers for stats failed: {e}")
+                    running = None
+                if running is not None:
+                    names = {
+                        info["Id"]: info["Names"][0].lstrip("/") for info in running
+                    }
+                    for container_id, name in names.items():
+                        stream = streams.get(container_id)
+                        if stream is None or stream.done():
+                            streams[container_id] = asyncio.ensure_future(
+                                self._follow(container_id, name)
+                            )
+                    for container_id in list(streams):
+                        if container_id not in names:
+                            streams.pop(container_id).cancel()
+                self._prune()
+                await asyncio.sleep(self.refresh)
+        finally:
+            for stream in streams.values():
+                stream.cancel()
+            if streams:
+                await asyncio.wait(list(streams.values()))
+
+    async def _follow(self, container_id: str, name: str) -> None:
+        """Record one container's stats stream until it ends"""
+        docs = self._api.stream_json(
+            "GET", f"/containers/{quote(container_id)}/stats", params={"stream": 1}
+        )
+        try:
+            async for doc in docs:
+                sample = api_stats_sample(doc)
+                if sample is not None:
+                    self.record(container_id, name, sample)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Stopped or removed meanwhile; re-followed if still running
+            logger.debug(f"Stats stream of {container_id[:12]} ended: {e}")
+        finally:
+            await docs.aclose()
+
+    async def _run_cli(self) -> None:
+        command = ["docker", "stats", "--no-trunc", "--format", "{{json .}}"]
+        while True:
+            try:
+                async for stream, line in stream_command(command):
+                    # Each refresh starts with terminal clear-screen codes
+                    start = line.find("{")
+                    if stream != "stdout" or start < 0:
+                        continue
+                    row = json.loads(line[start:])
+                    self.record(row["ID"], row.get("Name", ""), cli_stats_sample(row))
+                logger.warning("docker stats ended; restarting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"docker stats failed: {e}")
+            await asyncio.sleep(self.refresh)
+
+    def record(
+        self, container_id: str, name: str, values: Dict[str, Optional[float]]
+    ) -> None:
+        """
+        Add a sample to a container's history and send it to subscribers
+
+        Args:
+            container_id: Full container ID
+            name: Container name
+            values: Value per STATS_FIELDS name
+        """
+        series = self._series.get(container_id)
+        if series is None:
+            series = self._series[container_id] = _Series(name, self.capacity)
+        series.name = name
+        series.updated = time.monotonic()
+        series.samples.append(time.time(), values)
+        self.samples_recorded += 1
+
+        sample = self._describe(container_id, series, series.samples.latest())
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()  # Drop the oldest for a slow subscriber
+                self.samples_dropped += 1
+            queue.put_nowait(sample)
+
+        if time.monotonic() - self._last_prune >= 1:
+            self._prune()
+
+    def _prune(self) -> None:
+        """Forget containers that stopped reporting"""
+        now = time.monotonic()
+        self._last_prune = now
+        for container_id, series in list(self._series.items()):
+            if now - series.updated > self.stale_after:
+                del self._series[container_id]
+
+    @staticmethod
+    def _describe(container_id: str, series: _Series, sample: Dict) -> Dict[str, Any]:
+        return {"id": container_id[:12], "name": series.name, **sample}
+
+    def resolve(self, reference: str) -> Optional[str]:
+        """Full ID of a sampled container given an ID prefix or name"""
+        self._prune()
+        for container_id, series in self._series.items():
+            if container_id.startswith(reference) or series.name == reference:
+                return container_id
+        return None
+
+    def latest(self) -> List[Dict[str, Any]]:
+        """
+        The newest sample of every container
+
+        Returns:
+            Dicts of "id", "name", "time" and each STATS_FIELDS value
+        """
+        self._prune()
+        return [
+            self._describe(container_id, series, series.samples.latest())
+            for container_id, series in self._series.items()
+        ]
+
+    def history(
+        self, reference: str, since: Optional[float] = None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Recent samples of one container, oldest first
+
+        Args:
+            reference: Container ID, ID prefix or name
+            since: Only samples taken after this time (seconds since epoch)
+
+        Returns:
+            The samples, or None if the container isn't being sampled
+        """
+        container_id = self.resolve(reference)
+        if container_id is None:
+            return None
+        series = self._series[container_id]
+        return [
+            self._describe(container_id, series, sample)
+            for sample in series.samples.samples(since)
+        ]
+
+    async def subscribe(self) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Follow samples as they are recorded
+
+        A subscriber that falls more than subscriber_buffer samples behind
+        loses the oldest ones.
+
+        Yields:
+            Samples as latest() describes them
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.subscriber_buffer)
+        self._subscribers.append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers.remove(queue)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Containers sampled, samples recorded and dropped, memory held"""
+        return {
+            "running": self.running,
+            "containers": len(self._series),
+            "capacity": self.capacity,
+            "samples_recorded": self.samples_recorded,
+            "samples_dropped": self.samples_dropped,
+            "subscribers": len(self._subscribers),
+            "buffer_bytes": sum(
+                series.samples.nbytes for series in self._series.values()
+            ),
+        }
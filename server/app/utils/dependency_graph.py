@@ -0,0 +1,110 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Mapping
+
+
+class DependencyFailedError(RuntimeError):
+    """A node was skipped because a node it waits for failed"""
+
+    def __init__(self, node: str, failed: List[str]):
+        self.node = node
+        self.failed = failed
+        super().__init__(f"{node} skipped: {', '.join(failed)} failed")
+
+
+def topological_order(graph: Mapping[str, Iterable[str]]) -> List[str]:
+    """
+    Order nodes so each comes after everything it depends on
+
+    Args:
+        graph: Dependencies of each node
+
+    Returns:
+        The nodes, dependencies first; ties keep the graph's order
+
+    Raises:
+        ValueError: If a dependency is unknown or the graph has a cycle
+    """
+    dependencies = {node: list(dict.fromkeys(graph[node])) for node in graph}
+    for node, needs in dependencies.items():
+        unknown = [dependency for dependency in needs if dependency not in graph]
+        if unknown:
+            raise ValueError(f"{node} depends on unknown {', '.join(unknown)}")
+
+    order: List[str] = []
+    placed = set()
+    remaining = list(dependencies)
+    while remaining:
+        ready = [
+            node
+            for node in remaining
+            if all(dependency in placed for dependency in dependencies[node])
+        ]
+        if not ready:
+            raise ValueError(f"Dependency cycle between {', '.join(remaining)}")
+        order.extend(ready)
+        placed.update(ready)
+        remaining = [node for node in remaining if node not in placed]
+    return order
+
+
+async def run_in_dependency_order(
+    graph: Mapping[str, Iterable[str]],
+    action: Callable[[str], Awaitable[Any]],
+    reverse: bool = False,
+) -> Dict[str, Any]:
+    """
+    Run an action on every node, each as soon as the nodes it waits for are done
+
+    Nodes that don't wait on each other run concurrently. A node whose
+    dependency failed is skipped with a DependencyFailedError, and so are
+    the nodes waiting on it; the rest carry on. Cancelling the call cancels
+    every running action.
+
+    Args:
+        graph: Dependencies of each node
+        action: Coroutine function run with each node
+        reverse: Run dependents first (e.g. for teardown)
+
+    Returns:
+        Each node's result, or the exception its action raised
+    """
+    order = topological_order(graph)
+    waits_for = {node: set(graph[node]) for node in order}
+    if reverse:
+        order.reverse()
+        waits_for = {
+            node: {dependent for dependent in order if node in graph[dependent]}
+            for node in order
+        }
+
+    async def run(node: str, before: Dict[str, asyncio.Future]) -> Any:
+        if before:
+            await asyncio.wait(list(before.values()))
+            failed = [
+                name
+                for name, task in before.items()
+                if task.cancelled() or task.exception() is not None
+            ]
+            if failed:
+                raise DependencyFailedError(node, failed)
+        return await action(node)
+
+    tasks: Dict[str, asyncio.Future] = {}
+    for node in order:
+        before = {name: tasks[name] for name in waits_for[node]}
+        tasks[node] = asyncio.ensure_future(run(node, before))
+    try:
+        await asyncio.wait(list(tasks.values()))
+    except asyncio.CancelledError:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+    return {node: _outcome(task) for node, task in tasks.items()}
+
+
+def _outcome(task: asyncio.Future) -> Any:
+    """A finished task's result, or the exception it ended with"""
+    if task.cancelled():
+        return asyncio.CancelledError()
+    return task.exception() or task.result()
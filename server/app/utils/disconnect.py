@@ -0,0 +1,58 @@
+import asyncio
+import logging
+from typing import Awaitable, TypeVar
+
+from fastapi import HTTPException, Request
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    """Return once the client has gone away"""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T]) -> T:
+    """
+    Await an operation, cancelling it if the client disconnects first
+
+    Commands started through run_command_async are killed when their task is
+    cancelled, so an abandoned `docker build` or `qemu-img convert` stops
+    instead of running to completion for nobody.
+
+    Args:
+        request: The incoming request (its body must already have been read)
+        awaitable: Operation to run
+
+    Returns:
+        The operation's result
+
+    Raises:
+        HTTPException: 499 if the client disconnected
+    """
+    task = asyncio.ensure_future(awaitable)
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        await asyncio.wait({task, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        disconnected.cancel()
+
+    if not task.done():
+        logger.info(
+            f"Client disconnected, cancelling {request.method} {request.url.path}"
+        )
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        raise HTTPException(status_code=499, detail="Client disconnected")
+    return task.result()
@@ -0,0 +1,493 @@
+import json
+import socket
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlencode
+
+from app.config import COMMAND_TIMEOUT, DOCKER_API_POOL_SIZE
+from app.utils.scheduler import Priority, get_scheduler
+
+logger = logging.getLogger(__name__)
+
+PROBE_TIMEOUT = 5  # seconds
+
+
+class DockerAPIError(RuntimeError):
+    """The Docker daemon answered with an error status"""
+
+    def __init__(self, status: int, message: str):
+        """
+        Args:
+            status: HTTP status code
+            message: Error message returned by the daemon
+        """
+        super().__init__(message)
+        self.status = status
+
+
+def probe_socket(path: str) -> Optional[Dict]:
+    """
+    Check whether a Docker daemon answers on a unix socket
+
+    Blocking; meant for startup probes.
+
+    Args:
+        path: Path of the daemon socket
+
+    Returns:
+        The daemon's /version document, or None if it isn't reachable
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(PROBE_TIMEOUT)
+            sock.connect(path)
+            sock.sendall(
+                b"GET /version HTTP/1.0\r\nHost: docker\r\nConnection: close\r\n\r\n"
+            )
+            response = b""
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                response += chunk
+        head, _, body = response.partition(b"\r\n\r\n")
+        if head.split(b" ", 2)[1] != b"200":
+            return None
+        return json.loads(body)
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class _Connection:
+    """One HTTP/1.1 connection to the daemon"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.loop = asyncio.get_running_loop()
+        self.reused = False
+
+    def close(self) -> None:
+        try:
+            self.writer.close()
+        except RuntimeError:
+            pass  # Its event loop is already closed
+
+
+class _Response:
+    """Status, headers and body reader of one response"""
+
+    def __init__(self, connection: _Connection, status: int, headers: Dict[str, str]):
+        self.connection = connection
+        self.status = status
+        self.headers = headers
+        self.chunked = "chunked" in headers.get("transfer-encoding", "").lower()
+        if status in (204, 304):
+            self.length: Optional[int] = 0  # No body by definition
+        elif "content-length" in headers:
+            self.length = int(headers["content-length"])
+        else:
+            self.length = None
+        # Without a length or chunking the body ends when the daemon closes
+        self.keep_alive = headers.get("connection", "").lower() != "close" and (
+            self.chunked or self.length is not None
+        )
+
+    async def iter_chunks(self) -> AsyncIterator[bytes]:
+        """Yield the body as it arrives, in pieces of at most 64 KiB"""
+        reader = self.connection.reader
+        if self.chunked:
+            while True:
+                size = int((await reader.readline()).split(b";")[0].strip(), 16)
+                if size == 0:
+                    # Skip trailers up to the blank line
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    return
+                while size:
+                    data = await reader.readexactly(min(size, 65536))
+                    size -= len(data)
+                    yield data
+                await reader.readline()
+        elif self.length is not None:
+            remaining = self.length
+            while remaining:
+                data = await reader.read(min(remaining, 65536))
+                if not data:
+                    raise ConnectionError("Docker daemon closed the connection")
+                remaining -= len(data)
+                yield data
+        else:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    return
+                yield data
+
+    async def read(self) -> bytes:
+        return b"".join([chunk async for chunk in self.iter_chunks()])
+
+
+class DockerAPI:
+    """
+    Docker Engine API client over the daemon's unix socket
+
+    Requests go over a pool of keep-alive connections, so a call costs one
+    HTTP round trip instead of forking the docker CLI and connecting anew.
+    Responses are decoded JSON. Like run_command_async, calls can wait for
+    a scheduler slot first.
+    """
+
+    def __init__(self, socket_path: str, pool_size: int = DOCKER_API_POOL_SIZE):
+        """
+        Initialize the client; connections are opened on demand
+
+        Args:
+            socket_path: Path of the daemon socket
+            pool_size: Maximum number of idle connections kept open
+        """
+        self.socket_path = socket_path
+        self.pool_size = pool_size
+        self._idle: List[_Connection] = []
+        self.connections_opened = 0
+
+    async def _connect(self) -> _Connection:
+        loop = asyncio.get_running_loop()
+        while self._idle:
+            connection = self._idle.pop()
+            # Connections belong to the loop that opened them; drop ones the
+            # daemon has closed while they were idle
+            if connection.loop is loop and not connection.reader.at_eof():
+                connection.reused = True
+                return connection
+            connection.close()
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        self.connections_opened += 1
+        return _Connection(reader, writer)
+
+    def _release(self, connection: _Connection, response: _Response) -> None:
+        if response.keep_alive and len(self._idle) < self.pool_size:
+            self._idle.append(connection)
+        else:
+            connection.close()
+
+    async def _send(
+        self,
+        connection: _Connection,
+        method: str,
+        path: str,
+        body: Optional[bytes],
+        content_type: str,
+    ) -> _Response:
+        head = [f"{method} {path} HTTP/1.1", "Host: docker"]
+        if body is not None:
+            head.append(f"Content-Type: {content_type}")
+        head.append(f"Content-Length: {len(body or b'')}")
+        connection.writer.write(("\r\n".join(head) + "\r\n\r\n").encode())
+        if body:
+            connection.writer.write(body)
+        await connection.writer.drain()
+
+        status_line = await connection.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Docker daemon closed the connection")
+        status = int(status_line.split(b" ", 2)[1])
+        headers = {}
+        while True:
+            line = await connection.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return _Response(connection, status, headers)
+
+    @asynccontextmanager
+    async def _exchange(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]],
+        body: Any,
+        content_type: str,
+    ) -> AsyncIterator[_Response]:
+        """Send a request and hold its connection while the body is read"""
+        if params:
+            query = {
+                key: json.dumps(value) if isinstance(value, dict) else value
+                for key, value in params.items()
+                if value is not None
+            }
+            path = f"{path}?{urlencode(query)}"
+        if body is not None and not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+
+        connection = await self._connect()
+        try:
+            try:
+                response = await self._send(
+                    connection, method, path, body, content_type
+                )
+            except ConnectionError:
+                if not connection.reused:
+                    raise
+                # The daemon dropped the idle connection before our request
+                # arrived; retry once on a fresh one
+                connection.close()
+                connection = await self._connect()
+                response = await self._send(
+                    connection, method, path, body, content_type
+                )
+        except BaseException:
+            connection.close()
+            raise
+
+        completed = False
+        try:
+            yield response
+            completed = True
+        except DockerAPIError:
+            completed = True  # The error body was read in full
+            raise
+        finally:
+            # A body that wasn't read to the end leaves the connection unusable
+            if completed and response.keep_alive:
+                self._release(connection, response)
+            else:
+                connection.close()
+
+    @staticmethod
+    async def _raise_for_status(response: _Response) -> None:
+        if response.status < 400:
+            return
+        data = await response.read()
+        try:
+            message = json.loads(data).get("message", "")
+        except (ValueError, AttributeError):
+            message = data.decode(errors="replace").strip()
+        raise DockerAPIError(response.status, message or f"HTTP {response.status}")
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        body: Any = None,
+        content_type: str = "application/json",
+        timeout: Optional[float] = COMMAND_TIMEOUT,
+        op_class: Optional[str] = None,
+        priority: Priority = Priority.NORMAL,
+    ) -> Any:
+        """
+        Send a request and return the decoded response
+
+        Args:
+            method: HTTP method
+            path: API path, e.g. "/containers/json"
+            params: Query parameters; dict values are JSON-encoded (filters)
+            body: JSON-serializable request body, or raw bytes
+            content_type: Content type of a bytes body
+            timeout: Seconds to wait for the response (None waits forever)
+            op_class: Scheduler operation class to wait for a slot in
+            priority: Scheduler queue priority
+
+        Returns:
+            The decoded JSON body, the text body, or None if it is empty
+
+        Raises:
+            DockerAPIError: If the daemon answers with an error status
+        """
+        async with get_scheduler().slot(op_class, priority):
+            return await asyncio.wait_for(
+                self._request(method, path, params, body, content_type), timeout
+            )
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]],
+        body: Any,
+        content_type: str,
+    ) -> Any:
+        async with self._exchange(method, path, params, body, content_type) as response:
+            await self._raise_for_status(response)
+            data = await response.read()
+        if not data:
+            return None
+        if response.headers.get("content-type", "").startswith("application/json"):
+            return json.loads(data)
+        return data.decode(errors="replace")
+
+    async def stream(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        body: Any = None,
+        content_type: str = "application/json",
+        op_class: Optional[str] = None,
+        priority: Priority = Priority.NORMAL,
+    ) -> AsyncIterator[bytes]:
+        """
+        Send a request and yield the response body as it arrives
+
+        Used for endpoints that stream (pulls, events, logs). Stopping
+        iteration early closes the connection, which makes the daemon stop
+        sending.
+
+        Args:
+            method: HTTP method
+            path: API path
+            params: Query parameters; dict values are JSON-encoded
+            body: JSON-serializable request body, or raw bytes
+            content_type: Content type of a bytes body
+            op_class: Scheduler operation class whose slot is held while
+                      the response streams
+            priority: Scheduler queue priority
+
+        Yields:
+            Raw body chunks
+
+        Raises:
+            DockerAPIError: If the daemon answers with an error status
+        """
+        async with get_scheduler().slot(op_class, priority):
+            async with self._exchange(
+                method, path, params, body, content_type
+            ) as response:
+                await self._raise_for_status(response)
+                async for chunk in response.iter_chunks():
+                    yield chunk
+
+    async def stream_json(
+        self, method: str, path: str, **kwargs: Any
+    ) -> AsyncIterator[Dict]:
+        """
+        Like stream(), for endpoints that send one JSON document per line
+
+        Yields:
+            Decoded JSON documents
+        """
+        chunks = self.stream(method, path, **kwargs)
+        pending = b""
+        try:
+            async for chunk in chunks:
+                *lines, pending = (pending + chunk).split(b"\n")
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line)
+            if pending.strip():
+                yield json.loads(pending)
+        finally:
+            await chunks.aclose()
+
+    async def close(self) -> None:
+        """Close the idle connections"""
+        while self._idle:
+            self._idle.pop().close()
+
+    # Endpoints used by the Docker service
+
+    async def stream_logs(
+        self,
+        container_id: str,
+        tail: Optional[int] = None,
+        since: Optional[float] = None,
+        follow: bool = False,
+        **kwargs: Any,
+    ) -> AsyncIterator[Tuple[int, bytes]]:
+        """
+        Yield a container's stdout and stderr as it arrives
+
+        Frames are split as they are received rather than buffered whole,
+        so memory use doesn't depend on how long a log line is.
+
+        Args:
+            container_id: Container ID or name
+            tail: Only the last lines (all of them if None)
+            since: Only output after this time (seconds since the epoch)
+            follow: Keep streaming new output until the container stops
+            **kwargs: Passed to stream() (op_class, priority)
+
+        Yields:
+            Tuples of (stream type, bytes); 1 is stdout and 2 is stderr
+            (containers with a TTY only have stdout)
+        """
+        params: Dict[str, Any] = {
+            "stdout": 1,
+            "stderr": 1,
+            "follow": 1 if follow else 0,
+            "tail": "all" if tail is None else tail,
+        }
+        if since is not None:
+            params["since"] = int(since)
+        chunks = self.stream(
+            "GET", f"/containers/{quote(container_id)}/logs", params=params, **kwargs
+        )
+        demuxer = _LogDemuxer()
+        try:
+            async for chunk in chunks:
+                for frame in demuxer.feed(chunk):
+                    yield frame
+            for frame in demuxer.flush():
+                yield frame
+        finally:
+            await chunks.aclose()
+
+
+class _LogDemuxer:
+    """
+    Incremental splitter of a log stream into (stream type, bytes) pieces
+
+    Multiplexed streams (containers without a TTY) are recognised from the
+    first frame header; payloads are passed on as their bytes arrive, so at
+    most a partial 8-byte header is held between calls.
+    """
+
+    def __init__(self):
+        self._pending = b""
+        self._multiplexed: Optional[bool] = None
+        self._stream = 1
+        self._remaining = 0  # Payload bytes left in the current frame
+
+    def feed(self, data: bytes) -> List[Tuple[int, bytes]]:
+        data = self._pending + data
+        self._pending = b""
+        if self._multiplexed is None:
+            if len(data) < 8:
+                self._pending = data
+                return []
+            self._multiplexed = is_multiplexed(data)
+        if not self._multiplexed:
+            return [(1, data)] if data else []
+
+        pieces = []
+        while data:
+            if self._remaining:
+                payload = data[: self._remaining]
+                data = data[self._remaining :]
+                self._remaining -= len(payload)
+                pieces.append((self._stream, payload))
+                continue
+            if len(data) < 8:
+                self._pending = data
+                break
+            self._stream = data[0]
+            self._remaining = int.from_bytes(data[4:8], "big")
+            data = data[8:]
+        return pieces
+
+    def flush(self) -> List[Tuple[int, bytes]]:
+        """Whatever is left at the end of the stream"""
+        # A short raw stream never got as far as detection
+        pending, self._pending = self._pending, b""
+        return [(1, pending)] if pending and not self._multiplexed else []
+
+
+def is_multiplexed(data: bytes) -> bool:
+    """Whether log bytes start with a multiplexed frame header (no TTY)"""
+    return len(data) >= 8 and data[0] in (0, 1, 2) and data[1:4] == b"\0\0\0"
@@ -0,0 +1,308 @@
+import re
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from urllib.parse import quote
+
+from app.utils.docker_api import DockerAPI, DockerAPIError
+
+logger = logging.getLogger(__name__)
+
+# Container events that don't change what the mirror records
+IGNORED_ACTIONS = (
+    "exec_",
+    "attach",
+    "detach",
+    "resize",
+    "top",
+    "archive-path",
+    "extract-to-dir",
+    "export",
+    "copy",
+    "commit",
+)
+
+# Recently removed containers remembered, so that an inspect that was
+# already in flight doesn't bring one back
+REMOVED_HISTORY = 1024
+
+
+def parse_docker_time(value: Optional[str]) -> Optional[datetime]:
+    """
+    Parse an RFC 3339 timestamp from the daemon
+
+    Args:
+        value: e.g. "2024-05-01T10:00:00.123456789Z"; the daemon's zero time
+               (year 1) means "never"
+
+    Returns:
+        A timezone-aware datetime, or None
+    """
+    if not value or value.startswith("0001-"):
+        return None
+    # fromisoformat() wants exactly six fractional digits and no "Z"
+    value = re.sub(r"\.(\d+)", lambda m: "." + m.group(1).ljust(6, "0")[:6], value)
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def human_duration(seconds: float) -> str:
+    """Format a duration the way the docker CLI does ("About an hour", ...)"""
+    if seconds < 1:
+        return "Less than a second"
+    if seconds < 2:
+        return "1 second"
+    if seconds < 60:
+        return f"{int(seconds)} seconds"
+    minutes = int(seconds / 60)
+    if minutes == 1:
+        return "About a minute"
+    if minutes < 60:
+        return f"{minutes} minutes"
+    hours = int(seconds / 3600 + 0.5)
+    if hours == 1:
+        return "About an hour"
+    if hours < 48:
+        return f"{hours} hours"
+    if hours < 24 * 7 * 2:
+        return f"{hours // 24} days"
+    if hours < 24 * 30 * 2:
+        return f"{hours // 24 // 7} weeks"
+    if hours < 24 * 365 * 2:
+        return f"{hours // 24 // 30} months"
+    return f"{hours // 24 // 365} years"
+
+
+def container_status(state: Dict, now: Optional[datetime] = None) -> str:
+    """
+    Render a container's State like the Status column of docker ps
+
+    Args:
+        state: State object from the container's inspect document
+        now: Reference time (defaults to the current time)
+
+    Returns:
+        e.g. "Up 5 minutes", "Exited (1) 2 hours ago"
+    """
+    now = now or datetime.now(timezone.utc)
+
+    def since(value: Optional[str]) -> str:
+        moment = parse_docker_time(value)
+        if moment is None:
+            return "Less than a second"
+        return human_duration(max((now - moment).total_seconds(), 0))
+
+    status = state.get("Status")
+    if status == "running" or (status is None and state.get("Running")):
+        text = f"Up {since(state.get('StartedAt'))}"
+        health = (state.get("Health") or {}).get("Status")
+        if state.get("Paused"):
+            text += " (Paused)"
+        elif health == "starting":
+            text += " (health: starting)"
+        elif health in ("healthy", "unhealthy"):
+            text += f" ({health})"
+        return text
+    if status == "paused":
+        return f"Up {since(state.get('StartedAt'))} (Paused)"
+    if status == "restarting":
+        return f"Restarting ({state.get('ExitCode', 0)}) {since(state.get('FinishedAt'))} ago"
+    if status == "exited":
+        return (
+            f"Exited ({state.get('ExitCode', 0)}) {since(state.get('FinishedAt'))} ago"
+        )
+    if status == "removing":
+        return "Removal In Progress"
+    if status == "dead":
+        return "Dead"
+    return "Created"
+
+
+class DockerStateMirror:
+    """
+    In-memory copy of the daemon's containers and images
+
+    Seeded from the Engine API, then kept current from the /events stream:
+    a container event re-inspects that one container and an image event
+    re-lists the images. When the stream drops, the mirror is marked stale,
+    reseeded and resubscribed with backoff. Readers check ``ready`` and
+    query the daemon directly while the mirror is stale.
+    """
+
+    def __init__(self, api: DockerAPI, max_backoff: float = 30.0):
+        """
+        Initialize an empty mirror
+
+        Args:
+            api: Engine API client
+            max_backoff: Longest wait in seconds between reconnect attempts
+        """
+        self._api = api
+        self.max_backoff = max_backoff
+        self._containers: Dict[str, Dict] = {}  # Full ID -> inspect document
+        self._removed: "OrderedDict[str, None]" = OrderedDict()  # Full IDs
+        self._images: List[Dict] = []  # /images/json documents
+        self._task: Optional[asyncio.Task] = None
+        self.ready = False
+        self.resyncs = 0
+        self.events_applied = 0
+
+    async def start(self) -> None:
+        """Seed the mirror and follow the events stream in the background"""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """Stop following events; the mirror is stale afterwards"""
+        self.ready = False
+        if self._task is not None:
+            # Before Python 3.12, wait_for() can swallow a cancellation that
+            # races with the request it wraps; cancel until the task ends
+            while not self._task.done():
+                self._task.cancel()
+                await asyncio.wait([self._task], timeout=0.1)
+            self._task = None
+
+    async def _run(self) -> None:
+        backoff = 0.5
+        while True:
+            try:
+                # Events are replayed from before the seed, so nothing that
+                # changes while seeding is lost
+                since = int(time.time()) - 1
+                await self.resync()
+                backoff = 0.5
+                await self._follow(since)
+                logger.warning("Docker events stream ended; resyncing")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Docker state mirror failed: {e}")
+            self.ready = False
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def resync(self) -> None:
+        """Replace the mirrored state with a fresh copy from the daemon"""
+        summaries = await self._api.request(
+            "GET", "/containers/json", params={"all": 1}
+        )
+        inspected = await asyncio.gather(
+            *(self._inspect(summary["Id"]) for summary in summaries)
+        )
+        images = await self._api.request(
+            "GET", "/images/json", params={"shared-size": 1}
+        )
+
+        self._containers = {info["Id"]: info for info in inspected if info}
+        self._images = images
+        self.ready = True
+        self.resyncs += 1
+        logger.info(
+            f"Docker state mirror synced: {len(self._containers)} containers, "
+            f"{len(self._images)} images"
+        )
+
+    async def _follow(self, since: int) -> None:
+        events = self._api.stream_json(
+            "GET",
+            "/events",
+            params={"since": since, "filters": {"type": ["container", "image"]}},
+        )
+        try:
+            async for event in events:
+                await self._apply(event)
+        finally:
+            await events.aclose()
+
+    async def _apply(self, event: Dict) -> None:
+        action = event.get("Action") or event.get("status") or ""
+        actor_id = (event.get("Actor") or {}).get("ID") or event.get("id")
+        if event.get("Type") == "container":
+            if action.startswith(IGNORED_ACTIONS):
+                return
+            if action == "destroy":
+                self._forget(actor_id)
+            else:
+                await self.refresh_container(actor_id)
+        elif event.get("Type") == "image":
+            await self.refresh_images()
+        self.events_applied += 1
+
+    async def _inspect(self, container_id: str) -> Optional[Dict]:
+        try:
+            return await self._api.request(
+                "GET", f"/containers/{quote(container_id)}/json", op_class="docker"
+            )
+        except DockerAPIError as e:
+            if e.status == 404:
+                return None  # Removed in the meantime
+            raise
+
+    def _resolve(self, reference: str) -> Optional[str]:
+        """Full ID of a mirrored container given an ID prefix or name"""
+        for container_id, info in self._containers.items():
+            if container_id.startswith(reference) or info["Name"] == f"/{reference}":
+                return container_id
+        return None
+
+    async def refresh_container(self, reference: str) -> None:
+        """
+        Re-inspect one container, e.g. right after changing it
+
+        Args:
+            reference: Container ID, ID prefix or name
+        """
+        info = await self._inspect(reference)
+        if info is None:
+            self.remove_container(reference)
+        elif info["Id"] not in self._removed:
+            # Unless it was destroyed while we were inspecting it
+            self._containers[info["Id"]] = info
+
+    def remove_container(self, reference: str) -> None:
+        """Forget a container that was removed"""
+        container_id = self._resolve(reference)
+        if container_id is not None:
+            self._forget(container_id)
+
+    def _forget(self, container_id: str) -> None:
+        self._containers.pop(container_id, None)
+        self._removed[container_id] = None
+        if len(self._removed) > REMOVED_HISTORY:
+            self._removed.popitem(last=False)
+
+    async def refresh_images(self) -> None:
+        """Re-list the images"""
+        self._images = await self._api.request(
+            "GET", "/images/json", params={"shared-size": 1}
+        )
+
+    def container(self, container_id: str) -> Optional[Dict]:
+        """Mirrored inspect document of a container, by full ID"""
+        return self._containers.get(container_id)
+
+    def containers(self, all_containers: bool = False) -> List[Dict]:
+        """
+        Mirrored containers
+
+        Args:
+            all_containers: Whether to include stopped containers
+
+        Returns:
+            Inspect documents of the containers
+        """
+        containers = [
+            info
+            for info in self._containers.values()
+            if all_containers or info["State"].get("Running")
+        ]
+        # Newest first, like docker ps
+        containers.sort(key=lambda info: info.get("Created", ""), reverse=True)
+        return containers
+
+    def images(self) -> List[Dict]:
+        """Mirrored /images/json documents"""
+        return list(self._images)
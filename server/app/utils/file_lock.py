@@ -0,0 +1,121 @@
+import os
+import logging
+import threading
+from typing import Dict
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class FileLock:
+    """
+    Reentrant exclusive lock shared by threads and processes
+
+    Threads of this process serialize on an RLock; other processes (e.g.
+    additional uvicorn workers) are excluded with fcntl.flock on the lock
+    file. On platforms without fcntl only the in-process lock applies.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize the lock
+
+        Args:
+            path: Path of the lock file (created if missing)
+        """
+        self.path = path
+        self._reset()
+
+    def _reset(self) -> None:
+        """Start from an unlocked state owned by the current process"""
+        self._pid = os.getpid()
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self) -> None:
+        """Acquire the lock, blocking until it is available"""
+        if self._pid != os.getpid():
+            # A forked worker shares the parent's open file description, and
+            # flock() doesn't exclude holders of the same description
+            self._reset()
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                if self._fd is None:
+                    self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except Exception:
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+
+    def release(self) -> None:
+        """Release one level of the lock"""
+        self._depth -= 1
+        if self._depth == 0 and fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.release()
+
+
+_locks: Dict[str, FileLock] = {}
+_locks_lock = threading.Lock()
+
+
+def get_file_lock(path: str) -> FileLock:
+    """
+    Get the process-wide lock for a lock file
+
+    Two flock()s on separate descriptors of the same file conflict even inside
+    one process, so every user of a lock file must share one FileLock.
+
+    Args:
+        path: Path of the lock file
+
+    Returns:
+        The shared FileLock for that path
+    """
+    key = os.path.abspath(path)
+    with _locks_lock:
+        lock = _locks.get(key)
+        if lock is None:
+            if fcntl is None:
+                logger.warning(
+                    "fcntl unavailable - metadata is only locked within this process"
+                )
+            lock = FileLock(key)
+            _locks[key] = lock
+        return lock
+
+
+def atomic_write(path: str, content: str) -> None:
+    """
+    Replace a file's content so readers see either the old or the new version
+
+    Args:
+        path: Destination file
+        content: Text to write
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,196 @@
+import os
+import json
+import shutil
+import logging
+import platform
+import threading
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.config import DOCKER_HOST
+from app.utils.docker_api import probe_socket
+
+logger = logging.getLogger(__name__)
+
+KVM_DEVICE = "/dev/kvm"
+PROBE_TIMEOUT = 10  # seconds per probe command
+BINARIES = ("qemu-img", "qemu-system-x86_64", "docker")
+
+
+def _probe_output(command: List[str]) -> Optional[str]:
+    """Run a probe command, returning stdout or None if it fails"""
+    try:
+        result = subprocess.run(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            timeout=PROBE_TIMEOUT,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"Capability probe {' '.join(command)} failed: {e}")
+        return None
+    if result.returncode != 0:
+        logger.warning(
+            f"Capability probe {' '.join(command)} failed: {result.stderr.strip()}"
+        )
+        return None
+    return result.stdout
+
+
+def _parse_help_list(output: Optional[str]) -> List[str]:
+    """Parse `-accel help` / `-machine help` output into the listed names"""
+    if not output:
+        return []
+    names = []
+    for line in output.splitlines()[1:]:  # Skip header line
+        parts = line.split()
+        if parts:
+            names.append(parts[0])
+    return names
+
+
+class HostCapabilities:
+    """
+    Registry of what this host can run
+
+    Probes binaries, versions, KVM access, QEMU accelerators and machine
+    types, qemu-img formats and the Docker server once; request handlers read
+    the recorded results and never probe themselves. Call refresh() after
+    installing or upgrading host software.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._info: Optional[Dict] = None
+
+    def refresh(self) -> Dict:
+        """
+        Probe the host and replace the recorded capabilities
+
+        Returns:
+            The new capabilities snapshot
+        """
+        binaries = {}
+        for name in BINARIES:
+            path = shutil.which(name)
+            version = None
+            if path:
+                output = _probe_output([path, "--version"])
+                version = output.splitlines()[0].strip() if output else None
+            binaries[name] = {"path": path, "version": version}
+
+        kvm_present = os.path.exists(KVM_DEVICE)
+        kvm = {
+            "present": kvm_present,
+            "accessible": kvm_present and os.access(KVM_DEVICE, os.R_OK | os.W_OK),
+        }
+
+        accelerators: List[str] = []
+        machine_types: List[str] = []
+        qemu_system = binaries["qemu-system-x86_64"]["path"]
+        if qemu_system:
+            accelerators = _parse_help_list(
+                _probe_output([qemu_system, "-accel", "help"])
+            )
+            machine_types = _parse_help_list(
+                _probe_output([qemu_system, "-machine", "help"])
+            )
+
+        qemu_img_formats: List[str] = []
+        qemu_img = binaries["qemu-img"]["path"]
+        if qemu_img:
+            for line in (_probe_output([qemu_img, "--help"]) or "").splitlines():
+                if line.startswith("Supported formats:"):
+                    qemu_img_formats = line.split(":", 1)[1].split()
+
+        docker_server = None
+        docker = binaries["docker"]["path"]
+        if docker:
+            output = _probe_output([docker, "version", "--format", "{{json .Server}}"])
+            try:
+                server = json.loads(output) if output else None
+            except json.JSONDecodeError:
+                server = None
+            if server:
+                docker_server = {
+                    "version": server.get("Version"),
+                    "api_version": server.get("ApiVersion"),
+                    "os": server.get("Os"),
+                    "arch": server.get("Arch"),
+                }
+
+        docker_api = {"socket": None, "available": False, "api_version": None}
+        if DOCKER_HOST.startswith("unix://"):
+            docker_api["socket"] = DOCKER_HOST[len("unix://") :]
+            version = probe_socket(docker_api["socket"])
+            if version:
+                docker_api["available"] = True
+                docker_api["api_version"] = version.get("ApiVersion")
+
+        info = {
+            "probed_at": datetime.now().isoformat(),
+            "platform": platform.system(),
+            "binaries": binaries,
+            "kvm": kvm,
+            "accelerators": accelerators,
+            "machine_types": machine_types,
+            "qemu_img_formats": qemu_img_formats,
+            "docker_server": docker_server,
+            "docker_api": docker_api,
+        }
+        info["preferred_accelerator"] = self._pick_accelerator(info)
+
+        with self._lock:
+            self._info = info
+        logger.info(
+            f"Host capabilities: accelerator={info['preferred_accelerator']}, "
+            f"binaries={[name for name, b in binaries.items() if b['path']]}"
+        )
+        return info
+
+    @staticmethod
+    def _pick_accelerator(info: Dict) -> str:
+        """Choose the fastest usable QEMU accelerator"""
+        accelerators = info["accelerators"]
+        if "kvm" in accelerators and info["kvm"]["accessible"]:
+            return "kvm"
+        if "hvf" in accelerators and info["platform"] == "Darwin":
+            return "hvf"
+        if "whpx" in accelerators and info["platform"] == "Windows":
+            return "whpx"
+        return "tcg"
+
+    def snapshot(self) -> Dict:
+        """Return the recorded capabilities, probing on first use"""
+        with self._lock:
+            info = self._info
+        return info if info is not None else self.refresh()
+
+    def has_binary(self, name: str) -> bool:
+        """Whether a host binary was found on PATH"""
+        binary = self.snapshot()["binaries"].get(name)
+        return bool(binary and binary["path"])
+
+    @property
+    def preferred_accelerator(self) -> str:
+        return self.snapshot()["preferred_accelerator"]
+
+    @property
+    def docker_socket(self) -> Optional[str]:
+        """Path of the Docker daemon socket, or None if it didn't answer"""
+        docker_api = self.snapshot()["docker_api"]
+        return docker_api["socket"] if docker_api["available"] else None
+
+    @property
+    def qemu_img_formats(self) -> List[str]:
+        return self.snapshot()["qemu_img_formats"]
+
+
+_host_capabilities = HostCapabilities()
+
+
+def get_host_capabilities() -> HostCapabilities:
+    """Return the process-wide capability registry"""
+    return _host_capabilities
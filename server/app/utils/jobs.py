@@ -0,0 +1,212 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
+from uuid import uuid4
+
+from app.models.base import JobStatus
+
+logger = logging.getLogger(__name__)
+
+# Events after which a job's event stream ends
+TERMINAL_EVENTS = ("done", "error", "cancelled")
+
+
+class Job:
+    """
+    A long-running operation executed in the background
+
+    The operation is an async iterator of (event, data) pairs, the same
+    shape the SSE endpoints stream: "log" lines, "step" progress and a final
+    "done" with the result. The job records them so clients can poll its
+    state, or subscribe and receive the retained events followed by live
+    ones. "step" events are stamped with the time since the job started and
+    the previous step is closed with its duration.
+    """
+
+    def __init__(self, kind: str, params: Dict[str, Any], history: int):
+        """
+        Args:
+            kind: Operation name, e.g. "build"
+            params: Parameters the job was submitted with
+            history: Number of events retained for late subscribers
+        """
+        self.id = str(uuid4())
+        self.kind = kind
+        self.params = params
+        self.status = JobStatus.QUEUED
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.steps: List[Dict[str, Any]] = []
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.events: Deque[Tuple[str, Any]] = deque(maxlen=history)
+        self._started = 0.0  # monotonic clock
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (
+            JobStatus.SUCCEEDED,
+            JobStatus.FAILED,
+            JobStatus.CANCELLED,
+        )
+
+    @property
+    def progress(self) -> Optional[Dict[str, Any]]:
+        """The step in progress (or the last one, once finished)"""
+        return self.steps[-1] if self.steps else None
+
+    def _record(self, event: str, data: Any) -> None:
+        if event == "step":
+            elapsed = round(time.monotonic() - self._started, 3)
+            if self.steps:
+                previous = self.steps[-1]
+                previous["duration"] = round(elapsed - previous["elapsed"], 3)
+            data = dict(data, elapsed=elapsed, duration=None)
+            self.steps.append(data)
+        self.events.append((event, data))
+        for queue in self._subscribers:
+            queue.put_nowait((event, data))
+
+    def _finish(self, status: JobStatus) -> None:
+        self.status = status
+        self.finished_at = datetime.now()
+        if self.steps and self.steps[-1]["duration"] is None:
+            last = self.steps[-1]
+            elapsed = time.monotonic() - self._started
+            last["duration"] = round(elapsed - last["elapsed"], 3)
+
+    async def _run(self, source: AsyncIterator[Tuple[str, Any]]) -> None:
+        try:
+            async for event, data in source:
+                if self.status == JobStatus.QUEUED:
+                    # The first event means the operation got past any
+                    # scheduler queue and is doing work
+                    self.status = JobStatus.RUNNING
+                    self.started_at = datetime.now()
+                    self._started = time.monotonic()
+                if event == "done":
+                    # Reported once the operation has cleaned up, below
+                    self.result = data
+                else:
+                    self._record(event, data)
+            if self.result is None:
+                raise RuntimeError(f"{self.kind} finished without a result")
+        except asyncio.CancelledError:
+            # Closing the source below stops the operation's command
+            logger.info(f"{self.kind} job {self.id} cancelled")
+            self._finish(JobStatus.CANCELLED)
+            self._record("cancelled", {"detail": "Cancelled"})
+        except Exception as e:
+            logger.warning(f"{self.kind} job {self.id} failed: {e}")
+            self.error = str(e)
+            self._finish(JobStatus.FAILED)
+            self._record("error", {"detail": str(e)})
+        else:
+            self._finish(JobStatus.SUCCEEDED)
+            self._record("done", self.result)
+        finally:
+            await source.aclose()
+
+    async def subscribe(self) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Follow the job's events
+
+        Yields:
+            The retained events, then live ones up to and including the
+            terminal "done", "error" or "cancelled" event
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        backlog = list(self.events)
+        self._subscribers.add(queue)
+        try:
+            for event, data in backlog:
+                yield event, data
+                if event in TERMINAL_EVENTS:
+                    return
+            while True:
+                event, data = await queue.get()
+                yield event, data
+                if event in TERMINAL_EVENTS:
+                    return
+        finally:
+            self._subscribers.discard(queue)
+
+    async def cancel(self) -> bool:
+        """
+        Cancel the job and wait for its operation to stop
+
+        Returns:
+            False if the job had already finished
+        """
+        if self.finished or self._task is None:
+            return False
+        # Before Python 3.12, wait_for() can swallow a cancellation that
+        # races with the command it wraps; cancel until the task ends
+        while not self._task.done():
+            self._task.cancel()
+            await asyncio.wait([self._task], timeout=0.1)
+        return True
+
+
+class JobManager:
+    """
+    Runs jobs of one kind and keeps the most recent ones for inspection
+
+    Finished jobs beyond the retention limit are forgotten, oldest first;
+    running jobs are always kept.
+    """
+
+    def __init__(self, kind: str, history: int = 2000, retain: int = 50):
+        """
+        Args:
+            kind: Operation name used in logs and errors, e.g. "build"
+            history: Number of events retained per job
+            retain: Number of finished jobs kept
+        """
+        self.kind = kind
+        self.history = history
+        self.retain = retain
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+
+    def submit(
+        self, source: AsyncIterator[Tuple[str, Any]], params: Dict[str, Any]
+    ) -> Job:
+        """
+        Start running an operation in the background
+
+        Args:
+            source: The operation's event iterator; it isn't started until
+                    the event loop next runs
+            params: Parameters recorded on the job
+
+        Returns:
+            The queued job
+        """
+        job = Job(self.kind, params, self.history)
+        job._task = asyncio.ensure_future(job._run(source))
+        self._jobs[job.id] = job
+        self._prune()
+        return job
+
+    def _prune(self) -> None:
+        finished = [job for job in self._jobs.values() if job.finished]
+        for job in finished[: max(len(finished) - self.retain, 0)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        """Known jobs, newest first"""
+        return list(reversed(self._jobs.values()))
+
+    async def close(self) -> None:
+        """Cancel every job that is still running"""
+        for job in list(self._jobs.values()):
+            await job.cancel()
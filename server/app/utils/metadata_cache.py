@@ -0,0 +1,140 @@
+import os
+import json
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from app.utils.file_lock import atomic_write
+
+logger = logging.getLogger(__name__)
+
+
+def _copy_tree(value: Any) -> Any:
+    """
+    Copy nested dicts/lists of JSON scalars
+
+    Much cheaper than copy.deepcopy (and than json.load) because the leaves
+    are immutable JSON scalars that can be shared safely.
+    """
+    if isinstance(value, dict):
+        return {key: _copy_tree(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy_tree(item) for item in value]
+    return value
+
+
+class MetadataCache:
+    """
+    Long-lived in-process cache of a JSON metadata file
+
+    Backs the legacy "json" metadata backend (JsonMetadataStore) only; the
+    default SQLite backend reads the database on every call. The file is
+    parsed once and kept in memory. Writes made through the cache update it
+    directly, and the cached copy is thrown away whenever the file's inode,
+    mtime or size change underneath us (another process wrote it).
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize the cache
+
+        Args:
+            path: Path of the JSON metadata file
+        """
+        self.path = path
+        self._lock = threading.RLock()
+        self._data: Optional[Dict] = None
+        self._signature: Optional[Tuple[int, int, int]] = None
+
+        try:
+            # Exclusive create so a concurrent writer's data is never truncated
+            with open(self.path, "x") as f:
+                json.dump({}, f)
+        except FileExistsError:
+            pass
+
+    def _file_signature(self) -> Optional[Tuple[int, int, int]]:
+        """Return (inode, mtime_ns, size) of the metadata file or None if missing"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _read_file(self) -> Dict:
+        """Parse the metadata file, treating a missing or corrupt file as empty"""
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError):
+            return {}
+
+    def load(self) -> Dict:
+        """
+        Return the current metadata
+
+        The returned dict is a private copy, so callers may mutate it freely
+        before handing it back to save().
+
+        Returns:
+            Metadata dictionary
+        """
+        with self._lock:
+            return _copy_tree(self.current())
+
+    def current(self) -> Dict:
+        """
+        Return the cached metadata without copying it
+
+        Callers must treat the result as read-only; use load() to get a copy
+        that can be modified and saved.
+
+        Returns:
+            Metadata dictionary shared with the cache
+        """
+        with self._lock:
+            signature = self._file_signature()
+            if self._data is None or signature != self._signature:
+                logger.debug(f"Loading metadata from {self.path}")
+                self._data = self._read_file()
+                self._signature = signature
+            return self._data
+
+    def save(self, metadata: Dict) -> None:
+        """
+        Write metadata to disk and make it the cached copy
+
+        Args:
+            metadata: Metadata dictionary to persist
+        """
+        serialized = json.dumps(metadata, default=str)
+        with self._lock:
+            # Write-to-temp-and-rename: readers never observe a half-written file
+            atomic_write(self.path, serialized)
+            # Re-parse so the cache holds exactly what is on disk
+            # (datetimes stored via default=str become strings, etc.)
+            self._data = json.loads(serialized)
+            self._signature = self._file_signature()
+
+
+_caches: Dict[str, MetadataCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_metadata_cache(path: str) -> MetadataCache:
+    """
+    Get the shared cache for a metadata file, creating it on first use
+
+    Args:
+        path: Path of the JSON metadata file
+
+    Returns:
+        The process-wide MetadataCache for that path
+    """
+    key = os.path.abspath(path)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = MetadataCache(key)
+            _caches[key] = cache
+        return cache
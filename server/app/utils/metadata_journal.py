@@ -0,0 +1,301 @@
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from app.utils.file_lock import atomic_write, get_file_lock
+from app.utils.metadata_cache import _copy_tree
+from app.utils.metadata_store import MetadataStore, _normalize
+
+logger = logging.getLogger(__name__)
+
+
+class JournalMetadataStore(MetadataStore):
+    """
+    JSON metadata backend with an append-only journal
+
+    State lives in memory. metadata.json is a snapshot in the legacy format
+    and every mutation is appended as one JSON line to metadata.journal, so a
+    write costs O(record) instead of rewriting the file. A background thread
+    folds the journal into a new snapshot once it grows past a threshold.
+
+    Several worker processes may share the files: appends and compactions
+    hold the cross-process lock, and before every operation a process applies
+    whatever other processes appended since it last looked. A compaction
+    replaces the journal with a new file, which makes the others replay.
+
+    Put, delete and field-merge entries are idempotent in sequence, so a
+    crash between writing the snapshot and replacing the journal replays to
+    the same state. A torn final line is dropped.
+    """
+
+    def __init__(
+        self,
+        folder: str,
+        flat_collection: Optional[str] = None,
+        compact_threshold: int = 1000,
+    ):
+        """
+        Open the store and replay the journal
+
+        Args:
+            folder: Resource data folder holding metadata.json
+            flat_collection: Collection stored at the top level of the snapshot
+            compact_threshold: Journal entries that trigger a background compaction
+        """
+        self.snapshot_path = os.path.join(folder, "metadata.json")
+        self.journal_path = os.path.join(folder, "metadata.journal")
+        self.flat_collection = flat_collection
+        self.compact_threshold = compact_threshold
+
+        self._file_lock = get_file_lock(os.path.join(folder, "metadata.lock"))
+        self._lock = threading.RLock()
+        self._data: Dict = {}
+        self._journal_inode: Optional[int] = None
+        self._journal_offset = 0
+        self._journal_entries = 0
+        self._stats = {
+            "replayed_entries": 0,
+            "replay_seconds": 0.0,
+            "discarded_bytes": 0,
+            "compactions": 0,
+            "last_compaction_at": None,
+            "last_compaction_seconds": None,
+        }
+
+        with self._file_lock, self._lock:
+            open(self.journal_path, "ab").close()
+            self._replay()
+            self._repair_tail()
+
+        self._closed = threading.Event()
+        self._compact_requested = threading.Event()
+        self._compactor = threading.Thread(
+            target=self._compaction_loop,
+            name=f"metadata-compactor-{os.path.basename(folder)}",
+            daemon=True,
+        )
+        self._compactor.start()
+
+    # Replay
+
+    def _replay(self) -> None:
+        """Rebuild in-memory state from the snapshot and journal (file lock held)"""
+        started = time.perf_counter()
+        try:
+            with open(self.snapshot_path, "r") as f:
+                self._data = json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError):
+            self._data = {}
+
+        self._journal_inode = os.stat(self.journal_path).st_ino
+        self._journal_offset = 0
+        self._journal_entries = 0
+        self._catch_up()
+
+        self._stats["replayed_entries"] = self._journal_entries
+        self._stats["replay_seconds"] = time.perf_counter() - started
+        logger.info(
+            f"Replayed {self._journal_entries} metadata journal entries for "
+            f"{self.snapshot_path} in {self._stats['replay_seconds']:.3f}s"
+        )
+
+    def _catch_up(self) -> bool:
+        """
+        Apply journal entries appended since the last call
+
+        Returns:
+            False if the journal was replaced (compacted by another process)
+            and a full replay is needed
+        """
+        try:
+            st = os.stat(self.journal_path)
+        except FileNotFoundError:
+            return False
+        if st.st_ino != self._journal_inode or st.st_size < self._journal_offset:
+            return False
+        if st.st_size == self._journal_offset:
+            return True
+
+        with open(self.journal_path, "rb") as f:
+            f.seek(self._journal_offset)
+            pending = f.read(st.st_size - self._journal_offset)
+
+        for raw in pending.splitlines(keepends=True):
+            # An incomplete or corrupt line is either being appended right now
+            # or was torn by a crash; stop before it either way
+            if not raw.endswith(b"\n"):
+                break
+            try:
+                entry = json.loads(raw)
+            except json.JSONDecodeError:
+                break
+            self._apply(entry)
+            self._journal_offset += len(raw)
+            self._journal_entries += 1
+        return True
+
+    def _refresh(self) -> None:
+        """Bring in-memory state up to date with the files"""
+        with self._lock:
+            if self._catch_up():
+                return
+        with self._file_lock, self._lock:
+            if not self._catch_up():
+                self._replay()
+
+    def _repair_tail(self) -> None:
+        """Truncate bytes after the last complete entry (file lock held)"""
+        size = os.path.getsize(self.journal_path)
+        if size > self._journal_offset:
+            logger.warning(
+                f"Discarding {size - self._journal_offset} torn bytes from "
+                f"{self.journal_path}"
+            )
+            self._stats["discarded_bytes"] += size - self._journal_offset
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(self._journal_offset)
+
+    def _view(self, data: Dict, collection: str, create: bool = False) -> Dict:
+        """Return the mapping holding a collection inside the state"""
+        if collection == self.flat_collection:
+            return data
+        if create:
+            return data.setdefault(collection, {})
+        return data.get(collection) or {}
+
+    def _apply(self, entry: Dict) -> None:
+        """Apply one journal entry to the in-memory state"""
+        op, collection, key = entry["op"], entry["collection"], entry["key"]
+        if op == "put":
+            self._view(self._data, collection, create=True)[key] = entry["record"]
+        elif op == "update":
+            record = self._view(self._data, collection).get(key)
+            if record is not None:
+                record.update(entry["fields"])
+        elif op == "delete":
+            self._view(self._data, collection).pop(key, None)
+
+    # Reads
+
+    def all(self, collection: str) -> Dict[str, Dict]:
+        self._refresh()
+        with self._lock:
+            return _copy_tree(self._view(self._data, collection))
+
+    def get(self, collection: str, key: str) -> Optional[Dict]:
+        self._refresh()
+        with self._lock:
+            record = self._view(self._data, collection).get(key)
+            return _copy_tree(record) if record is not None else None
+
+    # Writes
+
+    def _append(self, entry: Dict) -> bool:
+        """
+        Durably append one entry to the journal and apply it
+
+        The entry is skipped (returning False) if its target record doesn't
+        exist for updates and deletes.
+        """
+        entry, serialized = _normalize(entry)
+        line = (serialized + "\n").encode()
+        with self._file_lock, self._lock:
+            if not self._catch_up():
+                self._replay()
+            if entry["op"] != "put" and entry["key"] not in self._view(
+                self._data, entry["collection"]
+            ):
+                return False
+            self._repair_tail()
+
+            with open(self.journal_path, "ab") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._apply(entry)
+            self._journal_offset += len(line)
+            self._journal_entries += 1
+            if self._journal_entries >= self.compact_threshold:
+                self._compact_requested.set()
+            return True
+
+    def put(self, collection: str, key: str, record: Dict) -> None:
+        self._append(
+            {"op": "put", "collection": collection, "key": key, "record": record}
+        )
+
+    def update(self, collection: str, key: str, fields: Dict) -> Optional[Dict]:
+        with self._file_lock:
+            entry = {
+                "op": "update",
+                "collection": collection,
+                "key": key,
+                "fields": fields,
+            }
+            if not self._append(entry):
+                return None
+            return self.get(collection, key)
+
+    def delete(self, collection: str, key: str) -> bool:
+        return self._append({"op": "delete", "collection": collection, "key": key})
+
+    # Compaction
+
+    def compact(self) -> None:
+        """Fold the journal into a fresh snapshot"""
+        with self._file_lock, self._lock:
+            if not self._catch_up():
+                self._replay()
+            if self._journal_entries == 0:
+                return
+
+            started = time.perf_counter()
+            atomic_write(self.snapshot_path, json.dumps(self._data, default=str))
+            # Replacing (rather than truncating) the journal gives it a new
+            # inode, which tells other processes to replay
+            atomic_write(self.journal_path, "")
+            self._journal_inode = os.stat(self.journal_path).st_ino
+            self._journal_offset = 0
+            self._journal_entries = 0
+
+            self._stats["compactions"] += 1
+            self._stats["last_compaction_at"] = datetime.now().isoformat()
+            self._stats["last_compaction_seconds"] = time.perf_counter() - started
+
+    def _compaction_loop(self) -> None:
+        """Background thread running compactions when requested"""
+        while True:
+            self._compact_requested.wait()
+            if self._closed.is_set():
+                return
+            self._compact_requested.clear()
+            try:
+                self.compact()
+            except Exception:
+                logger.exception(f"Compaction of {self.journal_path} failed")
+
+    def stats(self) -> Dict:
+        self._refresh()
+        with self._lock:
+            try:
+                snapshot_bytes = os.path.getsize(self.snapshot_path)
+            except FileNotFoundError:
+                snapshot_bytes = 0
+            return {
+                "backend": "journal",
+                "journal_entries": self._journal_entries,
+                "journal_bytes": self._journal_offset,
+                "snapshot_bytes": snapshot_bytes,
+                "compact_threshold": self.compact_threshold,
+                **self._stats,
+            }
+
+    def close(self) -> None:
+        self._closed.set()
+        self._compact_requested.set()
+        self._compactor.join()
@@ -0,0 +1,510 @@
+import os
+import json
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.config import (
+    METADATA_BACKEND,
+    METADATA_JOURNAL_COMPACT_THRESHOLD,
+    VIRTUAL_DISK_FOLDER,
+    VM_DATA_FOLDER,
+    DOCKER_DATA_FOLDER,
+    PORT_DATA_FOLDER,
+)
+from app.utils.metadata_cache import MetadataCache, get_metadata_cache, _copy_tree
+from app.utils.file_lock import FileLock, get_file_lock
+
+logger = logging.getLogger(__name__)
+
+# (folder, flat collection) of every resource type's metadata
+RESOURCE_FOLDERS = (
+    (VIRTUAL_DISK_FOLDER, "disks"),
+    (VM_DATA_FOLDER, "vms"),
+    (DOCKER_DATA_FOLDER, None),
+    (PORT_DATA_FOLDER, None),
+)
+
+# Record fields copied into their own indexed SQLite columns
+INDEXED_FIELDS = ("name", "disk_id", "status", "tag")
+
+
+def _normalize(record: Dict) -> Tuple[Dict, str]:
+    """
+    Serialize a record the same way the JSON files always have
+
+    Returns:
+        Tuple of (normalized record, JSON text)
+    """
+    serialized = json.dumps(record, default=str)
+    return json.loads(serialized), serialized
+
+
+def _index_value(value: Any) -> Optional[str]:
+    """Convert a field value to the text stored in an indexed column"""
+    if value is None:
+        return None
+    normalized = json.loads(json.dumps(value, default=str))
+    return normalized if isinstance(normalized, str) else json.dumps(normalized)
+
+
+def _matches(record: Dict, filters: Dict[str, Any]) -> bool:
+    """Check a record against equality filters"""
+    return all(record.get(field) == value for field, value in filters.items())
+
+
+class MetadataStore(ABC):
+    """
+    Base class for metadata backends
+
+    Records are JSON-serializable dicts keyed by ID and grouped into named
+    collections ("disks", "vms", "dockerfiles", "images", ...). Every method
+    returns copies, so callers may mutate results freely.
+
+    Single operations are atomic across threads and worker processes.
+    Read-modify-write sequences spanning several calls must run inside
+    ``with store.locked():``.
+    """
+
+    _file_lock: FileLock
+
+    def locked(self) -> FileLock:
+        """
+        Hold the store's cross-process lock
+
+        Returns:
+            Reentrant context manager serializing writers in every process
+        """
+        return self._file_lock
+
+    @abstractmethod
+    def all(self, collection: str) -> Dict[str, Dict]:
+        """Return every record in a collection, keyed by ID"""
+
+    @abstractmethod
+    def get(self, collection: str, key: str) -> Optional[Dict]:
+        """Return one record or None if it doesn't exist"""
+
+    def find(self, collection: str, **filters: Any) -> List[Dict]:
+        """Return records whose fields equal the given values"""
+        return [
+            record
+            for record in self.all(collection).values()
+            if _matches(record, filters)
+        ]
+
+    @abstractmethod
+    def put(self, collection: str, key: str, record: Dict) -> None:
+        """Insert or replace a record"""
+
+    def put_many(self, collection: str, records: Dict[str, Dict]) -> None:
+        """Insert or replace several records at once"""
+        for key, record in records.items():
+            self.put(collection, key, record)
+
+    @abstractmethod
+    def update(self, collection: str, key: str, fields: Dict) -> Optional[Dict]:
+        """
+        Merge fields into an existing record
+
+        Returns:
+            The updated record or None if it doesn't exist
+        """
+
+    @abstractmethod
+    def delete(self, collection: str, key: str) -> bool:
+        """
+        Delete a record
+
+        Returns:
+            Boolean indicating whether the record existed
+        """
+
+    def stats(self) -> Dict:
+        """Return backend statistics (sizes, replay times, ...)"""
+        return {}
+
+    def close(self) -> None:
+        """Release any resources held by the backend"""
+
+
+class JsonMetadataStore(MetadataStore):
+    """
+    Metadata backend using the legacy metadata.json files
+
+    Reads come from the shared MetadataCache; every write rewrites the whole
+    file (atomically, under the cross-process lock). The disk and VM files
+    keep their records at the top level (``flat_collection``), the Docker
+    file nests one mapping per collection.
+    """
+
+    def __init__(self, path: str, flat_collection: Optional[str] = None):
+        """
+        Initialize the store
+
+        Args:
+            path: Path of the JSON metadata file
+            flat_collection: Collection stored at the top level of the file
+        """
+        self.path = path
+        self.flat_collection = flat_collection
+        self._cache: MetadataCache = get_metadata_cache(path)
+        self._lock = threading.RLock()
+        self._file_lock = get_file_lock(
+            os.path.join(os.path.dirname(path), "metadata.lock")
+        )
+
+    def _view(self, data: Dict, collection: str, create: bool = False) -> Dict:
+        """Return the mapping holding a collection inside the file contents"""
+        if collection == self.flat_collection:
+            return data
+        if create:
+            return data.setdefault(collection, {})
+        return data.get(collection) or {}
+
+    def all(self, collection: str) -> Dict[str, Dict]:
+        with self._lock:
+            return _copy_tree(self._view(self._cache.current(), collection))
+
+    def get(self, collection: str, key: str) -> Optional[Dict]:
+        with self._lock:
+            record = self._view(self._cache.current(), collection).get(key)
+            return _copy_tree(record) if record is not None else None
+
+    def put(self, collection: str, key: str, record: Dict) -> None:
+        self.put_many(collection, {key: record})
+
+    def put_many(self, collection: str, records: Dict[str, Dict]) -> None:
+        with self._file_lock, self._lock:
+            data = self._cache.load()
+            self._view(data, collection, create=True).update(records)
+            self._cache.save(data)
+
+    def update(self, collection: str, key: str, fields: Dict) -> Optional[Dict]:
+        with self._file_lock, self._lock:
+            data = self._cache.load()
+            view = self._view(data, collection)
+            if key not in view:
+                return None
+            view[key].update(fields)
+            self._cache.save(data)
+            return self.get(collection, key)
+
+    def delete(self, collection: str, key: str) -> bool:
+        with self._file_lock, self._lock:
+            data = self._cache.load()
+            view = self._view(data, collection)
+            if key not in view:
+                return False
+            del view[key]
+            self._cache.save(data)
+            return True
+
+    def stats(self) -> Dict:
+        try:
+            file_bytes = os.path.getsize(self.path)
+        except FileNotFoundError:
+            file_bytes = 0
+        return {"backend": "json", "file_bytes": file_bytes}
+
+
+class SqliteMetadataStore(MetadataStore):
+    """
+    Metadata backend storing one row per record in SQLite (WAL mode)
+
+    Name, disk_id, status and image tag are copied into indexed columns so
+    lookups on them don't scan the collection, and every mutation touches a
+    single row. Writes take the same cross-process file lock as locked(),
+    so a worker's read-modify-write section can't interleave with another
+    worker's writes.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open (and create if needed) the database
+
+        Args:
+            path: Path of the SQLite database file
+        """
+        self.path = path
+        self._lock = threading.RLock()
+        self._file_lock = get_file_lock(
+            os.path.join(os.path.dirname(path), "metadata.lock")
+        )
+        self._connect()
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS records (
+                collection TEXT NOT NULL,
+                id TEXT NOT NULL,
+                name TEXT,
+                disk_id TEXT,
+                status TEXT,
+                tag TEXT,
+                data TEXT NOT NULL,
+                PRIMARY KEY (collection, id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_records_name ON records (collection, name);
+            CREATE INDEX IF NOT EXISTS idx_records_disk_id ON records (collection, disk_id);
+            CREATE INDEX IF NOT EXISTS idx_records_status ON records (collection, status);
+            CREATE INDEX IF NOT EXISTS idx_records_tag ON records (collection, tag);
+            CREATE TABLE IF NOT EXISTS store_info (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            """)
+
+    def _connect(self) -> None:
+        """Open the connection owned by the current process"""
+        self._pid = os.getpid()
+        self._connection = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("PRAGMA busy_timeout=5000")
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # SQLite connections must not be shared with forked worker processes
+        if self._pid != os.getpid():
+            self._connect()
+        return self._connection
+
+    def _row_values(self, collection: str, key: str, record: Dict) -> Tuple:
+        """Build the column values for a record"""
+        normalized, serialized = _normalize(record)
+        indexed = [_index_value(normalized.get(field)) for field in INDEXED_FIELDS]
+        return (collection, key, *indexed, serialized)
+
+    def _write_rows(self, rows: Iterable[Tuple]) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO records "
+            "(collection, id, name, disk_id, status, tag, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    def all(self, collection: str) -> Dict[str, Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, data FROM records WHERE collection = ?", (collection,)
+            ).fetchall()
+        return {key: json.loads(data) for key, data in rows}
+
+    def get(self, collection: str, key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM records WHERE collection = ? AND id = ?",
+                (collection, key),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find(self, collection: str, **filters: Any) -> List[Dict]:
+        clauses = ["collection = ?"]
+        params: List[Any] = [collection]
+        remaining = {}
+        for field, value in filters.items():
+            if field in INDEXED_FIELDS and value is not None:
+                clauses.append(f"{field} = ?")
+                params.append(_index_value(value))
+            elif field == "id":
+                clauses.append("id = ?")
+                params.append(value)
+            else:
+                remaining[field] = value
+
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT data FROM records WHERE {' AND '.join(clauses)}", params
+            ).fetchall()
+        records = [json.loads(data) for (data,) in rows]
+        if remaining:
+            remaining = _normalize(remaining)[0]
+            records = [record for record in records if _matches(record, remaining)]
+        return records
+
+    def put(self, collection: str, key: str, record: Dict) -> None:
+        with self._file_lock, self._lock:
+            self._write_rows([self._row_values(collection, key, record)])
+
+    def put_many(self, collection: str, records: Dict[str, Dict]) -> None:
+        rows = [
+            self._row_values(collection, key, record) for key, record in records.items()
+        ]
+        with self._file_lock, self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._write_rows(rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def update(self, collection: str, key: str, fields: Dict) -> Optional[Dict]:
+        with self._file_lock, self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT data FROM records WHERE collection = ? AND id = ?",
+                    (collection, key),
+                ).fetchone()
+                if not row:
+                    self._conn.execute("COMMIT")
+                    return None
+                record = json.loads(row[0])
+                record.update(fields)
+                values = self._row_values(collection, key, record)
+                self._write_rows([values])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return json.loads(values[-1])
+
+    def delete(self, collection: str, key: str) -> bool:
+        with self._file_lock, self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM records WHERE collection = ? AND id = ?",
+                (collection, key),
+            )
+        return cursor.rowcount > 0
+
+    def get_info(self, key: str) -> Optional[str]:
+        """Read a value from the store_info table"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM store_info WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_info(self, key: str, value: str) -> None:
+        """Write a value to the store_info table"""
+        with self._file_lock, self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO store_info (key, value) VALUES (?, ?)",
+                (key, value),
+            )
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts = dict(
+                self._conn.execute(
+                    "SELECT collection, COUNT(*) FROM records GROUP BY collection"
+                ).fetchall()
+            )
+        sizes = {}
+        for suffix in ("", "-wal"):
+            try:
+                sizes[suffix] = os.path.getsize(self.path + suffix)
+            except FileNotFoundError:
+                sizes[suffix] = 0
+        return {
+            "backend": "sqlite",
+            "records": counts,
+            "db_bytes": sizes[""],
+            "wal_bytes": sizes["-wal"],
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def migrate_json_to_sqlite(
+    json_path: str, store: SqliteMetadataStore, flat_collection: Optional[str] = None
+) -> int:
+    """
+    Copy every record from a legacy metadata.json file into a SQLite store
+
+    The migration runs once per database: it is recorded in store_info and
+    later calls are no-ops. The check and the import run under the store's
+    cross-process lock, so workers starting together import only once. The
+    JSON file is left in place.
+
+    Args:
+        json_path: Path of the legacy metadata.json file
+        store: Destination SQLite store
+        flat_collection: Collection stored at the top level of the JSON file
+
+    Returns:
+        Number of records migrated
+    """
+    with store.locked():
+        if store.get_info("migrated_from") is not None:
+            return 0
+
+        migrated = 0
+        if os.path.exists(json_path):
+            try:
+                with open(json_path, "r") as f:
+                    data = json.load(f)
+            except json.JSONDecodeError:
+                logger.warning(
+                    f"Skipping migration of corrupt metadata file {json_path}"
+                )
+                data = {}
+
+            collections = {flat_collection: data} if flat_collection else data
+            for collection, records in collections.items():
+                if not isinstance(records, dict):
+                    continue
+                store.put_many(collection, records)
+                migrated += len(records)
+
+        store.set_info("migrated_from", json_path)
+    logger.info(f"Migrated {migrated} metadata records from {json_path}")
+    return migrated
+
+
+_stores: Dict[Tuple[str, str], MetadataStore] = {}
+_stores_lock = threading.Lock()
+
+
+def open_metadata_store(
+    folder: str, flat_collection: Optional[str] = None, backend: Optional[str] = None
+) -> MetadataStore:
+    """
+    Get the shared metadata store for a resource folder
+
+    Args:
+        folder: Resource data folder (e.g. VIRTUAL_DISK_FOLDER)
+        flat_collection: Collection stored at the top level of the legacy JSON file
+        backend: "sqlite", "journal" or "json"; defaults to METADATA_BACKEND
+
+    Returns:
+        The process-wide MetadataStore for that folder
+    """
+    backend = backend or METADATA_BACKEND
+    key = (backend, os.path.abspath(folder))
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is not None:
+            return store
+
+        json_path = os.path.join(folder, "metadata.json")
+        if backend == "sqlite":
+            store = SqliteMetadataStore(os.path.join(folder, "metadata.db"))
+            migrate_json_to_sqlite(json_path, store, flat_collection)
+        elif backend == "journal":
+            from app.utils.metadata_journal import JournalMetadataStore
+
+            store = JournalMetadataStore(
+                folder, flat_collection, METADATA_JOURNAL_COMPACT_THRESHOLD
+            )
+        elif backend == "json":
+            store = JsonMetadataStore(json_path, flat_collection)
+        else:
+            raise ValueError(f"Unsupported metadata backend: {backend}")
+
+        _stores[key] = store
+        return store
+
+
+if __name__ == "__main__":
+    # One-shot migration of every metadata.json file:
+    #   python -m app.utils.metadata_store
+    logging.basicConfig(level=logging.INFO)
+    for folder, flat_collection in RESOURCE_FOLDERS:
+        open_metadata_store(folder, flat_collection, backend="sqlite").close()
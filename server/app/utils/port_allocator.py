@@ -0,0 +1,265 @@
+import socket
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.config import CONTAINER_PORT_RANGE, PORT_DATA_FOLDER, VM_PORT_RANGE
+from app.utils.metadata_store import MetadataStore, open_metadata_store
+
+COLLECTION = "ports"
+
+
+def parse_port_range(spec: str) -> Tuple[int, int]:
+    """
+    Parse a "first-last" port range
+
+    Args:
+        spec: Range such as "30000-32767"
+
+    Returns:
+        Tuple of (first, last), both included
+    """
+    first, _, last = spec.partition("-")
+    try:
+        bounds = int(first), int(last or first)
+    except ValueError:
+        raise ValueError(f"Invalid port range: {spec}")
+    if not 1 <= bounds[0] <= bounds[1] <= 65535:
+        raise ValueError(f"Invalid port range: {spec}")
+    return bounds
+
+
+def port_is_free(port: int) -> bool:
+    """Check whether nothing on the host is listening on a TCP port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        # Ports only held by connections in TIME_WAIT are free to listen on
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind(("", port))
+        except OSError:
+            return False
+    return True
+
+
+class PortConflictError(ValueError):
+    """A host port is already leased to someone else"""
+
+    def __init__(self, port: int, owner: Optional[str]):
+        self.port = port
+        self.owner = owner
+        holder = f"leased to {owner}" if owner else "in use on the host"
+        super().__init__(f"Host port {port} is {holder}")
+
+
+class PortAllocator:
+    """
+    Hands out host ports to VMs and containers
+
+    Leases live in a metadata store collection keyed by port, so every
+    worker shares one index and a port is never given to two owners. Owners
+    are strings such as "vm:<id>" or "container:<name>". Automatic
+    assignment draws from a named pool's range, resuming after the last
+    port it handed out so recently released ports aren't reused straight
+    away, and skips ports something else on the host is listening on.
+    """
+
+    def __init__(
+        self,
+        store: MetadataStore,
+        pools: Dict[str, Tuple[int, int]],
+        probe: Callable[[int], bool] = port_is_free,
+    ):
+        """
+        Args:
+            store: Metadata store holding the leases
+            pools: (first, last) port range per pool name
+            probe: Returns whether the host can bind a port
+        """
+        ranges = sorted(pools.values())
+        for (_, last), (first, _) in zip(ranges, ranges[1:]):
+            if first <= last:
+                raise ValueError("Port pool ranges must not overlap")
+        self.store = store
+        self.pools = dict(pools)
+        self.probe = probe
+        self._next = {pool: first for pool, (first, _) in self.pools.items()}
+
+    def leases(self, owner: Optional[str] = None) -> List[Dict]:
+        """
+        Current leases, ordered by port
+
+        Args:
+            owner: Only this owner's leases
+
+        Returns:
+            Dicts of port, owner, pool (None for ports asked for by number)
+            and leased_at
+        """
+        records = self.store.all(COLLECTION).values()
+        if owner is not None:
+            records = [record for record in records if record["owner"] == owner]
+        return sorted(records, key=lambda record: record["port"])
+
+    def _lease(self, port: int, owner: str, pool: Optional[str]) -> None:
+        self.store.put(
+            COLLECTION,
+            str(port),
+            {
+                "port": port,
+                "owner": owner,
+                "pool": pool,
+                "leased_at": datetime.now().isoformat(),
+            },
+        )
+
+    def allocate(self, owner: str, pool: str, count: int = 1) -> List[int]:
+        """
+        Lease free ports from a pool
+
+        An owner that already holds ports from the pool gets those back
+        first, so retrying a launch doesn't leak leases.
+
+        Args:
+            owner: Who the ports are for
+            pool: Pool to draw from
+            count: Number of ports
+
+        Returns:
+            The leased ports
+        """
+        first, last = self.pools[pool]
+        with self.store.locked():
+            leases = self.store.all(COLLECTION)
+            ports = [
+                record["port"]
+                for record in leases.values()
+                if record["owner"] == owner and record.get("pool") == pool
+            ][:count]
+            size = last - first + 1
+            start = self._next[pool]
+            for offset in range(size):
+                if len(ports) == count:
+                    break
+                port = first + (start - first + offset) % size
+                if str(port) in leases or not self.probe(port):
+                    continue
+                self._lease(port, owner, pool)
+                ports.append(port)
+                self._next[pool] = port + 1 if port < last else first
+            else:
+                if len(ports) < count:
+                    for port in ports:
+                        if str(port) not in leases:
+                            self.store.delete(COLLECTION, str(port))
+                    raise RuntimeError(f"No free ports left in the {pool} pool")
+        return sorted(ports)
+
+    def reserve(self, owner: str, ports: Iterable[int]) -> None:
+        """
+        Lease specific ports, all or none
+
+        Args:
+            owner: Who the ports are for
+            ports: Ports asked for
+
+        Raises:
+            PortConflictError: If a port is leased to another owner or
+                               something on the host is listening on it
+        """
+        ports = sorted(set(ports))
+        with self.store.locked():
+            leases = self.store.all(COLLECTION)
+            wanted = []
+            for port in ports:
+                record = leases.get(str(port))
+                if record is not None:
+                    if record["owner"] != owner:
+                        raise PortConflictError(port, record["owner"])
+                elif not self.probe(port):
+                    raise PortConflictError(port, None)
+                else:
+                    wanted.append(port)
+            for port in wanted:
+                self._lease(port, owner, None)
+
+    def release(self, owner: str) -> List[int]:
+        """
+        Give up all of an owner's ports
+
+        Returns:
+            The released ports
+        """
+        with self.store.locked():
+            ports = [record["port"] for record in self.leases(owner)]
+            for port in ports:
+                self.store.delete(COLLECTION, str(port))
+        return ports
+
+    def release_missing(self, prefix: str, owners: Set[str]) -> List[int]:
+        """
+        Release the leases of owners that no longer exist
+
+        Args:
+            prefix: Kind of owner checked, e.g. "container:"
+            owners: Owners of that kind that still exist
+
+        Returns:
+            The released ports
+        """
+        with self.store.locked():
+            ports = [
+                record["port"]
+                for record in self.leases()
+                if record["owner"].startswith(prefix) and record["owner"] not in owners
+            ]
+            for port in ports:
+                self.store.delete(COLLECTION, str(port))
+        return ports
+
+    def metrics(self) -> Dict:
+        """Leased and total ports per pool, plus leases outside any pool"""
+        leased = {pool: 0 for pool in self.pools}
+        other = 0
+        for record in self.store.all(COLLECTION).values():
+            pool = next(
+                (
+                    pool
+                    for pool, (first, last) in self.pools.items()
+                    if first <= record["port"] <= last
+                ),
+                None,
+            )
+            if pool is None:
+                other += 1
+            else:
+                leased[pool] += 1
+        return {
+            "pools": {
+                pool: {
+                    "range": f"{first}-{last}",
+                    "size": last - first + 1,
+                    "leased": leased[pool],
+                }
+                for pool, (first, last) in self.pools.items()
+            },
+            "other_leases": other,
+        }
+
+
+_port_allocator: Optional[PortAllocator] = None
+_port_allocator_lock = threading.Lock()
+
+
+def get_port_allocator() -> PortAllocator:
+    """Return the process-wide port allocator"""
+    global _port_allocator
+    with _port_allocator_lock:
+        if _port_allocator is None:
+            _port_allocator = PortAllocator(
+                open_metadata_store(PORT_DATA_FOLDER),
+                {
+                    "vm": parse_port_range(VM_PORT_RANGE),
+                    "container": parse_port_range(CONTAINER_PORT_RANGE),
+                },
+            )
+        return _port_allocator
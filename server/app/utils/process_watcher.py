@@ -0,0 +1,229 @@
+import os
+import asyncio
+import logging
+import threading
+import subprocess
+from typing import Callable, Dict, List, Optional, Tuple
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+# Called with (pid, return code); the return code is None when the process
+# wasn't our child and its exit status can't be collected
+ExitCallback = Callable[[int, Optional[int]], None]
+
+
+class ProcessWatcher:
+    """
+    Notify callbacks the moment watched processes exit
+
+    Runs on the asyncio event loop. On Linux each process gets a pidfd that
+    becomes readable when it exits, so there is no polling. Elsewhere our own
+    children are waited on with os.waitpid in a helper thread, and only
+    processes we didn't spawn (e.g. VMs restored after a restart) fall back
+    to psutil polling.
+
+    watch() may be called from any thread, including before start(); such
+    watches are registered once the loop is running. If start() was never
+    called (the app's lifespan didn't run), or the loop it ran on has since
+    closed, the first watch() made from a running loop starts the watcher
+    there.
+    """
+
+    def __init__(self, poll_interval: float = 2.0):
+        """
+        Initialize the watcher
+
+        Args:
+            poll_interval: Seconds between checks of processes that can only be polled
+        """
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: List[Tuple[int, ExitCallback, Optional[subprocess.Popen]]] = []
+        self._watches: Dict[int, Tuple[ExitCallback, Optional[subprocess.Popen]]] = {}
+        self._pidfds: Dict[int, int] = {}
+        self._polled: Dict[int, psutil.Process] = {}
+        self._poll_task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    async def start(self) -> None:
+        """Start watching on the running event loop"""
+        self._start(asyncio.get_running_loop())
+
+    def _start(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Start watching on a loop unless already running on a live one"""
+        with self._lock:
+            if self._loop is not None and not self._loop.is_closed():
+                return
+            if self._loop is not None:
+                # The previous loop is gone along with its readers and poll
+                # task; park what it was watching so it's registered again
+                for pidfd in self._pidfds.values():
+                    os.close(pidfd)
+                self._pidfds.clear()
+                self._pending.extend(
+                    (pid, callback, process)
+                    for pid, (callback, process) in self._watches.items()
+                )
+                self._watches.clear()
+                self._polled.clear()
+            self._loop = loop
+            pending, self._pending = self._pending, []
+        self._poll_task = loop.create_task(self._poll_loop())
+        for pid, callback, process in pending:
+            self._register(pid, callback, process)
+
+    async def stop(self) -> None:
+        """
+        Stop watching
+
+        Processes keep running; their watches are parked and resume on the
+        next start().
+        """
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        self._poll_task.cancel()
+        try:
+            await self._poll_task
+        except asyncio.CancelledError:
+            pass
+        for pid in list(self._pidfds):
+            self._close_pidfd(loop, pid)
+        with self._lock:
+            self._pending.extend(
+                (pid, callback, process)
+                for pid, (callback, process) in self._watches.items()
+            )
+        self._watches.clear()
+        self._polled.clear()
+
+    def watch(
+        self,
+        pid: int,
+        callback: ExitCallback,
+        process: Optional[subprocess.Popen] = None,
+    ) -> None:
+        """
+        Invoke callback on the event loop when a process exits
+
+        Args:
+            pid: Process ID to watch
+            callback: Function called with (pid, return code)
+            process: Popen object if the process is our child, used to reap it
+                     and collect its return code
+        """
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is not None:
+            self._start(running_loop)
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                self._pending.append((pid, callback, process))
+                return
+            loop = self._loop
+        if running_loop is loop:
+            self._register(pid, callback, process)
+        else:
+            loop.call_soon_threadsafe(self._register, pid, callback, process)
+
+    def is_watching(self, pid: int) -> bool:
+        """Whether an exit notification for this process is still pending"""
+        return pid in self._watches or any(p[0] == pid for p in self._pending)
+
+    def _register(
+        self, pid: int, callback: ExitCallback, process: Optional[subprocess.Popen]
+    ) -> None:
+        """Start tracking one process (event loop thread)"""
+        if self._loop is None or pid in self._watches:
+            return
+        self._watches[pid] = (callback, process)
+
+        if hasattr(os, "pidfd_open"):
+            try:
+                pidfd = os.pidfd_open(pid)
+            except ProcessLookupError:
+                self._exited(pid)
+                return
+            except OSError as e:
+                logger.debug(f"pidfd_open({pid}) failed, falling back: {e}")
+            else:
+                self._pidfds[pid] = pidfd
+                self._loop.add_reader(pidfd, self._exited, pid)
+                return
+
+        if process is not None:
+            # Our child: block in waitpid on a helper thread
+            threading.Thread(
+                target=self._wait_child,
+                args=(self._loop, pid, process),
+                name=f"waitpid-{pid}",
+                daemon=True,
+            ).start()
+            return
+
+        try:
+            self._polled[pid] = psutil.Process(pid)
+        except psutil.NoSuchProcess:
+            self._exited(pid)
+
+    def _wait_child(
+        self, loop: asyncio.AbstractEventLoop, pid: int, process: subprocess.Popen
+    ) -> None:
+        """Helper thread body: wait for a child and report its exit"""
+        process.wait()
+        try:
+            loop.call_soon_threadsafe(self._exited, pid)
+        except RuntimeError:
+            pass  # Loop closed during shutdown
+
+    def _close_pidfd(self, loop: asyncio.AbstractEventLoop, pid: int) -> None:
+        pidfd = self._pidfds.pop(pid, None)
+        if pidfd is not None:
+            loop.remove_reader(pidfd)
+            os.close(pidfd)
+
+    def _exited(self, pid: int) -> None:
+        """Deliver the exit notification for a process (event loop thread)"""
+        watch = self._watches.pop(pid, None)
+        if self._loop is not None:
+            self._close_pidfd(self._loop, pid)
+        self._polled.pop(pid, None)
+        if watch is None:
+            return
+
+        callback, process = watch
+        # poll() also reaps our child so it doesn't linger as a zombie
+        return_code = process.poll() if process is not None else None
+        try:
+            callback(pid, return_code)
+        except Exception:
+            logger.exception(f"Exit callback for process {pid} failed")
+
+    async def _poll_loop(self) -> None:
+        """Check processes that have no pidfd or waiter thread"""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            for pid, proc in list(self._polled.items()):
+                try:
+                    alive = proc.status() != psutil.STATUS_ZOMBIE
+                except psutil.NoSuchProcess:
+                    alive = False
+                if not alive:
+                    self._exited(pid)
+
+
+_process_watcher = ProcessWatcher()
+
+
+def get_process_watcher() -> ProcessWatcher:
+    """Return the process-wide watcher started by the application lifespan"""
+    return _process_watcher
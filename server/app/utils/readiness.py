@@ -0,0 +1,135 @@
+import asyncio
+import logging
+from collections import Counter, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+async def poll_until(
+    check: Callable[[], Awaitable[Optional[T]]],
+    timeout: float,
+    initial_interval: float = 0.05,
+    max_interval: float = 1.0,
+) -> T:
+    """
+    Call a check until it returns something other than None
+
+    The wait between calls starts at initial_interval and doubles up to
+    max_interval, so quick successes are seen quickly without hammering
+    whatever is checked while a slow one is pending.
+
+    Args:
+        check: Returns the result, or None to be called again
+        timeout: Seconds after which to give up
+        initial_interval: Seconds before the first retry
+        max_interval: Longest wait between calls
+
+    Returns:
+        The check's first non-None result
+
+    Raises:
+        asyncio.TimeoutError: If the check didn't succeed within the timeout
+    """
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + timeout
+    interval = initial_interval
+    while True:
+        result = await check()
+        if result is not None:
+            return result
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        await asyncio.sleep(min(interval, remaining))
+        interval = min(interval * 2, max_interval)
+
+
+async def probe_tcp(
+    host: str, port: int, timeout: float = 1.0, settle: float = 0.05
+) -> bool:
+    """
+    Whether something accepts connections on a TCP port
+
+    Docker's userland proxy accepts connections on a published port even
+    before the container listens, then closes them; a connection closed
+    within ``settle`` seconds therefore doesn't count.
+
+    Args:
+        host: Address to connect to
+        port: Port to connect to
+        timeout: Seconds to wait for the connection
+        settle: Seconds the connection has to stay open
+
+    Returns:
+        True if the port accepted a connection and kept it open
+    """
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port), timeout
+        )
+    except (OSError, asyncio.TimeoutError):
+        return False
+    try:
+        # Data (e.g. an SSH or database greeting) or silence both mean a
+        # server answered; only an immediate close means nobody is there
+        return await asyncio.wait_for(reader.read(1), settle) != b""
+    except asyncio.TimeoutError:
+        return True
+    except OSError:
+        return False
+    finally:
+        writer.close()
+
+
+class LatencyStats:
+    """Outcome counts and latency percentiles of the most recent operations"""
+
+    def __init__(self, window: int = 500):
+        """
+        Args:
+            window: Number of recent latencies the percentiles cover
+        """
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._outcomes: Counter = Counter()
+        self._last: Optional[float] = None
+
+    def record(self, outcome: str, seconds: float) -> None:
+        """
+        Record one operation
+
+        Args:
+            outcome: How it ended, e.g. "healthcheck" or "timeout"
+            seconds: How long it took
+        """
+        self._outcomes[outcome] += 1
+        self._latencies.append(seconds)
+        self._last = seconds
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Summary of the recorded operations
+
+        Returns:
+            Total "count", counts per outcome under "outcomes", and the
+            "last", "mean", "p50", "p95" and "max" latency in seconds over
+            the window (None before anything was recorded)
+        """
+        latencies = sorted(self._latencies)
+
+        def percentile(fraction: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+        return {
+            "count": sum(self._outcomes.values()),
+            "outcomes": dict(self._outcomes),
+            "last": self._last,
+            "mean": sum(latencies) / len(latencies) if latencies else None,
+            "p50": percentile(0.5),
+            "p95": percentile(0.95),
+            "max": latencies[-1] if latencies else None,
+        }
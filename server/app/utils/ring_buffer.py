@@ -0,0 +1,83 @@
+import math
+from array import array
+from typing import Dict, List, Mapping, Optional, Sequence
+
+
+class RingBuffer:
+    """
+    Fixed-capacity series of timestamped numeric samples
+
+    Each field is a preallocated array of doubles, so memory use is set by
+    the capacity alone; once full, every append overwrites the oldest
+    sample. Missing values are stored as NaN and read back as None.
+    """
+
+    def __init__(self, fields: Sequence[str], capacity: int):
+        """
+        Args:
+            fields: Names of the values in each sample
+            capacity: Number of samples kept
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        self._times = array("d", bytes(8 * capacity))
+        self._columns = {field: array("d", bytes(8 * capacity)) for field in fields}
+        self._next = 0  # Slot the next sample goes into
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the sample arrays"""
+        return self._times.itemsize * self.capacity * (len(self.fields) + 1)
+
+    def append(self, timestamp: float, values: Mapping[str, Optional[float]]) -> None:
+        """
+        Add a sample, overwriting the oldest one when full
+
+        Args:
+            timestamp: Time of the sample (seconds since the epoch)
+            values: Value per field; missing fields are recorded as unknown
+        """
+        slot = self._next
+        self._times[slot] = timestamp
+        for field, column in self._columns.items():
+            value = values.get(field)
+            column[slot] = math.nan if value is None else value
+        self._next = (slot + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def _sample(self, slot: int) -> Dict[str, Optional[float]]:
+        sample: Dict[str, Optional[float]] = {"time": self._times[slot]}
+        for field, column in self._columns.items():
+            value = column[slot]
+            sample[field] = None if math.isnan(value) else value
+        return sample
+
+    def latest(self) -> Optional[Dict[str, Optional[float]]]:
+        """The newest sample, or None if empty"""
+        if not self._count:
+            return None
+        return self._sample((self._next - 1) % self.capacity)
+
+    def samples(
+        self, since: Optional[float] = None
+    ) -> List[Dict[str, Optional[float]]]:
+        """
+        Samples oldest first
+
+        Args:
+            since: Only samples taken after this time
+
+        Returns:
+            Dicts of "time" and each field
+        """
+        first = (self._next - self._count) % self.capacity
+        slots = [(first + offset) % self.capacity for offset in range(self._count)]
+        if since is not None:
+            slots = [slot for slot in slots if self._times[slot] > since]
+        return [self._sample(slot) for slot in slots]
@@ -0,0 +1,193 @@
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from enum import IntEnum
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+from app.config import SCHEDULER_LIMITS
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Queue priority; lower values are served first"""
+
+    INTERACTIVE = 0  # Reads and stops a user is waiting on
+    NORMAL = 1
+    BULK = 2  # Conversions, batch builds and other background work
+
+
+class _OperationQueue:
+    """Concurrency limit, waiters and metrics of one operation class"""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.running = 0
+        # Heap of [priority, sequence, future]; the sequence keeps FIFO order
+        # within a priority
+        self.waiters: List[list] = []
+        self.peak_queued = 0
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def metrics(self) -> Dict:
+        queued_by_priority = {priority.name.lower(): 0 for priority in Priority}
+        for priority, _, _ in self.waiters:
+            queued_by_priority[Priority(priority).name.lower()] += 1
+        return {
+            "limit": self.limit,
+            "running": self.running,
+            "queued": len(self.waiters),
+            "queued_by_priority": queued_by_priority,
+            "peak_queued": self.peak_queued,
+            "acquired": self.acquired,
+            "total_wait_seconds": self.total_wait,
+            "avg_wait_seconds": (
+                self.total_wait / self.acquired if self.acquired else 0.0
+            ),
+            "max_wait_seconds": self.max_wait,
+        }
+
+
+class OperationScheduler:
+    """
+    Bounded concurrency for heavy host operations
+
+    Each operation class (builds, pulls, disk I/O, VM boots, ...) has its own
+    limit. Callers beyond the limit wait in a priority queue, so interactive
+    work overtakes queued bulk work. A released slot is handed directly to
+    the next waiter. Runs on the event loop; not thread-safe.
+    """
+
+    def __init__(self, limits: Dict[str, int]):
+        """
+        Initialize the scheduler
+
+        Args:
+            limits: Maximum concurrent operations per class
+        """
+        self._queues = {
+            name: _OperationQueue(name, max(1, limit)) for name, limit in limits.items()
+        }
+        self._sequence = itertools.count()
+        self._delayed: Dict[asyncio.TimerHandle, str] = {}
+
+    def _queue(self, op_class: str) -> _OperationQueue:
+        try:
+            return self._queues[op_class]
+        except KeyError:
+            raise ValueError(f"Unknown operation class: {op_class}")
+
+    async def acquire(
+        self, op_class: str, priority: Priority = Priority.NORMAL
+    ) -> None:
+        """
+        Wait for a slot in an operation class
+
+        Args:
+            op_class: Operation class, e.g. "build"
+            priority: Position in the queue relative to other waiters
+        """
+        queue = self._queue(op_class)
+        started = time.monotonic()
+
+        if queue.running < queue.limit and not queue.waiters:
+            queue.running += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            entry = [int(priority), next(self._sequence), future]
+            heapq.heappush(queue.waiters, entry)
+            queue.peak_queued = max(queue.peak_queued, len(queue.waiters))
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.cancelled():
+                    queue.waiters.remove(entry)
+                    heapq.heapify(queue.waiters)
+                else:
+                    # The slot was handed over just as we were cancelled
+                    self.release(op_class)
+                raise
+
+        waited = time.monotonic() - started
+        queue.acquired += 1
+        queue.total_wait += waited
+        queue.max_wait = max(queue.max_wait, waited)
+
+    def release(self, op_class: str) -> None:
+        """
+        Give back a slot acquired with acquire()
+
+        Args:
+            op_class: Operation class the slot belongs to
+        """
+        queue = self._queue(op_class)
+        while queue.waiters:
+            _, _, future = heapq.heappop(queue.waiters)
+            if not future.done():
+                future.set_result(None)  # Slot passes to the waiter
+                return
+        queue.running -= 1
+
+    def release_later(self, op_class: str, delay: float) -> None:
+        """
+        Give back a slot after a delay
+
+        Used for operations whose load outlasts the call that started them,
+        e.g. a VM counts against vm_boot while it boots.
+
+        Args:
+            op_class: Operation class the slot belongs to
+            delay: Seconds to keep the slot
+        """
+
+        def fire() -> None:
+            del self._delayed[handle]
+            self.release(op_class)
+
+        handle = asyncio.get_running_loop().call_later(delay, fire)
+        self._delayed[handle] = op_class
+
+    def flush_delayed_releases(self) -> None:
+        """Release every slot pending in release_later() now (at shutdown)"""
+        for handle, op_class in list(self._delayed.items()):
+            handle.cancel()
+            self.release(op_class)
+        self._delayed.clear()
+
+    @asynccontextmanager
+    async def slot(
+        self, op_class: Optional[str], priority: Priority = Priority.NORMAL
+    ) -> AsyncIterator[None]:
+        """
+        Hold a slot for the duration of a block
+
+        Args:
+            op_class: Operation class, or None to run unscheduled
+            priority: Queue priority
+        """
+        if op_class is None:
+            yield
+            return
+        await self.acquire(op_class, priority)
+        try:
+            yield
+        finally:
+            self.release(op_class)
+
+    def metrics(self) -> Dict[str, Dict]:
+        """Per-class limits, running and queued counts and wait times"""
+        return {name: queue.metrics() for name, queue in self._queues.items()}
+
+
+_scheduler = OperationScheduler(SCHEDULER_LIMITS)
+
+
+def get_scheduler() -> OperationScheduler:
+    """Return the process-wide operation scheduler"""
+    return _scheduler
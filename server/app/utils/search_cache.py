@@ -0,0 +1,122 @@
+import time
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """Cache key of a search query: lower case, single spaces"""
+    return " ".join(query.lower().split())
+
+
+def _matches(result: Dict, query: str) -> bool:
+    """Whether every term of a normalized query is in a result"""
+    text = f"{result.get('name', '')} {result.get('description', '')}".lower()
+    return all(term in text for term in query.split())
+
+
+class SearchCache:
+    """
+    Image search results by normalized query, expiring after a TTL and
+    evicting the least recently used queries beyond max_entries
+
+    A query that isn't cached can be answered from a cached query it extends
+    ("ngin" -> "nginx") by filtering that result set, as long as the set was
+    complete: a search that hit the result limit may have left out matches
+    for the longer query.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        max_entries: int,
+        limit: int,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            ttl: Seconds results stay valid
+            max_entries: Number of queries kept
+            limit: Result limit the searches run with
+            clock: Monotonic time source
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.limit = limit
+        self._clock = clock
+        # Query -> (expiry time, results), least recently used first
+        self._entries: "OrderedDict[str, Tuple[float, List[Dict]]]" = OrderedDict()
+        self.hits = 0
+        self.prefix_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, key: str) -> Optional[Tuple[float, List[Dict]]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= self._clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _insert(self, key: str, expires: float, results: List[Dict]) -> None:
+        self._entries[key] = (expires, results)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, query: str) -> Optional[List[Dict]]:
+        """
+        Cached results for a query
+
+        Args:
+            query: Search query (normalized here)
+
+        Returns:
+            The results, or None if the query has to be searched
+        """
+        key = normalize_query(query)
+        entry = self._lookup(key)
+        if entry is not None:
+            self.hits += 1
+            return list(entry[1])
+
+        # Longest cached prefix first: it's the smallest superset
+        for length in range(len(key) - 1, 0, -1):
+            entry = self._lookup(key[:length])
+            if entry is None or len(entry[1]) >= self.limit:
+                continue
+            expires, superset = entry
+            results = [result for result in superset if _matches(result, key)]
+            # Expires with the results it was derived from
+            self._insert(key, expires, results)
+            self.prefix_hits += 1
+            return list(results)
+
+        self.misses += 1
+        return None
+
+    def put(self, query: str, results: List[Dict]) -> None:
+        """
+        Cache the results of a search
+
+        Args:
+            query: Search query (normalized here)
+            results: Results the search returned
+        """
+        self._insert(normalize_query(query), self._clock() + self.ttl, results)
+
+    def metrics(self) -> Dict[str, int]:
+        """Lookups served exactly, by prefix and not at all, and evictions"""
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "prefix_hits": self.prefix_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
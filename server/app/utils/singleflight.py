@@ -0,0 +1,76 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _Call:
+    """One in-flight operation and the number of callers waiting for it"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into a single operation
+
+    The first caller for a key starts the operation in its own task; callers
+    arriving while it runs wait for the same result (or exception) instead
+    of starting another. A caller that is cancelled stops waiting without
+    affecting the others, and the operation itself is cancelled only once
+    every caller has gone.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, operation: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run an operation, or join the identical one already running
+
+        Args:
+            key: Identifies operations that produce the same result
+            operation: Starts the operation; only called if none is running
+
+        Returns:
+            The operation's result
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(operation()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                logger.info(f"No callers left for {key!r}, cancelling it")
+                call.task.cancel()
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def metrics(self) -> Dict[str, Any]:
+        """Operations started, callers coalesced into one, and in flight"""
+        return {
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls),
+        }
@@ -0,0 +1,55 @@
+import json
+import logging
+from typing import Any, AsyncIterator, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+
+def format_sse(event: str, data: Any) -> str:
+    """
+    Encode one Server-Sent Event
+
+    Args:
+        event: Event name
+        data: JSON-serializable payload (pydantic models are accepted)
+
+    Returns:
+        The event in text/event-stream format
+    """
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+def event_stream_response(events: AsyncIterator[Tuple[str, Any]]) -> StreamingResponse:
+    """
+    Stream (event, data) pairs to the client as Server-Sent Events
+
+    The status code is sent before the operation runs, so a failure part-way
+    through is reported as a final "error" event. If the client disconnects
+    the event source is closed, which stops any command feeding it.
+
+    Args:
+        events: Async iterator of (event name, payload) pairs
+
+    Returns:
+        A text/event-stream response
+    """
+
+    async def body() -> AsyncIterator[str]:
+        try:
+            async for event, data in events:
+                yield format_sse(event, data)
+        except Exception as e:
+            logger.warning(f"Event stream failed: {e}")
+            yield format_sse("error", {"detail": str(e)})
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        # Disable caching and proxy buffering so events arrive immediately
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
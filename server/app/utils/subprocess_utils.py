@@ -2,89 +2,340 @@ import subprocess
 import logging
 import platform
 import os
-from typing import List, Tuple, Optional
+import re
+import shutil
+import asyncio
+import codecs
+from collections import deque
+from typing import AsyncIterator, Dict, List, Tuple, Optional
+
+from app.config import COMMAND_TIMEOUT
+from app.utils.scheduler import Priority, get_scheduler
 
 logger = logging.getLogger(__name__)
 
+
+class CommandError(RuntimeError):
+    """A command exited non-zero or timed out"""
+
+    def __init__(
+        self, message: str, return_code: Optional[int] = None, stderr: str = ""
+    ):
+        """
+        Args:
+            message: Error message
+            return_code: Exit code, or None if the command was killed on timeout
+            stderr: Captured standard error
+        """
+        super().__init__(message)
+        self.return_code = return_code
+        self.stderr = stderr
+
+
 def run_command(command: List[str]) -> Tuple[str, str, int]:
     """
     Run a shell command and return its output
-    
+
     Args:
         command: List of command parts
-        
+
     Returns:
         Tuple of (stdout, stderr, return_code)
     """
     logger.info(f"Running command: {' '.join(command)}")
-    
+
     process = subprocess.Popen(
-        command,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        universal_newlines=True
+        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
     )
-    
+
     stdout, stderr = process.communicate()
     return_code = process.returncode
-    
+
     if return_code != 0:
         logger.error(f"Command failed: {stderr}")
         raise RuntimeError(f"Command failed: {stderr}")
-    
+
     return stdout, stderr, return_code
 
+
+async def run_command_async(
+    command: List[str],
+    timeout: Optional[float] = COMMAND_TIMEOUT,
+    input: Optional[str] = None,
+    op_class: Optional[str] = None,
+    priority: Priority = Priority.NORMAL,
+) -> Tuple[str, str, int]:
+    """
+    Run a command without blocking the event loop
+
+    Like run_command, but the process is awaited on the event loop, so an
+    in-flight command costs a coroutine instead of a threadpool worker. The
+    process is killed if the timeout expires or the awaiting task is
+    cancelled (e.g. because the client disconnected).
+
+    Args:
+        command: List of command parts
+        timeout: Seconds to wait before killing the command (None waits forever)
+        input: Optional text written to the command's stdin
+        op_class: Scheduler operation class to wait for a slot in; the
+                  timeout only starts once the command runs
+        priority: Scheduler queue priority
+
+    Returns:
+        Tuple of (stdout, stderr, return_code)
+
+    Raises:
+        CommandError: If the command exits non-zero or times out
+    """
+    async with get_scheduler().slot(op_class, priority):
+        return await _run_command_async(command, timeout, input)
+
+
+async def _run_command_async(
+    command: List[str], timeout: Optional[float], input: Optional[str]
+) -> Tuple[str, str, int]:
+    """Body of run_command_async once a scheduler slot is held"""
+    logger.info(f"Running command: {' '.join(command)}")
+
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=(
+            asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL
+        ),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+
+    try:
+        stdout, stderr = await asyncio.wait_for(
+            process.communicate(input.encode() if input is not None else None),
+            timeout,
+        )
+    except asyncio.TimeoutError:
+        await _kill_process(process)
+        logger.error(f"Command timed out after {timeout}s: {' '.join(command)}")
+        raise CommandError(f"Command timed out after {timeout}s")
+    except asyncio.CancelledError:
+        await _kill_process(process)
+        logger.info(f"Command cancelled: {' '.join(command)}")
+        raise
+
+    stdout = stdout.decode(errors="replace")
+    stderr = stderr.decode(errors="replace")
+    return_code = process.returncode
+
+    if return_code != 0:
+        logger.error(f"Command failed: {stderr}")
+        raise CommandError(f"Command failed: {stderr}", return_code, stderr)
+
+    return stdout, stderr, return_code
+
+
+async def _kill_process(process: asyncio.subprocess.Process) -> None:
+    """Kill an asyncio subprocess and reap it"""
+    try:
+        process.kill()
+    except ProcessLookupError:
+        pass
+    await process.wait()
+
+
+_READ_CHUNK = 65536
+# Progress bars (qemu-img -p, docker) redraw with a carriage return
+_LINE_BREAK = re.compile(rb"(\r\n|\r|\n)")
+
+
+async def _iter_lines(
+    reader: asyncio.StreamReader, max_line_bytes: int, keep_ends: bool = False
+) -> AsyncIterator[str]:
+    """
+    Yield the lines of a stream as they arrive
+
+    A line longer than max_line_bytes comes in several pieces, so memory use
+    doesn't depend on the output and nothing is dropped.
+
+    Args:
+        reader: Stream to read
+        max_line_bytes: Largest piece yielded
+        keep_ends: Keep each line's break, so the pieces join back into the
+                   exact output
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = b""
+    while True:
+        chunk = await reader.read(_READ_CHUNK)
+        data = pending + chunk
+        # A trailing "\r" may be the first half of a "\r\n"
+        held = b"\r" if chunk and data.endswith(b"\r") else b""
+        parts = _LINE_BREAK.split(data[: len(data) - len(held)])
+        pending = parts.pop()
+        for line, end in zip(parts[::2], parts[1::2]):
+            while len(line) > max_line_bytes:
+                yield decoder.decode(line[:max_line_bytes])
+                line = line[max_line_bytes:]
+            yield decoder.decode(line + end if keep_ends else line, final=True)
+        while len(pending) > max_line_bytes:
+            yield decoder.decode(pending[:max_line_bytes])
+            pending = pending[max_line_bytes:]
+        pending += held
+        if not chunk:
+            if pending:
+                yield decoder.decode(pending, final=True)
+            return
+
+
+async def stream_command(
+    command: List[str],
+    timeout: Optional[float] = None,
+    env: Optional[Dict[str, str]] = None,
+    max_line_bytes: int = 16384,
+    buffer_lines: int = 64,
+    op_class: Optional[str] = None,
+    priority: Priority = Priority.NORMAL,
+    keep_line_ends: bool = False,
+) -> AsyncIterator[Tuple[str, str]]:
+    """
+    Run a command and yield its output lines as they are produced
+
+    At most buffer_lines lines are held between the pipes and the consumer;
+    when the consumer falls behind, reading stops and the command blocks on
+    its pipe. The command is killed if the timeout expires or the consumer
+    stops iterating (e.g. the client of a streaming response disconnected).
+
+    Args:
+        command: List of command parts
+        timeout: Seconds to wait for the whole command (None waits forever)
+        env: Extra environment variables for the command
+        max_line_bytes: Longer lines are yielded in pieces of this size
+        buffer_lines: Maximum number of lines buffered in memory
+        op_class: Scheduler operation class whose slot is held while the
+                  command runs
+        priority: Scheduler queue priority
+        keep_line_ends: Keep the line breaks, so the yielded text joins
+                        back into the exact output
+
+    Yields:
+        Tuples of (stream, line) where stream is "stdout" or "stderr"
+
+    Raises:
+        CommandError: If the command exits non-zero or times out; the
+            message holds the last lines of stderr
+    """
+    async with get_scheduler().slot(op_class, priority):
+        lines = _stream_command(
+            command, timeout, env, max_line_bytes, buffer_lines, keep_line_ends
+        )
+        try:
+            async for item in lines:
+                yield item
+        finally:
+            # Close explicitly so the command is killed right away if our
+            # consumer stopped early
+            await lines.aclose()
+
+
+async def _stream_command(
+    command: List[str],
+    timeout: Optional[float],
+    env: Optional[Dict[str, str]],
+    max_line_bytes: int,
+    buffer_lines: int,
+    keep_line_ends: bool,
+) -> AsyncIterator[Tuple[str, str]]:
+    """Body of stream_command once a scheduler slot is held"""
+    logger.info(f"Streaming command: {' '.join(command)}")
+
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env={**os.environ, **env} if env else None,
+    )
+    queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_lines)
+    stderr_tail: deque = deque(maxlen=20)
+
+    async def pump(reader: asyncio.StreamReader, name: str) -> None:
+        async for line in _iter_lines(reader, max_line_bytes, keep_line_ends):
+            await queue.put((name, line))
+        await queue.put((name, None))
+
+    pumps = [
+        asyncio.ensure_future(pump(process.stdout, "stdout")),
+        asyncio.ensure_future(pump(process.stderr, "stderr")),
+    ]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout if timeout is not None else None
+
+    def remaining() -> Optional[float]:
+        return None if deadline is None else max(deadline - loop.time(), 0)
+
+    try:
+        open_streams = len(pumps)
+        while open_streams:
+            name, line = await asyncio.wait_for(queue.get(), remaining())
+            if line is None:
+                open_streams -= 1
+                continue
+            if name == "stderr":
+                stderr_tail.append(line)
+            yield name, line
+        await asyncio.wait_for(process.wait(), remaining())
+    except asyncio.TimeoutError:
+        logger.error(f"Command timed out after {timeout}s: {' '.join(command)}")
+        raise CommandError(f"Command timed out after {timeout}s")
+    finally:
+        for task in pumps:
+            task.cancel()
+        if process.returncode is None:
+            await _kill_process(process)
+            logger.info(f"Command stopped early: {' '.join(command)}")
+
+    if process.returncode != 0:
+        stderr = "\n".join(stderr_tail)
+        logger.error(f"Command failed: {stderr}")
+        raise CommandError(f"Command failed: {stderr}", process.returncode, stderr)
+
+
 def run_command_background(command: List[str]) -> Optional[subprocess.Popen]:
     """
     Run a shell command in the background
-    
+
     Args:
         command: List of command parts
-        
+
     Returns:
         Popen process object or None
     """
     logger.info(f"Running background command: {' '.join(command)}")
-    
+
     # Determine the appropriate DEVNULL based on the platform
     if platform.system() == "Windows":
-        devnull = open(os.devnull, 'wb')
+        devnull = open(os.devnull, "wb")
         process = subprocess.Popen(
             command,
             stdout=devnull,
             stderr=devnull,
-            shell=True  # Use shell on Windows for better compatibility
+            shell=True,  # Use shell on Windows for better compatibility
         )
     else:
         process = subprocess.Popen(
-            command,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
+            command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
         )
-    
+
     return process
 
+
 def check_command_exists(command: str) -> bool:
     """
     Check if a command exists in the system
-    
+
+    Resolves the command on PATH in-process instead of forking `which`/`where`.
+
     Args:
         command: Command name to check
-        
+
     Returns:
         Boolean indicating if command exists
     """
-    if platform.system() == "Windows":
-        check_cmd = ["where", command]
-    else:
-        check_cmd = ["which", command]
-    
-    try:
-        subprocess.check_call(
-            check_cmd,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        )
-        return True
-    except subprocess.CalledProcessError:
-        return False
\ No newline at end of file
+    return shutil.which(command) is not None
@@ -1,6 +1,175 @@
 import pytest
 import sys
 import os
+import shutil
+import stat
+import tempfile
+import threading
 
 # Add the server directory to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from tests.fake_docker_daemon import FakeDockerDaemon
+
+
+@pytest.fixture
+def docker_daemon():
+    """Fake Docker daemon listening on a temporary unix socket"""
+    # Unix socket paths are limited to ~100 bytes; keep it short
+    directory = tempfile.mkdtemp(prefix="dockerd")
+    daemon = FakeDockerDaemon(os.path.join(directory, "docker.sock"))
+    thread = threading.Thread(
+        target=daemon.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    yield daemon
+    daemon.shutdown()
+    daemon.server_close()
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+class _Capabilities:
+    """Host capabilities with the docker binary and the given socket (or none)"""
+
+    def __init__(self, socket_path):
+        self.docker_socket = socket_path
+
+    def has_binary(self, name):
+        return True
+
+
+@pytest.fixture
+def anyio_backend():
+    """Run async tests (marked anyio) on asyncio"""
+    return "asyncio"
+
+
+@pytest.fixture
+def wait_for():
+    """Coroutine function that polls a predicate until it holds"""
+    import asyncio
+
+    async def wait(predicate, timeout=5.0):
+        for _ in range(int(timeout / 0.02)):
+            if predicate():
+                return
+            await asyncio.sleep(0.02)
+        raise AssertionError("condition not reached")
+
+    return wait
+
+
+@pytest.fixture
+def port_allocator(tmp_path):
+    """Port allocator with its own lease store and small pools"""
+    from app.utils.metadata_store import open_metadata_store
+    from app.utils.port_allocator import PortAllocator
+
+    folder = tmp_path / "ports"
+    folder.mkdir()
+    return PortAllocator(
+        open_metadata_store(str(folder)),
+        {"vm": (42200, 42209), "container": (42300, 42309)},
+    )
+
+
+@pytest.fixture
+def api_docker_service(docker_daemon, port_allocator, monkeypatch):
+    """Factory for DockerService instances talking to the fake daemon"""
+    from app.services import docker_service
+
+    monkeypatch.setattr(
+        docker_service,
+        "get_host_capabilities",
+        lambda: _Capabilities(docker_daemon.server_address),
+    )
+    monkeypatch.setattr(docker_service, "get_port_allocator", lambda: port_allocator)
+    return docker_service.DockerService
+
+
+@pytest.fixture
+async def service(api_docker_service):
+    """DockerService talking to the fake daemon, closed after the test"""
+    service = api_docker_service()
+    yield service
+    await service.close()
+
+
+@pytest.fixture
+async def docker_api(docker_daemon):
+    """Engine API client for the fake daemon, closed after the test"""
+    from app.utils.docker_api import DockerAPI
+
+    api = DockerAPI(docker_daemon.server_address)
+    yield api
+    await api.close()
+
+
+@pytest.fixture
+def fake_docker_cli(tmp_path, port_allocator, monkeypatch):
+    """
+    Make DockerService use the docker CLI, with no daemon socket. Returns a
+    function that installs the given Python source as `docker` on the PATH.
+    """
+    from app.services import docker_service
+
+    folder = tmp_path / "bin"
+    folder.mkdir()
+    monkeypatch.setenv("PATH", f"{folder}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(
+        docker_service, "get_host_capabilities", lambda: _Capabilities(None)
+    )
+    monkeypatch.setattr(docker_service, "get_port_allocator", lambda: port_allocator)
+
+    def install(source):
+        binary = folder / "docker"
+        binary.write_text(f"#!{sys.executable}\n{source}")
+        binary.chmod(binary.stat().st_mode | stat.S_IEXEC)
+
+    return install
+
+
+@pytest.fixture
+async def cli_service(fake_docker_cli):
+    """DockerService running the fake docker CLI, closed after the test"""
+    from app.services import docker_service
+
+    service = docker_service.DockerService()
+    yield service
+    await service.close()
+
+
+@pytest.fixture
+def fake_docker_build(docker_daemon, monkeypatch):
+    """
+    Replace `docker build` with one that takes 0.2s and adds the image to the
+    fake daemon (tags containing "fail" fail). Returns the commands run;
+    peak_concurrency records the most builds that ran at once.
+    """
+    import asyncio
+    from app.services import docker_service
+    from app.utils.subprocess_utils import CommandError
+
+    class Builds(list):
+        running = 0
+        peak_concurrency = 0
+
+    builds = Builds()
+
+    async def stream_command(command, **kwargs):
+        builds.append(command)
+        tag = command[command.index("-t") + 1]
+        builds.running += 1
+        builds.peak_concurrency = max(builds.peak_concurrency, builds.running)
+        try:
+            yield "stdout", "Step 1/1 : FROM scratch"
+            await asyncio.sleep(0.2)
+            if "fail" in tag:
+                raise CommandError("Command failed", 1, "no such base image")
+            docker_daemon.add_image(tag)
+            yield "stdout", "Successfully built"
+        finally:
+            builds.running -= 1
+
+    monkeypatch.setattr(docker_service, "stream_command", stream_command)
+    return builds
@@ -0,0 +1,591 @@
+"""
+Fake Docker daemon for tests
+
+Serves just enough of the Engine API over a unix socket for DockerAPI and
+DockerService: containers, images, pulls, logs and the events stream. State
+is held in memory and changes are announced on /events like the real daemon.
+"""
+
+import re
+import sys
+import json
+import time
+import queue
+import hashlib
+import threading
+import socketserver
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, unquote, urlsplit
+
+NEVER = "0001-01-01T00:00:00Z"
+
+
+def _timestamp(seconds: float) -> str:
+    """RFC 3339 with nanoseconds, as the daemon formats times"""
+    moment = datetime.fromtimestamp(seconds, timezone.utc)
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.%f") + "000Z"
+
+
+def _make_id(seed: str) -> str:
+    return hashlib.sha256(f"{seed}{time.time()}".encode()).hexdigest()
+
+
+class FakeDockerHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    # Responses
+
+    def _send_json(self, status, data, close=False):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if close:
+            self.close_connection = True
+
+    def _send_text(self, text):
+        body = text.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_empty(self, status=204):
+        self.send_response(status)
+        if status not in (204, 304):
+            self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _start_chunks(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _end_chunks(self):
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _not_found(self, what):
+        self._send_json(404, {"message": f"No such {what}"})
+
+    # Routing
+
+    def _route(self, method):
+        url = urlsplit(self.path)
+        self.query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length) if length else b""
+        self.body = (
+            json.loads(raw)
+            if raw
+            and self.headers.get("Content-Type", "").startswith("application/json")
+            else raw
+        )
+        self.server.requests.append((method, self.path))
+
+        path = unquote(url.path)
+        for route_method, pattern, handler in ROUTES:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                with self.server.lock:
+                    return handler(self, *match.groups())
+        self._send_json(404, {"message": f"page not found: {path}"})
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+    # Endpoints
+
+    def ping(self):
+        self._send_text("OK")
+
+    def version(self):
+        self._send_json(200, {"Version": "27.0.3", "ApiVersion": "1.46"})
+
+    def info(self):
+        self._send_json(200, {"NCPU": 4, "MemTotal": 8 * 1024**3})
+
+    def drop(self):
+        # Answer, then drop the connection like an idle timeout would
+        self._send_json(200, {"dropped": True}, close=True)
+
+    def list_containers(self):
+        filters = json.loads(self.query.get("filters", "{}"))
+        rows = []
+        for info in self.server.containers.values():
+            if not int(self.query.get("all", 0)) and not info["State"]["Running"]:
+                continue
+            name = info["Name"].lstrip("/")
+            if any(not re.search(p, name) for p in filters.get("name", [])):
+                continue
+            if any(not info["Id"].startswith(p) for p in filters.get("id", [])):
+                continue
+            labels = info["Config"].get("Labels") or {}
+            selectors = [p.partition("=") for p in filters.get("label", [])]
+            if any(
+                key not in labels or (sep and labels[key] != value)
+                for key, sep, value in selectors
+            ):
+                continue
+            rows.append(
+                {
+                    "Id": info["Id"],
+                    "Image": info["Config"]["Image"],
+                    "ImageID": info["Image"],
+                    "Names": [info["Name"]],
+                    "State": info["State"]["Status"],
+                    "Status": self.server.status_text(info),
+                    "Created": int(self.server.created[info["Id"]]),
+                }
+            )
+        self._send_json(200, rows)
+
+    def inspect_container(self, ref):
+        info = self.server.find_container(ref)
+        if info is None:
+            return self._not_found(f"container: {ref}")
+        info = dict(info, State=dict(info["State"]))
+        if info["State"]["Running"]:
+            bindings = (info.get("HostConfig") or {}).get("PortBindings") or {}
+            info["NetworkSettings"] = {"Ports": bindings}
+            if self.server.healthcheck is not None:
+                status, after = self.server.healthcheck
+                started = self.server.started.get(info["Id"], 0)
+                if time.time() - started < after:
+                    status = "starting"
+                info["State"]["Health"] = {"Status": status}
+        self._send_json(200, info)
+
+    def container_action(self, ref, action):
+        info = self.server.find_container(ref)
+        if info is None:
+            return self._not_found(f"container: {ref}")
+        running = info["State"]["Running"]
+        if (action == "start" and running) or (action == "stop" and not running):
+            return self._send_empty(304)
+        if action in ("stop", "restart") and running and self.server.stop_delay:
+            # Stop outside the state lock, like a graceful shutdown taking time
+            self.server.lock.release()
+            try:
+                time.sleep(min(self.server.stop_delay, float(self.query.get("t", 10))))
+            finally:
+                self.server.lock.acquire()
+        if action in ("stop", "kill"):
+            self.server.set_stopped(info, 137 if action == "kill" else 0)
+        else:
+            self.server.set_running(info)
+        self._send_empty()
+
+    def create_container(self):
+        image = self.server.find_image(self.body["Image"])
+        if image is None:
+            return self._not_found(f"image: {self.body['Image']}")
+        name = self.query.get("name") or f"container_{len(self.server.containers)}"
+        info = self.server.add_container(name, self.body["Image"], running=False)
+        info["Config"]["Env"] = self.body.get("Env") or []
+        info["Config"]["Labels"] = self.body.get("Labels") or {}
+        info["HostConfig"] = self.body.get("HostConfig") or {}
+        info["NetworkingConfig"] = self.body.get("NetworkingConfig") or {}
+        self._send_json(201, {"Id": info["Id"], "Warnings": []})
+
+    def create_network(self):
+        name = self.body["Name"]
+        if name in self.server.networks:
+            return self._send_json(409, {"message": f"network {name} already exists"})
+        self.server.networks[name] = self.body
+        self._send_json(201, {"Id": _make_id(name), "Warning": ""})
+
+    def remove_network(self, name):
+        if self.server.networks.pop(name, None) is None:
+            return self._not_found(f"network {name}")
+        self._send_empty()
+
+    def update_container(self, ref):
+        info = self.server.find_container(ref)
+        if info is None:
+            return self._not_found(f"container: {ref}")
+        info.setdefault("HostConfig", {}).update(self.body)
+        self.server.emit("container", "update", info["Id"])
+        self._send_json(200, {"Warnings": []})
+
+    def remove_container(self, ref):
+        info = self.server.find_container(ref)
+        if info is None:
+            return self._not_found(f"container: {ref}")
+        del self.server.containers[info["Id"]]
+        self.server.emit("container", "destroy", info["Id"])
+        self._send_empty()
+
+    def container_logs(self, ref):
+        info = self.server.find_container(ref)
+        if info is None:
+            return self._not_found(f"container: {ref}")
+        lines = self.server.logs.setdefault(info["Id"], [])
+        tail = self.query.get("tail", "all")
+        sent = 0 if tail == "all" else max(len(lines) - int(tail), 0)
+        self._start_chunks("application/vnd.docker.multiplexed-stream")
+        # Follow outside the state lock
+        self.server.lock.release()
+        try:
+            while True:
+                running = info["State"]["Running"] and not self.server.closing
+                for stream, line in lines[sent:]:
+                    payload = line if isinstance(line, bytes) else line.encode()
+                    header = bytes([stream, 0, 0, 0]) + len(payload).to_bytes(4, "big")
+                    self._chunk(header + payload)
+                    sent += 1
+                if not int(self.query.get("follow", 0)) or not running:
+                    break
+                time.sleep(0.02)
+            self._end_chunks()
+        except OSError:
+            self.close_connection = True
+        finally:
+            self.server.lock.acquire()
+
+    def list_images(self):
+        shared = int(self.query.get("shared-size", 0))
+        rows = []
+        for image in self.server.images.values():
+            rows.append(
+                dict(
+                    image,
+                    SharedSize=image["Size"] // 2 if shared else -1,
+                    Containers=-1,  # Only computed for docker system df
+                )
+            )
+        self._send_json(200, rows)
+
+    def inspect_image(self, ref):
+        image = self.server.find_image(ref)
+        if image is None:
+            return self._not_found(f"image: {ref}")
+        self._send_json(200, image)
+
+    def remove_image(self, ref):
+        image = self.server.find_image(ref)
+        if image is None:
+            return self._not_found(f"image: {ref}")
+        del self.server.images[image["Id"]]
+        self.server.emit("image", "delete", image["Id"])
+        self._send_json(200, [{"Deleted": image["Id"]}])
+
+    def tag_image(self, ref):
+        image = self.server.find_image(ref)
+        if image is None:
+            return self._not_found(f"image: {ref}")
+        reference = f"{self.query['repo']}:{self.query.get('tag', 'latest')}"
+        with self.server.lock:
+            for other in self.server.images.values():
+                if reference in (other["RepoTags"] or []):
+                    other["RepoTags"].remove(reference)
+            image["RepoTags"] = (image["RepoTags"] or []) + [reference]
+        self.server.emit("image", "tag", image["Id"])
+        self._send_empty(201)
+
+    def pull_image(self):
+        reference = f"{self.query['fromImage']}:{self.query.get('tag', 'latest')}"
+        # Stream outside the state lock
+        self.server.lock.release()
+        try:
+            self._start_chunks("application/json")
+            self._chunk(b'{"status":"Pulling from library/nginx","id":"latest"}\n')
+            time.sleep(self.server.pull_delay)
+            # A document split across chunks
+            self._chunk(b'{"status":"Downloading","id":"abc123",')
+            self._chunk(
+                b'"progressDetail":{"current":1000000,"total":10000000},'
+                b'"progress":"[=>   ] 1MB/10MB"}\n'
+            )
+            time.sleep(self.server.pull_delay)
+            if self.server.find_image(reference) is None:
+                self.server.add_image(reference)
+            self._chunk(
+                b'{"status":"Pull complete","id":"abc123"}\n{"status":"Done"}\n'
+            )
+            self._end_chunks()
+        finally:
+            self.server.lock.acquire()
+
+    def container_stats(self, ref):
+        info = self.server.find_container(ref)
+        if info is None:
+            return self._not_found(f"container: {ref}")
+        # Stream outside the state lock; one document per interval while the
+        # container runs, at a steady 50% of two CPUs
+        self.server.lock.release()
+        try:
+            self._start_chunks("application/json")
+            tick = 0
+            previous = {}
+            while info["State"]["Running"] and not self.server.closing:
+                tick += 1
+                cpu = {
+                    "cpu_usage": {"total_usage": tick * 250000000},
+                    "system_cpu_usage": tick * 1000000000,
+                    "online_cpus": 2,
+                }
+                doc = {
+                    "cpu_stats": cpu,
+                    "precpu_stats": previous,
+                    "memory_stats": {
+                        "usage": 60 * 1024 * 1024,
+                        "limit": 1024 * 1024 * 1024,
+                        "stats": {"inactive_file": 10 * 1024 * 1024},
+                    },
+                    "networks": {
+                        "eth0": {"rx_bytes": tick * 1000, "tx_bytes": tick * 10}
+                    },
+                    "blkio_stats": {
+                        "io_service_bytes_recursive": [
+                            {"op": "read", "value": 4096},
+                            {"op": "write", "value": tick * 512},
+                        ]
+                    },
+                    "pids_stats": {"current": 3},
+                }
+                previous = cpu
+                self._chunk(json.dumps(doc).encode() + b"\n")
+                time.sleep(self.server.stats_interval)
+            self._end_chunks()
+        except OSError:
+            self.close_connection = True
+        finally:
+            self.server.lock.acquire()
+
+    def search_images(self):
+        term = self.query["term"]
+        self._send_json(
+            200,
+            [
+                {
+                    "name": term,
+                    "description": "The official image",
+                    "star_count": 100,
+                    "is_official": True,
+                    "is_automated": False,
+                }
+            ],
+        )
+
+    def events(self):
+        subscriber = queue.Queue()
+        since = float(self.query.get("since", time.time()))
+        for event in self.server.history:
+            if event["time"] >= int(since):
+                subscriber.put(event)
+        self.server.subscribers.append(subscriber)
+        # Stream outside the state lock
+        self.server.lock.release()
+        try:
+            self._start_chunks("application/json")
+            while not self.server.closing:
+                try:
+                    event = subscriber.get(timeout=0.05)
+                except queue.Empty:
+                    continue
+                if event is None:  # disconnect_events()
+                    self.close_connection = True
+                    return
+                self._chunk(json.dumps(event).encode() + b"\n")
+            self.close_connection = True
+        except OSError:
+            self.close_connection = True
+        finally:
+            self.server.lock.acquire()
+            self.server.subscribers.remove(subscriber)
+
+
+CONTAINER = r"/containers/([^/]+)"
+IMAGE = r"/images/(.+)"
+ROUTES = [
+    ("GET", r"/_ping", FakeDockerHandler.ping),
+    ("GET", r"/version", FakeDockerHandler.version),
+    ("GET", r"/info", FakeDockerHandler.info),
+    ("GET", r"/drop", FakeDockerHandler.drop),
+    ("GET", r"/events", FakeDockerHandler.events),
+    ("GET", r"/containers/json", FakeDockerHandler.list_containers),
+    ("POST", r"/containers/create", FakeDockerHandler.create_container),
+    ("GET", CONTAINER + r"/json", FakeDockerHandler.inspect_container),
+    ("GET", CONTAINER + r"/logs", FakeDockerHandler.container_logs),
+    ("GET", CONTAINER + r"/stats", FakeDockerHandler.container_stats),
+    ("POST", CONTAINER + r"/update", FakeDockerHandler.update_container),
+    (
+        "POST",
+        CONTAINER + r"/(start|stop|restart|kill)",
+        FakeDockerHandler.container_action,
+    ),
+    ("DELETE", CONTAINER, FakeDockerHandler.remove_container),
+    ("POST", r"/networks/create", FakeDockerHandler.create_network),
+    ("DELETE", r"/networks/([^/]+)", FakeDockerHandler.remove_network),
+    ("GET", r"/images/json", FakeDockerHandler.list_images),
+    ("GET", r"/images/search", FakeDockerHandler.search_images),
+    ("POST", r"/images/create", FakeDockerHandler.pull_image),
+    ("GET", IMAGE + r"/json", FakeDockerHandler.inspect_image),
+    ("POST", IMAGE + r"/tag", FakeDockerHandler.tag_image),
+    ("DELETE", IMAGE, FakeDockerHandler.remove_image),
+]
+
+
+class FakeDockerDaemon(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path):
+        super().__init__(path, FakeDockerHandler)
+        self.lock = threading.RLock()
+        self.pull_delay = 0  # seconds between pull progress messages
+        self.stop_delay = 0  # seconds a running container takes to stop
+        self.stats_interval = 1.0  # seconds between stats documents
+        # (status, seconds after start) running containers report, if set
+        self.healthcheck = None
+        self.started = {}
+        self.connections = 0
+        self.requests = []
+        self.containers = {}
+        self.created = {}
+        self.images = {}
+        self.logs = {}
+        self.networks = {}
+        self.history = []
+        self.subscribers = []
+        self.closing = False
+
+    # State helpers for tests; all of them announce the change on /events
+
+    def emit(self, type, action, actor_id, **attributes):
+        now = time.time()
+        event = {
+            "Type": type,
+            "Action": action,
+            "Actor": {"ID": actor_id, "Attributes": attributes},
+            "time": int(now),
+            "timeNano": int(now * 1e9),
+        }
+        with self.lock:
+            self.history.append(event)
+            for subscriber in self.subscribers:
+                subscriber.put(event)
+
+    def add_image(self, reference, cmd=None):
+        with self.lock:
+            image_id = f"sha256:{_make_id(reference)}"
+            self.images[image_id] = {
+                "Id": image_id,
+                "RepoTags": [reference] if reference else None,
+                "Created": int(time.time()),
+                "Size": 1000,
+                "Config": {"Cmd": cmd},
+            }
+            self.emit("image", "pull", reference or image_id)
+            return image_id
+
+    def add_container(self, name, image, running=True, started_ago=0, labels=None):
+        with self.lock:
+            container_id = _make_id(name)
+            now = time.time()
+            self.created[container_id] = now - started_ago
+            image_info = self.find_image(image)
+            info = {
+                "Id": container_id,
+                "Name": f"/{name}",
+                "Image": image_info["Id"] if image_info else "",
+                "Created": _timestamp(now - started_ago),
+                "Config": {"Image": image, "Env": [], "Labels": labels or {}},
+                "State": {
+                    "Status": "created",
+                    "Running": False,
+                    "ExitCode": 0,
+                    "StartedAt": NEVER,
+                    "FinishedAt": NEVER,
+                },
+            }
+            self.containers[container_id] = info
+            self.emit("container", "create", container_id, name=name, image=image)
+            if running:
+                self.set_running(info, started_ago)
+            return info
+
+    def set_running(self, info, started_ago=0):
+        with self.lock:
+            info["State"].update(
+                Status="running",
+                Running=True,
+                ExitCode=0,
+                StartedAt=_timestamp(time.time() - started_ago),
+            )
+            self.started[info["Id"]] = time.time() - started_ago
+            self.emit("container", "start", info["Id"])
+
+    def set_stopped(self, info, exit_code=0):
+        with self.lock:
+            info["State"].update(
+                Status="exited",
+                Running=False,
+                ExitCode=exit_code,
+                FinishedAt=_timestamp(time.time()),
+            )
+            self.emit("container", "die", info["Id"], exitCode=str(exit_code))
+
+    def find_container(self, ref):
+        with self.lock:
+            for info in self.containers.values():
+                if info["Id"].startswith(ref) or info["Name"] == f"/{ref}":
+                    return info
+        return None
+
+    def find_image(self, ref):
+        with self.lock:
+            for image in self.images.values():
+                if ref.startswith("sha256:"):
+                    if image["Id"].startswith(ref):
+                        return image
+                elif image["Id"][len("sha256:") :].startswith(ref):
+                    return image
+                tags = image["RepoTags"] or []
+                if ref in tags or f"{ref}:latest" in tags:
+                    return image
+        return None
+
+    def status_text(self, info):
+        state = info["State"]
+        if state["Running"]:
+            return "Up Less than a second"
+        if state["Status"] == "exited":
+            return f"Exited ({state['ExitCode']}) Less than a second ago"
+        return "Created"
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-response (cancelled requests) are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def disconnect_events(self):
+        """End every open /events stream, as a daemon restart would"""
+        with self.lock:
+            for subscriber in self.subscribers:
+                subscriber.put(None)
+
+    def shutdown(self):
+        self.closing = True
+        super().shutdown()
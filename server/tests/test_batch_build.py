@@ -0,0 +1,61 @@
+import pytest
+
+from app.models.docker import ImageBuild
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_batch_builds_overlap_under_the_concurrency_cap(
+    service, fake_docker_build
+):
+    dockerfiles = [
+        service.create_dockerfile("batch-test", f"FROM scratch\n# batch {index}\n")
+        for index in range(5)
+    ]
+    builds = [
+        ImageBuild(dockerfile_id=dockerfile.id, tag=f"batch:{index}")
+        for index, dockerfile in enumerate(dockerfiles)
+    ]
+    builds.append(ImageBuild(dockerfile_id=dockerfiles[0].id, tag="batch:again"))
+
+    try:
+        events = [event async for event in service.build_batch_events(builds, 2)]
+    finally:
+        for dockerfile in dockerfiles:
+            service.delete_dockerfile(dockerfile.id)
+    assert fake_docker_build.peak_concurrency == 2
+
+    event, summary = events[-1]
+    assert event == "done"
+    assert (summary.total, summary.succeeded, summary.failed) == (6, 6, 0)
+    # The sixth build reuses the first's image under a new tag
+    assert summary.results[5].image.id == summary.results[0].image.id
+    assert len(fake_docker_build) == 5
+    # 5 builds of 0.2s, two at a time
+    assert summary.duration < 0.2 * 5
+
+    started = [data.index for event, data in events if event == "build"]
+    assert sorted(started) == sorted(list(range(6)) * 2)
+    assert any(event == "step" for event, _ in events)
+
+
+async def test_failed_build_does_not_stop_the_batch(service, fake_docker_build):
+    dockerfiles = [
+        service.create_dockerfile("batch-test", f"FROM scratch\n# partial {index}\n")
+        for index in range(2)
+    ]
+    builds = [
+        ImageBuild(dockerfile_id=dockerfiles[0].id, tag="partial-fail:1"),
+        ImageBuild(dockerfile_id=dockerfiles[1].id, tag="partial:1"),
+    ]
+
+    try:
+        summary = await service.build_batch(builds)
+    finally:
+        for dockerfile in dockerfiles:
+            service.delete_dockerfile(dockerfile.id)
+    assert (summary.succeeded, summary.failed) == (1, 1)
+    failed, built = summary.results
+    assert failed.status == "failed"
+    assert "no such base image" in failed.error
+    assert built.status == "succeeded" and built.image.tag == "partial:1"
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_identical_builds_are_cached_and_coalesced(
+    docker_daemon, service, fake_docker_build
+):
+    dockerfile = service.create_dockerfile("cache-test", "FROM scratch\n# cached\n")
+
+    try:
+        first, second = await asyncio.gather(
+            service.build_image(dockerfile.id, "cached:1"),
+            service.build_image(dockerfile.id, "cached:2"),
+        )
+        cached = await service.build_image(dockerfile.id, "cached:1")
+        with_args = await service.build_image(
+            dockerfile.id, "cached:args", {"VERSION": "2"}
+        )
+    finally:
+        service.delete_dockerfile(dockerfile.id)
+
+    # One build for the two concurrent requests, one for the new build args
+    assert len(fake_docker_build) == 2
+    assert fake_docker_build[1][-3:-1] == ["--build-arg", "VERSION=2"]
+    assert first.id == second.id == cached.id != with_args.id
+    # The coalesced request's tag was added to the shared image
+    image = docker_daemon.find_image(first.id)
+    assert sorted(image["RepoTags"]) == ["cached:1", "cached:2"]
+
+    metrics = service.build_cache_metrics()
+    assert (metrics["hits"], metrics["misses"]) == (1, 3)
+    assert (metrics["started"], metrics["coalesced"]) == (2, 1)
+
+
+async def test_deleted_image_is_rebuilt(docker_daemon, service, fake_docker_build):
+    dockerfile = service.create_dockerfile("cache-test", "FROM scratch\n# deleted\n")
+
+    try:
+        built = await service.build_image(dockerfile.id, "deleted:1")
+        await service.delete_image(built.id)
+        rebuilt = await service.build_image(dockerfile.id, "deleted:1")
+    finally:
+        service.delete_dockerfile(dockerfile.id)
+
+    assert len(fake_docker_build) == 2
+    assert docker_daemon.find_image(rebuilt.id) is not None
+
+
+async def test_build_continues_while_a_coalesced_request_waits(
+    service, fake_docker_build
+):
+    dockerfile = service.create_dockerfile("cache-test", "FROM scratch\n# shared\n")
+
+    try:
+        leader = asyncio.ensure_future(service.build_image(dockerfile.id, "a:1"))
+        await asyncio.sleep(0.05)
+        follower = asyncio.ensure_future(service.build_image(dockerfile.id, "a:2"))
+        await asyncio.sleep(0.05)
+        leader.cancel()  # e.g. its client disconnected
+        built = await follower
+    finally:
+        service.delete_dockerfile(dockerfile.id)
+
+    assert built.tag == "a:2"
+    assert len(fake_docker_build) == 1
+
+
+async def test_coalesced_requests_each_get_the_build_output(service, fake_docker_build):
+    dockerfile = service.create_dockerfile("cache-test", "FROM scratch\n# output\n")
+
+    async def lines(tag):
+        return [
+            data["line"]
+            async for event, data in service.build_image_events(dockerfile.id, tag)
+            if event == "log"
+        ]
+
+    try:
+        leader = asyncio.ensure_future(lines("out:1"))
+        await asyncio.sleep(0.05)
+        follower = asyncio.ensure_future(lines("out:2"))
+        await asyncio.sleep(0.05)
+        leader.cancel()  # The follower keeps receiving output
+        follower_lines = await follower
+    finally:
+        service.delete_dockerfile(dockerfile.id)
+
+    assert follower_lines == [
+        "Waiting for an identical build in progress",
+        "Successfully built",
+    ]
+    assert service._build_listeners == {}
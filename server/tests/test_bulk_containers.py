@@ -0,0 +1,66 @@
+import pytest
+from pydantic import ValidationError
+
+from app.models.docker import BulkContainerAction, ContainerAction
+from app.services import docker_service
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_bulk_stop_runs_in_parallel_and_reports_each(docker_daemon, service):
+    docker_daemon.stop_delay = 0.3
+    docker_daemon.add_image("nginx:latest")
+    names = [f"web-{index}" for index in range(6)]
+    for name in names:
+        docker_daemon.add_container(name, "nginx:latest")
+
+    summary = await service.bulk_container_action(
+        ContainerAction.STOP, names + ["missing"], concurrency=3, timeout=5
+    )
+    assert (summary.total, summary.succeeded, summary.failed) == (7, 6, 1)
+    # Six 0.3s stops, three at a time
+    assert summary.duration < 0.3 * 6
+    assert summary.results[-1].id == "missing"
+    assert "No such container" in summary.results[-1].error
+    assert not any(
+        info["State"]["Running"] for info in docker_daemon.containers.values()
+    )
+    stops = [path for _, path in docker_daemon.requests if path.endswith("stop?t=5")]
+    assert len(stops) == 7
+
+
+async def test_bulk_delete_by_label(docker_daemon, service):
+    docker_daemon.add_image("nginx:latest")
+    for index in range(3):
+        docker_daemon.add_container(
+            f"web-{index}", "nginx:latest", labels={"app": "web", "tier": "front"}
+        )
+    docker_daemon.add_container("db", "nginx:latest", labels={"app": "db"})
+
+    summary = await service.bulk_container_action(
+        ContainerAction.DELETE, labels=["app=web", "tier"], timeout=0
+    )
+    assert (summary.total, summary.succeeded) == (3, 3)
+    remaining = [info["Name"] for info in docker_daemon.containers.values()]
+    assert remaining == ["/db"]
+
+
+async def test_stop_waits_out_the_grace_period(docker_daemon, service, monkeypatch):
+    # The daemon only answers once the container stopped, which may take up
+    # to the requested timeout
+    monkeypatch.setattr(docker_service, "COMMAND_TIMEOUT", 0.1)
+    docker_daemon.stop_delay = 0.3
+    docker_daemon.add_image("nginx:latest")
+    docker_daemon.add_container("web", "nginx:latest")
+
+    summary = await service.bulk_container_action(
+        ContainerAction.STOP, ["web"], timeout=1
+    )
+    assert summary.succeeded == 1
+
+
+def test_timeout_must_be_in_range():
+    with pytest.raises(ValidationError):
+        BulkContainerAction(ids=["web"], timeout=-1)
+    with pytest.raises(ValidationError):
+        BulkContainerAction(ids=["web"], timeout=86400)
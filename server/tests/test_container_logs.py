@@ -0,0 +1,147 @@
+import os
+
+import pytest
+
+from app.services import docker_service
+from app.utils.docker_api import _LogDemuxer
+
+
+def _frame(stream, payload):
+    return bytes([stream, 0, 0, 0]) + len(payload).to_bytes(4, "big") + payload
+
+
+def test_demuxer_handles_frames_split_anywhere():
+    data = _frame(1, b"hello\n") + _frame(2, b"oops\n") + _frame(1, b"bye\n")
+    demuxer = _LogDemuxer()
+    pieces = []
+    for index in range(len(data)):
+        pieces.extend(demuxer.feed(data[index : index + 1]))
+    pieces.extend(demuxer.flush())
+
+    stdout = b"".join(payload for stream, payload in pieces if stream == 1)
+    stderr = b"".join(payload for stream, payload in pieces if stream == 2)
+    assert (stdout, stderr) == (b"hello\nbye\n", b"oops\n")
+
+    raw = _LogDemuxer()
+    assert raw.feed(b"tty") == [] and raw.flush() == [(1, b"tty")]
+
+
+@pytest.mark.anyio
+async def test_tail_and_limits(docker_daemon, service, monkeypatch):
+    monkeypatch.setattr(docker_service, "LOG_CHUNK_BYTES", 1000)
+    docker_daemon.add_image("nginx:latest")
+    info = docker_daemon.add_container("chatty", "nginx:latest")
+    docker_daemon.logs[info["Id"]] = [
+        (1, "dropped by tail\n"),
+        (1, "kept\n"),
+        (2, "é" * 2500 + "\n"),
+    ]
+
+    async def collect(**kwargs):
+        return [
+            event
+            async for event in service.container_log_events("chatty", tail=2, **kwargs)
+        ]
+
+    full, limited = await collect(), await collect(limit_bytes=1005)
+    logs = [data for event, data in full if event == "log"]
+    assert logs[0] == {"stream": "stdout", "text": "kept\n"}
+    stderr = [data["text"] for data in logs[1:]]
+    # 5001 bytes sent in 1000-byte pieces without splitting characters
+    assert len(stderr) == 6 and "".join(stderr) == "é" * 2500 + "\n"
+    assert full[-1] == ("end", {"bytes": 5006, "truncated": False})
+
+    assert "".join(data["text"] for event, data in limited if event == "log") == (
+        "kept\n" + "é" * 500
+    )
+    assert limited[-1] == ("end", {"bytes": 1005, "truncated": True})
+
+
+@pytest.mark.anyio
+async def test_output_ending_mid_character_is_flushed(docker_daemon, service):
+    docker_daemon.add_image("nginx:latest")
+    info = docker_daemon.add_container("cut", "nginx:latest")
+    docker_daemon.logs[info["Id"]] = [(1, b"ok\n\xc3"), (2, "fine\n")]
+
+    events = [event async for event in service.container_log_events("cut")]
+    stdout = "".join(
+        data["text"] for event, data in events if data.get("stream") == "stdout"
+    )
+    assert stdout == "ok\n\ufffd"
+    assert events[-1] == ("end", {"bytes": 9, "truncated": False})
+
+
+@pytest.mark.anyio
+async def test_follow_streams_until_the_container_stops(docker_daemon, service):
+    docker_daemon.add_image("nginx:latest")
+    info = docker_daemon.add_container("follow", "nginx:latest")
+    docker_daemon.logs[info["Id"]] = [(1, "ready\n")]
+
+    events = service.container_log_events("follow", follow=True, since="10m")
+    received = [await events.__anext__()]
+    docker_daemon.logs[info["Id"]].append((2, "request failed\n"))
+    received.append(await events.__anext__())
+    docker_daemon.set_stopped(info)
+    received.extend([event async for event in events])
+    assert [data.get("text") for _, data in received] == [
+        "ready\n",
+        "request failed\n",
+        None,
+    ]
+    assert received[-1][0] == "end"
+    logs = [path for _, path in docker_daemon.requests if "/logs" in path]
+    assert "follow=1" in logs[0] and "since=" in logs[0]
+
+
+FAKE_DOCKER = """
+import os, sys, time
+with open({pid_file!r}, "w") as pid_file:
+    pid_file.write(str(os.getpid()))
+print("hello", flush=True)
+time.sleep(60)
+"""
+
+
+@pytest.mark.anyio
+async def test_disconnect_kills_docker_logs(tmp_path, fake_docker_cli, cli_service):
+    pid_file = tmp_path / "pid"
+    fake_docker_cli(FAKE_DOCKER.format(pid_file=str(pid_file)))
+
+    events = cli_service.container_log_events("web", follow=True)
+    first = await events.__anext__()
+    # What the SSE response does when the client goes away
+    await events.aclose()
+
+    assert first == ("log", {"stream": "stdout", "text": "hello\n"})
+    pid = int(pid_file.read_text())
+    with pytest.raises(ProcessLookupError):
+        os.kill(pid, 0)
+
+
+FAKE_DOCKER_LOGS = """
+import sys
+sys.stdout.write("x" * 30 + "\\n\\nend\\n")
+"""
+
+
+@pytest.mark.anyio
+async def test_cli_logs_keep_long_and_blank_lines(
+    fake_docker_cli, cli_service, monkeypatch
+):
+    fake_docker_cli(FAKE_DOCKER_LOGS)
+    monkeypatch.setattr(docker_service, "LOG_CHUNK_BYTES", 8)
+
+    async def collect(limit_bytes):
+        events = cli_service.container_log_events("web", limit_bytes=limit_bytes)
+        return [event async for event in events]
+
+    full, limited = await collect(None), await collect(33)
+    assert "".join(data["text"] for kind, data in full if kind == "log") == (
+        "x" * 30 + "\n\nend\n"
+    )
+    assert full[-1] == ("end", {"bytes": 36, "truncated": False})
+    # Only limit_bytes cuts the output
+    assert "".join(data["text"] for kind, data in limited if kind == "log") == (
+        "x" * 30 + "\n\ne"
+    )
+    assert limited[-1] == ("end", {"bytes": 33, "truncated": True})
@@ -0,0 +1,67 @@
+import asyncio
+import socket
+import time
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def test_plain_container_is_ready_once_running(docker_daemon, service):
+    image_id = docker_daemon.add_image("plain:1")
+
+    started = time.monotonic()
+    container = await service.run_container(image_id[7:19], "plain")
+    assert time.monotonic() - started < 0.5
+    assert container.name == "plain" and container.status.startswith("Up")
+    assert service.readiness_metrics()["outcomes"] == {"running": 1}
+
+
+async def test_waits_for_the_healthcheck(docker_daemon, service):
+    docker_daemon.healthcheck = ("healthy", 0.3)
+    image_id = docker_daemon.add_image("healthy:1")
+
+    await service.run_container(image_id[7:19], "healthy")
+    metrics = service.readiness_metrics()
+    assert metrics["outcomes"] == {"healthcheck": 1}
+    # Backoff keeps the wait close to the actual start time
+    assert 0.3 <= metrics["last"] < 0.8
+
+
+async def test_unhealthy_container_is_reported(docker_daemon, service):
+    docker_daemon.healthcheck = ("unhealthy", 0.1)
+    image_id = docker_daemon.add_image("unhealthy:1")
+
+    with pytest.raises(RuntimeError, match="became unhealthy"):
+        await service.run_container(image_id[7:19], "unhealthy")
+
+
+async def test_waits_for_published_ports(docker_daemon, service):
+    port = _free_port()
+    image_id = docker_daemon.add_image("web:1")
+
+    async def listen_later():
+        await asyncio.sleep(0.3)
+        return await asyncio.start_server(
+            lambda reader, writer: None, "127.0.0.1", port
+        )
+
+    listening = asyncio.ensure_future(listen_later())
+    try:
+        container = await service.run_container(
+            image_id[7:19], "web", {str(port): "80"}
+        )
+    finally:
+        server = await listening
+        server.close()
+
+    assert container.name == "web"
+    metrics = service.readiness_metrics()
+    assert metrics["outcomes"] == {"tcp": 1}
+    assert metrics["last"] >= 0.3
@@ -0,0 +1,101 @@
+import json
+
+import pytest
+
+from app.models.docker import ContainerResources
+from app.services import docker_service
+
+GIB = 1024**3
+HOST = {"cpus": 4, "memory": 8 * GIB}
+
+
+@pytest.mark.parametrize(
+    "resources, message",
+    [
+        (ContainerResources(cpus=6), "cpus"),
+        (ContainerResources(cpuset_cpus="0-1,4"), "[4]"),
+        (ContainerResources(cpuset_cpus="two"), "Invalid cpuset"),
+        (ContainerResources(memory=16 * GIB), "memory"),
+        (ContainerResources(memory=GIB, memory_swap=GIB // 2), "memory_swap"),
+        (ContainerResources(pids_limit=0), "pids_limit"),
+        (ContainerResources(blkio_weight=5), "blkio_weight"),
+        (ContainerResources(device_read_bps={"/etc/passwd": 1}), "device_read_bps"),
+    ],
+)
+def test_limits_beyond_the_host_are_rejected(resources, message):
+    with pytest.raises(ValueError, match=message.replace("[", r"\[")):
+        docker_service._validate_resources(resources, HOST)
+
+
+@pytest.mark.anyio
+async def test_limits_are_set_on_create_and_updated_in_place(docker_daemon, service):
+    image_id = docker_daemon.add_image("nginx:latest")
+    resources = ContainerResources(
+        cpus=1.5,
+        cpuset_cpus="0-2",
+        memory=512 * 1024**2,
+        memory_swap=-1,
+        pids_limit=100,
+        device_write_bps={"/dev/sda": 10 * 1024**2},
+    )
+
+    container = await service.run_container(image_id, "limited", resources=resources)
+    updated = await service.update_container_resources(
+        container.id, ContainerResources(cpus=2, memory=GIB)
+    )
+    with pytest.raises(ValueError, match="after creation"):
+        await service.update_container_resources(
+            container.id, ContainerResources(device_read_bps={"/dev/sda": 1})
+        )
+    with pytest.raises(ValueError, match="cpus"):
+        await service.run_container(
+            image_id, "greedy", resources=ContainerResources(cpus=8)
+        )
+
+    assert container.resources == resources
+    host_config = docker_daemon.find_container("limited")["HostConfig"]
+    assert host_config["NanoCpus"] == 2_000_000_000
+    assert host_config["BlkioDeviceWriteBps"] == [
+        {"Path": "/dev/sda", "Rate": 10 * 1024**2}
+    ]
+
+    assert (updated.cpus, updated.memory) == (2, GIB)
+    # Limits that weren't part of the update are kept
+    assert (updated.pids_limit, updated.cpuset_cpus) == (100, "0-2")
+    assert docker_daemon.find_container("greedy") is None
+
+
+FAKE_DOCKER = """
+import json, sys
+with open({calls!r}, "a") as calls:
+    calls.write(json.dumps(sys.argv[1:]) + "\\n")
+if sys.argv[1] == "info":
+    print(json.dumps({{"NCPU": 2, "MemTotal": 2 * 1024**3}}))
+"""
+
+
+@pytest.mark.anyio
+async def test_cli_passes_limits_as_flags(tmp_path, fake_docker_cli, cli_service):
+    calls = tmp_path / "calls"
+    fake_docker_cli(FAKE_DOCKER.format(calls=str(calls)))
+
+    await cli_service._create_container(
+        "nginx",
+        "web",
+        {},
+        {},
+        ContainerResources(
+            cpus=0.5, memory=256 * 1024**2, device_read_bps={"/dev/sda": 1000}
+        ),
+    )
+    with pytest.raises(ValueError, match="cpus"):
+        await cli_service.update_container_resources("web", ContainerResources(cpus=3))
+
+    commands = [json.loads(line) for line in calls.read_text().splitlines()]
+    run = commands[0]
+    assert run[:2] == ["run", "-d"] and run[-1] == "nginx"
+    assert ["--cpus", "0.5"] == run[run.index("--cpus") : run.index("--cpus") + 2]
+    assert run[run.index("--memory") + 1] == str(256 * 1024**2)
+    assert run[run.index("--device-read-bps") + 1] == "/dev/sda:1000"
+    # Checked against the host's 2 CPUs before anything is updated
+    assert [command[0] for command in commands[1:]] == ["info"]
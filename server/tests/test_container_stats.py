@@ -0,0 +1,83 @@
+import pytest
+
+from app.utils.container_stats import cli_stats_sample
+from app.utils.ring_buffer import RingBuffer
+
+
+def test_ring_buffer_keeps_the_newest_samples():
+    ring = RingBuffer(["cpu", "memory"], capacity=3)
+    assert ring.latest() is None
+    for second in range(5):
+        ring.append(second, {"cpu": second * 10.0})
+
+    assert len(ring) == 3
+    assert [sample["time"] for sample in ring.samples()] == [2, 3, 4]
+    assert ring.samples(since=3) == [{"time": 4, "cpu": 40.0, "memory": None}]
+    assert ring.latest()["cpu"] == 40.0
+    assert ring.nbytes == 3 * 3 * 8
+
+
+def test_cli_rows_are_parsed_into_numbers():
+    sample = cli_stats_sample(
+        {
+            "CPUPerc": "12.50%",
+            "MemUsage": "50MiB / 1.5GiB",
+            "MemPerc": "3.26%",
+            "NetIO": "1.2kB / 648B",
+            "BlockIO": "--",
+            "PIDs": "7",
+        }
+    )
+    assert sample["cpu_percent"] == 12.5
+    assert sample["memory_bytes"] == 50 * 1024**2
+    assert sample["memory_limit"] == 1.5 * 1024**3
+    assert (sample["net_rx_bytes"], sample["net_tx_bytes"]) == (1200, 648)
+    assert sample["block_read_bytes"] is None
+    assert sample["pids"] == 7
+
+
+@pytest.mark.anyio
+async def test_samples_running_containers_into_bounded_history(
+    docker_daemon, service, wait_for
+):
+    docker_daemon.stats_interval = 0.05
+    docker_daemon.add_image("nginx:latest")
+    web = docker_daemon.add_container("web", "nginx:latest")
+    docker_daemon.add_container("db", "nginx:latest")
+    docker_daemon.add_container("old", "nginx:latest", running=False)
+    sampler = service._stats
+    sampler.capacity = 5
+    sampler.refresh = 0.1
+    sampler.stale_after = 0.3
+
+    live = service.container_stats_events("web")
+    first = await live.__anext__()
+    await live.aclose()
+
+    await wait_for(lambda: len(sampler.history("db") or []) == 5)
+    latest = {stats.name: stats for stats in await service.container_stats()}
+    history = await service.container_stats_history("web")
+
+    docker_daemon.set_stopped(web)
+    await wait_for(lambda: sampler.history("web") is None)
+    metrics = service.container_stats_metrics()
+
+    event, stats = first
+    assert event == "stats" and stats.name == "web"
+
+    assert sorted(latest) == ["db", "web"]
+    db = latest["db"]
+    assert db.cpu_percent == 50.0
+    assert db.memory_bytes == 50 * 1024**2 and db.memory_limit == 1024**3
+    assert (db.block_read_bytes, db.pids) == (4096, 3)
+
+    assert len(history) == 5
+    assert [sample.time for sample in history] == sorted(
+        sample.time for sample in history
+    )
+    # Totals grow with every sample
+    assert history[-1].net_rx_bytes > history[0].net_rx_bytes
+
+    assert metrics["containers"] == 1
+    assert metrics["buffer_bytes"] == 5 * 10 * 8
+    assert metrics["subscribers"] == 0
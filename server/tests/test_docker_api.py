@@ -0,0 +1,107 @@
+import time
+
+import pytest
+
+from app.utils.docker_api import DockerAPIError, probe_socket
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_requests_share_a_keep_alive_connection(docker_daemon, docker_api):
+    docker_daemon.add_container("web", "nginx:latest")
+
+    pong = await docker_api.request("GET", "/_ping")
+    containers = await docker_api.request(
+        "GET",
+        "/containers/json",
+        params={"all": 1, "filters": {"name": ["web"]}},
+    )
+    images = await docker_api.request("GET", "/images/json")
+    assert pong == "OK"
+    assert [c["Names"] for c in containers] == [["/web"]]
+    assert images == []
+    assert docker_api.connections_opened == 1
+    assert docker_daemon.connections == 1
+    assert docker_daemon.requests[1] == (
+        "GET",
+        "/containers/json?all=1&filters=%7B%22name%22%3A+%5B%22web%22%5D%7D",
+    )
+
+
+async def test_error_status_raises_with_daemon_message(docker_daemon, docker_api):
+    with pytest.raises(DockerAPIError) as error:
+        await docker_api.request("GET", "/containers/missing/json")
+    assert error.value.status == 404
+    assert str(error.value) == "No such container: missing"
+    # The connection stays in the pool
+    assert await docker_api.request("GET", "/_ping") == "OK"
+    assert docker_daemon.connections == 1
+
+
+async def test_reconnects_after_daemon_drops_idle_connection(docker_daemon, docker_api):
+    await docker_api.request("GET", "/drop")
+    assert await docker_api.request("GET", "/_ping") == "OK"
+    assert docker_daemon.connections == 2
+
+
+async def test_stream_json_splits_documents_across_chunks(docker_api):
+    messages = [
+        message
+        async for message in docker_api.stream_json(
+            "POST", "/images/create", params={"fromImage": "nginx"}
+        )
+    ]
+    await docker_api.request("GET", "/_ping")
+    assert [message["status"] for message in messages] == [
+        "Pulling from library/nginx",
+        "Downloading",
+        "Pull complete",
+        "Done",
+    ]
+    assert messages[1]["progress"] == "[=>   ] 1MB/10MB"
+    # A fully read stream returns its connection
+    assert docker_api.connections_opened == 1
+
+
+async def test_logs_are_demultiplexed(docker_daemon, docker_api):
+    info = docker_daemon.add_container("web", "nginx:latest")
+    docker_daemon.logs[info["Id"]] = [(1, "starting\n"), (2, "crashed\n")]
+
+    frames = [frame async for frame in docker_api.stream_logs("web", tail=10)]
+    assert frames == [(1, b"starting\n"), (2, b"crashed\n")]
+
+
+def test_probe_socket(docker_daemon):
+    path = docker_daemon.server_address
+    assert probe_socket(path)["ApiVersion"] == "1.46"
+    assert probe_socket(path + ".missing") is None
+
+
+async def test_service_uses_engine_api(docker_daemon, service):
+    image_id = docker_daemon.add_image("nginx:latest")
+    web = docker_daemon.add_container("web", "nginx:latest", started_ago=60)
+    docker_daemon.add_image(None)
+
+    containers = await service.list_containers(all_containers=True)
+    images = await service.list_images()
+    await service.stop_container("web")
+    pulled = [event async for event in service.pull_image_events("nginx")]
+    assert [(c.id, c.name, c.image, c.status) for c in containers] == [
+        (web["Id"][:12], "web", "nginx:latest", "Up Less than a second")
+    ]
+    assert sorted(i.tag for i in images) == ["<none>", "nginx:latest"]
+    assert 59 <= time.time() - containers[0].created_at.timestamp() <= 62
+    # Container summaries don't say when it was last started or stopped
+    assert containers[0].updated_at is None
+    nginx = next(i for i in images if i.tag == "nginx:latest")
+    assert (nginx.size, nginx.shared_size, nginx.containers) == (1000, 500, 1)
+    assert abs(nginx.created_at.timestamp() - time.time()) < 5
+    assert pulled[1] == (
+        "log",
+        {"stream": "stdout", "line": "abc123: Downloading [=>   ] 1MB/10MB"},
+    )
+    assert pulled[-1][0] == "done"
+    assert pulled[-1][1].id == image_id[7:19]
+    assert web["State"]["Status"] == "exited"
+    # Images and their container counts are listed concurrently
+    assert docker_daemon.connections == 2
@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.utils.docker_mirror import DockerStateMirror, container_status
+
+
+def test_container_status_matches_docker_ps():
+    now = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+    def ago(**kwargs):
+        return (now - timedelta(**kwargs)).isoformat().replace("+00:00", "Z")
+
+    running = {"Status": "running", "Running": True, "StartedAt": ago(minutes=5)}
+    assert container_status(running, now) == "Up 5 minutes"
+    running["Health"] = {"Status": "healthy"}
+    assert container_status(running, now) == "Up 5 minutes (healthy)"
+    exited = {"Status": "exited", "ExitCode": 1, "FinishedAt": ago(hours=2)}
+    assert container_status(exited, now) == "Exited (1) 2 hours ago"
+    assert container_status({"Status": "created"}, now) == "Created"
+
+
+@pytest.fixture
+async def mirror(docker_api):
+    """State mirror of the fake daemon, stopped after the test"""
+    mirror = DockerStateMirror(docker_api)
+    yield mirror
+    await mirror.stop()
+
+
+@pytest.mark.anyio
+async def test_mirror_follows_events(docker_daemon, docker_api, mirror, wait_for):
+    web = docker_daemon.add_container("web", "nginx:latest", started_ago=300)
+
+    await mirror.start()
+    await wait_for(lambda: mirror.ready)
+    names = lambda: [c["Name"] for c in mirror.containers(True)]
+    assert names() == ["/web"]
+
+    db = docker_daemon.add_container("db", "postgres:16")
+    await wait_for(lambda: "/db" in names())
+    docker_daemon.set_stopped(db, exit_code=1)
+    await wait_for(lambda: len(mirror.containers()) == 1)
+    assert mirror.containers(True)[0]["State"]["ExitCode"] == 1
+
+    await docker_api.request("DELETE", f"/containers/{web['Id']}")
+    await wait_for(lambda: names() == ["/db"])
+
+    docker_daemon.add_image("nginx:latest")
+    await wait_for(lambda: len(mirror.images()) == 1)
+
+
+@pytest.mark.anyio
+async def test_mirror_resyncs_after_reconnect(docker_daemon, mirror, wait_for):
+    await mirror.start()
+    await wait_for(lambda: mirror.ready)
+    docker_daemon.disconnect_events()
+    # Changed while the stream is down
+    docker_daemon.add_container("web", "nginx:latest")
+    await wait_for(lambda: mirror.resyncs == 2 and mirror.ready)
+    assert [c["Name"] for c in mirror.containers(True)] == ["/web"]
+
+
+@pytest.mark.anyio
+async def test_refresh_racing_a_destroy_doesnt_bring_it_back(
+    docker_daemon, mirror, monkeypatch
+):
+    web = docker_daemon.add_container("web", "nginx:latest")
+    await mirror.resync()
+    stale = mirror.container(web["Id"])
+    inspected = asyncio.Event()
+
+    async def slow_inspect(reference):
+        # Answered before the container was removed, delivered after
+        await inspected.wait()
+        return stale
+
+    monkeypatch.setattr(mirror, "_inspect", slow_inspect)
+    refresh = asyncio.ensure_future(mirror.refresh_container("web"))
+    await asyncio.sleep(0)
+    await mirror._apply(
+        {"Type": "container", "Action": "destroy", "Actor": {"ID": web["Id"]}}
+    )
+    inspected.set()
+    await refresh
+
+    assert mirror.containers(True) == []
+
+
+@pytest.mark.anyio
+async def test_service_lists_from_the_mirror(docker_daemon, service, wait_for):
+    docker_daemon.add_image("nginx:latest")
+    docker_daemon.add_container("web", "nginx:latest", started_ago=120)
+
+    await service.start_state_mirror()
+    await wait_for(lambda: service._mirror.ready)
+    requests = len(docker_daemon.requests)
+    for _ in range(10):
+        containers = await service.list_containers()
+        images = await service.list_images()
+    assert len(docker_daemon.requests) == requests  # No daemon calls
+
+    # Our own changes show up right away, without waiting for events
+    await service.stop_container("web")
+    stopped = await service.list_containers(all_containers=True)
+    # Filtered listings come from the daemon but keep the mirror's times
+    filtered = await service._containers(True, {"name": "^web$"})
+    assert filtered[0].updated_at == stopped[0].updated_at
+
+    assert [(c.name, c.status) for c in containers] == [("web", "Up 2 minutes")]
+    assert [(i.tag, i.containers) for i in images] == [("nginx:latest", 1)]
+    assert await service.list_containers() == []
+    assert stopped[0].status.startswith("Exited (0)")
+    # Created two minutes ago, last changed when it was stopped
+    assert (stopped[0].updated_at - stopped[0].created_at).total_seconds() >= 119
@@ -183,6 +183,36 @@ def test_container_lifecycle():
     assert delete_response.status_code == 204
 
 
+def test_bulk_container_action():
+    """Test stopping and deleting containers in bulk"""
+    pull_response = client.post(
+        "/api/docker/images/pull?image_name=hello-world&tag=latest"
+    )
+    image_id = pull_response.json()["id"]
+    ids = []
+    for index in range(2):
+        container_data = {"image_id": image_id, "name": f"bulk-test-{index}"}
+        response = client.post("/api/docker/containers/run", json=container_data)
+        ids.append(response.json()["id"])
+
+    response = client.post(
+        "/api/docker/containers/bulk/stop", json={"ids": ids, "timeout": 1}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["action"], data["succeeded"], data["failed"]) == ("stop", 2, 0)
+
+    response = client.post("/api/docker/containers/bulk/delete", json={"ids": ids})
+    assert response.status_code == 200
+    assert [result["status"] for result in response.json()["results"]] == [
+        "succeeded",
+        "succeeded",
+    ]
+
+    response = client.post("/api/docker/containers/bulk/pause", json={"ids": ids})
+    assert response.status_code == 422
+
+
 def test_get_templates():
     """Test getting Dockerfile templates"""
     response = client.get("/api/docker/templates")
@@ -218,3 +248,84 @@ def test_create_dockerfile_from_template():
     assert data["name"] == dockerfile_data["name"]
     assert "id" in data
     assert "path" in data
+
+
+def test_build_job():
+    """Test building an image as a background job and following its events"""
+    dockerfile_data = {
+        "name": "build-job-dockerfile",
+        "content": "FROM ubuntu:latest\nRUN echo built",
+        "custom_path": None,
+    }
+    # The context manager keeps one event loop running for the background job
+    with TestClient(app) as job_client:
+        create_response = job_client.post(
+            "/api/docker/dockerfiles", json=dockerfile_data
+        )
+        dockerfile_id = create_response.json()["id"]
+
+        response = job_client.post(
+            "/api/docker/images/build/jobs",
+            json={"dockerfile_id": dockerfile_id, "tag": "build-job-test:latest"},
+        )
+        assert response.status_code == 202
+        job = response.json()
+        assert job["status"] in ("queued", "running")
+
+        events = job_client.get(f"/api/docker/images/build/jobs/{job['id']}/events")
+        assert "event: step" in events.text
+        assert "event: done" in events.text
+
+        response = job_client.get(f"/api/docker/images/build/jobs/{job['id']}")
+        data = response.json()
+        assert data["status"] == "succeeded"
+        assert data["image"]["tag"] == "build-job-test:latest"
+        assert data["steps"][0]["duration"] is not None
+
+        response = job_client.post(f"/api/docker/images/build/jobs/{job['id']}/cancel")
+        assert response.status_code == 400  # Already finished
+
+
+def test_build_batch():
+    """Test building several images in one request"""
+    dockerfile_ids = []
+    for index in range(2):
+        dockerfile_data = {
+            "name": f"batch-dockerfile-{index}",
+            "content": f"FROM ubuntu:latest\nRUN echo {index}",
+            "custom_path": None,
+        }
+        response = client.post("/api/docker/dockerfiles", json=dockerfile_data)
+        dockerfile_ids.append(response.json()["id"])
+
+    batch = {
+        "builds": [
+            {"dockerfile_id": dockerfile_id, "tag": f"batch-test:{index}"}
+            for index, dockerfile_id in enumerate(dockerfile_ids)
+        ],
+        "concurrency": 2,
+    }
+    response = client.post("/api/docker/images/build/batch", json=batch)
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["total"], data["succeeded"]) == (2, 2)
+    assert [r["image"]["tag"] for r in data["results"]] == [
+        "batch-test:0",
+        "batch-test:1",
+    ]
+
+    batch["builds"][0]["dockerfile_id"] = "missing"
+    response = client.post("/api/docker/images/build/batch/stream", json=batch)
+    assert response.status_code == 400
+
+
+def test_container_logs_rejects_bad_parameters():
+    """Test that log requests with invalid tail/since fail before streaming"""
+    response = client.get("/api/docker/containers/any/logs", params={"tail": -1})
+    assert response.status_code == 400
+
+    response = client.get(
+        "/api/docker/containers/any/logs", params={"since": "yesterday"}
+    )
+    assert response.status_code == 400
+    assert "since" in response.json()["detail"]
@@ -0,0 +1,83 @@
+import os
+import stat
+
+import pytest
+
+from app.utils import host_capabilities
+from app.utils.host_capabilities import HostCapabilities
+
+FAKE_BINARIES = {
+    "qemu-img": """#!/bin/sh
+case "$1" in
+  --version) echo "qemu-img version 8.2.2" ;;
+  --help) echo "usage: qemu-img"; echo "Supported formats: qcow2 raw vmdk" ;;
+esac
+""",
+    "qemu-system-x86_64": """#!/bin/sh
+case "$*" in
+  --version) echo "QEMU emulator version 8.2.2" ;;
+  "-accel help") printf 'Accelerators supported in QEMU binary:\\ntcg\\nkvm\\n' ;;
+  "-machine help") printf 'Supported machines are:\\npc  Standard PC\\nq35  Standard PC (Q35)\\n' ;;
+esac
+""",
+    "docker": """#!/bin/sh
+case "$1" in
+  --version) echo "Docker version 27.0.3" ;;
+  version) echo '{"Version":"27.0.3","ApiVersion":"1.46","Os":"linux","Arch":"amd64"}' ;;
+esac
+""",
+}
+
+
+@pytest.fixture
+def fake_host(tmp_path, monkeypatch):
+    """PATH containing only fake QEMU and Docker binaries"""
+    for name, script in FAKE_BINARIES.items():
+        path = tmp_path / name
+        path.write_text(script)
+        path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}/bin{os.pathsep}/usr/bin")
+    return tmp_path
+
+
+def test_probe_records_binaries_and_features(fake_host, monkeypatch):
+    monkeypatch.setattr(host_capabilities, "KVM_DEVICE", str(fake_host / "kvm"))
+    info = HostCapabilities().refresh()
+
+    assert info["binaries"]["qemu-img"]["path"] == str(fake_host / "qemu-img")
+    assert info["binaries"]["qemu-img"]["version"] == "qemu-img version 8.2.2"
+    assert info["qemu_img_formats"] == ["qcow2", "raw", "vmdk"]
+    assert info["accelerators"] == ["tcg", "kvm"]
+    assert info["machine_types"] == ["pc", "q35"]
+    assert info["docker_server"]["api_version"] == "1.46"
+    # KVM is listed by QEMU but the device is missing
+    assert info["kvm"] == {"present": False, "accessible": False}
+    assert info["preferred_accelerator"] == "tcg"
+
+
+def test_kvm_preferred_when_device_accessible(fake_host, monkeypatch):
+    device = fake_host / "kvm"
+    device.write_text("")
+    monkeypatch.setattr(host_capabilities, "KVM_DEVICE", str(device))
+
+    caps = HostCapabilities()
+    assert caps.preferred_accelerator == "kvm"
+
+
+def test_snapshot_probes_once_until_refresh(fake_host):
+    caps = HostCapabilities()
+    assert caps.has_binary("docker")
+
+    (fake_host / "docker").unlink()
+    assert caps.has_binary("docker")  # Cached result, no re-probe
+    caps.refresh()
+    assert not caps.has_binary("docker")
+
+
+def test_missing_binaries(tmp_path, monkeypatch):
+    monkeypatch.setenv("PATH", str(tmp_path))
+    info = HostCapabilities().refresh()
+
+    assert all(binary["path"] is None for binary in info["binaries"].values())
+    assert info["accelerators"] == []
+    assert info["docker_server"] is None
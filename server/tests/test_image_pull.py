@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+
+@pytest.mark.anyio
+async def test_concurrent_pulls_share_one_pull(docker_daemon, service, wait_for):
+    docker_daemon.pull_delay = 0.2
+
+    async def pull():
+        return [event async for event in service.pull_image_events("nginx", "1.27")]
+
+    await service.start_state_mirror()
+    await wait_for(lambda: service._mirror.ready)
+    first = asyncio.ensure_future(pull())
+    await asyncio.sleep(0.1)
+    second = asyncio.ensure_future(pull())
+    await asyncio.sleep(0.2)
+    # Joins once the layer is downloading
+    third = await pull()
+    first, second = await first, await second
+
+    pulls = [path for method, path in docker_daemon.requests if "create" in path]
+    assert len(pulls) == 1
+    # Resolved from the refreshed image list, not inspected afterwards
+    assert not any("/images/nginx" in path for _, path in docker_daemon.requests)
+
+    images = {events[-1][1].id for events in (first, second, third)}
+    assert images == {docker_daemon.find_image("nginx:1.27")["Id"][7:19]}
+
+    progress = [data for event, data in first if event == "progress"]
+    assert progress[0] == {
+        "layer": "abc123",
+        "status": "Downloading",
+        "current": 1000000,
+        "total": 10000000,
+        "layers_done": 0,
+        "layers": 1,
+    }
+    assert progress[-1]["layers_done"] == 1
+    assert ("progress", progress[-1]) in second
+    # The latecomer is told where the pull is up to
+    assert third[0][1]["line"] == "Joining the pull of nginx:1.27 in progress"
+    assert third[1] == ("progress", progress[0])
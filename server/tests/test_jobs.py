@@ -0,0 +1,98 @@
+import asyncio
+
+from app.models.base import JobStatus
+from app.services.docker_service import _build_step
+from app.utils.jobs import JobManager
+
+
+async def _build(release: asyncio.Event, fail: bool = False):
+    yield "log", {"stream": "stdout", "line": "Step 1/2 : FROM alpine"}
+    yield "step", {"step": 1, "total": 2, "instruction": "FROM alpine"}
+    yield "step", {"step": 2, "total": 2, "instruction": "RUN make"}
+    await release.wait()
+    if fail:
+        raise RuntimeError("make: *** [all] Error 1")
+    yield "done", {"id": "abc123"}
+
+
+def test_job_records_steps_and_replays_events_to_late_subscribers():
+    async def scenario():
+        manager = JobManager("build")
+        release = asyncio.Event()
+        job = manager.submit(_build(release), {"tag": "app"})
+        assert job.status == JobStatus.QUEUED
+
+        live = asyncio.ensure_future(_collect(job.subscribe()))
+        await asyncio.sleep(0.05)
+        assert job.status == JobStatus.RUNNING
+        assert job.progress["step"] == 2
+        assert job.steps[0]["duration"] is not None
+        release.set()
+        live_events = await live
+
+        late_events = await _collect(job.subscribe())
+        return job, live_events, late_events
+
+    job, live_events, late_events = asyncio.run(scenario())
+    assert job.status == JobStatus.SUCCEEDED
+    assert job.result == {"id": "abc123"}
+    assert job.steps[-1]["duration"] is not None
+    assert [event for event, _ in live_events] == ["log", "step", "step", "done"]
+    assert late_events == live_events
+
+
+def test_job_failure_and_cancellation():
+    async def scenario():
+        manager = JobManager("build")
+        failing = asyncio.Event()
+        failing.set()
+        failed = manager.submit(_build(failing, fail=True), {})
+        cancelled = manager.submit(_build(asyncio.Event()), {})
+        await asyncio.sleep(0.05)
+
+        assert await cancelled.cancel() is True
+        assert await cancelled.cancel() is False  # Already finished
+        return failed, cancelled, await _collect(cancelled.subscribe())
+
+    failed, cancelled, events = asyncio.run(scenario())
+    assert failed.status == JobStatus.FAILED
+    assert failed.error == "make: *** [all] Error 1"
+    assert cancelled.status == JobStatus.CANCELLED
+    assert events[-1] == ("cancelled", {"detail": "Cancelled"})
+
+
+def test_manager_keeps_running_jobs_and_recent_finished_ones():
+    async def scenario():
+        manager = JobManager("build", retain=1)
+        done = asyncio.Event()
+        done.set()
+        running = manager.submit(_build(asyncio.Event()), {})
+        first = manager.submit(_build(done), {})
+        await asyncio.sleep(0.05)
+        second = manager.submit(_build(done), {})
+        await asyncio.sleep(0.05)
+        manager.submit(_build(done), {})  # Prunes down to one finished job
+        listed = manager.list()
+        await manager.close()
+        return listed, running, first, second
+
+    listed, running, first, second = asyncio.run(scenario())
+    assert running in listed and second in listed
+    assert first not in listed
+    assert running.status == JobStatus.CANCELLED
+
+
+def test_build_step_parsing():
+    assert _build_step("Step 3/7 : RUN pip install -r requirements.txt") == {
+        "step": 3,
+        "total": 7,
+        "instruction": "RUN pip install -r requirements.txt",
+        "stage": None,
+    }
+    assert _build_step("#9 [builder 2/5] COPY . .")["stage"] == "builder"
+    assert _build_step("#5 [2/4] RUN make")["step"] == 2
+    assert _build_step("#5 DONE 1.2s") is None
+
+
+async def _collect(events):
+    return [event async for event in events]
@@ -0,0 +1,56 @@
+import json
+import os
+
+from app.utils.metadata_cache import MetadataCache, get_metadata_cache
+
+
+def test_load_creates_empty_file(tmp_path):
+    """Test that a missing metadata file is created empty"""
+    path = tmp_path / "metadata.json"
+    cache = MetadataCache(str(path))
+    assert path.exists()
+    assert cache.load() == {}
+
+
+def test_save_then_load_does_not_reparse(tmp_path, monkeypatch):
+    """Test that reads after a write are served from memory"""
+    cache = MetadataCache(str(tmp_path / "metadata.json"))
+    cache.save({"a": {"name": "disk-a"}})
+
+    def fail_read():
+        raise AssertionError("metadata file was re-read")
+
+    monkeypatch.setattr(cache, "_read_file", fail_read)
+    assert cache.load() == {"a": {"name": "disk-a"}}
+
+
+def test_load_returns_private_copy(tmp_path):
+    """Test that mutating a loaded dict does not leak into the cache"""
+    cache = MetadataCache(str(tmp_path / "metadata.json"))
+    cache.save({"a": {"in_use": False}})
+
+    metadata = cache.load()
+    metadata["a"]["in_use"] = True
+    metadata["b"] = {}
+
+    assert cache.load() == {"a": {"in_use": False}}
+
+
+def test_external_write_invalidates_cache(tmp_path):
+    """Test that a write by another process is picked up"""
+    path = tmp_path / "metadata.json"
+    cache = MetadataCache(str(path))
+    cache.save({"a": {"name": "old"}})
+
+    # Simulate another process replacing the file (new inode)
+    replacement = tmp_path / "metadata.json.tmp"
+    replacement.write_text(json.dumps({"a": {"name": "new"}, "b": {"name": "b"}}))
+    os.replace(replacement, path)
+
+    assert cache.load() == {"a": {"name": "new"}, "b": {"name": "b"}}
+
+
+def test_get_metadata_cache_is_shared(tmp_path):
+    """Test that one cache exists per metadata file"""
+    path = str(tmp_path / "metadata.json")
+    assert get_metadata_cache(path) is get_metadata_cache(path)
@@ -0,0 +1,268 @@
+import json
+import multiprocessing
+import time
+
+import pytest
+from app.utils.metadata_journal import JournalMetadataStore
+from app.utils.metadata_store import (
+    JsonMetadataStore,
+    MetadataStore,
+    SqliteMetadataStore,
+    migrate_json_to_sqlite,
+    open_metadata_store,
+)
+
+
+def _open_backend(backend, folder):
+    if backend == "json":
+        return JsonMetadataStore(f"{folder}/metadata.json", "vms")
+    if backend == "journal":
+        return JournalMetadataStore(folder, "vms", compact_threshold=7)
+    return SqliteMetadataStore(f"{folder}/metadata.db")
+
+
+def _increment_worker(backend, folder, times):
+    # Reuses the store inherited from the parent, like a forked uvicorn worker
+    store = open_metadata_store(folder, "vms", backend)
+    for _ in range(times):
+        with store.locked():
+            record = store.get("vms", "counter")
+            store.put("vms", "counter", {"id": "counter", "value": record["value"] + 1})
+
+
+def _hold_lock_worker(backend, folder, held, seconds):
+    store = open_metadata_store(folder, "vms", backend)
+    with store.locked():
+        held.set()
+        time.sleep(seconds)
+
+
+def _migrate_worker(folder, results):
+    store = SqliteMetadataStore(f"{folder}/metadata.db")
+    results.put(migrate_json_to_sqlite(f"{folder}/metadata.json", store, "vms"))
+    store.close()
+
+
+@pytest.fixture(params=["json", "sqlite", "journal"])
+def store(request, tmp_path):
+    """Provide each metadata backend"""
+    store = _open_backend(request.param, str(tmp_path))
+    yield store
+    store.close()
+
+
+def test_put_get_delete(store):
+    """Test basic record lifecycle"""
+    store.put("vms", "vm-1", {"id": "vm-1", "name": "web", "status": "stopped"})
+    assert store.get("vms", "vm-1")["name"] == "web"
+    assert list(store.all("vms")) == ["vm-1"]
+
+    assert store.delete("vms", "vm-1") is True
+    assert store.get("vms", "vm-1") is None
+    assert store.delete("vms", "vm-1") is False
+
+
+def test_update_merges_fields(store):
+    """Test that update only touches the given fields"""
+    store.put("vms", "vm-1", {"id": "vm-1", "name": "web", "status": "stopped"})
+    updated = store.update("vms", "vm-1", {"status": "running", "pid": 42})
+    assert updated == {"id": "vm-1", "name": "web", "status": "running", "pid": 42}
+    assert store.get("vms", "vm-1") == updated
+    assert store.update("vms", "missing", {"status": "running"}) is None
+
+
+def test_find_by_indexed_and_plain_fields(store):
+    """Test equality lookups"""
+    store.put(
+        "vms", "a", {"id": "a", "disk_id": "d1", "status": "running", "cpu_cores": 2}
+    )
+    store.put(
+        "vms", "b", {"id": "b", "disk_id": "d2", "status": "running", "cpu_cores": 1}
+    )
+    store.put(
+        "vms", "c", {"id": "c", "disk_id": "d1", "status": "stopped", "cpu_cores": 2}
+    )
+
+    assert sorted(r["id"] for r in store.find("vms", status="running")) == ["a", "b"]
+    assert [r["id"] for r in store.find("vms", disk_id="d1", status="stopped")] == ["c"]
+    assert sorted(r["id"] for r in store.find("vms", cpu_cores=2)) == ["a", "c"]
+
+
+def test_collections_are_separate(store):
+    """Test that records in different collections don't mix"""
+    store.put("images", "x", {"id": "x", "tag": "app:latest"})
+    store.put("dockerfiles", "x", {"id": "x", "name": "app"})
+    assert store.get("images", "x") == {"id": "x", "tag": "app:latest"}
+    assert [r["id"] for r in store.find("images", tag="app:latest")] == ["x"]
+
+
+def test_migrate_json_to_sqlite(tmp_path):
+    """Test the one-shot migration of a nested metadata.json"""
+    json_path = tmp_path / "metadata.json"
+    json_path.write_text(
+        json.dumps(
+            {
+                "dockerfiles": {"f1": {"id": "f1", "name": "app"}},
+                "images": {"i1": {"id": "i1", "tag": "app:1"}},
+            }
+        )
+    )
+    store = SqliteMetadataStore(str(tmp_path / "metadata.db"))
+
+    assert migrate_json_to_sqlite(str(json_path), store) == 2
+    assert store.get("dockerfiles", "f1")["name"] == "app"
+    assert store.find("images", tag="app:1")[0]["id"] == "i1"
+
+    # Second run is a no-op even if the JSON file changed
+    json_path.write_text(json.dumps({"images": {"i2": {"id": "i2"}}}))
+    assert migrate_json_to_sqlite(str(json_path), store) == 0
+    assert store.get("images", "i2") is None
+    store.close()
+
+
+def test_journal_replays_after_restart(tmp_path):
+    """Test that journal entries survive a restart"""
+    store = JournalMetadataStore(str(tmp_path), "vms")
+    store.put("vms", "a", {"id": "a", "status": "stopped"})
+    store.update("vms", "a", {"status": "running"})
+    store.put("vms", "b", {"id": "b"})
+    store.delete("vms", "b")
+    store.close()
+
+    # The snapshot is untouched until compaction
+    assert not (tmp_path / "metadata.json").exists()
+
+    reopened = JournalMetadataStore(str(tmp_path), "vms")
+    assert reopened.all("vms") == {"a": {"id": "a", "status": "running"}}
+    assert reopened.stats()["replayed_entries"] == 4
+    reopened.close()
+
+
+def test_journal_drops_torn_tail(tmp_path):
+    """Test that a partially written last entry is discarded"""
+    store = JournalMetadataStore(str(tmp_path), "vms")
+    store.put("vms", "a", {"id": "a"})
+    store.close()
+    with open(tmp_path / "metadata.journal", "a") as f:
+        f.write('{"op": "put", "collection": "vms", "key": "b"')
+
+    reopened = JournalMetadataStore(str(tmp_path), "vms")
+    assert list(reopened.all("vms")) == ["a"]
+    assert reopened.stats()["discarded_bytes"] > 0
+    reopened.put("vms", "c", {"id": "c"})
+    reopened.close()
+
+    assert sorted(JournalMetadataStore(str(tmp_path), "vms").all("vms")) == ["a", "c"]
+
+
+def test_journal_compaction_writes_legacy_snapshot(tmp_path):
+    """Test that compaction folds the journal into metadata.json"""
+    store = JournalMetadataStore(str(tmp_path), "vms")
+    for i in range(5):
+        store.put("vms", str(i), {"id": str(i)})
+    store.compact()
+
+    assert sorted(json.loads((tmp_path / "metadata.json").read_text())) == [
+        "0",
+        "1",
+        "2",
+        "3",
+        "4",
+    ]
+    assert (tmp_path / "metadata.journal").read_text() == ""
+    stats = store.stats()
+    assert stats["journal_entries"] == 0
+    assert stats["compactions"] == 1
+    store.close()
+
+
+def test_journal_background_compaction(tmp_path):
+    """Test that crossing the threshold compacts in the background"""
+    store = JournalMetadataStore(str(tmp_path), "vms", compact_threshold=3)
+    for i in range(3):
+        store.put("vms", str(i), {"id": str(i)})
+
+    for _ in range(100):
+        if store.stats()["compactions"]:
+            break
+        time.sleep(0.01)
+    assert store.stats()["compactions"] == 1
+    store.close()
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite", "journal"])
+def test_locked_read_modify_write_across_processes(backend, tmp_path):
+    """Test that concurrent worker processes don't lose updates"""
+    store = open_metadata_store(str(tmp_path), "vms", backend)
+    store.put("vms", "counter", {"id": "counter", "value": 0})
+
+    ctx = multiprocessing.get_context("fork")
+    workers = [
+        ctx.Process(target=_increment_worker, args=(backend, str(tmp_path), 25))
+        for _ in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert all(worker.exitcode == 0 for worker in workers)
+    assert store.get("vms", "counter")["value"] == 100
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite", "journal"])
+def test_writes_wait_for_another_process_lock(backend, tmp_path):
+    """Test that plain writes don't slip into another worker's locked section"""
+    store = open_metadata_store(str(tmp_path), "vms", backend)
+    store.put("vms", "vm1", {"id": "vm1", "status": "running"})
+
+    ctx = multiprocessing.get_context("fork")
+    held = ctx.Event()
+    holder = ctx.Process(
+        target=_hold_lock_worker, args=(backend, str(tmp_path), held, 0.5)
+    )
+    holder.start()
+    assert held.wait(10)
+    started = time.monotonic()
+    store.update("vms", "vm1", {"status": "stopped"})
+    store.delete("vms", "vm1")
+    waited = time.monotonic() - started
+    holder.join()
+
+    assert holder.exitcode == 0
+    assert waited >= 0.3
+    store.close()
+
+
+def test_incomplete_backend_cannot_be_created():
+    class ReadOnlyStore(MetadataStore):
+        def all(self, collection):
+            return {}
+
+        def get(self, collection, key):
+            return None
+
+    with pytest.raises(TypeError):
+        ReadOnlyStore()
+
+
+def test_concurrent_workers_migrate_once(tmp_path):
+    records = {f"vm{i}": {"id": f"vm{i}"} for i in range(50)}
+    (tmp_path / "metadata.json").write_text(json.dumps(records))
+
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    workers = [
+        ctx.Process(target=_migrate_worker, args=(str(tmp_path), results))
+        for _ in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    counts = sorted(results.get(timeout=30) for _ in workers)
+    for worker in workers:
+        worker.join()
+
+    assert counts == [0, 0, 0, 50]
+    store = SqliteMetadataStore(str(tmp_path / "metadata.db"))
+    assert len(store.all("vms")) == 50
+    store.close()
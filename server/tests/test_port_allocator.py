@@ -0,0 +1,132 @@
+import socket
+
+import pytest
+
+from app.services import docker_service
+from app.utils.port_allocator import PortAllocator, PortConflictError, parse_port_range
+
+
+def test_parse_port_range():
+    assert parse_port_range("30000-32767") == (30000, 32767)
+    assert parse_port_range("2222") == (2222, 2222)
+    for spec in ("ssh", "10-5", "0-10", "60000-70000"):
+        with pytest.raises(ValueError):
+            parse_port_range(spec)
+
+
+def test_allocates_each_port_once_and_skips_busy_ones(port_allocator):
+    with socket.socket() as busy:
+        busy.bind(("", 42201))
+        busy.listen()
+        first = port_allocator.allocate("vm:a", "vm")
+        second = port_allocator.allocate("vm:b", "vm", count=2)
+
+    assert first == [42200]
+    # 42201 has a listener on the host
+    assert second == [42202, 42203]
+    # Asking again returns the owner's lease instead of a new port
+    assert port_allocator.allocate("vm:a", "vm") == [42200]
+
+    assert port_allocator.release("vm:a") == [42200]
+    # Released ports go to the back of the line
+    assert port_allocator.allocate("vm:c", "vm") == [42204]
+    assert [lease["owner"] for lease in port_allocator.leases()] == [
+        "vm:b",
+        "vm:b",
+        "vm:c",
+    ]
+
+
+def test_exhausted_pool_leases_nothing(port_allocator):
+    port_allocator.allocate("container:big", "container", count=8)
+    with pytest.raises(RuntimeError, match="No free ports"):
+        port_allocator.allocate("container:more", "container", count=3)
+    assert port_allocator.leases("container:more") == []
+    assert port_allocator.metrics()["pools"]["container"]["leased"] == 8
+
+
+def test_reserve_is_all_or_nothing(port_allocator):
+    port_allocator.reserve("container:web", [8080, 8443])
+    port_allocator.reserve("container:web", [8080])
+
+    with pytest.raises(PortConflictError, match="leased to container:web") as error:
+        port_allocator.reserve("container:api", [9000, 8443])
+    assert error.value.port == 8443
+    assert port_allocator.leases("container:api") == []
+
+    assert port_allocator.release_missing("container:", {"container:db"}) == [
+        8080,
+        8443,
+    ]
+    assert port_allocator.metrics()["other_leases"] == 0
+
+
+def test_overlapping_pools_are_rejected(port_allocator):
+    with pytest.raises(ValueError, match="overlap"):
+        PortAllocator(port_allocator.store, {"vm": (100, 200), "container": (150, 300)})
+
+
+@pytest.mark.anyio
+async def test_containers_lease_published_ports(
+    docker_daemon, service, port_allocator, monkeypatch
+):
+    # Nothing listens on the published ports
+    monkeypatch.setattr(docker_service, "CONTAINER_READY_TIMEOUT", 0.1)
+    image_id = docker_daemon.add_image("nginx:latest")[7:19]
+
+    web = await service.run_container(
+        image_id, "web", {"42150": "80"}, auto_ports=["443", "9000/udp"]
+    )
+    with pytest.raises(PortConflictError, match="42150"):
+        await service.run_container(image_id, "copy", {"42150": "80"})
+    leased = port_allocator.leases("container:web")
+    await service.delete_container(web.id)
+
+    assert [lease["port"] for lease in leased] == [42150, 42300, 42301]
+    assert docker_daemon.find_container("copy") is None
+    assert port_allocator.leases() == []
+
+
+@pytest.mark.anyio
+async def test_leases_of_removed_containers_are_reclaimed(
+    docker_daemon, service, port_allocator, monkeypatch
+):
+    # Nothing listens on the published ports
+    monkeypatch.setattr(docker_service, "CONTAINER_READY_TIMEOUT", 0.1)
+    image_id = docker_daemon.add_image("nginx:latest")[7:19]
+    port_allocator.reserve("container:gone", [42150])
+
+    await service.run_container(image_id, "web", {"42150": "80"})
+    bindings = docker_daemon.find_container("web")["HostConfig"]["PortBindings"]
+    assert bindings == {"80/tcp": [{"HostPort": "42150"}]}
+    assert [lease["owner"] for lease in port_allocator.leases()] == ["container:web"]
+
+
+@pytest.mark.anyio
+async def test_reused_container_leases_its_ports_again(
+    docker_daemon, service, port_allocator, monkeypatch
+):
+    # Nothing listens on the published ports
+    monkeypatch.setattr(docker_service, "CONTAINER_READY_TIMEOUT", 0.1)
+    image_id = docker_daemon.add_image("nginx:latest")[7:19]
+
+    web = await service.run_container(
+        image_id, "web", {"42150": "80"}, auto_ports=["443"]
+    )
+    await service.stop_container(web.id)
+    port_allocator.release("container:web")  # e.g. reclaimed while stopped
+
+    with pytest.raises(ValueError, match="different published ports"):
+        await service.run_container(image_id, "web", {"42151": "80"})
+    with pytest.raises(ValueError, match="different published ports"):
+        await service.run_container(image_id, "web", {"42150": "80"})
+    assert port_allocator.leases() == []
+
+    port_allocator.reserve("vm:other", [42150])
+    with pytest.raises(PortConflictError, match="42150"):
+        await service.run_container(image_id, "web")
+    port_allocator.release("vm:other")
+
+    await service.run_container(image_id, "web", {"42150": "80"}, auto_ports=["443"])
+    leased = [lease["port"] for lease in port_allocator.leases("container:web")]
+    assert leased == [42150, 42300]
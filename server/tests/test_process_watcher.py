@@ -0,0 +1,144 @@
+import os
+import sys
+import asyncio
+import subprocess
+
+from app.utils.process_watcher import ProcessWatcher
+
+
+def _spawn(code: str) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "-c", code])
+
+
+async def _wait_for_exit(watcher: ProcessWatcher, process, pass_process=True):
+    """Watch a process and return what the callback received"""
+    exited = asyncio.get_running_loop().create_future()
+    watcher.watch(
+        process.pid,
+        lambda pid, return_code: exited.set_result((pid, return_code)),
+        process if pass_process else None,
+    )
+    return await asyncio.wait_for(exited, timeout=10)
+
+
+def test_child_exit_reports_return_code():
+    async def scenario():
+        watcher = ProcessWatcher()
+        await watcher.start()
+        process = _spawn("import sys, time; time.sleep(0.2); sys.exit(3)")
+        try:
+            return await _wait_for_exit(watcher, process), process
+        finally:
+            await watcher.stop()
+
+    (pid, return_code), process = asyncio.run(scenario())
+    assert pid == process.pid
+    assert return_code == 3
+    assert process.returncode == 3  # Reaped, not left as a zombie
+
+
+def test_watch_before_start_is_registered_on_start():
+    async def scenario():
+        watcher = ProcessWatcher()
+        process = _spawn("pass")
+        exited = []
+        watcher.watch(process.pid, lambda pid, rc: exited.append(rc), process)
+        assert watcher.is_watching(process.pid)
+        await watcher.start()
+        for _ in range(100):
+            if exited:
+                break
+            await asyncio.sleep(0.05)
+        await watcher.stop()
+        return exited
+
+    assert asyncio.run(scenario()) == [0]
+
+
+def test_waitpid_fallback_without_pidfd(monkeypatch):
+    monkeypatch.delattr(os, "pidfd_open", raising=False)
+
+    async def scenario():
+        watcher = ProcessWatcher()
+        await watcher.start()
+        try:
+            return await _wait_for_exit(watcher, _spawn("import sys; sys.exit(1)"))
+        finally:
+            await watcher.stop()
+
+    _, return_code = asyncio.run(scenario())
+    assert return_code == 1
+
+
+def test_polling_fallback_for_foreign_process(monkeypatch):
+    monkeypatch.delattr(os, "pidfd_open", raising=False)
+
+    async def scenario():
+        watcher = ProcessWatcher(poll_interval=0.05)
+        await watcher.start()
+        process = _spawn("import time; time.sleep(0.2)")
+        try:
+            # Without the Popen the watcher can't wait on it and must poll
+            return await _wait_for_exit(watcher, process, pass_process=False)
+        finally:
+            await watcher.stop()
+            process.wait()
+
+    _, return_code = asyncio.run(scenario())
+    assert return_code is None
+
+
+def test_stop_parks_watches_for_next_start():
+    async def scenario():
+        watcher = ProcessWatcher()
+        process = _spawn("import time; time.sleep(0.3)")
+        exited = []
+        await watcher.start()
+        watcher.watch(process.pid, lambda pid, rc: exited.append(rc), process)
+        await watcher.stop()
+        assert watcher.is_watching(process.pid)
+
+        await watcher.start()
+        for _ in range(100):
+            if exited:
+                break
+            await asyncio.sleep(0.05)
+        await watcher.stop()
+        return exited
+
+    assert asyncio.run(scenario()) == [0]
+
+
+def test_watch_starts_the_watcher_when_start_was_never_called():
+    async def scenario():
+        watcher = ProcessWatcher()
+        try:
+            return await _wait_for_exit(watcher, _spawn("import sys; sys.exit(2)"))
+        finally:
+            await watcher.stop()
+
+    _, return_code = asyncio.run(scenario())
+    assert return_code == 2
+
+
+def test_watch_moves_to_a_new_loop_once_the_old_one_closed():
+    watcher = ProcessWatcher()
+    process = _spawn("import time; time.sleep(0.3)")
+    exited = []
+
+    async def first():
+        watcher.watch(process.pid, lambda pid, rc: exited.append(rc), process)
+
+    async def second():
+        other = _spawn("pass")
+        await _wait_for_exit(watcher, other)
+        for _ in range(100):
+            if exited:
+                break
+            await asyncio.sleep(0.05)
+        await watcher.stop()
+
+    # e.g. a TestClient without a context manager: one loop per request
+    asyncio.run(first())
+    asyncio.run(second())
+    assert exited == [0]
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from app.utils.scheduler import OperationScheduler, Priority
+
+
+def test_limit_bounds_concurrency():
+    async def scenario():
+        scheduler = OperationScheduler({"build": 2})
+        running = peak = 0
+
+        async def job():
+            nonlocal running, peak
+            async with scheduler.slot("build"):
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(job() for _ in range(10)))
+        return peak, scheduler.metrics()["build"]
+
+    peak, metrics = asyncio.run(scenario())
+    assert peak == 2
+    assert metrics["running"] == 0
+    assert metrics["queued"] == 0
+    assert metrics["acquired"] == 10
+    assert metrics["peak_queued"] == 8
+    assert metrics["max_wait_seconds"] > 0
+
+
+def test_interactive_work_jumps_the_queue():
+    async def scenario():
+        scheduler = OperationScheduler({"docker": 1})
+        order = []
+        await scheduler.acquire("docker")  # Occupy the only slot
+
+        async def job(name, priority):
+            async with scheduler.slot("docker", priority):
+                order.append(name)
+
+        tasks = [
+            asyncio.ensure_future(job("bulk-1", Priority.BULK)),
+            asyncio.ensure_future(job("normal", Priority.NORMAL)),
+            asyncio.ensure_future(job("bulk-2", Priority.BULK)),
+            asyncio.ensure_future(job("stop", Priority.INTERACTIVE)),
+        ]
+        await asyncio.sleep(0)
+        queued = scheduler.metrics()["docker"]["queued_by_priority"]
+        scheduler.release("docker")
+        await asyncio.gather(*tasks)
+        return order, queued
+
+    order, queued = asyncio.run(scenario())
+    assert order == ["stop", "normal", "bulk-1", "bulk-2"]
+    assert queued == {"interactive": 1, "normal": 1, "bulk": 2}
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def scenario():
+        scheduler = OperationScheduler({"pull": 1})
+        await scheduler.acquire("pull")
+        waiter = asyncio.ensure_future(scheduler.acquire("pull"))
+        await asyncio.sleep(0)
+        assert scheduler.metrics()["pull"]["queued"] == 1
+
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        queued = scheduler.metrics()["pull"]["queued"]
+        scheduler.release("pull")
+        return queued, scheduler.metrics()["pull"]["running"]
+
+    assert asyncio.run(scenario()) == (0, 0)
+
+
+def test_unknown_class_and_unscheduled_slot():
+    async def scenario():
+        scheduler = OperationScheduler({"build": 1})
+        async with scheduler.slot(None):
+            pass
+        with pytest.raises(ValueError):
+            await scheduler.acquire("nope")
+
+    asyncio.run(scenario())
+
+
+def test_release_later_and_flush():
+    async def scenario():
+        scheduler = OperationScheduler({"vm_boot": 1})
+        await scheduler.acquire("vm_boot")
+        scheduler.release_later("vm_boot", 0.05)
+        await asyncio.sleep(0.1)
+        after_delay = scheduler.metrics()["vm_boot"]["running"]
+
+        await scheduler.acquire("vm_boot")
+        scheduler.release_later("vm_boot", 60)
+        scheduler.flush_delayed_releases()
+        return after_delay, scheduler.metrics()["vm_boot"]["running"]
+
+    assert asyncio.run(scenario()) == (0, 0)
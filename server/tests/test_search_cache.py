@@ -0,0 +1,110 @@
+import asyncio
+import json
+
+import pytest
+
+from app.utils.search_cache import SearchCache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _result(name, description=""):
+    return {"name": name, "description": description}
+
+
+def test_entries_expire_after_the_ttl():
+    clock = _Clock()
+    cache = SearchCache(ttl=60, max_entries=10, limit=25, clock=clock)
+    cache.put("Nginx ", [_result("nginx")])
+
+    assert cache.get("nginx") == [_result("nginx")]
+    clock.now = 60
+    assert cache.get("nginx") is None
+    assert cache.metrics()["entries"] == 0
+
+
+def test_least_recently_used_query_is_evicted():
+    cache = SearchCache(ttl=60, max_entries=2, limit=25, clock=_Clock())
+    cache.put("redis", [])
+    cache.put("postgres", [])
+    cache.get("redis")
+    cache.put("mysql", [])
+
+    assert cache.get("postgres") is None
+    assert cache.get("redis") == [] and cache.get("mysql") == []
+    assert cache.metrics()["evictions"] == 1
+
+
+def test_longer_query_is_served_from_a_complete_shorter_one():
+    clock = _Clock()
+    cache = SearchCache(ttl=60, max_entries=10, limit=3, clock=clock)
+    cache.put("ngi", [_result("nginx", "Official build"), _result("angie")])
+
+    assert cache.get("nginx") == [_result("nginx", "Official build")]
+    # Derived entries expire with the results they came from
+    clock.now = 60
+    assert cache.get("nginx") is None
+
+    # A result set at the limit may be missing matches for the longer query
+    cache.put("ngi", [_result("nginx"), _result("angie"), _result("ngircd")])
+    assert cache.get("nginx") is None
+    assert cache.metrics()["prefix_hits"] == 1
+
+
+FAKE_DOCKER = """
+import json, sys
+with open({log!r}, "a") as log:
+    log.write(json.dumps(sys.argv[1:]) + "\\n")
+rows = [
+    {{"Name": "nginx", "Description": "Official build of Nginx.",
+      "StarCount": "20000", "IsOfficial": "[OK]", "IsAutomated": ""}},
+    {{"Name": "bitnami/nginx", "Description": "Bitnami container image for NGINX",
+      "StarCount": "200", "IsOfficial": "", "IsAutomated": "[OK]"}},
+]
+for row in rows:
+    print(json.dumps(row))
+"""
+
+
+@pytest.mark.anyio
+async def test_service_searches_once_through_the_cli(
+    tmp_path, fake_docker_cli, cli_service
+):
+    log = tmp_path / "docker.log"
+    fake_docker_cli(FAKE_DOCKER.format(log=str(log)))
+
+    first, concurrent = await asyncio.gather(
+        cli_service.search_image("ngin"), cli_service.search_image("NGIN ")
+    )
+    narrowed = await cli_service.search_image("ngin bitnami")
+    calls = [json.loads(line) for line in log.read_text().splitlines()]
+    assert len(calls) == 1
+    assert calls[0][-3:] == ["--format", "{{json .}}", "ngin"]
+
+    assert first == concurrent
+    assert first[0] == {
+        "name": "nginx",
+        "description": "Official build of Nginx.",
+        "stars": 20000,
+        "official": True,
+        "automated": False,
+    }
+    assert [result["name"] for result in narrowed] == ["bitnami/nginx"]
+
+    metrics = cli_service.search_cache_metrics()
+    assert (metrics["prefix_hits"], metrics["coalesced"]) == (1, 1)
+
+
+@pytest.mark.anyio
+async def test_service_searches_once_through_the_api(docker_daemon, service):
+    first, second = [await service.search_image("redis") for _ in range(2)]
+    searches = [path for _, path in docker_daemon.requests if "search" in path]
+    assert len(searches) == 1
+    assert first == second
+    assert first[0]["name"] == "redis" and first[0]["official"] is True
@@ -0,0 +1,51 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.models.disk import ConvertDiskRequest
+from app.utils.sse import event_stream_response, format_sse
+
+
+def test_format_sse_encodes_models():
+    text = format_sse("done", ConvertDiskRequest(format="raw"))
+    assert text == 'event: done\ndata: {"format": "raw", "name": null}\n\n'
+
+
+def _client(events_factory):
+    app = FastAPI()
+
+    @app.get("/events")
+    def events():
+        return event_stream_response(events_factory())
+
+    return TestClient(app)
+
+
+def test_events_are_streamed_in_order():
+    async def events():
+        for i in range(3):
+            await asyncio.sleep(0)
+            yield "progress", {"percent": i * 50}
+        yield "done", {"ok": True}
+
+    response = _client(events).get("/events")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text == (
+        format_sse("progress", {"percent": 0})
+        + format_sse("progress", {"percent": 50})
+        + format_sse("progress", {"percent": 100})
+        + format_sse("done", {"ok": True})
+    )
+
+
+def test_failure_becomes_error_event():
+    async def events():
+        yield "log", {"line": "starting"}
+        raise RuntimeError("Failed to build Docker image: boom")
+
+    response = _client(events).get("/events")
+    assert response.text.endswith(
+        format_sse("error", {"detail": "Failed to build Docker image: boom"})
+    )
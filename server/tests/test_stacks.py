@@ -0,0 +1,165 @@
+import asyncio
+import copy
+
+import pytest
+
+from app.models.base import JobStatus
+from app.models.docker import StackCreate
+from app.utils.dependency_graph import (
+    DependencyFailedError,
+    run_in_dependency_order,
+    topological_order,
+)
+
+
+def test_topological_order_checks_the_graph():
+    graph = {"app": ["db", "cache"], "db": [], "cache": ["db"]}
+    assert topological_order(graph) == ["db", "cache", "app"]
+    with pytest.raises(ValueError, match="unknown queue"):
+        topological_order({"app": ["queue"]})
+    with pytest.raises(ValueError, match="cycle between a, b"):
+        topological_order({"a": ["b"], "b": ["a"], "c": []})
+
+
+def test_failures_skip_only_what_depends_on_them():
+    graph = {"db": [], "cache": [], "app": ["db"], "web": ["app", "cache"]}
+    started = []
+
+    async def action(node):
+        started.append(node)
+        await asyncio.sleep(0.05)
+        if node == "db":
+            raise RuntimeError("no disk")
+        return node.upper()
+
+    outcomes = asyncio.run(run_in_dependency_order(graph, action))
+    # Independent nodes run together
+    assert started == ["db", "cache"]
+    assert outcomes["cache"] == "CACHE"
+    assert str(outcomes["db"]) == "no disk"
+    assert isinstance(outcomes["app"], DependencyFailedError)
+    assert outcomes["web"].failed == ["app"]
+
+    order = []
+
+    async def record(node):
+        order.append(node)
+
+    asyncio.run(run_in_dependency_order(graph, record, reverse=True))
+    assert order.index("web") < order.index("app") < order.index("db")
+    assert order.index("web") < order.index("cache")
+
+
+def _stack(image, **overrides):
+    definition = {
+        "name": "shop",
+        "environment": {"TZ": "UTC", "LOG_LEVEL": "info"},
+        "members": [
+            {"name": "db", "image_id": image},
+            {"name": "cache", "image_id": image},
+            {
+                "name": "app",
+                "image_id": image,
+                "environment": {"LOG_LEVEL": "debug"},
+                "depends_on": ["db", "cache"],
+            },
+        ],
+    }
+    definition.update(overrides)
+    return StackCreate(**definition)
+
+
+@pytest.mark.anyio
+async def test_deploy_gates_dependents_on_readiness_and_tears_down_in_reverse(
+    docker_daemon, service
+):
+    docker_daemon.healthcheck = ("healthy", 0.3)
+    image_id = docker_daemon.add_image("shop:1")[7:19]
+
+    deployed = await service.deploy_stack(_stack(image_id))
+    app = copy.deepcopy(docker_daemon.find_container("shop_app"))
+    started = {
+        member.name: docker_daemon.started[
+            docker_daemon.find_container(member.container.name)["Id"]
+        ]
+        for member in deployed.members
+    }
+    looked_up = await service.get_stack("shop")
+    removed = await service.delete_stack("shop")
+    gone = await service.get_stack("shop")
+
+    assert [member.status for member in deployed.members] == [JobStatus.SUCCEEDED] * 3
+    # db and cache start together; app once both are healthy
+    assert abs(started["db"] - started["cache"]) < 0.2
+    assert started["app"] - max(started["db"], started["cache"]) >= 0.3
+    assert deployed.duration < 0.3 * 3
+
+    assert app["Config"]["Labels"] == {"stack": "shop"}
+    assert sorted(app["Config"]["Env"]) == ["LOG_LEVEL=debug", "TZ=UTC"]
+    assert app["HostConfig"]["NetworkMode"] == "shop_net"
+    assert app["NetworkingConfig"]["EndpointsConfig"]["shop_net"] == {
+        "Aliases": ["app"]
+    }
+
+    assert [member.container.name for member in looked_up.members] == [
+        "shop_db",
+        "shop_cache",
+        "shop_app",
+    ]
+
+    assert [member.status for member in removed.members] == [JobStatus.SUCCEEDED] * 3
+    deletes = [
+        path.split("?")[0]
+        for method, path in docker_daemon.requests
+        if method == "DELETE" and path.startswith("/containers/")
+    ]
+    # app goes before what it depends on
+    assert deletes[0] == "/containers/shop_app" and len(deletes) == 3
+    assert docker_daemon.networks == {} and docker_daemon.containers == {}
+    assert gone is None
+
+
+@pytest.mark.anyio
+async def test_failed_member_cancels_its_dependents(docker_daemon, service):
+    image_id = docker_daemon.add_image("shop:1")[7:19]
+    stack = _stack(image_id)
+    stack.members[0].image_id = "missing"
+
+    deployed = await service.deploy_stack(stack)
+    await service.delete_stack("shop")
+    db, cache, app = deployed.members
+    assert db.status == JobStatus.FAILED and db.error
+    assert cache.status == JobStatus.SUCCEEDED
+    assert app.status == JobStatus.CANCELLED and "db failed" in app.error
+    assert [info["Name"] for info in docker_daemon.containers.values()] == []
+
+    with pytest.raises(ValueError, match="Duplicate"):
+        await service.deploy_stack(
+            _stack(image_id, members=[{"name": "db", "image_id": image_id}] * 2)
+        )
+
+
+@pytest.mark.anyio
+async def test_list_stacks_lists_containers_once(docker_daemon, service):
+    image_id = docker_daemon.add_image("shop:1")[7:19]
+    await service.deploy_stack(_stack(image_id))
+    await service.deploy_stack(
+        _stack(image_id, name="blog", members=[{"name": "db", "image_id": image_id}])
+    )
+    docker_daemon.add_container("shop_extra", "shop:1", labels={"stack": "shop"})
+
+    requests = len(docker_daemon.requests)
+    stacks = await service.list_stacks()
+    listings = [
+        path
+        for _, path in docker_daemon.requests[requests:]
+        if path.startswith("/containers/json")
+    ]
+    for stack in stacks:
+        await service.delete_stack(stack.name)
+
+    assert len(listings) == 1
+    assert {
+        stack.name: [member.container.name for member in stack.members]
+        for stack in stacks
+    } == {"shop": ["shop_db", "shop_cache", "shop_app"], "blog": ["blog_db"]}
@@ -0,0 +1,191 @@
+import sys
+import time
+import asyncio
+
+import psutil
+import pytest
+from fastapi import HTTPException
+
+from app.utils.subprocess_utils import (
+    CommandError,
+    _iter_lines,
+    run_command_async,
+    stream_command,
+)
+from app.utils.disconnect import cancel_on_disconnect
+
+SLEEPER = [sys.executable, "-c", "import time; time.sleep(30)"]
+
+
+def _leftover(marker="time.sleep(30)"):
+    """Child processes whose command line contains marker"""
+    return [p for p in psutil.Process().children() if marker in " ".join(p.cmdline())]
+
+
+def test_captures_output_and_exit_code():
+    stdout, stderr, code = asyncio.run(
+        run_command_async([sys.executable, "-c", "print('hi')"])
+    )
+    assert (stdout, code) == ("hi\n", 0)
+
+
+def test_input_is_written_to_stdin():
+    stdout, _, _ = asyncio.run(
+        run_command_async(
+            [sys.executable, "-c", "import sys; print(sys.stdin.read().upper())"],
+            input="abc",
+        )
+    )
+    assert stdout == "ABC\n"
+
+
+def test_failure_raises_command_error():
+    with pytest.raises(CommandError) as exc_info:
+        asyncio.run(
+            run_command_async(
+                [
+                    sys.executable,
+                    "-c",
+                    "import sys; sys.stderr.write('bad'); sys.exit(4)",
+                ]
+            )
+        )
+    assert exc_info.value.return_code == 4
+    assert exc_info.value.stderr == "bad"
+
+
+def test_timeout_kills_command():
+    started = time.monotonic()
+    with pytest.raises(CommandError, match="timed out"):
+        asyncio.run(run_command_async(SLEEPER, timeout=0.2))
+    assert time.monotonic() - started < 10
+    assert _leftover() == []
+
+
+def test_cancellation_kills_command():
+    async def scenario():
+        task = asyncio.create_task(run_command_async(SLEEPER))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert _leftover() == []
+
+
+async def _collect(command, **kwargs):
+    return [item async for item in stream_command(command, **kwargs)]
+
+
+def test_stream_yields_lines_incrementally():
+    code = (
+        "import sys, time\n"
+        "print('first', flush=True)\n"
+        "time.sleep(0.5)\n"
+        "sys.stderr.write('second\\n')\n"
+    )
+
+    async def scenario():
+        arrivals = []
+        started = time.monotonic()
+        async for stream, line in stream_command([sys.executable, "-c", code]):
+            arrivals.append((stream, line, time.monotonic() - started))
+        return arrivals
+
+    arrivals = asyncio.run(scenario())
+    assert [(s, l) for s, l, _ in arrivals] == [
+        ("stdout", "first"),
+        ("stderr", "second"),
+    ]
+    assert arrivals[0][2] < arrivals[1][2] - 0.3  # First line didn't wait for exit
+
+
+def test_stream_splits_progress_and_long_lines():
+    code = (
+        "import sys\n"
+        "sys.stdout.write('(10.00/100%)\\r(20.00/100%)\\r\\n')\n"
+        "sys.stdout.write('x' * 100000 + '\\n\\nend\\n')\n"
+    )
+    lines = asyncio.run(_collect([sys.executable, "-c", code], max_line_bytes=1000))
+    assert [l for _, l in lines] == ["(10.00/100%)", "(20.00/100%)"] + [
+        "x" * 1000
+    ] * 100 + ["", "end"]
+
+
+def test_line_pieces_join_back_into_the_output():
+    output = "é" * 10 + "\r\n\nplain\rlast"
+
+    async def scenario():
+        reader = asyncio.StreamReader()
+        encoded = output.encode()
+        # Split inside "é" and between "\r" and "\n"
+        for start in range(0, len(encoded), 7):
+            reader.feed_data(encoded[start : start + 7])
+        reader.feed_eof()
+        return [line async for line in _iter_lines(reader, 4, keep_ends=True)]
+
+    pieces = asyncio.run(scenario())
+    assert "".join(pieces) == output
+    assert pieces == ["éé"] * 4 + ["éé\r\n", "\n", "plai", "n\r", "last"]
+
+
+def test_stream_failure_reports_stderr_tail():
+    code = (
+        "import sys\nfor i in range(100): sys.stderr.write(f'err {i}\\n')\nsys.exit(2)"
+    )
+    with pytest.raises(CommandError) as exc_info:
+        asyncio.run(_collect([sys.executable, "-c", code]))
+    assert exc_info.value.return_code == 2
+    assert exc_info.value.stderr.splitlines() == [f"err {i}" for i in range(80, 100)]
+
+
+def test_stream_timeout_kills_command():
+    with pytest.raises(CommandError, match="timed out"):
+        asyncio.run(_collect(SLEEPER, timeout=0.2))
+    assert _leftover() == []
+
+
+def test_stream_closed_early_kills_command():
+    code = "import time\nwhile True: print('tick', flush=True); time.sleep(0.01)"
+
+    async def scenario():
+        stream = stream_command([sys.executable, "-c", code])
+        async for _ in stream:
+            break
+        await stream.aclose()
+
+    asyncio.run(scenario())
+    assert _leftover("tick") == []
+
+
+class _FakeRequest:
+    """Minimal Request stand-in whose client disconnects after a delay"""
+
+    method = "POST"
+
+    class url:
+        path = "/test"
+
+    def __init__(self, disconnect_after: float):
+        self.disconnect_after = disconnect_after
+
+    async def receive(self):
+        await asyncio.sleep(self.disconnect_after)
+        return {"type": "http.disconnect"}
+
+
+def test_disconnect_cancels_command():
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(cancel_on_disconnect(_FakeRequest(0.2), run_command_async(SLEEPER)))
+    assert exc_info.value.status_code == 499
+    assert _leftover() == []
+
+
+def test_result_returned_when_client_stays():
+    stdout, _, _ = asyncio.run(
+        cancel_on_disconnect(
+            _FakeRequest(30), run_command_async([sys.executable, "-c", "print(1)"])
+        )
+    )
+    assert stdout == "1\n"
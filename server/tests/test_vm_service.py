@@ -0,0 +1,146 @@
+import asyncio
+import shutil
+import subprocess
+import threading
+from datetime import datetime
+
+import pytest
+
+from app.models.disk import EditDiskRequest
+from app.models.vm import VMStatus
+from app.services import disk_service, vm_service
+from app.utils.process_watcher import ProcessWatcher
+
+
+class _QemuCapabilities:
+    preferred_accelerator = "tcg"
+
+    def has_binary(self, name):
+        return True
+
+
+@pytest.fixture
+def services(tmp_path, port_allocator, monkeypatch):
+    """A disk service with one disk on file and a VM service on top"""
+    (tmp_path / "vms").mkdir()
+    (tmp_path / "disks").mkdir()
+    for module in (vm_service, disk_service):
+        monkeypatch.setattr(
+            module, "get_host_capabilities", lambda: _QemuCapabilities()
+        )
+    monkeypatch.setattr(vm_service, "VM_DATA_FOLDER", str(tmp_path / "vms"))
+    monkeypatch.setattr(disk_service, "VIRTUAL_DISK_FOLDER", str(tmp_path / "disks"))
+    monkeypatch.setattr(vm_service, "get_port_allocator", lambda: port_allocator)
+    monkeypatch.setattr(vm_service, "get_process_watcher", ProcessWatcher)
+    disks = disk_service.DiskService()
+    vms = vm_service.VMService(disks)
+
+    path = tmp_path / "disks" / "root_disk1.qcow2"
+    path.write_bytes(b"")
+    now = datetime.now().isoformat()
+    disks._store.put(
+        "disks",
+        "disk1",
+        {
+            "id": "disk1",
+            "name": "root",
+            "size": "1G",
+            "format": "qcow2",
+            "path": str(path),
+            "in_use": False,
+            "dynamic": True,
+            "created_at": now,
+            "updated_at": now,
+        },
+    )
+    return disks, vms
+
+
+def test_disk_can_only_back_one_vm(services):
+    disks, vms = services
+    vms.create_vm("web", 1, 512, "disk1")
+
+    with pytest.raises(ValueError, match="in use"):
+        vms.create_vm("db", 1, 512, "disk1")
+    with pytest.raises(ValueError, match="in use"):
+        disks.delete_disk("disk1")
+    assert [vm.name for vm in vms.list_vms()] == ["web"]
+
+
+def test_resize_runs_without_the_metadata_lock(services, monkeypatch):
+    disks, _ = services
+    during_resize = {}
+
+    async def resize(command, **kwargs):
+        during_resize["op_class"] = kwargs.get("op_class")
+
+        # Another worker thread can take the lock, but finds the disk claimed
+        def delete():
+            try:
+                disks.delete_disk("disk1")
+            except ValueError as e:
+                during_resize["delete"] = str(e)
+
+        thread = threading.Thread(target=delete)
+        thread.start()
+        await asyncio.get_running_loop().run_in_executor(None, thread.join, 5)
+        during_resize["blocked"] = thread.is_alive()
+        return "", "", 0
+
+    monkeypatch.setattr(disk_service, "run_command_async", resize)
+    edited = asyncio.run(disks.edit_disk("disk1", EditDiskRequest(size="2G")))
+
+    assert during_resize == {
+        "op_class": "disk_io",
+        "blocked": False,
+        "delete": "Cannot delete disk that is in use by a VM",
+    }
+    assert edited.size == "2G"
+    assert not edited.in_use
+
+
+def test_stop_from_another_worker_kills_the_vm(tmp_path, port_allocator, monkeypatch):
+    monkeypatch.setattr(vm_service, "VM_DATA_FOLDER", str(tmp_path))
+    monkeypatch.setattr(
+        vm_service, "get_host_capabilities", lambda: _QemuCapabilities()
+    )
+    monkeypatch.setattr(vm_service, "get_port_allocator", lambda: port_allocator)
+    # Each worker has its own watcher
+    monkeypatch.setattr(vm_service, "get_process_watcher", ProcessWatcher)
+    launcher = vm_service.VMService(None)
+    stopper = vm_service.VMService(None)
+
+    # The launching worker starts "QEMU" and records it
+    qemu = tmp_path / "qemu-system-x86_64"
+    shutil.copy(shutil.which("sleep"), qemu)
+    process = subprocess.Popen([str(qemu), "60"])
+    now = datetime.now().isoformat()
+    ssh_port = port_allocator.allocate("vm:vm1", "vm")[0]
+    launcher._store.put(
+        "vms",
+        "vm1",
+        {
+            "id": "vm1",
+            "name": "web",
+            "cpu_cores": 1,
+            "memory_size": 512,
+            "disk_id": "disk1",
+            "status": VMStatus.RUNNING,
+            "pid": process.pid,
+            "ip_address": f"127.0.0.1:{ssh_port}",
+            "created_at": now,
+            "updated_at": now,
+        },
+    )
+    launcher.running_vms["vm1"] = process.pid
+
+    try:
+        stopped = asyncio.run(stopper.stop_vm("vm1"))
+        return_code = process.wait(timeout=5)
+    finally:
+        process.kill()
+        process.wait()
+
+    assert return_code == -15
+    assert stopped.status == VMStatus.STOPPED
+    assert port_allocator.leases() == []